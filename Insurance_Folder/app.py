@@ -1,10 +1,26 @@
-from flask import Flask, render_template, request, redirect, url_for, flash
+from flask import Flask, render_template, request, redirect, url_for, flash, g, jsonify, Response, stream_with_context, abort, send_from_directory
 import pyodbc
-import re
 import os
-import csv
+import json
+from datetime import date
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
+import audit
+import cache
+import dashboard
+import db_pool
+import exporter
+import instrumentation
+import jobs
+import lookups
+import table_browser
+import bulk_loader
+import registry
+import renewals
+import query_cache
+import revenue_rollup
+import scheduler
+import search_index
 
 # runs the app as a flask application (function to run is at the bottom of the code)
 app = Flask(__name__)
@@ -17,14 +33,132 @@ login_manager.init_app(app)
 # specifies the route to redirect to if a user tries to access a page that requires authentication
 login_manager.login_view = "login"
 
-# connecting the SQL db to the python script
-connection = pyodbc.connect(
-    r"Driver={ODBC Driver 17 for SQL Server};"
-    r"Server=(localdb)\localdb73;"
-    "Database=Insurance;"
-    "Trusted_Connection=yes;"
+# connecting the SQL db to the python script through a bounded pool of connections. every request
+# checks out its own connection (see get_db below) so concurrent requests never share a cursor.
+# the connections are wrapped so the time every request spends on SQL and commits is recorded
+pool = db_pool.ConnectionPool(
+    connect=instrumentation.instrumented(db_pool.connect),
+    max_size=int(os.environ.get("INSURANCE_POOL_SIZE", 10)),
 )
-cursor = connection.cursor()
+
+# per route latency, SQL, commit and template render timings, served by /metrics
+metrics = instrumentation.Metrics()
+instrumentation.init_app(app, metrics)
+
+# cache of the User objects loaded by flask login, keyed by Staff_ID
+USER_CACHE_TTL = int(os.environ.get("INSURANCE_USER_CACHE_TTL", 300))
+user_cache = cache.TTLCache(maxsize=1024, ttl=USER_CACHE_TTL)
+
+# number of CSV rows sent to the server (and committed) per batch by /upload_csv
+CSV_BATCH_SIZE = int(os.environ.get("INSURANCE_CSV_BATCH_SIZE", bulk_loader.DEFAULT_BATCH_SIZE))
+
+# changes made through the app are recorded in Audit_Log by a background writer (see audit.py)
+audit_writer = audit.AuditWriter(
+    db_pool.connect,
+    max_queue=int(os.environ.get("INSURANCE_AUDIT_QUEUE_SIZE", audit.DEFAULT_QUEUE_SIZE)),
+    batch_size=int(os.environ.get("INSURANCE_AUDIT_BATCH_SIZE", audit.DEFAULT_BATCH_SIZE)),
+)
+
+# the revenue report is cached for this many seconds (see revenue_report)
+REPORT_CACHE_TTL = int(os.environ.get("INSURANCE_REPORT_CACHE_TTL", 60))
+report_cache = cache.TTLCache(maxsize=16, ttl=REPORT_CACHE_TTL)
+
+# the payments and settlements added or changed since the last rollup are applied to Revenue_Expenses
+# every REVENUE_ROLLUP_INTERVAL seconds in the background (see revenue_rollup.py)
+REVENUE_ROLLUP_INTERVAL = int(os.environ.get("INSURANCE_REVENUE_ROLLUP_INTERVAL", 300))
+
+# uploaded CSV files are imported in the background by a few worker threads, each with its own
+# connection outside the request pool (see jobs.py)
+upload_jobs = jobs.JobManager(
+    connect=db_pool.connect,
+    workers=int(os.environ.get("INSURANCE_IMPORT_WORKERS", 2)),
+    max_queued=int(os.environ.get("INSURANCE_MAX_QUEUED_IMPORTS", 20)),
+    batch_size=CSV_BATCH_SIZE,
+    audit=audit_writer,
+    on_finished=lambda job: import_finished(job),
+)
+
+# the policies expiring in the next RENEWAL_HORIZON_DAYS days, kept in memory (see renewals.py). a
+# background thread rescans them every RENEWAL_SCAN_INTERVAL seconds, and the policies and payments
+# added through the app are applied as they are inserted (see AFTER_INSERT)
+RENEWAL_HORIZON_DAYS = int(os.environ.get("INSURANCE_RENEWAL_HORIZON_DAYS", renewals.DEFAULT_HORIZON_DAYS))
+RENEWAL_SCAN_INTERVAL = int(os.environ.get("INSURANCE_RENEWAL_SCAN_INTERVAL", 900))
+renewal_index = renewals.RenewalIndex(horizon_days=RENEWAL_HORIZON_DAYS)
+renewal_cache = cache.TTLCache(maxsize=64, ttl=REPORT_CACHE_TTL)
+
+# results of the customer service lookups (see lookups.py), kept until a table they read is written
+# to. INSURANCE_QUERY_CACHE_PATH shares them (and the table versions) between app processes
+query_results = query_cache.QueryCache(
+    max_bytes=int(os.environ.get("INSURANCE_QUERY_CACHE_BYTES", query_cache.DEFAULT_MAX_BYTES)),
+)
+
+# the numbers on the home page, kept in memory (see dashboard.py). a background thread brings them
+# up to date every DASHBOARD_REFRESH_INTERVAL seconds (and after every CSV import), and the rows
+# added through the app are applied as they are inserted (see add_record)
+DASHBOARD_REFRESH_INTERVAL = int(os.environ.get("INSURANCE_DASHBOARD_REFRESH_INTERVAL", 60))
+dashboard_summary = dashboard.DashboardSummary()
+
+# the full-text search index over the free text columns (see search_index.py), loaded from its files
+# under INSURANCE_SEARCH_DIR. a background thread builds it the first time and afterwards adds the
+# rows changed in the last SEARCH_REFRESH_INTERVAL seconds, and the rows added through the app are
+# indexed as they are inserted (see add_record)
+SEARCH_REFRESH_INTERVAL = int(os.environ.get("INSURANCE_SEARCH_REFRESH_INTERVAL", 60))
+text_index = search_index.SearchIndex()
+
+# applies the new payments and settlements to Revenue_Expenses (unless another run is doing it) and
+# drops the cached report
+def roll_up_revenue():
+    if revenue_rollup.scan(db_pool.connect) is not None:
+        report_cache.invalidate("revenue")
+
+
+# periodic background work. set INSURANCE_SCHEDULER=0 to leave it to the command line scripts
+scheduled_jobs = scheduler.Scheduler()
+scheduled_jobs.every(RENEWAL_SCAN_INTERVAL, lambda: renewal_index.scan(db_pool.connect), name="renewal_scan")
+dashboard_job = scheduled_jobs.every(
+    DASHBOARD_REFRESH_INTERVAL, lambda: dashboard_summary.scan(db_pool.connect), name="dashboard_refresh"
+)
+search_job = scheduled_jobs.every(
+    SEARCH_REFRESH_INTERVAL, lambda: text_index.scan(db_pool.connect), name="search_refresh"
+)
+rollup_job = scheduled_jobs.every(REVENUE_ROLLUP_INTERVAL, roll_up_revenue, name="revenue_rollup")
+
+
+# starts the background jobs in this process (once), unless INSURANCE_SCHEDULER=0. this is done
+# before the first request is handled (see ensure_background_jobs) or by __main__, never on import,
+# so scripts that import the app (the benchmarks, the tests) do not start them, and under the debug
+# reloader only the process that serves the requests runs them, not the one watching the files
+def start_background_jobs():
+    if os.environ.get("INSURANCE_SCHEDULER", "1") != "0":
+        scheduled_jobs.start()
+
+
+# returns the connection checked out for the current request, checking one out of the pool the
+# first time it is needed. the connection is stored on flask's g object for the rest of the request
+def get_db():
+    if "db" not in g:
+        g.db = pool.checkout()
+    return g.db
+
+
+# the Changed_By of audit rows: the logged in staff member's ID
+def audit_user():
+    return current_user.get_id() if current_user.is_authenticated else "anonymous"
+
+
+# starts the background jobs when the app is served by a WSGI server (a no-op once they are running)
+@app.before_request
+def ensure_background_jobs():
+    start_background_jobs()
+
+
+# hands the request's connection back to the pool once the app context is torn down. if the request
+# failed with an exception the connection may be in a bad state, so the pool closes it instead
+@app.teardown_appcontext
+def release_db(exception):
+    connection = g.pop("db", None)
+    if connection is not None:
+        pool.checkin(connection, broken=exception is not None)
 
 # defines the user object used by flask login. UserMixin is used to implement the login
 # functionality without having to manually implement it
@@ -39,14 +173,22 @@ class User(UserMixin):
 
 
 # loads a user database based on the user id -- specifically, sends a request to the 
-# database to retrieve items where the user_id is given
+# database to retrieve items where the user_id is given. flask login calls this on every
+# authenticated request, so users are kept in user_cache (keyed by Staff_ID) for USER_CACHE_TTL
+# seconds. anything that changes a Staff row must call user_cache.invalidate(staff_id)
 @login_manager.user_loader
 def load_user(user_id):
+    user = user_cache.get(user_id)
+    if user is not cache.MISSING:
+        return user
+
     try:
-        cursor.execute("SELECT Staff_ID, Email, Password, First_Name, Last_Name, Position FROM Staff WHERE Staff_ID = ?", user_id)
+        connection = get_db()
+        cursor = connection.cursor()
+        cursor.execute("SELECT Staff_ID, Email, Password, First_Name, Last_Name, Position FROM Staff WHERE Staff_ID = ?", (user_id,))
         user_data = cursor.fetchone()
         if user_data:
-            return User(
+            user = User(
                 id=user_data[0], 
                 email=user_data[1], 
                 password=user_data[2], 
@@ -54,6 +196,8 @@ def load_user(user_id):
                 last_name=user_data[4], 
                 position=user_data[5]
             )
+            user_cache.set(user_id, user)
+            return user
     except Exception as e:
         print(f"Error loading user: {e}")
     return None
@@ -71,6 +215,8 @@ def login():
         password = request.form["password"]
 
         # Fetch the user from the database
+        connection = get_db()
+        cursor = connection.cursor()
         cursor.execute("SELECT Staff_ID, Email, Password FROM Staff WHERE Email = ?", (email,))
         user_data = cursor.fetchone()
 
@@ -96,603 +242,239 @@ def logout():
     flash("You have been logged out.", "success")
     return redirect(url_for("login"))
 
-# the next four functions are to ensure proper entry within the database, based on the constraints
-# that are provided within the sql file (some values being non null, etc.) the function below takes
-# care of non null and values that may be too long
-def validate_non_null(field_name, field_value, max_length=None):
-    if not field_value:
-        flash(f"{field_name} is required and cannot be empty.", "error")
-        return False
-    if max_length and len(field_value) > max_length:
-        flash(f"{field_name} exceeds the maximum length of {max_length}.", "error")
-        return False
-    return True
-
-# validates that the numbers entered are positive (e.g. quantities, money, etc.)
-def validate_positive_float(field_name, field_value):
-    try:
-        value = float(field_value)
-        if value <= 0:
-            flash(f"{field_name} must be a positive number.", "error")
-            return False
-        return True
-    except ValueError:
-        flash(f"{field_name} must be a valid number.", "error")
-        return False
-    
-# validates the the email entered is a valid email
-def validate_email(field_name, value):
-    if not re.match(r"[^@]+@[^@]+\.[^@]+", value):
-        flash(f"{field_name} is not a valid email address.", "error")
-        return False
-    return True
-
-# validates that any url entered is secure and a real url
-def validate_url(field_name, value):
-    if not re.match(r"https?://[^\s/$.?#].[^\s]*", value):
-        flash(f"{field_name} is not a valid URL.", "error")
-        return False
-    return True
-
-# home route -- renders the index.html template
+# reports the connection pool metrics (wait time, connections in use, checkout failures) as json
+@app.route("/pool_stats")
+@login_required
+def pool_stats():
+    return jsonify(pool.stats())
+
+# reports the hit/miss counters of the user cache as json
+@app.route("/cache_stats")
+@login_required
+def cache_stats():
+    return jsonify(user_cache.stats())
+
+# the request timings plus the pool and cache counters in the Prometheus text format. meant to be
+# scraped from the same machine, so it does not require a login but only answers local requests
+@app.route("/metrics")
+def metrics_page():
+    if request.remote_addr not in ("127.0.0.1", "::1"):
+        abort(404)
+    text = (
+        metrics.prometheus()
+        + instrumentation.gauges("insurance_pool", pool.stats())
+        + instrumentation.gauges("insurance_user_cache", user_cache.stats())
+        + instrumentation.gauges("insurance_import_jobs", upload_jobs.stats())
+        + instrumentation.gauges("insurance_report_cache", report_cache.stats())
+        + instrumentation.gauges("insurance_audit", audit_writer.stats())
+        + instrumentation.gauges("insurance_renewals", renewal_index.stats())
+        + instrumentation.gauges("insurance_renewal_cache", renewal_cache.stats())
+        + instrumentation.gauges("insurance_scheduler", scheduled_jobs.stats())
+        + instrumentation.gauges("insurance_query_cache", query_results.stats())
+        + instrumentation.gauges("insurance_dashboard", dashboard_summary.stats())
+        + instrumentation.gauges("insurance_search", text_index.stats())
+    )
+    return Response(text, mimetype="text/plain; version=0.0.4")
+
+# home route -- renders the index.html template with the dashboard numbers. they come from memory
+# (see dashboard.py), so the page never waits on the database
 @app.route("/")
 @login_required
 def index():
-    return render_template("index.html")
-
-# adding a customer, which can either be a get or post request
-
-# if its a post request, take all the information entered in the form and store them in separate variables
-# if all the constraints are passed (non null values, etc.) then execute the corresponding SQL query
+    return render_template("index.html", dashboard=dashboard_summary.summary(), labels=dashboard.NUMBERS)
+
+# read-only views of every table in the schema. /tables/<table> shows one page of rows as html and
+# /api/<table> returns the same page as json. both take the same query string options:
+#   ?Status=Pending   -- any column name filters on that exact value
+#   ?sort=Amount&order=desc
+#   ?limit=100        -- rows per page (at most 1000)
+#   ?after=...        -- the cursor of the previous page, given in the response
+@app.route("/tables/<table_name>")
+@login_required
+def list_table(table_name):
+    try:
+        table = table_browser.get_table(table_name)
+        options = table_browser.page_options(table, request.args)
+        rows, last_key = [], None
+        for values, key in table_browser.iter_page(get_db(), table, **options):
+            rows.append(values)
+            last_key = key
+    except table_browser.BrowseError as e:
+        flash(str(e), "error")
+        return redirect(url_for("index"))
+
+    first_url = url_for("list_table", table_name=table_name,
+                        **{name: value for name, value in request.args.items() if name != "after"})
+    next_url = None
+    if len(rows) == options["page_size"]:
+        next_url = url_for("list_table", table_name=table_name,
+                           **dict(request.args.items(), after=table_browser.encode_cursor(last_key)))
+
+    return render_template(
+        "list_table.html",
+        table_name=table_name,
+        columns=table_browser.visible_columns(table),
+        sortable=table_browser.sortable_columns(table),
+        rows=rows,
+        options=options,
+        first_url=first_url,
+        next_url=next_url,
+    )
+
+
+# the json version streams the page out row by row as it is read from the server
+@app.route("/api/<table_name>")
+@login_required
+def api_table(table_name):
+    try:
+        table = table_browser.get_table(table_name)
+        options = table_browser.page_options(table, request.args)
+        rows = table_browser.iter_page(get_db(), table, **options)
+    except table_browser.BrowseError as e:
+        return jsonify(error=str(e)), 400
+
+    columns = table_browser.visible_columns(table)
+
+    def generate():
+        yield f'{{"table": {json.dumps(table_name)}, "rows": ['
+        count, last_key = 0, None
+        for values, key in rows:
+            row = json.dumps(dict(zip(columns, values)), default=table_browser.json_default)
+            yield row if count == 0 else "," + row
+            count += 1
+            last_key = key
+        next_cursor = table_browser.encode_cursor(last_key) if count == options["page_size"] else None
+        yield f'], "next": {json.dumps(next_cursor)}}}'
+
+    return Response(stream_with_context(generate()), mimetype="application/json")
+
+# downloads a whole table (or the rows matching the filters) as a file, streamed to the client as it
+# is read from the server, so it works for tables of any size (see exporter.py). query string options:
+#   ?format=csv       -- csv (default), ndjson or parquet
+#   ?gzip=1           -- gzip the file
+#   ?columns=A,B      -- only these columns
+#   ?Status=Pending   -- any column name filters on that exact value
+@app.route("/export/<table_name>")
+@login_required
+def export_table(table_name):
+    reserved = {"format", "gzip", "columns"}
+    filters = {name: value for name, value in request.args.items() if name not in reserved}
+    columns = request.args["columns"].split(",") if request.args.get("columns") else None
+    try:
+        chunks, mimetype, file_name = exporter.export(
+            get_db(), table_name,
+            format=request.args.get("format", "csv"),
+            columns=columns,
+            filters=filters,
+            compress=request.args.get("gzip", "0").lower() in ("1", "true", "yes"),
+        )
+    except (exporter.ExportError, table_browser.BrowseError) as e:
+        return jsonify(error=str(e)), 400
+
+    return Response(
+        stream_with_context(chunks),
+        mimetype=mimetype,
+        headers={"Content-Disposition": f"attachment; filename={file_name}"},
+    )
+
+# adding a record to a table, which can either be a get or post request
+
+# if its a post request, the form fields (named after the table's columns, lower cased) are checked
+# and converted by the table's entry in the registry, which is built from the column definitions in
+# InsuranceDB_Creator.sql. if every value passes, the prepared INSERT is executed and the new row is
+# queued for the audit log. otherwise each problem is flashed and the form is shown again
 
 # if its a get req then simply show the page
 
-# the same format follows for all the add_... functions
-@app.route("/add_customer", methods=["GET", "POST"])
-def add_customer():
-    if request.method == "POST":
-        customer_id = request.form["customer_id"]
-        first_name = request.form["first_name"]
-        last_name = request.form["last_name"]
-        dob = request.form["dob"]
-        gender = request.form["gender"]
-        address = request.form["address"]
-        city = request.form["city"]
-        country = request.form["country"]
-        phone = request.form["phone"]
-        email = request.form["email"]
-        marital_status = request.form["marital_status"]
-
-        if all([
-            validate_non_null("Customer ID", customer_id, max_length=10),
-            validate_non_null("First Name", first_name, max_length=50),
-            validate_non_null("Last Name", last_name, max_length=50),
-            validate_non_null("Date of Birth", dob),
-            validate_non_null("Gender", gender, max_length=10),
-            validate_non_null("Address", address, max_length=255),
-            validate_non_null("City", city, max_length=50),
-            validate_non_null("Country", country, max_length=50),
-            validate_non_null("Phone", phone, max_length=20),
-            validate_non_null("Email", email, max_length=50),
-            validate_non_null("Marital Status", marital_status, max_length=20)
-        ]):
-            try:
-                query = """
-                    INSERT INTO Customer (Customer_ID, First_Name, Last_Name, DOB, Gender, Address, City, Country, Phone, Email, Marital_Status)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """
-                cursor.execute(query, customer_id, first_name, last_name, dob, gender, address, city, country, phone, email, marital_status)
-                connection.commit()
-                flash("Customer added successfully.", "success")
-                return redirect(url_for("index"))
-            except pyodbc.Error as e:
-                flash(f"Error inserting Customer: {e}", "error")
-
-    return render_template("add_customer.html")
-
-
-
-@app.route("/add_incident", methods=["GET", "POST"])
-def add_incident():
-    if request.method == "POST":
-        incident_id = request.form["incident_id"]
-        incident_type = request.form["type"]
-        date = request.form["date"]
-        description = request.form["description"]
-
-        if all([
-            validate_non_null("Incident ID", incident_id, max_length=10),
-            validate_non_null("Type", incident_type, max_length=20),
-            validate_non_null("Date", date),
-            validate_non_null("Description", description, max_length=255)
-        ]):
-            try:
-                query = """
-                    INSERT INTO Incident (Incident_ID, Type, Date, Description)
-                    VALUES (?, ?, ?, ?)
-                """
-                cursor.execute(query, incident_id, incident_type, date, description)
-                connection.commit()
-                flash("Incident added successfully.", "success")
-                return redirect(url_for("index"))
-            except pyodbc.Error as e:
-                flash(f"Error inserting Incident: {e}", "error")
-
-    return render_template("add_incident.html")
-
-
-@app.route("/add_incident_report", methods=["GET", "POST"])
-def add_incident_report():
-    if request.method == "POST":
-        report_id = request.form["report_id"]
-        incident_id = request.form["incident_id"]
-        customer_id = request.form["customer_id"]
-        inspector_name = request.form.get("inspector_name")  # Optional field
-        estimated_cost = request.form.get("estimated_cost")  # Optional field
-        description = request.form.get("description")  # Optional field
-
-        if all([
-            validate_non_null("Report ID", report_id, max_length=10),
-            validate_non_null("Incident ID", incident_id, max_length=10),
-            validate_non_null("Customer ID", customer_id, max_length=10)
-        ]):
-            if estimated_cost and not validate_positive_float("Estimated Cost", estimated_cost):
-                return render_template("form.html")  # Stop if cost is invalid
-
-            try:
-                query = """
-                    INSERT INTO Incident_Report (Report_ID, Incident_ID, Customer_ID, Inspector_Name, Estimated_Cost, Description)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """
-                cursor.execute(
-                    query,
-                    report_id,
-                    incident_id,
-                    customer_id,
-                    inspector_name,
-                    float(estimated_cost) if estimated_cost else None,
-                    description
-                )
-                connection.commit()
-                flash("Incident Report added successfully.", "success")
-                return redirect(url_for("index"))
-            except pyodbc.Error as e:
-                flash(f"Error inserting Incident Report: {e}", "error")
-
-    return render_template("add_incident_report.html")
-
-
-@app.route("/add_company", methods=["GET", "POST"])
-def add_company():
-    if request.method == "POST":
-        company_id = request.form["company_id"]
-        name = request.form["name"]
-        contact_number = request.form["contact_number"]
-        email = request.form.get("email")  # Optional
-        website = request.form.get("website")  # Optional
-        address = request.form["address"]
-        city = request.form["city"]
-        country = request.form["country"]
-
-        if all([
-            validate_non_null("Company ID", company_id, max_length=10),
-            validate_non_null("Name", name, max_length=50),
-            validate_non_null("Contact Number", contact_number, max_length=20),
-            validate_non_null("Address", address, max_length=255),
-            validate_non_null("City", city, max_length=50),
-            validate_non_null("Country", country, max_length=50)
-        ]):
-            if email and not validate_email("Email", email):
-                return render_template("form.html")
-            if website and not validate_url("Website", website):
-                return render_template("form.html")
-
-            try:
-                query = """
-                    INSERT INTO Company (Company_ID, Name, Contact_Number, Email, Website, Address, City, Country)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """
-                cursor.execute(query, company_id, name, contact_number, email, website, address, city, country)
-                connection.commit()
-                flash("Company added successfully.", "success")
-                return redirect(url_for("index"))
-            except pyodbc.Error as e:
-                flash(f"Error inserting Company: {e}", "error")
-
-    return render_template("add_company.html")
-
-@app.route("/add_department", methods=["GET", "POST"])
-def add_department():
-    if request.method == "POST":
-        department_id = request.form["department_id"]
-        company_id = request.form["company_id"]
-        name = request.form["name"]
-        staff_count = request.form.get("staff_count")  # Optional
-        office_count = request.form.get("office_count")  # Optional
-
-        if all([
-            validate_non_null("Department ID", department_id, max_length=10),
-            validate_non_null("Company ID", company_id, max_length=10),
-            validate_non_null("Name", name, max_length=50),
-        ]):
-            try:
-                query = """
-                    INSERT INTO Department (Department_ID, Company_ID, Name, Staff_Count, Office_Count)
-                    VALUES (?, ?, ?, ?, ?)
-                """
-                cursor.execute(query, department_id, company_id, name, staff_count, office_count)
-                connection.commit()
-                flash("Department added successfully.", "success")
-                return redirect(url_for("index"))
-            except pyodbc.Error as e:
-                flash(f"Error inserting Department: {e}", "error")
-
-    return render_template("add_department.html")
-
-
-@app.route("/add_vehicle_service", methods=["GET", "POST"])
-def add_vehicle_service():
-    if request.method == "POST":
-        service_id = request.form["service_id"]
-        department_id = request.form["department_id"]
-        company_id = request.form["company_id"]
-        name = request.form["name"]
-        address = request.form.get("address")  # Optional
-        contact = request.form["contact"]
-        service_type = request.form.get("service_type")  # Optional
-
-        if all([
-            validate_non_null("Service ID", service_id, max_length=10),
-            validate_non_null("Department ID", department_id, max_length=10),
-            validate_non_null("Company ID", company_id, max_length=10),
-            validate_non_null("Name", name, max_length=50),
-            validate_non_null("Contact", contact, max_length=20),
-        ]):
-            try:
-                query = """
-                    INSERT INTO Vehicle_Service (Service_ID, Department_ID, Company_ID, Name, Address, Contact, Service_Type)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """
-                cursor.execute(query, service_id, department_id, company_id, name, address, contact, service_type)
-                connection.commit()
-                flash("Vehicle Service added successfully.", "success")
-                return redirect(url_for("index"))
-            except pyodbc.Error as e:
-                flash(f"Error inserting Vehicle Service: {e}", "error")
-
-    return render_template("add_vehicle_service.html")
+# the same view serves every table that has an add_<table>.html template, at /add_<table>
+def add_record(table_name):
+    spec = registry.get(table_name)
 
-
-@app.route("/add_vehicle", methods=["GET", "POST"])
-def add_vehicle():
     if request.method == "POST":
-        vehicle_id = request.form["vehicle_id"]
-        customer_id = request.form["customer_id"]
-        registration_number = request.form["registration_number"]
-        value = request.form.get("value")  # Optional
-        vehicle_type = request.form.get("type")  # Optional
-        make = request.form.get("make")  # Optional
-        model = request.form.get("model")  # Optional
-        engine_number = request.form.get("engine_number")  # Optional
-        chassis_number = request.form.get("chassis_number")  # Optional
-
-        if all([
-            validate_non_null("Vehicle ID", vehicle_id, max_length=10),
-            validate_non_null("Customer ID", customer_id, max_length=10),
-            validate_non_null("Registration Number", registration_number, max_length=20),
-        ]):
-            try:
-                query = """
-                    INSERT INTO Vehicle (Vehicle_ID, Customer_ID, Registration_Number, Value, Type, Make, Model, Engine_Number, Chassis_Number)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-                """
-                cursor.execute(query, vehicle_id, customer_id, registration_number, value, vehicle_type, make, model, engine_number, chassis_number)
-                connection.commit()
-                flash("Vehicle added successfully.", "success")
-                return redirect(url_for("index"))
-            except pyodbc.Error as e:
-                flash(f"Error inserting Vehicle: {e}", "error")
-
-    return render_template("add_vehicle.html")
-
-
-@app.route("/add_application", methods=["GET", "POST"])
-def add_application():
-    if request.method == "POST":
-        application_id = request.form["application_id"]
-        customer_id = request.form["customer_id"]
-        vehicle_id = request.form["vehicle_id"]
-        status = request.form["status"]
-        coverage_description = request.form["coverage_description"]
-
-        if all([
-            validate_non_null("Application ID", application_id, max_length=10),
-            validate_non_null("Customer ID", customer_id, max_length=10),
-            validate_non_null("Vehicle ID", vehicle_id, max_length=10),
-            validate_non_null("Status", status, max_length=10),
-            validate_non_null("Coverage Description", coverage_description, max_length=100),
-        ]):
-            try:
-                query = """
-                    INSERT INTO Application (Application_ID, Customer_ID, Vehicle_ID, Status, Coverage_Description)
-                    VALUES (?, ?, ?, ?, ?)
-                """
-                cursor.execute(query, application_id, customer_id, vehicle_id, status, coverage_description)
-                connection.commit()
-                flash("Application added successfully.", "success")
-                return redirect(url_for("index"))
-            except pyodbc.Error as e:
-                flash(f"Error inserting Application: {e}", "error")
-
-    return render_template("add_application.html")
-
-
-@app.route("/add_policy", methods=["GET", "POST"])
-def add_policy():
-    if request.method == "POST":
-        policy_number = request.form["policy_number"]
-        application_id = request.form["application_id"]
-        start_date = request.form["start_date"]
-        expiry_date = request.form["expiry_date"]
-        terms = request.form.get("terms")  # Optional
-
-        if all([
-            validate_non_null("Policy Number", policy_number, max_length=20),
-            validate_non_null("Application ID", application_id, max_length=10),
-            validate_non_null("Start Date", start_date),
-            validate_non_null("Expiry Date", expiry_date),
-        ]):
-            try:
-                query = """
-                    INSERT INTO Policy (Policy_Number, Application_ID, Start_Date, Expiry_Date, Terms)
-                    VALUES (?, ?, ?, ?, ?)
-                """
-                cursor.execute(query, policy_number, application_id, start_date, expiry_date, terms)
-                connection.commit()
-                flash("Policy added successfully.", "success")
-                return redirect(url_for("index"))
-            except pyodbc.Error as e:
-                flash(f"Error inserting Policy: {e}", "error")
-
-    return render_template("add_policy.html")
-
-@app.route("/add_premium_payment", methods=["GET", "POST"])
-def add_premium_payment():
-    if request.method == "POST":
-        payment_id = request.form["payment_id"]
-        policy_number = request.form["policy_number"]
-        amount = request.form["amount"]
-        payment_date = request.form["payment_date"]
-        receipt_id = request.form["receipt_id"]
-
-        if all([
-            validate_non_null("Payment ID", payment_id, max_length=10),
-            validate_non_null("Policy Number", policy_number, max_length=20),
-            validate_non_null("Amount", amount),
-            validate_non_null("Payment Date", payment_date),
-            validate_non_null("Receipt ID", receipt_id, max_length=20)
-        ]):
-
-            try:
-                query = """
-                    INSERT INTO Premium_Payment (Payment_ID, Policy_Number, Amount, Payment_Date, Receipt_ID)
-                    VALUES (?, ?, ?, ?, ?)
-                """
-                cursor.execute(query, payment_id, policy_number, amount, payment_date, receipt_id)
-                connection.commit()
-                flash("Premium Payment added successfully.", "success")
-                return redirect(url_for("index"))
-            except pyodbc.IntegrityError as e:
-                flash(f"Error inserting Premium Payment: {e}", "error")
-
-    return render_template("add_premium_payment.html")
-
-
-@app.route("/add_claim", methods=["GET", "POST"])
-def add_claim():
-    if request.method == "POST":
-        claim_id = request.form["claim_id"]
-        policy_number = request.form["policy_number"]
-        amount = request.form["amount"]
-        incident_id = request.form["incident_id"]
-        damage_type = request.form["damage_type"]
-        date = request.form["date"]
-        status = request.form["status"]
-
-        if all([
-            validate_non_null("Claim ID", claim_id, max_length=10),
-            validate_non_null("Policy Number", policy_number, max_length=20),
-            validate_non_null("Amount", amount),
-            validate_non_null("Incident ID", incident_id, max_length=10),
-            validate_non_null("Damage Type", damage_type, max_length=20),
-            validate_non_null("Date", date),
-            validate_non_null("Status", status, max_length=20)
-        ]):
-            try:
-                query = """
-                    INSERT INTO Claim (Claim_ID, Policy_Number, Amount, Incident_ID, Damage_Type, Date, Status)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """
-                cursor.execute(query, claim_id, policy_number, amount, incident_id, damage_type, date, status)
-                connection.commit()
-                flash("Claim added successfully.", "success")
-                return redirect(url_for("index"))
-            except pyodbc.IntegrityError as e:
-                flash(f"Error inserting Claim: {e}", "error")
-
-    return render_template("add_claim.html")
-
-
-@app.route("/add_claim_settlement", methods=["GET", "POST"])
-def add_claim_settlement():
-    if request.method == "POST":
-        settlement_id = request.form["settlement_id"]
-        claim_id = request.form["claim_id"]
-        amount_paid = request.form["amount_paid"]
-        settlement_date = request.form["settlement_date"]
-
-        if all([
-            validate_non_null("Settlement ID", settlement_id, max_length=10),
-            validate_non_null("Claim ID", claim_id, max_length=10),
-            validate_non_null("Amount Paid", amount_paid),
-            validate_non_null("Settlement Date", settlement_date)
-        ]):
-            try:
-                query = """
-                    INSERT INTO Claim_Settlement (Settlement_ID, Claim_ID, Amount_Paid, Settlement_Date)
-                    VALUES (?, ?, ?, ?)
-                """
-                cursor.execute(query, settlement_id, claim_id, amount_paid, settlement_date)
-                connection.commit()
-                flash("Claim Settlement added successfully.", "success")
-                return redirect(url_for("index"))
-            except pyodbc.IntegrityError as e:
-                flash(f"Error inserting Claim Settlement: {e}", "error")
-
-    return render_template("add_claim_settlement.html")
-
-
-@app.route("/add_risk_assessment", methods=["GET", "POST"])
-def add_risk_assessment():
-    if request.method == "POST":
-        assessment_id = request.form["assessment_id"]
-        customer_id = request.form["customer_id"]
-        age = request.form["age"]
-        health_status = request.form["health_status"]
-        risk_level = request.form["risk_level"]
-        premium_multiplier = request.form["premium_multiplier"]
-
-        if all([
-            validate_non_null("Assessment ID", assessment_id, max_length=10),
-            validate_non_null("Customer ID", customer_id, max_length=10),
-            validate_non_null("Age", age),
-            validate_non_null("Health Status", health_status, max_length=100),
-            validate_non_null("Risk Level", risk_level, max_length=20),
-            validate_non_null("Premium Multiplier", premium_multiplier)
-        ]):
-
-            try:
-                query = """
-                    INSERT INTO Risk_Assessment (Assessment_ID, Customer_ID, Age, Health_Status, Risk_Level, Premium_Multiplier)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """
-                cursor.execute(query, assessment_id, customer_id, age, health_status, risk_level, premium_multiplier)
-                connection.commit()
-                flash("Risk Assessment added successfully.", "success")
-                return redirect(url_for("index"))
-            except pyodbc.IntegrityError as e:
-                flash(f"Error inserting Risk Assessment: {e}", "error")
-
-    return render_template("add_risk_assessment.html")
-
-
-@app.route("/add_reinsurance_info", methods=["GET", "POST"])
-def add_reinsurance_info():
-    if request.method == "POST":
-        reinsurance_id = request.form["reinsurance_id"]
-        policy_number = request.form["policy_number"]
-        reinsurer_name = request.form["reinsurer_name"]
-        reinsurance_type = request.form["reinsurance_type"]
-        coverage_limit = request.form["coverage_limit"]
-        deductible = request.form["deductible"]
-
-        if all([
-            validate_non_null("Reinsurance ID", reinsurance_id, max_length=10),
-            validate_non_null("Policy Number", policy_number, max_length=20),
-            validate_non_null("Reinsurer Name", reinsurer_name, max_length=100),
-            validate_non_null("Reinsurance Type", reinsurance_type, max_length=50),
-            validate_non_null("Coverage Limit", coverage_limit),
-            validate_non_null("Deductible", deductible)
-        ]):
-
+        try:
+            params = spec.convert_form(request.form)
+        except registry.RowError as e:
+            for error in e.errors:
+                flash(error, "error")
+        else:
             try:
-                query = """
-                    INSERT INTO Reinsurance_Info (Reinsurance_ID, Policy_Number, Reinsurer_Name, Reinsurance_Type, Coverage_Limit, Deductible)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """
-                cursor.execute(query, reinsurance_id, policy_number, reinsurer_name, reinsurance_type, coverage_limit, deductible)
+                connection = get_db()
+                cursor = connection.cursor()
+                cursor.execute(spec.insert.sql, params)
                 connection.commit()
-                flash("Reinsurance Information added successfully.", "success")
+                row = dict(zip(spec.columns, params))
+                audit_writer.record(table_name, "INSERT", audit_user(), new_data=row)
+                record_added(table_name, row)
+                flash(f"{spec.label} added successfully.", "success")
                 return redirect(url_for("index"))
-            except pyodbc.IntegrityError as e:
-                flash(f"Error inserting Reinsurance Info: {e}", "error")
-
-    return render_template("add_reinsurance_info.html")
-
+            except db_pool.DatabaseError as e:
+                flash(f"Error inserting {spec.label}: {e}", "error")
 
-@app.route("/add_feedback_info", methods=["GET", "POST"])
-def add_feedback_info():
-    if request.method == "POST":
-        feedback_id = request.form["feedback_id"]
-        customer_id = request.form["customer_id"]
-        feedback_type = request.form["feedback_type"]
-        rating = request.form["rating"]
-        feedback_text = request.form["feedback_text"]
-        feedback_date = request.form["feedback_date"]
-
-        if all([
-            validate_non_null("Feedback ID", feedback_id, max_length=10),
-            validate_non_null("Customer ID", customer_id, max_length=10),
-            validate_non_null("Feedback Type", feedback_type, max_length=50),
-            validate_non_null("Rating", rating),
-            validate_non_null("Feedback Text", feedback_text),
-            validate_non_null("Feedback Date", feedback_date)
-        ]):
-            try:
-                query = """
-                    INSERT INTO Feedback_Info (Feedback_ID, Customer_ID, Feedback_Type, Rating, Feedback_Text, Feedback_Date)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                """
-                cursor.execute(query, feedback_id, customer_id, feedback_type, rating, feedback_text, feedback_date)
-                connection.commit()
-                flash("Feedback Information added successfully.", "success")
-                return redirect(url_for("index"))
-            except pyodbc.IntegrityError as e:
-                flash(f"Error inserting Feedback Info: {e}", "error")
+    return render_template(f"add_{table_name.lower()}.html")
 
-    return render_template("add_feedback_info.html")
 
-@app.route("/add_staff", methods=["GET", "POST"])
-def add_staff():
-    if request.method == "POST":
-        staff_id = request.form["staff_id"]
-        company_id = request.form["company_id"]
-        first_name = request.form["first_name"]
-        last_name = request.form["last_name"]
-        address = request.form["address"]
-        position = request.form["position"]
-        contact_number = request.form["contact_number"]
-        email = request.form["email"]
+# work that has to happen after a row is added to some tables, keyed by table name
+AFTER_INSERT = {
+    # a cached user must not outlive a change to its Staff row
+    "Staff": lambda row: user_cache.invalidate(row["Staff_ID"]),
+    # the renewal work list includes new policies and payments without waiting for the next scan
+    "Policy": lambda row: renewal_index.add_policy(row, get_db()),
+    "Premium_Payment": lambda row: renewal_index.add_payment(row),
+}
 
-        if all([
-            validate_non_null("Staff ID", staff_id, max_length=10),
-            validate_non_null("Company ID", company_id, max_length=10),
-            validate_non_null("First Name", first_name, max_length=50),
-            validate_non_null("Last Name", last_name, max_length=50),
-            validate_non_null("Address", address, max_length=50),
-            validate_non_null("Position", position, max_length=50),
-            validate_non_null("Contact Number", contact_number, max_length=15),
-            validate_non_null("Email", email, max_length=100)
-        ]):
-            try:
-                query = """
-                    INSERT INTO Staff (Staff_ID, Company_ID, First_Name, Last_Name, Address, Position, Contact_Number, Email)
-                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-                """
-                cursor.execute(query, staff_id, company_id, first_name, last_name, address, position, contact_number, email)
-                connection.commit()
-                flash("Staff added successfully.", "success")
-                return redirect(url_for("index"))
-            except pyodbc.IntegrityError as e:
-                flash(f"Error inserting Staff: {e}", "error")
-
-    return render_template("add_staff.html")
+# the row is in the database by now, so a failure in the caches and indexes kept next to it is
+# logged rather than shown as a failed insert. the background jobs bring them up to date later
+def record_added(table_name, row):
+    try:
+        query_cache.table_changed(table_name)
+        after_insert = AFTER_INSERT.get(table_name)
+        if after_insert:
+            after_insert(row)
+        dashboard_summary.record_insert(table_name, row)
+        text_index.record_insert(table_name, row)
+    except Exception:
+        app.logger.exception("Updating the caches after adding a %s row failed", table_name)
+
+
+# the same for a CSV import (a whole job) into some tables, once it has finished
+AFTER_IMPORT = {
+    # a merge can change any number of Staff rows, so none of the cached users are kept
+    "Staff": lambda job: user_cache.clear(),
+}
+
+
+# called on the import worker when a job has finished. the home page numbers, the search index and
+# the revenue rollup are refreshed straight away rather than at their next turn
+def import_finished(job):
+    if job.table_name in AFTER_IMPORT:
+        AFTER_IMPORT[job.table_name](job)
+    scheduled_jobs.run_soon(dashboard_job)
+    scheduled_jobs.run_soon(search_job)
+    scheduled_jobs.run_soon(rollup_job)
+
+
+for table_name in registry.TABLES:
+    endpoint = f"add_{table_name.lower()}"
+    if os.path.exists(os.path.join(app.root_path, app.template_folder, f"{endpoint}.html")):
+        app.add_url_rule(
+            f"/{endpoint}", endpoint, add_record, methods=["GET", "POST"], defaults={"table_name": table_name}
+        )
 
 # allows the user to upload a csv. if its a post request then obtain the table name and file and store
-# them in separate variables. if the file exists and is a csv then read the csv using the csv library
-# skip the header row if it exists, then insert the records into the table using a for loop
-
-# the query is constructed dynamically using the construct insert query function. 
+# them in separate variables. if the file exists and is a csv it is saved to the spool folder and
+# queued as an import job, and the request returns the job's ID (as json, with status 202, if the
+# client asked for json) without waiting for the import. /jobs/<id> reports how it is going.
+
+# the job reads the file with pandas CSV_BATCH_SIZE rows at a time (the whole file is never read into
+# memory) and the header row gives the column names. every chunk is validated as a whole before it
+# is inserted, including a check that its foreign keys exist (see fk_filter.py). rows that fail are
+# written to a reject file with the reason (which can be downloaded from /rejects/<file>) and the
+# rest are inserted by the bulk loader, which sends one parameterized insert per batch of rows and
+# commits each batch. if a batch fails, uploading the same file again resumes after the last
+# committed batch.
+
+# with mode=merge the file is merged instead (see merge_loader.py): rows whose key is already in the
+# table are updated if they changed and skipped if they did not, so a corrected file can be sent again
 @app.route("/upload_csv", methods=["GET", "POST"])
 def upload_csv():
     if request.method == "POST":
@@ -700,30 +482,130 @@ def upload_csv():
         file = request.files["csv_file"]
 
         if file and file.filename.endswith('csv'):
-            csv_content = csv.reader(file.stream)
-
-            header = next(csv_content)
-
-            # Insert records into the selected table
             try:
-                for row in csv_content:
-                    insert_query = construct_insert_query(table_name, header, row)
-                    cursor.execute(insert_query)
-                connection.commit()
-                flash(f"Records successfully inserted into {table_name}.", "success")
-                return redirect(url_for("upload_csv"))
-            except Exception as e:
-                flash(f"Error inserting records: {str(e)}", "error")
+                registry.get(table_name)
+                mode = request.form.get("mode", "insert")
+                if mode not in jobs.MODES:
+                    raise registry.RegistryError(f"Unknown import mode: {mode}")
+                job = upload_jobs.submit(table_name, file.filename, file, changed_by=audit_user(), mode=mode)
+            except (registry.RegistryError, jobs.QueueFull) as e:
+                flash(str(e), "error")
+                return render_template("upload_csv.html")
+
+            status_url = url_for("job_status", job_id=job.id)
+            if request.accept_mimetypes.best == "application/json":
+                return jsonify({"job_id": job.id, "status_url": status_url}), 202
+            flash(
+                f"{file.filename} was queued for import into {table_name} as job {job.id}. "
+                f"Follow its progress at {status_url}.",
+                "success",
+            )
+            return redirect(url_for("upload_csv"))
 
     return render_template("upload_csv.html")
 
-# to generate a record, get the table name and header for every row in the csv
-# then return the f string which dynamically constructs the query. 
-def construct_insert_query(table_name, header, row):
-    columns = ', '.join(header)
-    values = ', '.join([f"'{value}'" for value in row])
-    return f"INSERT INTO {table_name} ({columns}) VALUES ({values})"
+# the progress of an upload's import job as json: its state, rows processed / rejected, throughput
+# and estimated time left, plus a link to the reject file once there is one
+@app.route("/jobs/<job_id>")
+@login_required
+def job_status(job_id):
+    status = upload_jobs.status(job_id)
+    if status is None:
+        abort(404)
+    if status["reject_file"]:
+        status["reject_url"] = url_for("download_rejects", file_name=status["reject_file"])
+    return jsonify(status)
+
+# the monthly revenue, claims paid, expenses and profit as json, in calendar order. the report only
+# reads Revenue_Expenses; the new payments and settlements are rolled up into it in the background
+# (see REVENUE_ROLLUP_INTERVAL) or by revenue_rollup.py
+@app.route("/reports/revenue")
+@login_required
+def revenue_report():
+    report = report_cache.get("revenue")
+    if report is cache.MISSING:
+        report = revenue_rollup.report(get_db())
+        report_cache.set("revenue", report)
+    response = jsonify(report)
+    response.headers["Cache-Control"] = f"private, max-age={REPORT_CACHE_TTL}"
+    return response
+
+# the renewal work list as json: the policies expiring in the next `days` days (at most the renewal
+# horizon), soonest first, with each one's latest payment and whether it is overdue. the list comes
+# from the in-memory renewal index, and the pages asked for are cached until the index changes
+@app.route("/renewals")
+@login_required
+def renewal_list():
+    days = min(max(request.args.get("days", default=30, type=int), 0), RENEWAL_HORIZON_DAYS)
+    limit = min(max(request.args.get("limit", default=500, type=int), 1), 5000)
+    offset = max(request.args.get("offset", default=0, type=int), 0)
+    today = date.today()
+    if not renewal_index.covers(days, today):
+        # no scan yet, or the last one is from an earlier day
+        renewal_index.refresh(get_db(), today)
+
+    key = (today, days, limit, offset, renewal_index.version)
+    page = renewal_cache.get(key)
+    if page is cache.MISSING:
+        total, rows = renewal_index.work_list(days, today, limit=limit, offset=offset)
+        page = {"days": days, "as_of": today.isoformat(), "total": total, "offset": offset, "policies": rows}
+        renewal_cache.set(key, page)
+    response = jsonify(page)
+    response.headers["Cache-Control"] = f"private, max-age={REPORT_CACHE_TTL}"
+    return response
+
+# the customer service lookups as json, served from the query cache until the tables they read change
+@app.route("/customers/<customer_id>/policies")
+@login_required
+def customer_policies(customer_id):
+    return jsonify(lookups.run(query_results, get_db(), "customer_policies", customer_id))
+
+@app.route("/customers/<customer_id>/claims")
+@login_required
+def customer_claims(customer_id):
+    return jsonify(lookups.run(query_results, get_db(), "customer_claims", customer_id))
+
+@app.route("/policies/<policy_number>/payments")
+@login_required
+def policy_payments(policy_number):
+    return jsonify(lookups.run(query_results, get_db(), "policy_payments", policy_number))
+
+# ranked full-text search over incident and report descriptions, policy terms, coverage
+# descriptions and feedback, as json. takes
+#   ?q=broken windshield  -- the words to search for
+#   ?source=Incident      -- only search this table (can be repeated)
+#   ?limit=20&offset=0
+# the matches come from the in-memory search index, then the text of the page of results is read by key
+@app.route("/search")
+@login_required
+def search():
+    query = request.args.get("q", "")
+    sources = request.args.getlist("source")
+    unknown = [name for name in sources if name not in search_index.SOURCES]
+    if unknown:
+        return jsonify(error=f"Cannot search {', '.join(unknown)}"), 400
+    limit = min(max(request.args.get("limit", default=20, type=int), 1), 100)
+    offset = max(request.args.get("offset", default=0, type=int), 0)
+
+    total, results = text_index.search(query, limit=limit, offset=offset, sources=sources or None)
+    return jsonify({
+        "query": query,
+        "total": total,
+        "offset": offset,
+        "results": search_index.with_text(get_db(), results),
+    })
+
+# the reject file of an upload: the rejected rows as they were uploaded, with the row number and
+# the reason each one was rejected
+@app.route("/rejects/<file_name>")
+@login_required
+def download_rejects(file_name):
+    return send_from_directory(bulk_loader.REJECT_DIR, file_name, as_attachment=True)
 
 # run the app
 if __name__ == "__main__":
+    # with debug on, the reloader runs the app again in a child process (WERKZEUG_RUN_MAIN=true) and
+    # only keeps watching the files in this one, so the jobs are only started in the child
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_background_jobs()
     app.run(debug=True)
@@ -0,0 +1,293 @@
+# Audit trail for Audit_Log. Writing an audit row in the same request as every change would double
+# the request's round trips and commits, so changes are only recorded in memory: record() puts the
+# row on a bounded queue and returns, and a background thread writes whatever has queued up in
+# batches, with one executemany and one commit per batch.
+#
+# When the queue is full (the database is slow or down), record() waits up to put_timeout seconds
+# for room, which slows the callers down instead of letting the queue grow without limit. If there is
+# still no room the row is dropped and counted. If a batch is rejected while the connection is still
+# up, its rows are written one at a time so a bad row only loses itself. On shutdown the queue is
+# drained before the thread exits. stats() gives the queue depth and the flush latency for /metrics.
+
+######################################################
+
+# importing the necessary libraries
+
+import atexit
+import itertools
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+
+import registry
+
+######################################################
+
+DEFAULT_QUEUE_SIZE = 10000
+DEFAULT_BATCH_SIZE = 500
+
+# columns whose values are never written to the audit trail
+REDACTED_COLUMNS = {"Password"}
+
+# a batch whose connection failed is retried this many times (on a new connection) before it is dropped
+RETRIES = 3
+
+COLUMNS = ["Log_ID", "Table_Name", "Operation_Type", "Changed_By", "Change_Date", "Original_Data", "New_Data"]
+
+audit_log = logging.getLogger("insurance.audit")
+
+# upper case only: SQL server compares Log_IDs without regard to case
+_DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def _base36(number, width):
+    digits = []
+    for _ in range(width):
+        number, digit = divmod(number, 36)
+        digits.append(_DIGITS[digit])
+    return "".join(reversed(digits))
+
+
+# Log_IDs are 8 characters of milliseconds since 1970 (enough until 2059) followed by 2 characters of
+# a per process counter (started at a random value), so new rows always go at the end of the primary
+# key index instead of splitting pages all over it. two processes can still make the same ID in the
+# same millisecond; the row that loses is written again with a new one (see AuditWriter._write_row)
+_sequence = itertools.count(random.randrange(36 ** 2))
+
+
+def new_log_id():
+    return _base36(int(time.time() * 1000), 8) + _base36(next(_sequence), 2)
+
+
+# the row values as JSON, without the redacted columns
+def to_json(row):
+    if row is None:
+        return None
+    return json.dumps({key: "***" if key in REDACTED_COLUMNS else value for key, value in row.items()}, default=str)
+
+
+######################################################
+
+class AuditWriter:
+    def __init__(self, connect, max_queue=DEFAULT_QUEUE_SIZE, batch_size=DEFAULT_BATCH_SIZE, linger=0.05,
+                 put_timeout=5.0):
+        self._connect = connect
+        self.batch_size = batch_size
+        self.linger = linger
+        self.put_timeout = put_timeout
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._connection = None
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopped = False
+
+        self.insert_sql = registry.get("Audit_Log").prepare(COLUMNS).sql
+
+        # metrics, read through stats()
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.batches = 0
+        self.flush_seconds = 0.0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+
+    # starts the writer thread (once) and makes sure the queue is drained when the process exits
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+        return self
+
+    # queues one change. new_data / original_data are dictionaries of column values
+    def record(self, table_name, operation, changed_by, new_data=None, original_data=None):
+        if self._thread is None:
+            self.start()
+        row = (
+            new_log_id(),
+            table_name,
+            operation,
+            str(changed_by or "unknown")[:50],
+            datetime.now().isoformat(sep=" ", timespec="milliseconds"),
+            to_json(original_data),
+            to_json(new_data),
+        )
+        try:
+            self._queue.put(row, timeout=self.put_timeout)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            audit_log.error("Audit queue full, dropped %s %s by %s", operation, table_name, changed_by)
+            return
+        with self._lock:
+            self.recorded += 1
+
+    # writes everything still queued and stops the thread
+    def stop(self, timeout=30):
+        with self._lock:
+            if self._thread is None or self._stopped:
+                return
+            self._stopped = True
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    # waits for a row, then keeps collecting for up to `linger` seconds (or until the batch is full)
+    # so rows that arrive close together share one commit
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            rows = [] if first is None else [first]
+            stopping = first is None
+            deadline = time.monotonic() + self.linger
+            while len(rows) < self.batch_size and not stopping:
+                try:
+                    row = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if row is None:
+                    stopping = True
+                else:
+                    rows.append(row)
+            if rows:
+                self._flush(rows)
+            if stopping:
+                # anything queued after the stop marker is written too
+                leftover = []
+                while True:
+                    try:
+                        row = self._queue.get_nowait()
+                    except queue.Empty:
+                        break
+                    if row is not None:
+                        leftover.append(row)
+                for start in range(0, len(leftover), self.batch_size):
+                    self._flush(leftover[start:start + self.batch_size])
+                if self._connection is not None:
+                    self._connection.close()
+                return
+
+    def _insert(self, rows):
+        cursor = self._connection.cursor()
+        if hasattr(cursor, "fast_executemany"):
+            cursor.fast_executemany = True
+        cursor.executemany(self.insert_sql, rows)
+        self._connection.commit()
+
+    # writes one row on its own, and once more with a new Log_ID if that fails (another process may have
+    # taken the ID). returns whether it was written. raises if the connection itself has gone
+    def _write_row(self, row):
+        try:
+            self._insert([row])
+            return True
+        except Exception:
+            self._connection.rollback()
+        try:
+            self._insert([(new_log_id(),) + row[1:]])
+            return True
+        except Exception as e:
+            self._connection.rollback()
+            audit_log.error("Dropped audit row for %s %s by %s: %s", row[2], row[1], row[3], e)
+            return False
+
+    # writes the rows as one batch. if the batch is rejected but the connection is still good, the rows
+    # are written one at a time so only the bad ones are lost. if the connection fails, whatever is
+    # left is retried on a new one
+    def _flush(self, rows):
+        start = time.perf_counter()
+        pending = list(rows)
+        written = 0
+        failed = 0
+        one_at_a_time = False
+        for attempt in range(RETRIES):
+            try:
+                if self._connection is None:
+                    self._connection = self._connect()
+                if not one_at_a_time:
+                    try:
+                        self._insert(pending)
+                        written += len(pending)
+                        pending = []
+                    except Exception as e:
+                        self._connection.rollback()
+                        audit_log.warning("Writing %d audit rows failed, writing them one at a time: %s",
+                                          len(pending), e)
+                        one_at_a_time = True
+                while pending:
+                    if self._write_row(pending[0]):
+                        written += 1
+                    else:
+                        failed += 1
+                    pending.pop(0)
+                break
+            except Exception as e:
+                audit_log.warning("Writing %d audit rows failed (attempt %d): %s", len(pending), attempt + 1, e)
+                try:
+                    self._connection.close()
+                except Exception:
+                    pass
+                self._connection = None
+                time.sleep(min(2 ** attempt * 0.1, 1.0))
+        else:
+            failed += len(pending)
+            audit_log.error("Dropped %d audit rows after %d attempts", len(pending), RETRIES)
+
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.failed += failed
+            if not written:
+                return
+            self.written += written
+            self.batches += 1
+            self.flush_seconds += elapsed
+            self.last_flush_seconds = elapsed
+            self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_max": self._queue.maxsize,
+                "recorded": self.recorded,
+                "written": self.written,
+                "dropped": self.dropped,
+                "failed": self.failed,
+                "batches": self.batches,
+                "flush_seconds_total": self.flush_seconds,
+                "last_flush_seconds": self.last_flush_seconds,
+                "max_flush_seconds": self.max_flush_seconds,
+            }
+
+
+# bulk loads (and merges, see merge_loader.py) are recorded as one row per load, with the file and
+# the row counts as New_Data, instead of one audit row per loaded row
+BULK_INSERT = "BULK INSERT"
+MERGE = "MERGE"
+
+
+def load_summary(file_name, result):
+    summary = {
+        "file": file_name,
+        "rows": result.get("rows", 0),
+        "skipped": result.get("skipped", 0),
+        "rejected": result.get("rejected", 0),
+    }
+    for key in ("inserted", "updated", "unchanged", "duplicates"):
+        if key in result:
+            summary[key] = result[key]
+    return summary
+
+
+# the user name recorded for changes made from the command line scripts
+def script_user():
+    try:
+        return f"script:{os.getlogin()}"
+    except OSError:
+        return "script"
@@ -0,0 +1,98 @@
+# Benchmark for migration 001 (secondary indexes). Builds the schema in a local sqlite database,
+# seeds it with synthetic rows from datagen.py, and times the hot lookups before and after the
+# migration is applied, printing each query's plan so the switch from a table scan to an index
+# seek is visible.
+#
+# usage: python bench_indexes.py [--customers N] [--repeat N]
+
+######################################################
+
+# importing the necessary libraries
+
+import argparse
+import random
+import sqlite3
+import time
+
+import numpy as np
+
+import datagen
+import migrate
+
+######################################################
+
+# the lookups the indexes are meant for, with a function that picks a random parameter for each
+# (n is the scale, the number of customers, the database was seeded with)
+QUERIES = [
+    ("login by email",
+     "SELECT Staff_ID, Email, Password FROM Staff WHERE Email = ?",
+     lambda n: (f"staff{random.randrange(datagen.row_counts(n)['Staff'])}@insurance.com",)),
+    ("claims of a policy",
+     "SELECT Claim_ID, Amount, Status FROM Claim WHERE Policy_Number = ?",
+     lambda n: (random_id("Policy", n),)),
+    ("pending claim count",
+     "SELECT COUNT(*) FROM Claim WHERE Status = ?",
+     lambda n: ("Pending",)),
+    ("payments of a policy",
+     "SELECT Payment_ID, Amount, Payment_Date FROM Premium_Payment WHERE Policy_Number = ? ORDER BY Payment_Date",
+     lambda n: (random_id("Policy", n),)),
+    ("payments in a month",
+     "SELECT COUNT(*), SUM(Amount) FROM Premium_Payment WHERE Payment_Date BETWEEN ? AND ?",
+     lambda n: ("2023-03-01", "2023-03-31")),
+    ("vehicles of a customer",
+     "SELECT Vehicle_ID, Registration_Number FROM Vehicle WHERE Customer_ID = ?",
+     lambda n: (random_id("Customer", n),)),
+    ("applications of a customer",
+     "SELECT Application_ID, Status FROM Application WHERE Customer_ID = ?",
+     lambda n: (random_id("Customer", n),)),
+]
+
+# the tables the queries touch
+SEEDED_TABLES = ["Staff", "Vehicle", "Application", "Premium_Payment", "Claim"]
+
+
+# the id of a random existing row of table_name, in the format datagen.py generates
+def random_id(table_name, n):
+    return datagen.ids(table_name, np.array([random.randrange(datagen.row_counts(n)[table_name])]))[0]
+
+
+# runs every query `repeat` times with random parameters and returns {name: (plan, average ms)}
+def run_queries(connection, customers, repeat):
+    results = {}
+    cursor = connection.cursor()
+    for name, query, make_params in QUERIES:
+        plan = " / ".join(row[-1] for row in cursor.execute("EXPLAIN QUERY PLAN " + query, make_params(customers)))
+        start = time.perf_counter()
+        for _ in range(repeat):
+            cursor.execute(query, make_params(customers)).fetchall()
+        results[name] = (plan, (time.perf_counter() - start) / repeat * 1000)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the hot lookups before and after migration 001.")
+    parser.add_argument("--customers", type=int, default=100000, help="number of customers to seed")
+    parser.add_argument("--repeat", type=int, default=50, help="times each query is run")
+    parser.add_argument("--seed", type=int, default=1, help="random seed for the synthetic data")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    connection = sqlite3.connect(":memory:")
+    datagen.create_sqlite_schema(connection)
+    datagen.load_into(connection, args.customers, seed=args.seed, tables=SEEDED_TABLES)
+
+    before = run_queries(connection, args.customers, args.repeat)
+    migrate.migrate(connection, target=1)
+    connection.execute("ANALYZE")
+    after = run_queries(connection, args.customers, args.repeat)
+
+    for name, _, _ in QUERIES:
+        plan_before, ms_before = before[name]
+        plan_after, ms_after = after[name]
+        print(f"{name}: {ms_before:.3f} ms -> {ms_after:.3f} ms ({ms_before / ms_after:.0f}x)")
+        print(f"    before: {plan_before}")
+        print(f"    after:  {plan_after}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+# Load-test harness for the three insert paths: the web upload (/upload_csv, timed until its import
+# job has finished), the supplement script's uploader() (bulk_loader.load_csv_file) and the
+# single-row add_... routes, plus the chunk validation stage of the bulk loads on its own. Every path is fed the same synthetic rows from
+# datagen.py and runs against a fresh local sqlite stand-in database, so the numbers of different
+# runs (and branches) can be compared directly.
+#
+# usage: python bench_load.py [--scale N] [--tables Customer,Policy,...] [--add-rows N]
+#                             [--save results.json] [--compare baseline.json]
+
+######################################################
+
+# importing the necessary libraries
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from unittest import mock
+
+import bulk_loader
+import chunk_validation
+import datagen
+import jobs
+
+######################################################
+
+DEFAULT_TABLES = "Customer,Vehicle,Incident,Application,Policy,Premium_Payment,Claim"
+
+
+# creates an empty copy of the schema at path, with one staff member the benchmark can log in as
+def create_stand_in_db(path):
+    connection = sqlite3.connect(path)
+    datagen.create_sqlite_schema(connection)
+    connection.execute(
+        "INSERT INTO Staff (Staff_ID, Company_ID, First_Name, Last_Name, Address, Position, Email, Password) "
+        "VALUES ('BENCH00001', 'CO00000000', 'Bench', 'User', 'Nowhere', 'Tester', 'bench@insurance.com', 'bench')"
+    )
+    connection.commit()
+    connection.close()
+
+
+# points the app (and everything else using db_pool.connect) at a new, empty stand-in database
+def fresh_db(work_dir, name, pool=None):
+    path = os.path.join(work_dir, f"{name}.db")
+    create_stand_in_db(path)
+    os.environ["INSURANCE_SQLITE_PATH"] = path
+    if pool is not None:
+        pool.close()
+    return path
+
+
+def count_rows(path, tables):
+    connection = sqlite3.connect(path)
+    try:
+        return sum(connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in tables)
+    finally:
+        connection.close()
+
+
+def logged_in_client(app):
+    client = app.test_client()
+    client.post("/login", data={"email": "bench@insurance.com", "password": "bench"})
+    return client
+
+
+######################################################
+
+# the benchmarks. each returns (rows inserted, seconds)
+
+# uploads every file and waits for its import job before uploading the next one, so child tables
+# find their parents already loaded
+def bench_upload_csv(app, upload_jobs, files, tables):
+    client = logged_in_client(app)
+    start = time.perf_counter()
+    for table_name in tables:
+        with open(files[table_name], "rb") as f:
+            response = client.post(
+                "/upload_csv",
+                data={"table_name": table_name, "csv_file": (f, os.path.basename(files[table_name]))},
+                content_type="multipart/form-data",
+                headers={"Accept": "application/json"},
+            )
+        upload_jobs.wait(response.get_json()["job_id"])
+    return time.perf_counter() - start
+
+
+# the validation stage on its own: every file is read in chunks and split into valid and rejected rows
+def bench_validation(files, tables, chunk_size=bulk_loader.DEFAULT_BATCH_SIZE):
+    rows = 0
+    start = time.perf_counter()
+    for table_name in tables:
+        validator = None
+        for chunk in bulk_loader.read_csv_frames(files[table_name], chunk_size):
+            if validator is None:
+                validator = chunk_validation.ChunkValidator(table_name, list(chunk.columns))
+            valid, _ = validator.split(chunk)
+            rows += len(valid)
+    return rows, time.perf_counter() - start
+
+
+def bench_uploader(supplement, files, tables):
+    start = time.perf_counter()
+    for table_name in tables:
+        # uploader() asks for the file and the table on stdin
+        with mock.patch("builtins.input", side_effect=[files[table_name], table_name]), \
+                contextlib.redirect_stdout(io.StringIO()):
+            supplement.uploader()
+    return time.perf_counter() - start
+
+
+# posts the first `rows` generated rows of every table to its add_... route. the forms use the
+# lower cased column names as field names
+def bench_add_routes(app, scale, seed, tables, rows):
+    client = logged_in_client(app)
+    forms = []
+    for table_name in tables:
+        chunk = next(datagen.generate_table(table_name, scale, seed, chunk_size=rows))
+        for record in chunk.astype(str).to_dict("records"):
+            forms.append((f"/add_{table_name.lower()}", {column.lower(): value for column, value in record.items()}))
+
+    start = time.perf_counter()
+    for url, form in forms:
+        client.post(url, data=form)
+    return time.perf_counter() - start
+
+
+######################################################
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the CSV upload, uploader() and add_... insert paths.")
+    parser.add_argument("--scale", type=int, default=10000, help="datagen scale (number of customers)")
+    parser.add_argument("--seed", type=int, default=0, help="datagen seed")
+    parser.add_argument("--tables", default=DEFAULT_TABLES, help="comma separated tables to load")
+    parser.add_argument("--add-rows", type=int, default=200, help="rows per table posted to the add_... routes")
+    parser.add_argument("--save", help="write the results to this json file")
+    parser.add_argument("--compare", help="json file from an earlier --save run to compare against")
+    args = parser.parse_args()
+
+    tables = args.tables.split(",")
+    work_dir = tempfile.mkdtemp(prefix="bench_load_")
+    files = dict(datagen.write_csv(os.path.join(work_dir, "csv"), args.scale, args.seed, tables=tables))
+
+    # keep the checkpoint and reject files of the benchmark out of the app's folders
+    bulk_loader.CHECKPOINT_DIR = os.path.join(work_dir, "checkpoints")
+    bulk_loader.REJECT_DIR = os.path.join(work_dir, "rejects")
+    jobs.SPOOL_DIR = os.path.join(work_dir, "spool")
+
+    # the app and the supplement script connect to the database when they are imported. the app's
+    # background jobs would compete with the loads being measured, so they are not started
+    uploader_db = fresh_db(work_dir, "uploader")
+    os.environ["INSURANCE_SCHEDULER"] = "0"
+    import insurance_supplement
+    from app import app, pool, upload_jobs
+
+    results = {}
+
+    results["validation"] = bench_validation(files, tables)
+
+    seconds = bench_uploader(insurance_supplement, files, tables)
+    results["uploader"] = (count_rows(uploader_db, tables), seconds)
+
+    db_path = fresh_db(work_dir, "upload_csv", pool)
+    seconds = bench_upload_csv(app, upload_jobs, files, tables)
+    results["upload_csv"] = (count_rows(db_path, tables), seconds)
+
+    db_path = fresh_db(work_dir, "add_routes", pool)
+    seconds = bench_add_routes(app, args.scale, args.seed, tables, args.add_rows)
+    results["add_routes"] = (count_rows(db_path, tables), seconds)
+
+    baseline = {}
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    print(f"{'path':<12} {'rows':>10} {'seconds':>9} {'rows/sec':>10} {'vs baseline':>12}")
+    summary = {}
+    for name, (rows, seconds) in results.items():
+        rate = rows / seconds if seconds else 0.0
+        summary[name] = {"rows": rows, "seconds": seconds, "rows_per_second": rate}
+        change = ""
+        if name in baseline and baseline[name]["rows_per_second"]:
+            change = f"{rate / baseline[name]['rows_per_second']:.2f}x"
+        print(f"{name:<12} {rows:>10} {seconds:>9.2f} {rate:>10.0f} {change:>12}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump({"scale": args.scale, "seed": args.seed, "tables": tables, **summary}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+# Benchmark for the connection pool. Runs the flask app against a local sqlite stand-in database and
+# measures how many requests per second the app serves as the number of concurrent clients grows.
+#
+# usage: python bench_pool.py [--duration SECONDS] [--pool-size N] [--concurrency 1,2,4,8,16]
+
+######################################################
+
+# importing the necessary libraries
+
+import argparse
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+######################################################
+
+# creates a throwaway sqlite database with a Staff table so the login route has something to query
+def create_stand_in_db(path):
+    connection = sqlite3.connect(path)
+    connection.execute("""
+        CREATE TABLE Staff (
+            Staff_ID VARCHAR(10) PRIMARY KEY, Company_ID VARCHAR(10), First_Name VARCHAR(50),
+            Last_Name VARCHAR(50), Address VARCHAR(50), Position VARCHAR(50),
+            Contact_Number VARCHAR(15), Email VARCHAR(100), Password VARCHAR(20)
+        )
+    """)
+    connection.execute(
+        "INSERT INTO Staff VALUES ('STF0001', 'COMP001', 'John', 'Doe', '123 Elm Street', "
+        "'Insurance Agent', '+1-1234567890', 'john.doe@insurance.com', 'Morocco')"
+    )
+    connection.commit()
+    connection.close()
+
+
+# every client thread posts a failed login (one Staff lookup plus a template render) in a loop
+# until the deadline passes, and counts how many requests it got through
+def run_clients(app, concurrency, duration):
+    counts = [0] * concurrency
+    deadline = time.perf_counter() + duration
+
+    def client(index):
+        test_client = app.test_client()
+        while time.perf_counter() < deadline:
+            test_client.post("/login", data={"email": "nobody@insurance.com", "password": "x"})
+            counts[index] += 1
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return sum(counts) / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the app's connection pool.")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds to run each concurrency level")
+    parser.add_argument("--pool-size", type=int, default=10, help="maximum number of pooled connections")
+    parser.add_argument("--concurrency", default="1,2,4,8,16,32", help="comma separated client counts")
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), "bench_pool.db")
+    create_stand_in_db(db_path)
+
+    # the app reads these when it is imported. its background jobs would compete with the requests
+    # being measured, so they are not started
+    os.environ["INSURANCE_SQLITE_PATH"] = db_path
+    os.environ["INSURANCE_POOL_SIZE"] = str(args.pool_size)
+    os.environ["INSURANCE_SCHEDULER"] = "0"
+    from app import app, pool
+
+    print(f"{'clients':>8} {'req/s':>10} {'avg wait ms':>12} {'max wait ms':>12} {'failures':>9}")
+    for concurrency in [int(c) for c in args.concurrency.split(",")]:
+        pool.reset_stats()
+        requests_per_second = run_clients(app, concurrency, args.duration)
+        stats = pool.stats()
+        print(
+            f"{concurrency:>8} {requests_per_second:>10.1f} {stats['wait_time_avg'] * 1000:>12.3f} "
+            f"{stats['wait_time_max'] * 1000:>12.3f} {stats['checkout_failures']:>9}"
+        )
+
+    pool.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+# Benchmark for the segmentation job (segmentation.py) at 1M and 10M customers. For every scale a
+# sqlite stand-in database is filled with datagen.py (Customer, Vehicle, Application, Policy,
+# Premium_Payment and Claim), migrated, and segmented, and the time of every step of the job is
+# printed with its throughput. The databases are kept in --db-dir, so later runs at the same scale
+# and seed skip the (slow) data generation.
+#
+# usage: python bench_segmentation.py [--scales 1000000,10000000] [--segments K] [--seed N]
+#                                     [--db-dir DIR] [--save results.json]
+
+######################################################
+
+# importing the necessary libraries
+
+import argparse
+import json
+import os
+import sqlite3
+import tempfile
+import time
+
+import datagen
+import migrate
+import segmentation
+
+######################################################
+
+TABLES = ["Customer", "Vehicle", "Application", "Policy", "Premium_Payment", "Claim"]
+
+
+# the stand-in database for one scale, generated the first time it is needed
+def stand_in_db(db_dir, scale, seed):
+    path = os.path.join(db_dir, f"segmentation_{scale}_{seed}.db")
+    if os.path.exists(path):
+        return path, 0.0
+
+    start = time.perf_counter()
+    connection = sqlite3.connect(path + ".tmp")
+    try:
+        datagen.create_sqlite_schema(connection)
+        datagen.load_into(connection, scale, seed, tables=TABLES)
+        migrate.migrate(connection)
+    finally:
+        connection.close()
+    os.replace(path + ".tmp", path)
+    return path, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the segmentation job at 1M and 10M customers.")
+    parser.add_argument("--scales", default="1000000,10000000", help="comma separated numbers of customers")
+    parser.add_argument("--segments", type=int, default=segmentation.DEFAULT_SEGMENTS, help="number of segments")
+    parser.add_argument("--seed", type=int, default=0, help="datagen and segmentation seed")
+    parser.add_argument("--chunk-size", type=int, default=segmentation.DEFAULT_CHUNK_SIZE, help="customers per chunk")
+    parser.add_argument("--db-dir", default=tempfile.gettempdir(), help="where the stand-in databases are kept")
+    parser.add_argument("--save", help="write the results to this json file")
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'customers':>10} {'generate':>9} {'extract':>8} {'train':>8} {'assign':>8} {'write':>8} "
+          f"{'total':>8} {'rows/sec':>10}")
+    for scale in (int(value) for value in args.scales.split(",")):
+        path, generate = stand_in_db(args.db_dir, scale, args.seed)
+
+        os.environ["INSURANCE_SQLITE_PATH"] = path
+        connection = sqlite3.connect(path)
+        try:
+            result = segmentation.run(
+                connection, args.segments, args.seed, args.chunk_size, work_dir=args.db_dir,
+                model_path=os.path.join(args.db_dir, f"segments_{scale}.npz"),
+            )
+        finally:
+            connection.close()
+
+        seconds = result["seconds"]
+        total = sum(seconds.values())
+        results[scale] = {"generate": generate, **seconds, "total": total, "passes": result["passes"],
+                          "rows_per_second": result["customers"] / total if total else 0.0}
+        print(f"{result['customers']:>10} {generate:>9.1f} {seconds['extract']:>8.1f} {seconds['train']:>8.1f} "
+              f"{seconds['assign']:>8.1f} {seconds['write']:>8.1f} {total:>8.1f} "
+              f"{results[scale]['rows_per_second']:>10.0f}")
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,265 @@
+# Bulk loading engine used by the /upload_csv route. Instead of building and executing one INSERT
+# string per CSV row, it takes the table's prepared INSERT from the registry (which also checks every
+# row against the column definitions) and sends the rows to the server in batches with executemany
+# (using pyodbc's fast_executemany array binding when available). Every batch is committed on its
+# own and recorded in a checkpoint file, so a load that fails partway through can be resumed from
+# the last committed batch by loading the same file again.
+# Files on disk (used by the supplement script) are read in fixed-size chunks, so only one chunk
+# is ever held in memory no matter how large the file is.
+
+######################################################
+
+# importing the necessary libraries
+
+import itertools
+import json
+import os
+import re
+import time
+
+import pandas as pd
+
+import chunk_validation
+import query_cache
+import registry
+
+######################################################
+
+DEFAULT_BATCH_SIZE = 5000
+
+# checkpoint files are kept next to the app unless INSURANCE_CHECKPOINT_DIR says otherwise
+CHECKPOINT_DIR = os.environ.get(
+    "INSURANCE_CHECKPOINT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkpoints")
+)
+
+# rows that fail validation are written to a reject CSV in this folder (INSURANCE_REJECT_DIR)
+REJECT_DIR = os.environ.get(
+    "INSURANCE_REJECT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "rejects")
+)
+
+# groups an iterable of rows into lists of at most batch_size rows without reading ahead any further
+def batches(rows, batch_size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+######################################################
+
+# checkpoint helpers. a checkpoint records how many rows of a file are done (counted in the file
+# itself, so rows rejected along the way are included), along with the first data row of the file
+# so a different file uploaded under the same name is not skipped by mistake
+
+def row_fingerprint(row):
+    return json.dumps(list(row), default=str)
+
+
+def checkpoint_path(key):
+    safe_key = re.sub(r"[^A-Za-z0-9_.-]", "_", key)
+    return os.path.join(CHECKPOINT_DIR, f"{safe_key}.json")
+
+
+def load_checkpoint(key, first_row):
+    try:
+        with open(checkpoint_path(key)) as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if checkpoint.get("first_row") != row_fingerprint(first_row):
+        return 0
+    return checkpoint.get("rows_committed", 0)
+
+
+def save_checkpoint(key, first_row, rows_committed):
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    with open(checkpoint_path(key), "w") as f:
+        json.dump({"first_row": row_fingerprint(first_row), "rows_committed": rows_committed}, f)
+
+
+def clear_checkpoint(key):
+    try:
+        os.remove(checkpoint_path(key))
+    except OSError:
+        pass
+
+
+# the reject file for a load, named after the same key as its checkpoint
+def reject_path(key):
+    safe_key = re.sub(r"[^A-Za-z0-9_.-]", "_", key)
+    return os.path.join(REJECT_DIR, f"{safe_key}.rejects.csv")
+
+
+######################################################
+
+# raised when a batch fails. carries the number of rows this run committed before the failure (rows
+# skipped because an earlier run committed them are not counted) so the caller can report it
+class BulkLoadError(Exception):
+    def __init__(self, message, rows_committed):
+        super().__init__(message)
+        self.rows_committed = rows_committed
+
+
+# loads rows (any iterable of sequences, e.g. a csv.reader) into table_name in batches of batch_size
+# and commits after every batch. if checkpoint_key is given, rows already committed by an earlier
+# failed run of the same file are skipped and progress is saved after every batch. rows that have
+# already been converted (like the scores in risk_scoring.py) are passed with convert=False. progress,
+# if given, is called with the number of rows committed so far (counting skipped ones) after every batch.
+# returns a dictionary with the row count, elapsed time and rows per second.
+def bulk_insert(connection, table_name, columns, rows, batch_size=DEFAULT_BATCH_SIZE, checkpoint_key=None,
+                convert=True, progress=None):
+    # the registry only knows the tables and columns of the schema, so nothing else can end up in
+    # the query text. it also rejects a header that leaves out a NOT NULL column
+    insert, cursor = _prepare(connection, table_name, columns)
+
+    first_row = None
+    skipped = 0
+    position = 0
+    start = time.perf_counter()
+
+    for batch in batches(rows, batch_size):
+        if first_row is None:
+            first_row = batch[0]
+            if checkpoint_key:
+                skipped = load_checkpoint(checkpoint_key, first_row)
+
+        # skip whatever part of this batch an earlier run already committed
+        batch_start = min(len(batch), max(0, skipped - position))
+
+        # unless they were validated already, the rows are checked against the column definitions
+        # (empty fields become NULLs) before anything is sent, so a bad value is reported with its row
+        # number instead of failing the batch
+        params = batch[batch_start:]
+        if convert:
+            params = []
+            for number, row in enumerate(batch[batch_start:], start=position + batch_start + 1):
+                try:
+                    params.append(insert.convert(row))
+                except registry.RowError as e:
+                    raise BulkLoadError(f"Row {number} of {table_name}: {e}", max(0, position - skipped)) from e
+
+        _execute(connection, cursor, insert, table_name, params, max(0, position - skipped))
+
+        position += len(batch)
+        if checkpoint_key:
+            save_checkpoint(checkpoint_key, first_row, position)
+        if progress:
+            progress(position)
+
+    if checkpoint_key:
+        clear_checkpoint(checkpoint_key)
+
+    elapsed = time.perf_counter() - start
+    loaded = max(0, position - skipped)
+    return {
+        "rows": loaded,
+        "skipped": skipped,
+        "seconds": elapsed,
+        "rows_per_second": loaded / elapsed if elapsed else 0.0,
+    }
+
+
+# the prepared INSERT of table_name for columns, and a cursor to run it with
+def _prepare(connection, table_name, columns):
+    try:
+        insert = registry.get(table_name).prepare(columns)
+    except registry.RegistryError as e:
+        raise BulkLoadError(str(e), 0) from e
+
+    cursor = connection.cursor()
+    if hasattr(cursor, "fast_executemany"):
+        cursor.fast_executemany = True
+    return insert, cursor
+
+
+# inserts one batch and commits it. rows_committed is what a failure reports
+def _execute(connection, cursor, insert, table_name, params, rows_committed):
+    try:
+        if params:
+            cursor.executemany(insert.sql, params)
+            connection.commit()
+            query_cache.table_changed(table_name)
+    except Exception as e:
+        connection.rollback()
+        raise BulkLoadError(f"Error inserting into {table_name}: {e}", rows_committed) from e
+
+
+# reads a CSV file (a path or an open file) with pandas in chunks of chunk_size rows and yields one
+# DataFrame per chunk. every value is read as a string (so IDs like 0001 keep their leading zeros)
+# and only empty fields are treated as missing (not "NA", "null", ...)
+def read_csv_frames(source, chunk_size=DEFAULT_BATCH_SIZE):
+    with pd.read_csv(source, dtype=str, chunksize=chunk_size, keep_default_na=False, na_values=[""],
+                     encoding="utf-8-sig") as reader:
+        yield from reader
+
+
+# loads DataFrame chunks (e.g. from read_csv_frames) into table_name in batches of batch_size. each
+# chunk is validated as a whole by chunk_validation; the valid rows are inserted and the rejected ones
+# are written to a reject CSV with the reason, so bad rows no longer abort the load.
+# fk_filter (a fk_filter.ForeignKeyFilter) also rejects rows whose foreign keys have no parent row,
+# and gets the keys of every batch once it is committed, for the tables loaded after this one.
+# with a checkpoint_key the checkpoint records the row of the file that the last committed batch
+# ended on, so a resumed run skips the same part of the file even if different rows pass the checks
+# this time (e.g. because the parents of some rejected rows were loaded in between).
+# progress, if given, is called with (rows inserted by this run, rows rejected) after every batch.
+# returns a dictionary with the rows inserted, the rows of the file skipped, the elapsed time, rows
+# per second, "rejected" (the number of rejected rows) and "reject_path" (None if none were)
+def load_frames(connection, table_name, frames, batch_size=DEFAULT_BATCH_SIZE, checkpoint_key=None, fk_filter=None,
+                progress=None):
+    frames = iter(frames)
+    first = next(frames, None)
+    if first is None:
+        return {"rows": 0, "skipped": 0, "seconds": 0.0, "rows_per_second": 0.0, "rejected": 0, "reject_path": None}
+
+    columns = list(first.columns)
+    insert, cursor = _prepare(connection, table_name, columns)
+    first_row = first.iloc[0].astype(object).where(first.iloc[0].notna(), None).tolist()
+    skipped = load_checkpoint(checkpoint_key, first_row) if checkpoint_key else 0
+
+    counts = {"rejected": 0}
+    path = reject_path(checkpoint_key or table_name)
+    rows = chunk_validation.valid_rows(table_name, itertools.chain([first], frames), path, counts, fk_filter,
+                                       skip=skipped, numbered=True)
+
+    inserted = 0
+    start = time.perf_counter()
+    for batch in batches(rows, batch_size):
+        params = [row for _, row in batch]
+        _execute(connection, cursor, insert, table_name, params, inserted)
+        inserted += len(params)
+        if fk_filter is not None:
+            fk_filter.add(table_name, columns, params)
+        if checkpoint_key:
+            save_checkpoint(checkpoint_key, first_row, batch[-1][0])
+        if progress:
+            progress(inserted, counts["rejected"])
+
+    if checkpoint_key:
+        clear_checkpoint(checkpoint_key)
+
+    elapsed = time.perf_counter() - start
+    return {
+        "rows": inserted,
+        "skipped": skipped,
+        "seconds": elapsed,
+        "rows_per_second": inserted / elapsed if elapsed else 0.0,
+        "rejected": counts["rejected"],
+        "reject_path": path if counts["rejected"] else None,
+    }
+
+
+# streams a CSV file on disk into table_name. the header row gives the column names, the file is
+# read and validated chunk_size rows at a time, and the file name is used as the checkpoint key
+def load_csv_file(connection, table_name, file_path, chunk_size=DEFAULT_BATCH_SIZE, fk_filter=None):
+    return load_frames(
+        connection,
+        table_name,
+        read_csv_frames(file_path, chunk_size),
+        batch_size=chunk_size,
+        checkpoint_key=f"{table_name}_{os.path.basename(file_path)}",
+        fk_filter=fk_filter,
+    )
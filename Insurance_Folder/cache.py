@@ -0,0 +1,67 @@
+# A small in-process cache with a size limit and an expiry time. Used by the app to avoid a
+# database round trip for lookups that are repeated on every request (e.g. flask-login's load_user).
+
+######################################################
+
+# importing the necessary libraries
+
+import threading
+import time
+from collections import OrderedDict
+
+######################################################
+
+# returned by get() when there is no (unexpired) entry, so that None can be cached as a value
+MISSING = object()
+
+
+# least recently used cache. holds at most maxsize entries; when it is full, the entry that was used
+# longest ago is dropped. entries older than ttl seconds are treated as missing. safe to share
+# between the threads serving requests.
+class TTLCache:
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[1] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    # removes the entry for key, e.g. after the underlying row has been changed
+    def invalidate(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+            }
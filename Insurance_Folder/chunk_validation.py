@@ -0,0 +1,199 @@
+# Validation stage for the bulk loads. A whole chunk of rows (a pandas DataFrame, as read from a CSV
+# file) is checked at once with column operations instead of row by row: NOT NULL masks, VARCHAR
+# lengths, numeric / BIT / date parsing, positive amounts and the email / url patterns, all taken
+# from the table's entry in the registry. The rows that pass are converted to the values sent to the
+# server; the rows that fail are written to a reject CSV with the reason, instead of aborting the load.
+
+######################################################
+
+# importing the necessary libraries
+
+import csv
+import os
+
+import numpy as np
+import pandas as pd
+
+import registry
+
+######################################################
+
+REJECT_REASON_COLUMN = "Reject_Reason"
+REJECT_ROW_COLUMN = "Row"
+
+
+# the checks for one column, run over a whole chunk at once. returns the converted values (NaN / NA
+# where the value is missing or bad) and a list of (mask, message) pairs, one per failed check
+def check_column(column, series):
+    label = column.name.replace("_", " ")
+    is_text = pd.api.types.is_object_dtype(series.dtype) or pd.api.types.is_string_dtype(series.dtype)
+    present = series.notna()
+    if is_text:
+        present &= series != ""
+    problems = []
+
+    if not column.nullable:
+        problems.append((~present, f"{label} is required and cannot be empty."))
+
+    data_type = column.data_type
+    if data_type in registry.TEXT_TYPES:
+        values = series.where(present)
+        if not is_text:
+            values = series.astype(str).where(present)
+        if column.length:
+            problems.append((values.str.len() > column.length, f"{label} exceeds the maximum length of {column.length}."))
+        if column.name in registry.EMAIL_COLUMNS:
+            problems.append((present & ~values.str.match(registry.EMAIL.pattern).fillna(False).astype(bool),
+                             f"{label} is not a valid email address."))
+        if column.name in registry.URL_COLUMNS:
+            problems.append((present & ~values.str.match(registry.URL.pattern).fillna(False).astype(bool),
+                             f"{label} is not a valid URL."))
+        return values, problems
+
+    if data_type in registry.INTEGER_TYPES or data_type in registry.FLOAT_TYPES or data_type in registry.DECIMAL_TYPES:
+        numbers = pd.to_numeric(series.where(present), errors="coerce")
+        unparsed = present & (numbers.isna() | np.isinf(numbers))
+        if data_type in registry.INTEGER_TYPES:
+            problems.append((unparsed | (present & (numbers % 1 != 0)), f"{label} must be a whole number."))
+            values = numbers.where(~unparsed & (numbers % 1 == 0)).astype("Int64")
+        else:
+            problems.append((unparsed, f"{label} must be a valid number."))
+            values = numbers
+            if data_type in registry.DECIMAL_TYPES:
+                max_digits = (column.length or 18) - (column.scale or 0)
+                problems.append((numbers.abs() >= 10 ** max_digits,
+                                 f"{label} must have at most {max_digits} digits before the decimal point."))
+                values = numbers.round(column.scale or 0)
+        if column.name in registry.POSITIVE_COLUMNS:
+            problems.append((numbers <= 0, f"{label} must be a positive number."))
+        return values, problems
+
+    if data_type == "BIT":
+        values = series.where(present).astype(str).str.strip().str.lower().map(registry.BIT_VALUES)
+        problems.append((present & values.isna(), f"{label} must be 0 or 1."))
+        return values.astype("Int64"), problems
+
+    if data_type in ("DATE", "DATETIME"):
+        date_format, description = ("%Y-%m-%d", "a date (YYYY-MM-DD)") if data_type == "DATE" else \
+            ("ISO8601", "a date and time (YYYY-MM-DD HH:MM:SS)")
+        parsed = pd.to_datetime(series.where(present), format=date_format, errors="coerce")
+        problems.append((present & parsed.isna(), f"{label} must be {description}."))
+        # strings that parsed are sent as they are. typed values are formatted the same way
+        if is_text:
+            return series.where(present), problems
+        text_format = "%Y-%m-%d" if data_type == "DATE" else "%Y-%m-%d %H:%M:%S"
+        return parsed.dt.strftime(text_format), problems
+
+    return series.where(present), problems
+
+
+# splits chunks of one table into valid rows (converted, as tuples ready for executemany) and
+# rejected rows (as given, plus the row number and the reason). the checks are the same for every
+# chunk, only the data changes. with an fk_filter (see fk_filter.py) rows whose foreign keys have no
+# parent are rejected too (the loaders add the keys of the rows they commit to the filter)
+class ChunkValidator:
+    def __init__(self, table_name, columns, fk_filter=None):
+        spec = registry.get(table_name)
+        # raises RegistryError for unknown columns or a missing NOT NULL column
+        spec.prepare(columns)
+        self.table_name = table_name
+        self.columns = list(columns)
+        self.table_columns = [spec.table.column(name) for name in columns]
+        self.fk_filter = fk_filter
+
+    # first_row is the row number (1 = the first data row of the file) of the chunk's first row
+    def split(self, chunk, first_row=1):
+        converted, problems = [], []
+        for column in self.table_columns:
+            values, column_problems = check_column(column, chunk[column.name])
+            converted.append(values)
+            problems.extend((mask.to_numpy(dtype=bool, na_value=False), message) for mask, message in column_problems)
+
+        if self.fk_filter is not None:
+            problems.extend(self.fk_filter.check(self.table_name, chunk))
+
+        bad = np.zeros(len(chunk), dtype=bool)
+        for mask, _ in problems:
+            bad |= mask
+
+        good = ~bad
+        rows = []
+        if good.any():
+            rows = list(zip(*(values.to_numpy(dtype=object, na_value=None)[good].tolist() for values in converted)))
+
+        rejects = None
+        if bad.any():
+            positions = np.flatnonzero(bad)
+            failed = [(mask[positions], message) for mask, message in problems if mask[positions].any()]
+            rejects = chunk.iloc[positions].copy()
+            rejects.insert(0, REJECT_ROW_COLUMN, positions + first_row)
+            rejects[REJECT_REASON_COLUMN] = [
+                " ".join(message for mask, message in failed if mask[i]) for i in range(len(positions))
+            ]
+        return rows, rejects
+
+
+# runs every chunk of a table through the validator, writes the rejects to reject_path and yields the
+# valid rows one by one. counts["rejected"] is updated as rejects are found. the reject file is
+# (re)written by every run, so a resumed load still ends up with the complete list: the first `skip`
+# rows of the file (settled by an earlier run, see bulk_loader.load_frames) are not checked again,
+# and their rejects are kept from the earlier reject file. with numbered=True every valid row is
+# yielded as (its row number in the file, row)
+def valid_rows(table_name, chunks, reject_path, counts, fk_filter=None, skip=0, numbered=False):
+    validator = None
+    reject_file = writer = None
+    next_row = 1
+
+    earlier = None
+    if os.path.exists(reject_path):
+        if skip:
+            earlier = reject_path + ".earlier"
+            os.replace(reject_path, earlier)
+        else:
+            os.remove(reject_path)
+
+    try:
+        if earlier is not None:
+            reject_file = open(reject_path, "w", newline="", encoding="utf-8")
+            writer = csv.writer(reject_file)
+            with open(earlier, newline="", encoding="utf-8") as f:
+                reader = csv.reader(f)
+                writer.writerow(next(reader, []))
+                for reject in reader:
+                    if int(reject[0]) <= skip:
+                        writer.writerow(reject)
+                        counts["rejected"] += 1
+            os.remove(earlier)
+
+        for chunk in chunks:
+            first_row = next_row
+            next_row += len(chunk)
+            if next_row - 1 <= skip:
+                continue
+            if first_row <= skip:
+                chunk = chunk.iloc[skip - first_row + 1:]
+                first_row = skip + 1
+
+            if validator is None:
+                validator = ChunkValidator(table_name, list(chunk.columns), fk_filter)
+            rows, rejects = validator.split(chunk, first_row)
+
+            if rejects is not None:
+                if writer is None:
+                    os.makedirs(os.path.dirname(reject_path) or ".", exist_ok=True)
+                    reject_file = open(reject_path, "w", newline="", encoding="utf-8")
+                    writer = csv.writer(reject_file)
+                    writer.writerow(list(rejects.columns))
+                writer.writerows(rejects.astype(object).where(rejects.notna(), "").itertuples(index=False))
+                counts["rejected"] += len(rejects)
+
+            if numbered:
+                numbers = np.arange(first_row, first_row + len(chunk))
+                if rejects is not None:
+                    numbers = numbers[~np.isin(numbers, rejects[REJECT_ROW_COLUMN].to_numpy())]
+                yield from zip(numbers.tolist(), rows)
+            else:
+                yield from rows
+    finally:
+        if reject_file is not None:
+            reject_file.close()
@@ -0,0 +1,39 @@
+# Reading query results as columns. The batch jobs (risk scoring, renewals, segmentation) read whole
+# tables and work on them as NumPy arrays rather than row by row; these are the helpers they share
+# for fetching a query's columns and for turning the database's values into numbers and dates.
+
+######################################################
+
+# importing the necessary libraries
+
+import numpy as np
+import pandas as pd
+
+######################################################
+
+# rows fetched per round trip
+FETCH_SIZE = 50000
+
+
+# runs a query and returns its columns as a list of object arrays
+def fetch_columns(connection, sql, count, params=()):
+    cursor = connection.cursor()
+    cursor.execute(sql, params)
+    columns = [[] for _ in range(count)]
+    while True:
+        rows = cursor.fetchmany(FETCH_SIZE)
+        if not rows:
+            break
+        for column, values in zip(columns, zip(*rows)):
+            column.extend(values)
+    return [np.array(column, dtype=object) for column in columns]
+
+
+# the values as floats (NULLs and anything that is not a number become 0)
+def as_float(values):
+    return pd.to_numeric(pd.Series(values, dtype=object), errors="coerce").fillna(0).to_numpy(dtype=float)
+
+
+# the values as a series of timestamps (NULLs and anything that is not a date become NaT)
+def as_dates(values):
+    return pd.to_datetime(pd.Series(values, dtype=object), errors="coerce")
@@ -0,0 +1,246 @@
+# The numbers on the home page: open claims, pending applications, premiums collected this month and
+# policies expiring soon. They are kept in memory and brought up to date in the background (the app's
+# scheduler calls scan() every minute or so, and again right after a CSV import finishes), so showing
+# the home page never runs a query.
+#
+# A refresh only does work for the tables that changed since the last one. Every table's rowversion
+# (migrations 003 and 006) is compared with the highest version read the last time, and:
+#   - the premiums of the month are summed again through IX_Premium_Payment_Date whenever a payment
+#     changed (and at the start of a new month). a sum over the month's index range is used rather
+#     than adding the new payments because an edited payment would then be counted twice
+#   - the open claims and pending applications are counted again through the Status indexes
+#     (IX_Claim_Status from migration 001, IX_Application_Status from migration 007), which only
+#     reads the index entries of the rows in those states. a count is used rather than adding up the
+#     changed rows because a changed row may have been open before the change
+#   - the policies expiring in the next EXPIRING_SOON_DAYS days are counted through
+#     IX_Policy_Expiry_Date from migration 005 (also whenever the day changes)
+#
+# On the sqlite stand-in the version is the rowid, which does not change when a row is updated (a
+# claim being settled, say), so there every number is computed again on every refresh.
+#
+# Rows added through the app's add_* pages are applied straight away (record_insert), as adjustments
+# on top of the last refresh that are dropped once a refresh has read them from the database. An
+# insert that lands while a refresh is running can be counted twice until the next refresh.
+#
+# usage: python dashboard.py [--today YYYY-MM-DD]
+
+######################################################
+
+# importing the necessary libraries
+
+import argparse
+import calendar
+import threading
+import time
+from datetime import date, timedelta
+
+import db_pool
+from db_pool import version_bounds
+
+######################################################
+
+EXPIRING_SOON_DAYS = 30
+
+# the claim and application states that count as open / pending
+OPEN_CLAIM_STATUSES = ("Pending",)
+PENDING_APPLICATION_STATUSES = ("Pending",)
+
+# the tables the numbers are computed from
+TABLES = ("Claim", "Application", "Premium_Payment", "Policy")
+
+# number name -> label on the home page
+NUMBERS = {
+    "open_claims": "Open claims",
+    "pending_applications": "Pending applications",
+    "premiums_this_month": "Premiums collected this month",
+    "policies_expiring": "Policies expiring soon",
+}
+
+
+def _month_name(day):
+    return f"{calendar.month_name[day.month]} {day.year}"
+
+
+def _day(value):
+    return date.fromisoformat(str(value)[:10])
+
+
+def _count(cursor, sql, params):
+    cursor.execute(sql, params)
+    return int(cursor.fetchone()[0] or 0)
+
+
+######################################################
+
+class DashboardSummary:
+    def __init__(self, expiring_days=EXPIRING_SOON_DAYS):
+        self.expiring_days = expiring_days
+        self._lock = threading.Lock()
+
+        # the numbers as of the last refresh (None until the first one), the day they are for and the
+        # highest version of every table read so far
+        self._numbers = dict.fromkeys(NUMBERS)
+        self._day = None
+        self._versions = {}
+
+        # (sequence number, number name, change) for every row added through the app since then
+        self._adjustments = []
+        self._sequence = 0
+
+        self.refreshes = 0
+        self.recounts = 0
+        self.rows_read = 0
+        self.last_refresh_seconds = 0.0
+        self.refreshed_at = None
+
+    # brings the numbers up to date with the database
+    def refresh(self, connection, today=None):
+        start = time.perf_counter()
+        today = today or date.today()
+        with self._lock:
+            mark = self._sequence
+            old = dict(self._versions)
+            numbers = dict(self._numbers)
+            new_day = today != self._day
+            new_month = self._day is None or (today.year, today.month) != (self._day.year, self._day.month)
+
+        cursor = connection.cursor()
+        versions = {}
+        changed = {}
+        for table in TABLES:
+            upper_sql, between = version_bounds(table)
+            cursor.execute(upper_sql)
+            high = int(cursor.fetchone()[0] or 0)
+            versions[table] = high
+            low = old.get(table)
+            if low is None or db_pool.using_sqlite():
+                changed[table] = None
+            elif high > low:
+                changed[table] = _count(cursor, f"SELECT COUNT(*) FROM {table} WHERE {between}", (low, high))
+            else:
+                changed[table] = 0
+        rows = sum(count or 0 for count in changed.values())
+        recounts = 0
+
+        if changed["Claim"] != 0:
+            numbers["open_claims"] = self._status_count(cursor, "Claim", OPEN_CLAIM_STATUSES)
+            recounts += 1
+        if changed["Application"] != 0:
+            numbers["pending_applications"] = self._status_count(cursor, "Application", PENDING_APPLICATION_STATUSES)
+            recounts += 1
+        if changed["Policy"] != 0 or new_day:
+            numbers["policies_expiring"] = _count(
+                cursor,
+                "SELECT COUNT(*) FROM Policy WHERE Expiry_Date >= ? AND Expiry_Date <= ?",
+                (today.isoformat(), (today + timedelta(days=self.expiring_days)).isoformat()),
+            )
+            recounts += 1
+
+        if changed["Premium_Payment"] != 0 or new_month:
+            first = today.replace(day=1)
+            following = (first + timedelta(days=32)).replace(day=1)
+            cursor.execute(
+                "SELECT SUM(Amount) FROM Premium_Payment WHERE Payment_Date >= ? AND Payment_Date < ?",
+                (first.isoformat(), following.isoformat()),
+            )
+            numbers["premiums_this_month"] = round(float(cursor.fetchone()[0] or 0), 2)
+            recounts += 1
+
+        with self._lock:
+            self._numbers = numbers
+            self._day = today
+            self._versions = versions
+            self._adjustments = [adjustment for adjustment in self._adjustments if adjustment[0] > mark]
+            self.refreshes += 1
+            self.recounts += recounts
+            self.rows_read += rows
+            self.last_refresh_seconds = time.perf_counter() - start
+            self.refreshed_at = time.time()
+        return numbers
+
+    # refresh() on a connection of its own, for the scheduler
+    def scan(self, connect, today=None):
+        connection = connect()
+        try:
+            return self.refresh(connection, today)
+        finally:
+            connection.close()
+
+    def _status_count(self, cursor, table, statuses):
+        return _count(
+            cursor,
+            f"SELECT COUNT(*) FROM {table} WHERE Status IN ({', '.join('?' for _ in statuses)})",
+            statuses,
+        )
+
+    # applies a row just inserted into table_name (rows of other tables are ignored)
+    def record_insert(self, table_name, row):
+        today = date.today()
+        change = None
+        if table_name == "Claim" and row["Status"] in OPEN_CLAIM_STATUSES:
+            change = ("open_claims", 1)
+        elif table_name == "Application" and row["Status"] in PENDING_APPLICATION_STATUSES:
+            change = ("pending_applications", 1)
+        elif table_name == "Premium_Payment":
+            paid = _day(row["Payment_Date"])
+            if (paid.year, paid.month) == (today.year, today.month):
+                change = ("premiums_this_month", float(row["Amount"]))
+        elif table_name == "Policy":
+            if today <= _day(row["Expiry_Date"]) <= today + timedelta(days=self.expiring_days):
+                change = ("policies_expiring", 1)
+
+        if change is not None:
+            with self._lock:
+                self._sequence += 1
+                self._adjustments.append((self._sequence, *change))
+
+    # the numbers for the home page: {name: value} (a value is None before the first refresh), plus
+    # the month the premiums are for and when the numbers were last refreshed (as HH:MM:SS)
+    def summary(self):
+        with self._lock:
+            numbers = dict(self._numbers)
+            for _, name, change in self._adjustments:
+                if numbers[name] is not None:
+                    numbers[name] += change
+            day = self._day
+            refreshed_at = self.refreshed_at
+        if numbers["premiums_this_month"] is not None:
+            numbers["premiums_this_month"] = round(numbers["premiums_this_month"], 2)
+        return {
+            "numbers": numbers,
+            "month": _month_name(day) if day else None,
+            "expiring_days": self.expiring_days,
+            "refreshed_at": time.strftime("%H:%M:%S", time.localtime(refreshed_at)) if refreshed_at else None,
+        }
+
+    def stats(self):
+        with self._lock:
+            return {
+                "refreshes": self.refreshes,
+                "recounts": self.recounts,
+                "rows_read": self.rows_read,
+                "adjustments": len(self._adjustments),
+                "last_refresh_seconds": self.last_refresh_seconds,
+                "refreshed_at": self.refreshed_at or 0,
+            }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Print the numbers shown on the home page.")
+    parser.add_argument("--today", help="the date to count from (YYYY-MM-DD), today by default")
+    args = parser.parse_args()
+
+    summary = DashboardSummary()
+    connection = db_pool.connect()
+    try:
+        summary.refresh(connection, date.fromisoformat(args.today) if args.today else None)
+    finally:
+        connection.close()
+
+    for name, value in summary.summary()["numbers"].items():
+        print(f"{NUMBERS[name]:<32} {value}")
+    print(f"(computed in {summary.last_refresh_seconds:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+# Synthetic data generator for the Insurance schema. Produces referentially consistent rows for
+# every table at a configurable scale (the number of customers; the other tables are sized
+# relative to it), deterministically from a seed, so every benchmark run sees the same data.
+#
+# Rows are generated in chunks with NumPy, so memory use does not grow with the scale. The output
+# can be written to CSV or Parquet (one file per table, named after the table so parallel_loader.py
+# can load the directory), or loaded straight into the database through the bulk loader.
+#
+# usage: python datagen.py --scale 100000 --out data/               (CSV files)
+#        python datagen.py --scale 100000 --out data/ --format parquet
+#        python datagen.py --scale 100000 --load                     (insert into the database)
+#        python datagen.py --scale 100000 --sqlite bench.db          (build a local sqlite stand-in)
+
+######################################################
+
+# importing the necessary libraries
+
+import argparse
+import os
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+import bulk_loader
+import db_pool
+import schema
+
+######################################################
+
+TABLES = schema.parse_schema()
+
+DEFAULT_CHUNK_SIZE = 100000
+
+# every id column is VARCHAR(10) (Policy_Number is VARCHAR(20)), so the number of digits after the
+# prefix is what fits. two-letter prefixes allow up to 100M rows; Premium_Payment (3 per customer)
+# uses a one-letter prefix for its extra digit
+ID_FORMATS = {
+    "Customer": ("CU", 8),
+    "Incident": ("IN", 8),
+    "Incident_Report": ("IR", 8),
+    "Company": ("CO", 8),
+    "Department": ("DE", 8),
+    "Vehicle_Service": ("VS", 8),
+    "Vehicle": ("VE", 8),
+    "Application": ("AP", 8),
+    "Policy": ("POL", 9),
+    "Premium_Payment": ("P", 9),
+    "Claim": ("CL", 8),
+    "Claim_Settlement": ("SE", 8),
+    "Risk_Assessment": ("RA", 8),
+    "Customer_Segmentation": ("SG", 8),
+    "Reinsurance_Info": ("RI", 8),
+    "Feedback_Info": ("FB", 8),
+    "Staff": ("ST", 8),
+}
+
+FIRST_NAMES = np.array(["John", "Jane", "Michael", "Emily", "David", "Sophia", "Liam", "Olivia", "Ethan", "Ava"])
+LAST_NAMES = np.array(["Doe", "Smith", "Brown", "White", "Clark", "Wilson", "Davis", "Martinez", "Garcia", "Anderson"])
+CITIES = np.array(["Springfield", "Rivertown", "Hillview", "Lakeside", "Baytown", "Sunnyvale", "Crestwood"])
+STREETS = np.array(["Elm St", "Maple Rd", "Oak Ln", "Pine St", "Cedar Dr", "Birch Ave", "Spruce Way"])
+INCIDENT_TYPES = np.array(["Fire", "Theft", "Flood", "Accident", "Vandalism", "Hail", "Earthquake"])
+VEHICLE_TYPES = np.array(["Sedan", "SUV", "Truck", "Hatchback", "Coupe"])
+MAKES = np.array(["Toyota", "Honda", "Ford", "Nissan", "Hyundai", "Kia", "Mazda", "BMW", "Chevrolet"])
+APPLICATION_STATUSES = np.array(["Pending", "Issued", "Expired"])
+CLAIM_STATUSES = np.array(["Pending", "Approved", "Rejected"])
+DAMAGE_TYPES = np.array(["Collision", "Theft", "Fire", "Flood", "Earthquake", "Vandalism"])
+HEALTH_STATUSES = np.array(["Healthy", "Smoker", "Overweight", "Diabetic", "Heart Issues"])
+RISK_LEVELS = np.array(["Low", "Medium", "High"])
+FEEDBACK_TYPES = np.array(["Service", "Claim", "Policy", "Incident"])
+REINSURANCE_TYPES = np.array(["Proportional", "Non-Proportional", "Excess of Loss", "Quota Share", "Stop Loss"])
+MONTHS = ["January", "February", "March", "April", "May", "June", "July", "August", "September",
+          "October", "November", "December"]
+
+
+# number of rows generated for every table when the scale is `scale` customers
+def row_counts(scale):
+    companies = max(10, scale // 10000)
+    return {
+        "Customer": scale,
+        "Incident": max(1, scale // 2),
+        "Incident_Report": max(1, scale // 2),
+        "Company": companies,
+        "Department": companies * 3,
+        "Vehicle_Service": companies * 3,
+        "Vehicle": scale,
+        "Application": scale,
+        "Policy": scale,
+        "Premium_Payment": scale * 3,
+        "Claim": max(1, scale // 2),
+        "Claim_Settlement": max(1, scale // 2),
+        "Risk_Assessment": scale,
+        "Revenue_Expenses": 24,
+        "Customer_Segmentation": 10,
+        "Reinsurance_Info": max(1, scale // 20),
+        "Feedback_Info": max(1, scale // 5),
+        "Staff": max(10, scale // 100),
+        "Audit_Log": 0,
+    }
+
+
+######################################################
+
+# vectorized helpers
+
+def ids(table_name, index):
+    prefix, digits = ID_FORMATS[table_name]
+    return np.char.add(prefix, np.char.zfill(index.astype(str), digits))
+
+
+def pick(rng, values, size):
+    return values[rng.integers(0, len(values), size)]
+
+
+# random dates as YYYY-MM-DD strings, between start and start + days
+def dates(rng, size, start="2020-01-01", days=365 * 4):
+    offsets = rng.integers(0, days, size).astype("timedelta64[D]")
+    return np.datetime_as_string(np.datetime64(start) + offsets, unit="D")
+
+
+def add_days(date_strings, days):
+    return np.datetime_as_string(date_strings.astype("datetime64[D]") + np.timedelta64(days, "D"), unit="D")
+
+
+def money(rng, low, high, size):
+    return np.round(rng.uniform(low, high, size), 2)
+
+
+######################################################
+
+# one function per table. each builds the rows with index in [start, stop) as a dictionary of
+# column -> array. parent ids are derived from the row index (or drawn from the parent's range),
+# so every foreign key points at a row the generator also produces
+
+def gen_customer(rng, index, counts):
+    n = len(index)
+    return {
+        "Customer_ID": ids("Customer", index),
+        "First_Name": pick(rng, FIRST_NAMES, n),
+        "Last_Name": pick(rng, LAST_NAMES, n),
+        "DOB": dates(rng, n, start="1950-01-01", days=365 * 55),
+        "Gender": pick(rng, np.array(["Male", "Female"]), n),
+        "Address": np.char.add(np.char.add(rng.integers(1, 999, n).astype(str), " "), pick(rng, STREETS, n)),
+        "City": pick(rng, CITIES, n),
+        "Country": np.full(n, "USA"),
+        "Phone": np.char.add("+1-", rng.integers(1000000000, 9999999999, n).astype(str)),
+        "Email": np.char.add(np.char.add("customer", index.astype(str)), "@example.com"),
+        "Marital_Status": rng.integers(0, 2, n),
+    }
+
+
+def gen_incident(rng, index, counts):
+    n = len(index)
+    types = pick(rng, INCIDENT_TYPES, n)
+    return {
+        "Incident_ID": ids("Incident", index),
+        "Type": types,
+        "Date": dates(rng, n),
+        "Description": np.char.add(types, " reported by customer"),
+    }
+
+
+def gen_incident_report(rng, index, counts):
+    n = len(index)
+    return {
+        "Report_ID": ids("Incident_Report", index),
+        "Incident_ID": ids("Incident", index % counts["Incident"]),
+        "Customer_ID": ids("Customer", rng.integers(0, counts["Customer"], n)),
+        "Inspector_Name": np.char.add("Inspector ", rng.integers(1, 50, n).astype(str)),
+        "Estimated_Cost": money(rng, 500, 30000, n),
+        "Description": np.full(n, "Damage assessed on site"),
+    }
+
+
+def gen_company(rng, index, counts):
+    n = len(index)
+    return {
+        "Company_ID": ids("Company", index),
+        "Name": np.char.add("Company ", index.astype(str)),
+        "Contact_Number": np.char.add("+1-", rng.integers(1000000000, 9999999999, n).astype(str)),
+        "Email": np.char.add(np.char.add("info", index.astype(str)), "@company.com"),
+        "Website": np.char.add(np.char.add("https://www.company", index.astype(str)), ".com"),
+        "Address": np.char.add(np.char.add(rng.integers(1, 999, n).astype(str), " "), pick(rng, STREETS, n)),
+        "City": pick(rng, CITIES, n),
+        "Country": np.full(n, "USA"),
+    }
+
+
+def gen_department(rng, index, counts):
+    n = len(index)
+    return {
+        "Department_ID": ids("Department", index),
+        "Company_ID": ids("Company", index // 3),
+        "Name": pick(rng, np.array(["Claims", "Underwriting", "Customer Service", "Sales"]), n),
+        "Staff_Count": rng.integers(5, 100, n),
+        "Office_Count": rng.integers(1, 10, n),
+    }
+
+
+def gen_vehicle_service(rng, index, counts):
+    n = len(index)
+    return {
+        "Service_ID": ids("Vehicle_Service", index),
+        "Department_ID": ids("Department", index),
+        "Company_ID": ids("Company", index // 3),
+        "Name": np.char.add("Garage ", index.astype(str)),
+        "Address": np.char.add(np.char.add(rng.integers(1, 999, n).astype(str), " "), pick(rng, STREETS, n)),
+        "Contact": np.char.add("+1-", rng.integers(1000000000, 9999999999, n).astype(str)),
+        "Service_Type": pick(rng, np.array(["Repair", "Maintenance", "Inspection"]), n),
+    }
+
+
+def gen_vehicle(rng, index, counts):
+    n = len(index)
+    return {
+        "Vehicle_ID": ids("Vehicle", index),
+        "Customer_ID": ids("Customer", index % counts["Customer"]),
+        "Registration_Number": np.char.add("REG", index.astype(str)),
+        "Value": rng.integers(5000, 80000, n),
+        "Type": pick(rng, VEHICLE_TYPES, n),
+        "Make": pick(rng, MAKES, n),
+        "Model": np.char.add("Model ", rng.integers(1, 20, n).astype(str)),
+        "Engine_Number": np.char.add("ENG", index.astype(str)),
+        "Chassis_Number": np.char.add("CHS", index.astype(str)),
+    }
+
+
+def gen_application(rng, index, counts):
+    n = len(index)
+    return {
+        "Application_ID": ids("Application", index),
+        "Customer_ID": ids("Customer", index % counts["Customer"]),
+        "Vehicle_ID": ids("Vehicle", index % counts["Vehicle"]),
+        "Status": pick(rng, APPLICATION_STATUSES, n),
+        "Coverage_Description": np.full(n, "Comprehensive coverage"),
+    }
+
+
+def gen_policy(rng, index, counts):
+    n = len(index)
+    start = dates(rng, n)
+    return {
+        "Policy_Number": ids("Policy", index),
+        "Application_ID": ids("Application", index % counts["Application"]),
+        "Start_Date": start,
+        "Expiry_Date": add_days(start, 365),
+        "Terms": np.full(n, "Standard terms and conditions apply."),
+    }
+
+
+def gen_premium_payment(rng, index, counts):
+    n = len(index)
+    return {
+        "Payment_ID": ids("Premium_Payment", index),
+        "Policy_Number": ids("Policy", (index // 3) % counts["Policy"]),
+        "Amount": money(rng, 300, 2000, n),
+        "Payment_Date": dates(rng, n),
+        "Receipt_ID": np.char.add("RCPT", index.astype(str)),
+    }
+
+
+def gen_claim(rng, index, counts):
+    n = len(index)
+    return {
+        "Claim_ID": ids("Claim", index),
+        "Policy_Number": ids("Policy", rng.integers(0, counts["Policy"], n)),
+        "Amount": money(rng, 100, 20000, n),
+        "Incident_ID": ids("Incident", index % counts["Incident"]),
+        "Damage_Type": pick(rng, DAMAGE_TYPES, n),
+        "Date": dates(rng, n),
+        "Status": pick(rng, CLAIM_STATUSES, n),
+    }
+
+
+def gen_claim_settlement(rng, index, counts):
+    n = len(index)
+    return {
+        "Settlement_ID": ids("Claim_Settlement", index),
+        "Claim_ID": ids("Claim", index % counts["Claim"]),
+        "Amount_Paid": money(rng, 100, 20000, n),
+        "Settlement_Date": dates(rng, n),
+    }
+
+
+def gen_risk_assessment(rng, index, counts):
+    n = len(index)
+    return {
+        "Assessment_ID": ids("Risk_Assessment", index),
+        "Customer_ID": ids("Customer", index % counts["Customer"]),
+        "Age": rng.integers(18, 80, n),
+        "Health_Status": pick(rng, HEALTH_STATUSES, n),
+        "Risk_Level": pick(rng, RISK_LEVELS, n),
+        "Premium_Multiplier": np.round(rng.uniform(1.0, 2.0, n), 2),
+    }
+
+
+def gen_revenue_expenses(rng, index, counts):
+    n = len(index)
+    revenue = money(rng, 400000, 600000, n)
+    claims_paid = money(rng, 150000, 250000, n)
+    expenses = money(rng, 90000, 120000, n)
+    return {
+        "Month": np.array([f"{MONTHS[i % 12]} {2022 + i // 12}" for i in index]),
+        "Revenue": revenue,
+        "Claims_paid": claims_paid,
+        "Expenses": expenses,
+        "Profit": np.round(revenue - claims_paid - expenses, 2),
+    }
+
+
+def gen_customer_segmentation(rng, index, counts):
+    n = len(index)
+    return {
+        "Segment_ID": ids("Customer_Segmentation", index),
+        "Segment_Name": np.char.add("Segment ", index.astype(str)),
+        "Age_Range": pick(rng, np.array(["18-25", "25-35", "36-50", "51-65", "65+"]), n),
+        "Average_Income": money(rng, 30000, 150000, n),
+        "Risk_Level": pick(rng, RISK_LEVELS, n),
+        "Claim_Frequency": pick(rng, np.array(["Rare", "Low", "Occasional", "Moderate", "Frequent"]), n),
+    }
+
+
+def gen_reinsurance_info(rng, index, counts):
+    n = len(index)
+    return {
+        "Reinsurance_ID": ids("Reinsurance_Info", index),
+        "Policy_Number": ids("Policy", rng.integers(0, counts["Policy"], n)),
+        "Reinsurer_Name": pick(rng, np.array(["Global Reinsure Inc.", "SafeCover Reinsurance"]), n),
+        "Reinsurance_Type": pick(rng, REINSURANCE_TYPES, n),
+        "Coverage_Limit": money(rng, 50000, 150000, n),
+        "Deductible": money(rng, 500, 2000, n),
+    }
+
+
+def gen_feedback_info(rng, index, counts):
+    n = len(index)
+    return {
+        "Feedback_ID": ids("Feedback_Info", index),
+        "Customer_ID": ids("Customer", rng.integers(0, counts["Customer"], n)),
+        "Feedback_Type": pick(rng, FEEDBACK_TYPES, n),
+        "Rating": rng.integers(1, 6, n),
+        "Feedback_Text": pick(rng, np.array(["Excellent service.", "Claim was slow.", "Policy was unclear."]), n),
+        "Feedback_Date": dates(rng, n),
+    }
+
+
+def gen_staff(rng, index, counts):
+    n = len(index)
+    return {
+        "Staff_ID": ids("Staff", index),
+        "Company_ID": ids("Company", rng.integers(0, counts["Company"], n)),
+        "First_Name": pick(rng, FIRST_NAMES, n),
+        "Last_Name": pick(rng, LAST_NAMES, n),
+        "Address": np.char.add(np.char.add(rng.integers(1, 999, n).astype(str), " "), pick(rng, STREETS, n)),
+        "Position": pick(rng, np.array(["Insurance Agent", "Claims Adjuster", "Underwriter"]), n),
+        "Contact_Number": np.char.add("+1-", rng.integers(1000000000, 9999999999, n).astype(str)),
+        "Email": np.char.add(np.char.add("staff", index.astype(str)), "@insurance.com"),
+        "Password": np.full(n, "password"),
+    }
+
+
+GENERATORS = {
+    "Customer": gen_customer,
+    "Incident": gen_incident,
+    "Incident_Report": gen_incident_report,
+    "Company": gen_company,
+    "Department": gen_department,
+    "Vehicle_Service": gen_vehicle_service,
+    "Vehicle": gen_vehicle,
+    "Application": gen_application,
+    "Policy": gen_policy,
+    "Premium_Payment": gen_premium_payment,
+    "Claim": gen_claim,
+    "Claim_Settlement": gen_claim_settlement,
+    "Risk_Assessment": gen_risk_assessment,
+    "Revenue_Expenses": gen_revenue_expenses,
+    "Customer_Segmentation": gen_customer_segmentation,
+    "Reinsurance_Info": gen_reinsurance_info,
+    "Feedback_Info": gen_feedback_info,
+    "Staff": gen_staff,
+}
+
+
+######################################################
+
+# yields the rows of table_name as DataFrames of at most chunk_size rows, with the columns in schema
+# order. every chunk gets its own random generator seeded from (seed, table, chunk number), so a
+# given seed and chunk size always produce the same rows, and chunks can be generated independently
+def generate_table(table_name, scale, seed=0, chunk_size=DEFAULT_CHUNK_SIZE):
+    counts = row_counts(scale)
+    columns = [column.name for column in TABLES[table_name].columns]
+    table_number = list(TABLES).index(table_name)
+
+    for chunk_number, start in enumerate(range(0, counts.get(table_name, 0), chunk_size)):
+        stop = min(start + chunk_size, counts[table_name])
+        rng = np.random.default_rng([seed, table_number, chunk_number])
+        data = GENERATORS[table_name](rng, np.arange(start, stop), counts)
+        yield pd.DataFrame(data, columns=columns)
+
+
+# the tables in an order where every parent comes before its children
+def tables_in_load_order():
+    return [name for level in schema.load_levels(TABLES) for name in level if name in GENERATORS]
+
+
+######################################################
+
+# output targets
+
+def write_csv(out_dir, scale, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, tables=None):
+    os.makedirs(out_dir, exist_ok=True)
+    for table_name in tables or tables_in_load_order():
+        path = os.path.join(out_dir, f"{table_name}.csv")
+        for number, chunk in enumerate(generate_table(table_name, scale, seed, chunk_size)):
+            chunk.to_csv(path, mode="w" if number == 0 else "a", header=number == 0, index=False)
+        yield table_name, path
+
+
+def write_parquet(out_dir, scale, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, tables=None):
+    # pyarrow is only needed for parquet output
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    os.makedirs(out_dir, exist_ok=True)
+    for table_name in tables or tables_in_load_order():
+        path = os.path.join(out_dir, f"{table_name}.parquet")
+        writer = None
+        for chunk in generate_table(table_name, scale, seed, chunk_size):
+            batch = pa.Table.from_pandas(chunk, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(path, batch.schema)
+            writer.write_table(batch)
+        if writer is not None:
+            writer.close()
+        yield table_name, path
+
+
+# inserts the generated rows through the bulk loader, parents before children. returns the
+# bulk loader's result for every table
+def load_into(connection, scale, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, tables=None):
+    results = {}
+    for table_name in tables or tables_in_load_order():
+        columns = [column.name for column in TABLES[table_name].columns]
+
+        def rows():
+            for chunk in generate_table(table_name, scale, seed, chunk_size):
+                yield from chunk.astype(object).values.tolist()
+
+        results[table_name] = bulk_loader.bulk_insert(connection, table_name, columns, rows(), batch_size=chunk_size)
+    return results
+
+
+# creates every table of the schema in an (empty) sqlite database, for use as a local stand-in
+def create_sqlite_schema(connection):
+    for table in TABLES.values():
+        connection.execute(schema.create_table_sql(table))
+    connection.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic data for the Insurance schema.")
+    parser.add_argument("--scale", type=int, default=1000, help="number of customers (other tables scale with it)")
+    parser.add_argument("--seed", type=int, default=0, help="random seed")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="rows generated per chunk")
+    parser.add_argument("--tables", help="comma separated list of tables (default: all)")
+    parser.add_argument("--out", help="directory to write one file per table to")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv", help="file format for --out")
+    parser.add_argument("--load", action="store_true", help="insert the rows into the database")
+    parser.add_argument("--sqlite", help="create a sqlite stand-in database at this path and load it")
+    args = parser.parse_args()
+
+    tables = args.tables.split(",") if args.tables else None
+    counts = row_counts(args.scale)
+
+    if args.out:
+        writer = write_parquet if args.format == "parquet" else write_csv
+        for table_name, path in writer(args.out, args.scale, args.seed, args.chunk_size, tables):
+            print(f"{table_name:<22} {counts[table_name]:>12} rows -> {path}")
+
+    if args.load or args.sqlite:
+        if args.sqlite:
+            connection = sqlite3.connect(args.sqlite)
+            create_sqlite_schema(connection)
+        else:
+            connection = db_pool.connect()
+        try:
+            for table_name, result in load_into(connection, args.scale, args.seed, args.chunk_size, tables).items():
+                print(f"{table_name:<22} {result['rows']:>12} rows {result['rows_per_second']:>10.0f} rows/sec")
+        finally:
+            connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+# A bounded connection pool shared by the flask app (and any script that needs more than one
+# connection at a time). Each request checks a connection out, uses it, and checks it back in
+# when the flask app context is torn down, so concurrent requests never share a cursor.
+
+######################################################
+
+# importing the necessary libraries
+
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+######################################################
+
+# the connection string for the SQL server database used by the app and the supplement script
+CONNECTION_STRING = (
+    r"Driver={ODBC Driver 17 for SQL Server};"
+    r"Server=(localdb)\localdb73;"
+    "Database=Insurance;"
+    "Trusted_Connection=yes;"
+)
+
+
+# true when connect() opens the local sqlite stand-in instead of SQL server. the few queries that
+# need server specific SQL check this
+def using_sqlite():
+    return bool(os.environ.get("INSURANCE_SQLITE_PATH"))
+
+
+# the query for the highest row version of table that can safely be read, and the condition selecting
+# the rows between two versions. on SQL server rows still being inserted by an open transaction can
+# commit with a lower rowversion than rows already visible, so readers stop short of the oldest one
+# still active. on the sqlite stand-in rowid takes the place of the rowversion
+def version_bounds(table):
+    if using_sqlite():
+        return f"SELECT COALESCE(MAX(rowid), 0) FROM {table}", "rowid > ? AND rowid <= ?"
+    return (
+        "SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT) - 1",
+        "Row_Version > CAST(CAST(? AS BIGINT) AS BINARY(8)) AND Row_Version <= CAST(CAST(? AS BIGINT) AS BINARY(8))",
+    )
+
+
+# the errors a statement can fail with, whichever database connect() opened. pyodbc is only there
+# when the ODBC driver is installed
+try:
+    import pyodbc
+    DatabaseError = (pyodbc.Error, sqlite3.Error)
+except ImportError:
+    DatabaseError = (sqlite3.Error,)
+
+
+# opens a new connection to the database. if the INSURANCE_SQLITE_PATH environment variable is set,
+# a local sqlite file is used instead of SQL server, which lets the app and the benchmarks run
+# without an ODBC driver (sqlite uses the same ? placeholders as pyodbc)
+def connect():
+    if using_sqlite():
+        return sqlite3.connect(os.environ["INSURANCE_SQLITE_PATH"], check_same_thread=False)
+
+    import pyodbc
+    return pyodbc.connect(CONNECTION_STRING)
+
+
+# raised when no connection becomes free before the checkout timeout runs out
+class PoolTimeout(Exception):
+    pass
+
+
+# the pool itself. at most max_size connections exist at once; idle ones are kept in a LIFO queue
+# so the most recently used (and most likely still alive) connection is handed out first.
+# a connection that has been idle for longer than recheck_after seconds is health checked before
+# it is handed out, and is replaced with a fresh one if the server has dropped it.
+class ConnectionPool:
+    def __init__(self, connect=connect, max_size=10, timeout=30, recheck_after=5, health_check="SELECT 1"):
+        self._connect = connect
+        self.max_size = max_size
+        self.timeout = timeout
+        self.recheck_after = recheck_after
+        self.health_check = health_check
+
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+
+        # metrics, read through stats()
+        self.in_use = 0
+        self.created = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.reconnects = 0
+        self.wait_time_total = 0.0
+        self.wait_time_max = 0.0
+
+    # hands out a healthy connection, waiting up to self.timeout seconds for one to become free
+    def checkout(self):
+        start = time.perf_counter()
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.checkout_failures += 1
+            raise PoolTimeout(f"No database connection became free within {self.timeout} seconds.")
+
+        try:
+            connection = self._get_healthy()
+        except Exception:
+            self._slots.release()
+            with self._lock:
+                self.checkout_failures += 1
+            raise
+
+        waited = time.perf_counter() - start
+        with self._lock:
+            self.in_use += 1
+            self.checkouts += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+        return connection
+
+    # returns a connection to the pool. any uncommitted work is rolled back so the next user starts
+    # clean; connections that are known to be broken (or fail the rollback) are closed instead
+    def checkin(self, connection, broken=False):
+        try:
+            if not broken:
+                try:
+                    connection.rollback()
+                except Exception:
+                    broken = True
+
+            if broken:
+                self._discard(connection)
+            else:
+                self._idle.put((connection, time.monotonic()))
+        finally:
+            with self._lock:
+                self.in_use -= 1
+            self._slots.release()
+
+    # takes idle connections off the queue until one passes the health check. if none are left
+    # a new connection is opened
+    def _get_healthy(self):
+        while True:
+            try:
+                connection, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                break
+
+            if time.monotonic() - last_used < self.recheck_after or self._is_healthy(connection):
+                return connection
+
+            self._discard(connection)
+            with self._lock:
+                self.reconnects += 1
+
+        connection = self._connect()
+        with self._lock:
+            self.created += 1
+        return connection
+
+    def _is_healthy(self, connection):
+        try:
+            cursor = connection.cursor()
+            cursor.execute(self.health_check)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            pass
+
+    # snapshot of the pool metrics
+    def stats(self):
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "in_use": self.in_use,
+                "idle": self._idle.qsize(),
+                "created": self.created,
+                "checkouts": self.checkouts,
+                "checkout_failures": self.checkout_failures,
+                "reconnects": self.reconnects,
+                "wait_time_total": self.wait_time_total,
+                "wait_time_max": self.wait_time_max,
+                "wait_time_avg": self.wait_time_total / self.checkouts if self.checkouts else 0.0,
+            }
+
+    # zeroes the counters (used between benchmark runs); in_use and created reflect live state and are kept
+    def reset_stats(self):
+        with self._lock:
+            self.checkouts = 0
+            self.checkout_failures = 0
+            self.reconnects = 0
+            self.wait_time_total = 0.0
+            self.wait_time_max = 0.0
+
+    # closes every idle connection (connections that are checked out are closed when returned)
+    def close(self):
+        while True:
+            try:
+                connection, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._discard(connection)
@@ -0,0 +1,249 @@
+# Incremental extracts for downstream consumers (e.g. the reporting warehouse). Instead of pulling
+# every table in full, each run writes only the rows inserted or updated since the consumer's last
+# run, as NDJSON or Parquet files (optionally gzipped) under --out.
+#
+# Migration 006 (and 003 for payments and settlements) gives every table a rowversion column with an
+# index on it. A consumer's watermark per table (in Rollup_Watermark, named delta_sync.<consumer>.<table>)
+# is the highest version it has received, so a run reads the rows between the watermark and the
+# highest version that can safely be read (see db_pool.version_bounds) in version order,
+# through the index. The time a run takes depends on the number of changed rows, not the size of
+# the tables. On the sqlite stand-in rowid takes the place of the rowversion, so only inserted rows
+# are picked up there.
+#
+# A table's changes are written in parts of at most --part-rows rows. After every part the position
+# reached is saved in a state file, so a run that fails partway through carries on from the last
+# complete part the next time. When a table is finished a manifest listing its files is written next
+# to them and the watermark is moved; consumers should only read the files of runs that have a
+# manifest. Deleted rows are not tracked.
+#
+# usage: python delta_sync.py --out DIR [--consumer NAME] [--format ndjson|parquet] [--gzip]
+#                             [--tables A,B,...] [--part-rows N]
+
+######################################################
+
+# importing the necessary libraries
+
+import argparse
+import json
+import os
+import re
+import time
+
+import bulk_loader
+import db_pool
+import exporter
+import table_browser
+from db_pool import version_bounds
+
+######################################################
+
+DEFAULT_CONSUMER = "warehouse"
+DEFAULT_PART_ROWS = 500000
+FORMATS = ("ndjson", "parquet")
+
+WATERMARK_PREFIX = "delta_sync."
+
+# consumer names end up in watermark names (at most 50 characters) and file names
+CONSUMER_NAME = re.compile(r"[A-Za-z0-9_]{1,12}")
+
+
+# raised when another run moved a table's watermark first. the files written by this run for that
+# table are complete, but the table is extracted again by the next run
+class SyncConflict(Exception):
+    pass
+
+
+def watermark_name(consumer, table_name):
+    return f"{WATERMARK_PREFIX}{consumer}.{table_name}"
+
+
+def state_path(consumer):
+    return os.path.join(bulk_loader.CHECKPOINT_DIR, f"delta_sync.{consumer}.json")
+
+
+def load_state(consumer):
+    try:
+        with open(state_path(consumer)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_state(consumer, state):
+    os.makedirs(bulk_loader.CHECKPOINT_DIR, exist_ok=True)
+    path = state_path(consumer)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f)
+    os.replace(path + ".tmp", path)
+
+
+def read_watermark(connection, consumer, table_name):
+    cursor = connection.cursor()
+    cursor.execute("SELECT Version FROM Rollup_Watermark WHERE Name = ?", (watermark_name(consumer, table_name),))
+    row = cursor.fetchone()
+    return None if row is None else int(row[0])
+
+
+# moves the watermark from old to new, only if it is still at old
+def move_watermark(connection, consumer, table_name, old, new):
+    cursor = connection.cursor()
+    name = watermark_name(consumer, table_name)
+    try:
+        if old is None:
+            cursor.execute("INSERT INTO Rollup_Watermark (Name, Version) VALUES (?, ?)", (name, new))
+        else:
+            cursor.execute(
+                "UPDATE Rollup_Watermark SET Version = ?, Updated_At = CURRENT_TIMESTAMP WHERE Name = ? AND Version = ?",
+                (new, name, old),
+            )
+            if cursor.rowcount != 1:
+                raise SyncConflict(f"The {table_name} watermark of {consumer} was moved by another run.")
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+
+# the changed rows of table_name between two versions, oldest change first, each with its version
+# (as a number) after the visible columns
+def changes_query(table_name, columns):
+    _, between = version_bounds(table_name)
+    version, order = ("rowid", "rowid") if db_pool.using_sqlite() else ("CAST(Row_Version AS BIGINT)", "Row_Version")
+    return f"SELECT {', '.join(columns)}, {version} FROM {table_name} WHERE {between} ORDER BY {order}"
+
+
+# the batches of one part: at most part_rows rows, fetched batch_size at a time, without the version.
+# position["version"] is kept at the version of the last row handed out
+def _part_batches(cursor, first, part_rows, batch_size, position):
+    batch = first
+    remaining = part_rows
+    while batch:
+        remaining -= len(batch)
+        position["version"] = int(batch[-1][-1])
+        position["rows"] += len(batch)
+        yield [row[:-1] for row in batch]
+        if remaining <= 0:
+            return
+        batch = cursor.fetchmany(min(batch_size, remaining))
+
+
+######################################################
+
+# writes the rows of table_name changed since the consumer's watermark. returns the number of rows
+# and the files written
+def extract_table(connection, table_name, out_dir, consumer=DEFAULT_CONSUMER, format="ndjson", compress=False,
+                  part_rows=DEFAULT_PART_ROWS, batch_size=exporter.DEFAULT_BATCH_SIZE):
+    state = load_state(consumer)
+    entry = state.get(table_name)
+    cursor = connection.cursor()
+
+    if entry is None:
+        # a new run: everything up to the highest version that can be read now
+        low = read_watermark(connection, consumer, table_name)
+        upper_sql, _ = version_bounds(table_name)
+        cursor.execute(upper_sql)
+        high = int(cursor.fetchone()[0] or 0)
+        if high <= (low or 0):
+            return {"rows": 0, "files": []}
+        entry = {"watermark": low, "low": low or 0, "high": high, "position": low or 0, "rows": 0, "part": 0,
+                 "files": []}
+        state[table_name] = entry
+        save_state(consumer, state)
+
+    table = table_browser.get_table(table_name)
+    columns = table_browser.visible_columns(table)
+    directory = os.path.join(out_dir, table_name)
+    os.makedirs(directory, exist_ok=True)
+    extension = exporter.FORMATS[format][1] + (".gz" if compress else "")
+    run_name = f"{table_name}.{entry['low']:020d}-{entry['high']:020d}"
+
+    cursor.execute(changes_query(table_name, columns), (entry["position"], entry["high"]))
+    while True:
+        first = cursor.fetchmany(min(batch_size, part_rows))
+        if not first:
+            break
+        position = {"version": entry["position"], "rows": 0}
+        batches = _part_batches(cursor, first, part_rows, batch_size, position)
+        if format == "parquet":
+            chunks = exporter.parquet_chunks(table, columns, batches)
+        else:
+            chunks = exporter.ndjson_chunks(columns, batches)
+        if compress:
+            chunks = exporter.gzipped(chunks)
+
+        file_name = f"{run_name}.{entry['part']:05d}{extension}"
+        path = os.path.join(directory, file_name)
+        with open(path + ".tmp", "wb") as f:
+            for chunk in chunks:
+                f.write(chunk)
+        os.replace(path + ".tmp", path)
+
+        entry["position"] = position["version"]
+        entry["rows"] += position["rows"]
+        entry["part"] += 1
+        entry["files"].append(file_name)
+        save_state(consumer, state)
+
+    manifest = {
+        "table": table_name,
+        "consumer": consumer,
+        "low_version": entry["low"],
+        "high_version": entry["high"],
+        "rows": entry["rows"],
+        "columns": columns,
+        "format": format,
+        "gzip": compress,
+        "files": entry["files"],
+        "created_at": time.time(),
+    }
+    manifest_path = os.path.join(directory, f"{run_name}.manifest.json")
+    with open(manifest_path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(manifest_path + ".tmp", manifest_path)
+
+    del state[table_name]
+    save_state(consumer, state)
+    move_watermark(connection, consumer, table_name, entry["watermark"], entry["high"])
+    return {"rows": entry["rows"], "files": entry["files"]}
+
+
+# extracts every table (or the given ones). returns {table: result of extract_table}
+def run(connection, out_dir, consumer=DEFAULT_CONSUMER, format="ndjson", compress=False, tables=None,
+        part_rows=DEFAULT_PART_ROWS):
+    if not CONSUMER_NAME.fullmatch(consumer):
+        raise ValueError(f"Invalid consumer name: {consumer}")
+    if format not in FORMATS:
+        raise ValueError(f"Unknown delta format: {format}")
+
+    results = {}
+    for table_name in tables or list(table_browser.TABLES):
+        start = time.perf_counter()
+        results[table_name] = extract_table(connection, table_name, out_dir, consumer, format, compress, part_rows)
+        results[table_name]["seconds"] = time.perf_counter() - start
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write the rows changed since the last run of a consumer.")
+    parser.add_argument("--out", required=True, help="folder the delta files are written to")
+    parser.add_argument("--consumer", default=DEFAULT_CONSUMER, help="whose watermarks to use and move")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson", help="file format")
+    parser.add_argument("--gzip", action="store_true", help="gzip the files")
+    parser.add_argument("--tables", help="comma separated tables to extract (all by default)")
+    parser.add_argument("--part-rows", type=int, default=DEFAULT_PART_ROWS, help="rows per file at most")
+    args = parser.parse_args()
+
+    connection = db_pool.connect()
+    try:
+        results = run(connection, args.out, args.consumer, args.format, args.gzip,
+                      args.tables.split(",") if args.tables else None, args.part_rows)
+    finally:
+        connection.close()
+
+    for table_name, result in results.items():
+        print(f"{table_name}: {result['rows']} changed rows in {len(result['files'])} files "
+              f"({result['seconds']:.2f}s)")
+
+
+if __name__ == "__main__":
+    main()
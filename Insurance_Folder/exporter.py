@@ -0,0 +1,262 @@
+# Streams the rows of a table out of the database as CSV, NDJSON (one json object per line) or
+# Parquet, optionally gzipped. Used by the app's /export/<table> route and from the command line.
+#
+# Rows are read from the server batch_size at a time with fetchmany and every batch is encoded and
+# handed on (to the client, or to the output file) before the next one is fetched, so memory use
+# stays the same however big the table is. Parquet files are written one row group at a time
+# (PARQUET_ROW_GROUP_SIZE rows). Hidden columns (e.g. Staff.Password) are never exported.
+#
+# usage: python exporter.py <table> [--format csv|ndjson|parquet] [--gzip] [--out FILE]
+#                           [--columns A,B,...] [--where Column=value ...] [--batch-size N]
+
+######################################################
+
+# importing the necessary libraries
+
+import argparse
+import csv
+import importlib.util
+import io
+import json
+import os
+import sys
+import time
+import zlib
+
+import pandas as pd
+
+import db_pool
+import table_browser
+
+######################################################
+
+DEFAULT_BATCH_SIZE = 10000
+PARQUET_ROW_GROUP_SIZE = 100000
+
+# gzip level 1 compresses several times faster than the default with files only slightly bigger, so
+# the compression keeps up with the network
+GZIP_LEVEL = 1
+
+# format -> (mimetype, file extension)
+FORMATS = {
+    "csv": ("text/csv", ".csv"),
+    "ndjson": ("application/x-ndjson", ".ndjson"),
+    "parquet": ("application/vnd.apache.parquet", ".parquet"),
+}
+
+
+# raised for an export that cannot be made (unknown format, column, ...)
+class ExportError(Exception):
+    pass
+
+
+# the SELECT for the export of table, with only the given columns (all visible columns by default)
+# and the rows where every column in filters has the given value
+def build_query(table, columns=None, filters=None):
+    visible = table_browser.visible_columns(table)
+    columns = columns or visible
+    filters = filters or {}
+    for name in list(columns) + list(filters):
+        if name not in visible:
+            raise ExportError(f"{table.name} has no column {name}")
+
+    where = f" WHERE {' AND '.join(f'{name} = ?' for name in filters)}" if filters else ""
+    return f"SELECT {', '.join(columns)} FROM {table.name}{where}", list(filters.values()), list(columns)
+
+
+# runs the query and returns a generator of row batches. the query is executed straight away, so a
+# bad request fails here rather than halfway through a streamed response
+def fetch_batches(connection, query, params, batch_size=DEFAULT_BATCH_SIZE):
+    cursor = connection.cursor()
+    cursor.execute(query, params)
+
+    def batches():
+        while True:
+            batch = cursor.fetchmany(batch_size)
+            if not batch:
+                break
+            yield batch
+
+    return batches()
+
+
+######################################################
+
+# the encoders. each takes the column names and the row batches and yields bytes
+
+def csv_chunks(columns, batches):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator="\n")
+    writer.writerow(columns)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode()
+
+
+def ndjson_chunks(columns, batches):
+    # one encoder for every row, rather than json.dumps making a new one per row
+    encode = json.JSONEncoder(default=table_browser.json_default).encode
+    for batch in batches:
+        yield "".join(encode(dict(zip(columns, row))) + "\n" for row in batch).encode()
+
+
+# collects what the parquet writer writes, so it can be yielded after every row group
+class _Sink(io.RawIOBase):
+    def __init__(self):
+        self.parts = []
+        self.size = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.size
+
+    def drain(self):
+        data = b"".join(self.parts)
+        self.parts = []
+        return data
+
+
+def parquet_chunks(table, columns, batches, row_group_size=PARQUET_ROW_GROUP_SIZE):
+    # pyarrow is only needed for parquet output
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    types = {column.name: column.data_type for column in table.columns}
+    schema = pa.schema([(name, _arrow_type(pa, types[name])) for name in columns])
+    sink = _Sink()
+    writer = pq.ParquetWriter(sink, schema)
+
+    rows = []
+    for batch in batches:
+        rows.extend(batch)
+        if len(rows) >= row_group_size:
+            writer.write_table(_arrow_table(pa, schema, rows))
+            rows = []
+            yield sink.drain()
+    if rows:
+        writer.write_table(_arrow_table(pa, schema, rows))
+    writer.close()
+    yield sink.drain()
+
+
+# the arrow type of a column, from its type in InsuranceDB_Creator.sql
+def _arrow_type(pa, data_type):
+    return {
+        "INT": pa.int64(),
+        "INTEGER": pa.int64(),
+        "FLOAT": pa.float64(),
+        "DECIMAL": pa.float64(),
+        "BIT": pa.bool_(),
+        "DATE": pa.date32(),
+        "DATETIME": pa.timestamp("ms"),
+    }.get(data_type, pa.string())
+
+
+# one row group. values are converted through pandas, since the sqlite stand-in returns dates as
+# strings and SQL server returns DECIMAL columns as Decimal objects
+def _arrow_table(pa, schema, rows):
+    arrays = []
+    for field, values in zip(schema, zip(*rows)):
+        series = pd.Series(values, dtype=object)
+        if pa.types.is_integer(field.type):
+            array = pa.array(pd.to_numeric(series, errors="coerce").astype("Int64"), type=field.type)
+        elif pa.types.is_floating(field.type):
+            array = pa.array(pd.to_numeric(series, errors="coerce"), type=field.type, from_pandas=True)
+        elif pa.types.is_date(field.type) or pa.types.is_timestamp(field.type):
+            array = pa.array(pd.to_datetime(series, errors="coerce"), from_pandas=True).cast(field.type)
+        elif pa.types.is_boolean(field.type):
+            array = pa.array([None if value is None else bool(value) for value in values], type=field.type)
+        else:
+            array = pa.array([None if value is None else str(value) for value in values], type=field.type)
+        arrays.append(array)
+    return pa.Table.from_arrays(arrays, schema=schema)
+
+
+# gzips a stream of chunks as it goes
+def gzipped(chunks, level=GZIP_LEVEL):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+######################################################
+
+# starts the export of a table. returns the generator of output chunks, its mimetype and a file name
+# for it. the query runs before this returns, so any problem with the request is raised here
+def export(connection, table_name, format="csv", columns=None, filters=None, compress=False,
+           batch_size=DEFAULT_BATCH_SIZE):
+    if format not in FORMATS:
+        raise ExportError(f"Unknown export format: {format}")
+    if format == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise ExportError("Parquet export needs pyarrow, which is not installed.")
+    table = table_browser.get_table(table_name)
+    query, params, columns = build_query(table, columns, filters)
+    batches = fetch_batches(connection, query, params, batch_size)
+
+    if format == "csv":
+        chunks = csv_chunks(columns, batches)
+    elif format == "ndjson":
+        chunks = ndjson_chunks(columns, batches)
+    else:
+        chunks = parquet_chunks(table, columns, batches)
+
+    mimetype, extension = FORMATS[format]
+    file_name = table.name + extension
+    if compress:
+        chunks = gzipped(chunks)
+        mimetype, file_name = "application/gzip", file_name + ".gz"
+    return chunks, mimetype, file_name
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the rows of a table.")
+    parser.add_argument("table", help="the table to export")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="csv", help="output format")
+    parser.add_argument("--gzip", action="store_true", help="gzip the output")
+    parser.add_argument("--out", help="output file (by default <table>.<format>, - for stdout)")
+    parser.add_argument("--columns", help="comma separated columns to export (all by default)")
+    parser.add_argument("--where", action="append", default=[], metavar="COLUMN=VALUE",
+                        help="only export the rows where COLUMN has VALUE (can be repeated)")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="rows fetched per batch")
+    args = parser.parse_args()
+
+    filters = dict(condition.split("=", 1) for condition in args.where)
+    columns = args.columns.split(",") if args.columns else None
+
+    start = time.perf_counter()
+    connection = db_pool.connect()
+    try:
+        chunks, _, file_name = export(connection, args.table, args.format, columns, filters, args.gzip,
+                                      args.batch_size)
+        out = args.out or file_name
+        written = 0
+        with (os.fdopen(sys.stdout.fileno(), "wb", closefd=False) if out == "-" else open(out, "wb")) as f:
+            for chunk in chunks:
+                f.write(chunk)
+                written += len(chunk)
+    except (ExportError, table_browser.BrowseError) as e:
+        sys.exit(str(e))
+    finally:
+        connection.close()
+
+    seconds = time.perf_counter() - start
+    print(f"Wrote {written / 1e6:.1f} MB to {out} in {seconds:.2f}s ({written / 1e6 / seconds:.1f} MB/s).",
+          file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+# Foreign key pre-check for the bulk loads. Before a chunk is sent to the server, every foreign key
+# column in it is looked up in an in-memory set of the keys that exist in the parent table, so rows
+# pointing at a missing parent (e.g. a Claim for Incident 'INC001' when the incidents are numbered
+# 'INC0001') are rejected with the other invalid rows instead of failing a batch on the server.
+#
+# The keys of a parent table are read once, the first time a load needs them, and kept as a sorted
+# array of 64-bit hashes (8 bytes per key however long the key is), which is searched with NumPy for
+# a whole chunk at a time. Keys of parent rows inserted during the same load are added once the
+# batch they are in has been committed (a batch that fails must not let its children through).
+# A hash collision can only let an orphan through (the server still rejects it), never reject a
+# valid row. Keys are compared upper cased and without trailing spaces, like SQL server's default
+# collation does.
+
+######################################################
+
+# importing the necessary libraries
+
+import threading
+
+import numpy as np
+import pandas as pd
+
+import registry
+
+######################################################
+
+# rows read from a parent table per round trip while loading its keys
+FETCH_SIZE = 50000
+
+# separates the parts of a composite key before it is hashed
+KEY_SEPARATOR = "\x1f"
+
+
+# hashes key values (one array per key column, all the same length) into one uint64 per row
+def hash_keys(columns):
+    parts = [pd.Series(np.asarray(values, dtype=object)).astype(str).str.rstrip().str.upper() for values in columns]
+    keys = parts[0]
+    if len(parts) > 1:
+        keys = keys.str.cat(parts[1:], sep=KEY_SEPARATOR)
+    return pd.util.hash_array(keys.to_numpy(dtype=object))
+
+
+# the set of keys of one parent table (for one foreign key's parent columns)
+class KeySet:
+    def __init__(self, table_name, columns):
+        self.table_name = table_name
+        self.columns = columns
+        self.keys = np.empty(0, dtype=np.uint64)
+        # keys added since the last merge, sorted. merged into self.keys once they add up
+        self.pending = np.empty(0, dtype=np.uint64)
+
+    def load(self, connection):
+        cursor = connection.cursor()
+        cursor.execute(f"SELECT {', '.join(self.columns)} FROM {self.table_name}")
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(FETCH_SIZE)
+            if not rows:
+                break
+            chunks.append(hash_keys(list(zip(*rows))))
+        if chunks:
+            self.keys = np.unique(np.concatenate(chunks))
+
+    def add(self, hashes):
+        self.pending = np.union1d(self.pending, hashes)
+        if len(self.pending) > max(65536, len(self.keys) // 16):
+            self.keys = np.union1d(self.keys, self.pending)
+            self.pending = np.empty(0, dtype=np.uint64)
+
+    def contains(self, hashes):
+        found = _sorted_contains(self.keys, hashes)
+        if len(self.pending):
+            found |= _sorted_contains(self.pending, hashes)
+        return found
+
+    def __len__(self):
+        return len(self.keys) + len(self.pending)
+
+
+def _sorted_contains(keys, hashes):
+    if not len(keys):
+        return np.zeros(len(hashes), dtype=bool)
+    positions = np.searchsorted(keys, hashes).clip(max=len(keys) - 1)
+    return keys[positions] == hashes
+
+
+######################################################
+
+# the key sets for every foreign key in the schema, loaded on first use through connection. one
+# filter can be shared by the threads of a parallel load
+class ForeignKeyFilter:
+    def __init__(self, connection):
+        self.connection = connection
+        self._key_sets = {}
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.orphans = 0
+
+    def _key_set(self, parent_table, parent_columns):
+        key = (parent_table, tuple(parent_columns))
+        with self._lock:
+            key_set = self._key_sets.get(key)
+            if key_set is None:
+                key_set = KeySet(parent_table, list(parent_columns))
+                key_set.load(self.connection)
+                self._key_sets[key] = key_set
+            return key_set
+
+    # checks the foreign key columns of a chunk of table_name. returns (mask, message) pairs in the
+    # same form as chunk_validation's column checks: one per foreign key, marking the rows whose key
+    # is not in the parent table. rows with a NULL in the key are left to the NOT NULL checks
+    def check(self, table_name, chunk):
+        problems = []
+        for fk in registry.get(table_name).table.foreign_keys:
+            if not all(name in chunk.columns for name in fk.columns):
+                continue
+            values = [chunk[name] for name in fk.columns]
+            present = np.ones(len(chunk), dtype=bool)
+            for series in values:
+                present &= (series.notna() & (series.astype(str) != "")).to_numpy()
+            if not present.any():
+                continue
+
+            key_set = self._key_set(fk.parent_table, fk.parent_columns)
+            missing = np.zeros(len(chunk), dtype=bool)
+            hashes = hash_keys([series.to_numpy()[present] for series in values])
+            with self._lock:
+                missing[present] = ~key_set.contains(hashes)
+
+            labels = ", ".join(name.replace("_", " ") for name in fk.columns)
+            problems.append((missing, f"{labels} does not match any {fk.parent_table}."))
+            with self._lock:
+                self.checked += int(present.sum())
+                self.orphans += int(missing.sum())
+        return problems
+
+    # the keys of rows of table_name (tuples of values for columns) for every key set that has been
+    # loaded for it, as (key set, hashes) pairs for add_keys
+    def keys(self, table_name, columns, rows):
+        with self._lock:
+            key_sets = [key_set for (parent, _), key_set in self._key_sets.items() if parent == table_name]
+        keys = []
+        for key_set in key_sets:
+            if all(name in columns for name in key_set.columns) and rows:
+                positions = [columns.index(name) for name in key_set.columns]
+                keys.append((key_set, hash_keys([[row[i] for row in rows] for i in positions])))
+        return keys
+
+    # adds keys (from keys()) of rows that have been committed, so children later in the same load
+    # find them
+    def add_keys(self, keys):
+        with self._lock:
+            for key_set, hashes in keys:
+                key_set.add(hashes)
+
+    # records the keys of rows of table_name that have just been committed
+    def add(self, table_name, columns, rows):
+        self.add_keys(self.keys(table_name, columns, rows))
+
+    def stats(self):
+        with self._lock:
+            return {
+                "key_sets": {f"{table}({', '.join(columns)})": len(key_set)
+                             for (table, columns), key_set in self._key_sets.items()},
+                "checked": self.checked,
+                "orphans": self.orphans,
+            }
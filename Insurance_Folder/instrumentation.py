@@ -0,0 +1,266 @@
+# Request-level timing for the flask app. Every request records its route, total latency, the
+# number and time of the SQL statements it ran, the time spent in commit() and the time spent
+# rendering templates. Whatever is left over is the time spent in the view itself (form parsing,
+# validation, ...). The totals are kept per route and exported in the Prometheus text format, and
+# each response carries a Server-Timing header with the breakdown for that request.
+#
+# SQL is timed by wrapping the database connections (see InstrumentedConnection). Statements slower
+# than INSURANCE_SLOW_QUERY_MS milliseconds are written to the "insurance.slow_sql" logger with
+# their parameterized text (the parameter values are never logged).
+
+######################################################
+
+# importing the necessary libraries
+
+import logging
+import os
+import threading
+import time
+
+from flask import g, has_app_context, request, before_render_template, template_rendered
+
+######################################################
+
+# upper bounds (in seconds) of the request latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# statements taking longer than this many milliseconds are logged. unset (or 0) turns the log off
+SLOW_QUERY_MS = float(os.environ.get("INSURANCE_SLOW_QUERY_MS", 0))
+
+slow_query_log = logging.getLogger("insurance.slow_sql")
+
+if os.environ.get("INSURANCE_SLOW_QUERY_LOG"):
+    _handler = logging.FileHandler(os.environ["INSURANCE_SLOW_QUERY_LOG"])
+    _handler.setFormatter(logging.Formatter("%(asctime)s %(message)s"))
+    slow_query_log.addHandler(_handler)
+    slow_query_log.setLevel(logging.WARNING)
+
+
+# the timings of the request being served, or None outside a request (e.g. in a script)
+def _current():
+    if has_app_context():
+        return g.get("timing")
+    return None
+
+
+# adds a finished SQL call to the current request's timings and to the slow query log
+def _record_sql(kind, sql, seconds, statements=1):
+    timing = _current()
+    if timing is not None:
+        if kind == "commit":
+            timing["commit_count"] += 1
+            timing["commit_seconds"] += seconds
+        else:
+            timing["sql_count"] += statements
+            timing["sql_seconds"] += seconds
+
+    if SLOW_QUERY_MS and seconds * 1000 >= SLOW_QUERY_MS:
+        route = timing["route"] if timing is not None else "-"
+        text = " ".join(str(sql).split())
+        slow_query_log.warning(f"{seconds * 1000:.1f} ms {kind} [{route}] {text}")
+
+
+######################################################
+
+# wrappers around a DB-API connection and its cursors. they time execute, executemany and commit
+# and hand everything else (fetchone, rollback, fast_executemany, ...) to the wrapped object, so
+# they can be used anywhere a pyodbc (or sqlite3) connection is expected
+
+class InstrumentedCursor:
+    def __init__(self, cursor):
+        object.__setattr__(self, "_cursor", cursor)
+
+    def execute(self, sql, *params):
+        start = time.perf_counter()
+        try:
+            self._cursor.execute(sql, *params)
+        finally:
+            _record_sql("execute", sql, time.perf_counter() - start)
+        return self
+
+    def executemany(self, sql, seq_of_params):
+        seq_of_params = list(seq_of_params)
+        start = time.perf_counter()
+        try:
+            self._cursor.executemany(sql, seq_of_params)
+        finally:
+            _record_sql("executemany", sql, time.perf_counter() - start, statements=len(seq_of_params))
+        return self
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._cursor, name, value)
+
+
+class InstrumentedConnection:
+    def __init__(self, connection):
+        self._connection = connection
+
+    def cursor(self):
+        return InstrumentedCursor(self._connection.cursor())
+
+    # sqlite connections can execute directly (the benchmarks and migrations use this)
+    def execute(self, sql, *params):
+        return self.cursor().execute(sql, *params)
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            self._connection.commit()
+        finally:
+            _record_sql("commit", "COMMIT", time.perf_counter() - start)
+
+    def __getattr__(self, name):
+        return getattr(self._connection, name)
+
+
+# wraps a connection factory (e.g. db_pool.connect) so every connection it opens is instrumented
+def instrumented(connect):
+    def connect_instrumented():
+        return InstrumentedConnection(connect())
+    return connect_instrumented
+
+
+######################################################
+
+# per route totals, shared by all the threads serving requests
+class Metrics:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def _route(self, key):
+        if key not in self._routes:
+            self._routes[key] = {
+                "requests": 0,
+                "seconds": 0.0,
+                "buckets": [0] * len(self.buckets),
+                "sql_count": 0,
+                "sql_seconds": 0.0,
+                "commit_count": 0,
+                "commit_seconds": 0.0,
+                "render_seconds": 0.0,
+                "view_seconds": 0.0,
+            }
+        return self._routes[key]
+
+    def observe(self, timing, status):
+        with self._lock:
+            totals = self._route((timing["route"], timing["method"], status))
+            totals["requests"] += 1
+            totals["seconds"] += timing["seconds"]
+            for position, bound in enumerate(self.buckets):
+                if timing["seconds"] <= bound:
+                    totals["buckets"][position] += 1
+            for name in ("sql_count", "sql_seconds", "commit_count", "commit_seconds", "render_seconds", "view_seconds"):
+                totals[name] += timing[name]
+
+    def reset(self):
+        with self._lock:
+            self._routes.clear()
+
+    # the metrics in the Prometheus text exposition format
+    def prometheus(self):
+        with self._lock:
+            routes = {key: dict(totals, buckets=list(totals["buckets"])) for key, totals in self._routes.items()}
+
+        lines = [
+            "# HELP insurance_request_duration_seconds Time taken to serve a request.",
+            "# TYPE insurance_request_duration_seconds histogram",
+        ]
+        for (route, method, status), totals in sorted(routes.items()):
+            labels = f'route="{route}",method="{method}",status="{status}"'
+            for bound, count in zip(self.buckets, totals["buckets"]):
+                lines.append(f'insurance_request_duration_seconds_bucket{{{labels},le="{bound}"}} {count}')
+            lines.append(f'insurance_request_duration_seconds_bucket{{{labels},le="+Inf"}} {totals["requests"]}')
+            lines.append(f"insurance_request_duration_seconds_sum{{{labels}}} {totals['seconds']:.6f}")
+            lines.append(f"insurance_request_duration_seconds_count{{{labels}}} {totals['requests']}")
+
+        counters = [
+            ("insurance_sql_statements_total", "sql_count", "SQL statements executed."),
+            ("insurance_sql_seconds_total", "sql_seconds", "Time spent executing SQL statements."),
+            ("insurance_commits_total", "commit_count", "Transactions committed."),
+            ("insurance_commit_seconds_total", "commit_seconds", "Time spent in commit."),
+            ("insurance_template_render_seconds_total", "render_seconds", "Time spent rendering templates."),
+            ("insurance_view_seconds_total", "view_seconds", "Time spent in the view outside SQL and templates."),
+        ]
+        for metric, name, description in counters:
+            lines.append(f"# HELP {metric} {description}")
+            lines.append(f"# TYPE {metric} counter")
+            for (route, method, status), totals in sorted(routes.items()):
+                labels = f'route="{route}",method="{method}",status="{status}"'
+                lines.append(f"{metric}{{{labels}}} {totals[name]:g}")
+        return "\n".join(lines) + "\n"
+
+
+# formats a dictionary of numbers (e.g. pool.stats()) as Prometheus gauges named prefix_key
+def gauges(prefix, values):
+    lines = []
+    for key, value in values.items():
+        if isinstance(value, (int, float)):
+            lines.append(f"# TYPE {prefix}_{key} gauge")
+            lines.append(f"{prefix}_{key} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+######################################################
+
+# hooks the timing into a flask app. metrics collects the per route totals
+
+def init_app(app, metrics):
+    @app.before_request
+    def start_timing():
+        g.timing = {
+            "route": request.url_rule.rule if request.url_rule is not None else "unmatched",
+            "method": request.method,
+            "start": time.perf_counter(),
+            "sql_count": 0,
+            "sql_seconds": 0.0,
+            "commit_count": 0,
+            "commit_seconds": 0.0,
+            "render_seconds": 0.0,
+            "render_start": None,
+        }
+
+    @app.after_request
+    def finish_timing(response):
+        timing = g.get("timing")
+        if timing is None:
+            return response
+
+        timing["seconds"] = time.perf_counter() - timing["start"]
+        timing["view_seconds"] = max(
+            0.0, timing["seconds"] - timing["sql_seconds"] - timing["commit_seconds"] - timing["render_seconds"]
+        )
+        metrics.observe(timing, response.status_code)
+
+        # streamed responses (e.g. /api/<table>) keep running after this point, so their timings
+        # only cover the work done before the first byte is sent
+        response.headers["Server-Timing"] = ", ".join([
+            f"sql;desc=\"{timing['sql_count']} statements\";dur={timing['sql_seconds'] * 1000:.2f}",
+            f"commit;dur={timing['commit_seconds'] * 1000:.2f}",
+            f"render;dur={timing['render_seconds'] * 1000:.2f}",
+            f"view;dur={timing['view_seconds'] * 1000:.2f}",
+            f"total;dur={timing['seconds'] * 1000:.2f}",
+        ])
+        return response
+
+    def render_started(sender, template, context, **extra):
+        timing = _current()
+        if timing is not None:
+            timing["render_start"] = time.perf_counter()
+
+    def render_finished(sender, template, context, **extra):
+        timing = _current()
+        if timing is not None and timing["render_start"] is not None:
+            timing["render_seconds"] += time.perf_counter() - timing["render_start"]
+            timing["render_start"] = None
+
+    before_render_template.connect(render_started, app, weak=False)
+    template_rendered.connect(render_finished, app, weak=False)
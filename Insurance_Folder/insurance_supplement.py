@@ -6,285 +6,196 @@
 
 # importing the necessary libraries
 
-import pyodbc
-import pandas as pd
+import argparse
+import inspect
 import os
+import time
+from contextlib import contextmanager
 
-######################################################
-
-# Connecting the SQL server to the Python script
-connection = pyodbc.connect(
-    r"Driver={ODBC Driver 17 for SQL Server};"
-    r"Server=(localdb)\localdb73;"
-    "Database=Insurance;"
-    "Trusted_Connection=yes;"
-)
-
-cursor = connection.cursor()
+import audit
+import bulk_loader
+import db_pool
+import fk_filter
+import merge_loader
+import registry
 
 ######################################################
 
-# Functions that insert records into various tables. 
-def insert_customer(customer_id, first_name, last_name, dob, gender, address, city, country, phone, email, marital_status):
-    try:
-        query = """
-            INSERT INTO Customer (Customer_ID, First_Name, Last_Name, DOB, Gender, Address, City, Country, Phone, Email, Marital_Status)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, customer_id, first_name, last_name, dob, gender, address, city, country, phone, email, marital_status)
-        connection.commit()
-        print("Customer inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Customer:", e)
-
-def insert_incident(incident_id, type, date, description):
-    try:
-        query = """
-            INSERT INTO Incident (Incident_ID, Type, Date, Description)
-            VALUES (?, ?, ?, ?)
-        """
-        cursor.execute(query, incident_id, type, date, description)
-        connection.commit()
-        print("Incident inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Incident:", e)
-
-def insert_incident_report(report_id, incident_id, customer_id, inspector_name, estimated_cost, description):
-    try:
-        query = """
-            INSERT INTO Incident_Report (Report_ID, Incident_ID, Customer_ID, Inspector_Name, Estimated_Cost, Description)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, report_id, incident_id, customer_id, inspector_name, estimated_cost, description)
-        connection.commit()
-        print("Incident Report inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Incident Report:", e)
-
-def insert_company(company_id, name, contact_number, email, website, address, city, country):
-    try:
-        query = """
-            INSERT INTO Company (Company_ID, Name, Contact_Number, Email, Website, Address, City, Country)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, company_id, name, contact_number, email, website, address, city, country)
-        connection.commit()
-        print("Company inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Company:", e)
+# Connecting the SQL server to the Python script (db_pool.connect uses the same connection string
+# as the app, or a local sqlite database when INSURANCE_SQLITE_PATH is set)
+connection = db_pool.connect()
 
-def insert_department(department_id, company_id, name, staff_count, office_count):
-    try:
-        query = """
-            INSERT INTO Department (Department_ID, Company_ID, Name, Staff_Count, Office_Count)
-            VALUES (?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, department_id, company_id, name, staff_count, office_count)
-        connection.commit()
-        print("Department inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Department:", e)
-
-def insert_vehicle_service(service_id, department_id, company_id, name, address, contact, service_type):
-    try:
-        query = """
-            INSERT INTO Vehicle_Service (Service_ID, Department_ID, Company_ID, Name, Address, Contact, Service_Type)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, service_id, department_id, company_id, name, address, contact, service_type)
-        connection.commit()
-        print("Vehicle Service inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Vehicle Service:", e)
-
-def insert_vehicle(vehicle_id, customer_id, registration_number, value, type, make, model, engine_number, chassis_number):
-    try:
-        query = """
-            INSERT INTO Vehicle (Vehicle_ID, Customer_ID, Registration_Number, Value, Type, Make, Model, Engine_Number, Chassis_Number)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, vehicle_id, customer_id, registration_number, value, type, make, model, engine_number, chassis_number)
-        connection.commit()
-        print("Vehicle inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Vehicle:", e)
-
-def insert_application(application_id, customer_id, vehicle_id, status, coverage_description):
-    try:
-        query = """
-            INSERT INTO Application (Application_ID, Customer_ID, Vehicle_ID, Status, Coverage_Description)
-            VALUES (?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, application_id, customer_id, vehicle_id, status, coverage_description)
-        connection.commit()
-        print("Application inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Application:", e)
+cursor = connection.cursor()
 
-def insert_policy(policy_number, application_id, start_date, expiry_date, terms):
-    try:
-        query = """
-            INSERT INTO Policy (Policy_Number, Application_ID, Start_Date, Expiry_Date, Terms)
-            VALUES (?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, policy_number, application_id, start_date, expiry_date, terms)
-        connection.commit()
-        print("Policy inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Policy:", e)
+# uploads are recorded in Audit_Log in the background; the queue is drained when the script exits
+audit_writer = audit.AuditWriter(db_pool.connect)
 
-def insert_premium_payment(payment_id, policy_number, amount, payment_date, receipt_id):
-    try:
-        query = """
-            INSERT INTO Premium_Payment (Payment_ID, Policy_Number, Amount, Payment_Date, Receipt_ID)
-            VALUES (?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, payment_id, policy_number, amount, payment_date, receipt_id)
-        connection.commit()
-        print("Premium Payment inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Premium Payment:", e)
+# lets executemany (used by batch() below) send each group as one array-bound round trip
+if hasattr(cursor, "fast_executemany"):
+    cursor.fast_executemany = True
 
-def insert_claim(claim_id, policy_number, amount, incident_id, damage_type, date, status):
-    try:
-        query = """
-            INSERT INTO Claim (Claim_ID, Policy_Number, Amount, Incident_ID, Damage_Type, Date, Status)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, claim_id, policy_number, amount, incident_id, damage_type, date, status)
-        connection.commit()
-        print("Claim inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Claim:", e)
-
-def insert_claim_settlement(settlement_id, claim_id, amount_paid, settlement_date):
-    try:
-        query = """
-            INSERT INTO Claim_Settlement (Settlement_ID, Claim_ID, Amount_Paid, Settlement_Date)
-            VALUES (?, ?, ?, ?)
-        """
-        cursor.execute(query, settlement_id, claim_id, amount_paid, settlement_date)
-        connection.commit()
-        print("Claim Settlement inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Claim Settlement:", e)
+######################################################
 
-def insert_risk_assessment(assessment_id, customer_id, age, health_status, risk_level, premium_multiplier):
-    try:
-        query = """
-            INSERT INTO Risk_Assessment (Assessment_ID, Customer_ID, Age, Health_Status, Risk_Level, Premium_Multiplier)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, assessment_id, customer_id, age, health_status, risk_level, premium_multiplier)
-        connection.commit()
-        print("Risk Assessment inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Risk Assessment:", e)
+# Batching for the insert functions below. Outside a batch every insert is executed, committed and
+# reported on its own, as before. Inside a `with batch():` block the inserts are only collected,
+# and are sent to the server in groups of group_size rows (consecutive rows for the same table go
+# in a single executemany) with one commit per group. Instead of a line per row, a progress line is
+# printed after every group and a summary at the end.
+#
+#     with batch(group_size=1000):
+#         for record in records:
+#             insert_customer(*record)
+
+class _Batch:
+    def __init__(self, group_size):
+        self.group_size = group_size
+        self.pending = []
+        self.inserted = 0
+        self.failed = 0
+        self.start = time.perf_counter()
+
+    def add(self, label, query, params):
+        self.pending.append((label, query, params))
+        if len(self.pending) >= self.group_size:
+            self.flush()
+
+    # sends the pending rows and commits them. if a group fails, it is rolled back and retried one
+    # row at a time so only the bad rows are dropped, the same as without a batch
+    def flush(self):
+        if not self.pending:
+            return
+        group, self.pending = self.pending, []
+
+        try:
+            for label, query, rows in _runs(group):
+                cursor.executemany(query, rows)
+            connection.commit()
+            self.inserted += len(group)
+        except db_pool.DatabaseError:
+            connection.rollback()
+            for label, query, params in group:
+                try:
+                    cursor.execute(query, params)
+                    self.inserted += 1
+                except db_pool.DatabaseError as e:
+                    self.failed += 1
+                    print(f"Error inserting {label}:", e)
+            connection.commit()
+
+        elapsed = time.perf_counter() - self.start
+        print(f"{self.inserted} rows inserted, {self.failed} failed ({self.inserted / elapsed:.0f} rows/sec)")
+
+
+# splits a group into runs of consecutive rows that share the same insert statement, keeping the
+# order of the rows (so parent rows are still inserted before the child rows that reference them)
+def _runs(group):
+    runs = []
+    for label, query, params in group:
+        if runs and runs[-1][1] == query:
+            runs[-1][2].append(params)
+        else:
+            runs.append((label, query, [params]))
+    return runs
+
+
+# the batch currently collecting inserts, if any
+_current_batch = None
+
+
+@contextmanager
+def batch(group_size=1000):
+    global _current_batch
+    if _current_batch is not None:
+        # nested batches just join the outer one
+        yield _current_batch
+        return
 
-def insert_revenue_expenses(month, revenue, claims_paid, expenses, profit):
+    _current_batch = _Batch(group_size)
     try:
-        query = """
-            INSERT INTO Revenue_Expenses (Month, Revenue, Claims_paid, Expenses, Profit)
-            VALUES (?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, month, revenue, claims_paid, expenses, profit)
-        connection.commit()
-        print("Revenue/Expenses inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Revenue/Expenses:", e)
+        yield _current_batch
+    finally:
+        current, _current_batch = _current_batch, None
+        current.flush()
+        print(f"Batch finished: {current.inserted} rows inserted, {current.failed} failed.")
 
-def insert_customer_segmentation(segment_id, segment_name, age_range, average_income, risk_level, claim_frequency):
-    try:
-        query = """
-            INSERT INTO Customer_Segmentation (Segment_ID, Segment_Name, Age_Range, Average_Income, Risk_Level, Claim_Frequency)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, segment_id, segment_name, age_range, average_income, risk_level, claim_frequency)
-        connection.commit()
-        print("Customer Segmentation inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Customer Segmentation:", e)
 
-def insert_reinsurance_info(reinsurance_id, policy_number, reinsurer_name, reinsurance_type, coverage_limit, deductible):
-    try:
-        query = """
-            INSERT INTO Reinsurance_Info (Reinsurance_ID, Policy_Number, Reinsurer_Name, Reinsurance_Type, Coverage_Limit, Deductible)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, reinsurance_id, policy_number, reinsurer_name, reinsurance_type, coverage_limit, deductible)
-        connection.commit()
-        print("Reinsurance Info inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Reinsurance Info:", e)
+# runs one insert. used by every insert function below
+def _insert(label, query, params):
+    if _current_batch is not None:
+        _current_batch.add(label, query, params)
+        return
 
-def insert_feedback_info(feedback_id, customer_id, feedback_type, rating, feedback_text, feedback_date):
     try:
-        query = """
-            INSERT INTO Feedback_Info (Feedback_ID, Customer_ID, Feedback_Type, Rating, Feedback_Text, Feedback_Date)
-            VALUES (?, ?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, feedback_id, customer_id, feedback_type, rating, feedback_text, feedback_date)
+        cursor.execute(query, params)
         connection.commit()
-        print("Feedback Info inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Feedback Info:", e)
+        print(f"{label} inserted successfully.")
+    except db_pool.DatabaseError as e:
+        print(f"Error inserting {label}:", e)
 
-def insert_staff(staff_id, company_id, first_name, last_name, address, position, contact_number, email):
-    try:
-        query = """
-            INSERT INTO Staff (Staff_ID, Company_ID, First_Name, Last_Name, Address, Position, Contact_Number, Email)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, staff_id, company_id, first_name, last_name, address, position, contact_number, email)
-        connection.commit()
-        print("Staff inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Staff:", e)
+######################################################
 
-def insert_audit_log(log_id, table_name, operation_type, changed_by, change_date, original_data, new_data):
-    try:
-        query = """
-            INSERT INTO Audit_Log (Log_ID, Table_Name, Operation_Type, Changed_By, Change_Date, Original_Data, New_Data)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        """
-        cursor.execute(query, log_id, table_name, operation_type, changed_by, change_date, original_data, new_data)
-        connection.commit()
-        print("Audit Log inserted successfully.")
-    except pyodbc.Error as e:
-        print("Error inserting Audit Log:", e)
+# Functions that insert records into various tables. One is generated per table from the registry,
+# which holds the table's prepared INSERT and checks every value against its column before anything
+# is sent. Their parameters are the table's columns in lower case, in column order, so they can be
+# called with the values in order or by name, e.g.
+# insert_claim(claim_id, policy_number, amount, incident_id, damage_type, date, status)
+# insert_incident(incident_id="I1", type="Fire", date="2024-01-01", description="Kitchen fire")
+def _insert_function(spec):
+    name = f"insert_{spec.name.lower()}"
+    signature = inspect.Signature(
+        [inspect.Parameter(column.lower(), inspect.Parameter.POSITIONAL_OR_KEYWORD) for column in spec.columns]
+    )
+
+    def insert(*args, **kwargs):
+        try:
+            values = signature.bind(*args, **kwargs).arguments
+        except TypeError as e:
+            raise TypeError(f"{name}(): {e}") from None
+        try:
+            params = spec.convert([values[column.lower()] for column in spec.columns])
+        except registry.RowError as e:
+            print(f"Error inserting {spec.label}:", e)
+            return
+        _insert(spec.label, spec.insert.sql, params)
+
+    insert.__name__ = insert.__qualname__ = name
+    insert.__signature__ = signature
+    return insert
 
 ##############################################
 
 # Dictionary mapping the table name to the insert functions defined above
 
-insert_functions = {
-    "Customer": insert_customer,
-    "Incident": insert_incident,
-    "Incident_Report": insert_incident_report,
-    "Company": insert_company,
-    "Department": insert_department,
-    "Vehicle_Service": insert_vehicle_service,
-    "Vehicle": insert_vehicle,
-    "Application": insert_application,
-    "Policy": insert_policy,
-    "Premium_Payment": insert_premium_payment,
-    "Claim": insert_claim,
-    "Claim_Settlement": insert_claim_settlement,
-    "Risk_Assessment": insert_risk_assessment,
-    "Revenue_Expenses": insert_revenue_expenses,
-    "Customer_Segmentation": insert_customer_segmentation,
-    "Reinsurance_Info": insert_reinsurance_info,
-    "Feedback_Info": insert_feedback_info,
-    "Staff": insert_staff,
-    "Audit_Log": insert_audit_log,
-}
+insert_functions = {name: _insert_function(spec) for name, spec in registry.TABLES.items()}
+
+# the functions by name
+insert_customer = insert_functions["Customer"]
+insert_incident = insert_functions["Incident"]
+insert_incident_report = insert_functions["Incident_Report"]
+insert_company = insert_functions["Company"]
+insert_department = insert_functions["Department"]
+insert_vehicle_service = insert_functions["Vehicle_Service"]
+insert_vehicle = insert_functions["Vehicle"]
+insert_application = insert_functions["Application"]
+insert_policy = insert_functions["Policy"]
+insert_premium_payment = insert_functions["Premium_Payment"]
+insert_claim = insert_functions["Claim"]
+insert_claim_settlement = insert_functions["Claim_Settlement"]
+insert_risk_assessment = insert_functions["Risk_Assessment"]
+insert_revenue_expenses = insert_functions["Revenue_Expenses"]
+insert_customer_segmentation = insert_functions["Customer_Segmentation"]
+insert_reinsurance_info = insert_functions["Reinsurance_Info"]
+insert_feedback_info = insert_functions["Feedback_Info"]
+insert_staff = insert_functions["Staff"]
+insert_audit_log = insert_functions["Audit_Log"]
 
 ##############################################
 
 # Function that uploads the csv file and adds the records to the appropriate table
 # The user simply has to input the table name and the file name
+# With merge, rows already in the table are updated instead (see merge_loader.py)
 
-def uploader():
+def uploader(chunk_size=bulk_loader.DEFAULT_BATCH_SIZE, merge=False):
 
     file_path = input("Enter the path to the CSV file: ").strip()
 
@@ -299,32 +210,54 @@ def uploader():
         return
     
     try:
-        # Converts the CSV into a DataFrame
-        data = pd.read_csv(file_path)
-
-        # The where() method replaces values that are false with the specified value
-        # In this case, we replace NaN with None for SQL compatibility.
-        # The pd.notnull(data) creates a mask where False indicates a NaN,
-        # and True indicates a non-null value.
-        data = data.where(pd.notnull(data), None)
-
-        # looks up the appropriate function using the table name
-        insert_function = insert_functions[table_name]
-
-        # iterates through every row in the csv/dataframe, and converts the row into a named tuple
-        # the index isn't included to ensure that only the data columns are part of the record
-        # we use named tuples because we can access fields by name instead of position
-        # we can then use the tuples to pass data through the insertion function appropriately
-        for record in data.itertuples(index=False):
-            try:
-                # since every record is now a tuple, we use * to unpack the tuple and pass it as
-                # individual arguments to the function as required.
-                insert_function(*record)
-            except TypeError as e:
-                print(f"Error inserting record: {record} -- {e}")
+        # The file is read chunk_size rows at a time rather than all at once, so a multi-GB export
+        # never has to fit in memory. Each chunk is validated as a whole (including whether its
+        # foreign keys exist); rows that fail are written to a reject file with the reason and the
+        # rest are sent to the server as one batched insert (see bulk_loader.py). The CSV header must
+        # use the table's column names.
+        if merge:
+            # Merged files are staged in a temporary table and applied in one transaction, so a
+            # failed merge changes nothing
+            result = merge_loader.merge_csv_file(
+                connection, table_name, file_path, chunk_size=chunk_size, fk_filter=fk_filter.ForeignKeyFilter(connection)
+            )
+            print(f"{result['inserted']} records inserted, {result['updated']} updated and {result['unchanged']} "
+                  f"unchanged in {table_name} ({result['rows_per_second']:.0f} rows/sec).")
+        else:
+            result = bulk_loader.load_csv_file(
+                connection, table_name, file_path, chunk_size=chunk_size, fk_filter=fk_filter.ForeignKeyFilter(connection)
+            )
+            print(f"{result['rows']} records inserted into {table_name} ({result['rows_per_second']:.0f} rows/sec).")
+        audit_writer.record(table_name, audit.MERGE if merge else audit.BULK_INSERT, audit.script_user(),
+                            new_data=audit.load_summary(os.path.basename(file_path), result))
+        if result["rejected"]:
+            print(f"{result['rejected']} rows were rejected, see {result['reject_path']}")
+
+    except bulk_loader.BulkLoadError as e:
+        # every chunk before the failing one has been committed; running the uploader again on
+        # the same file picks up from there. a failed merge has not changed anything
+        if merge:
+            print(f"{e} -- nothing was changed.")
+        else:
+            print(f"{e} -- {e.rows_committed} rows were committed. Run again with the same file to resume.")
 
     except Exception as e:
         print("Error processing the file: ", e)
 
 
-uploader()
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Upload a CSV file into one of the Insurance tables.")
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=bulk_loader.DEFAULT_BATCH_SIZE,
+        help="number of rows read from the file and inserted per batch",
+    )
+    parser.add_argument(
+        "--merge",
+        action="store_true",
+        help="insert new rows and update changed ones instead of only inserting",
+    )
+    args = parser.parse_args()
+
+    uploader(chunk_size=args.chunk_size, merge=args.merge)
@@ -0,0 +1,330 @@
+# Background imports for /upload_csv. An uploaded file is spooled to disk and queued as a job, and the
+# request returns straight away with the job's ID instead of running the whole import while the
+# browser (and any proxy in front of the app) waits. A small pool of worker threads runs the queued
+# imports with the bulk loader, at most `workers` at a time and each on its own connection (not one
+# from the request pool), so a big load cannot starve the web requests of connections or threads.
+#
+# Every job keeps its progress (rows processed and rejected, throughput and an ETA based on how much
+# of the file has been read) in memory and in a small status file next to the spooled upload, so
+# /jobs/<id> can report it from any app process.
+
+######################################################
+
+# importing the necessary libraries
+
+import contextlib
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import audit
+import bulk_loader
+import fk_filter
+import merge_loader
+
+######################################################
+
+# uploads waiting to be imported (and the jobs' status files) are kept here (INSURANCE_SPOOL_DIR)
+SPOOL_DIR = os.environ.get(
+    "INSURANCE_SPOOL_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "spool")
+)
+
+# status of finished jobs is kept for this many seconds
+JOB_RETENTION = 24 * 60 * 60
+
+JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+
+# raised by submit when too many imports are already waiting
+class QueueFull(Exception):
+    pass
+
+
+def status_path(job_id):
+    return os.path.join(SPOOL_DIR, f"{job_id}.json")
+
+
+# reads the status file of a job started by any process. returns None for an unknown job
+def read_status(job_id):
+    if not JOB_ID.fullmatch(job_id):
+        return None
+    try:
+        with open(status_path(job_id)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+# the checkpoint and reject files of an import are named after this: the table and a hash of the
+# spooled file's contents. uploading the same file again finds its checkpoint whatever it is called,
+# and two different files uploaded under the same name never share one
+def content_key(table_name, path):
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return f"{table_name}_{digest.hexdigest()[:16]}"
+
+
+######################################################
+
+# the ways a file can be imported: "insert" adds its rows (see bulk_loader.py), "merge" inserts new
+# rows and updates changed ones (see merge_loader.py)
+MODES = ("insert", "merge")
+
+
+# one uploaded CSV file to be imported into table_name. changed_by is recorded in the audit log
+class ImportJob:
+    def __init__(self, table_name, file_name, batch_size, changed_by=None, mode="insert"):
+        self.id = uuid.uuid4().hex
+        self.table_name = table_name
+        self.file_name = file_name
+        self.batch_size = batch_size
+        self.changed_by = changed_by
+        self.mode = mode
+        self.path = os.path.join(SPOOL_DIR, f"{self.id}.csv")
+        self.key = None
+
+        self.state = "queued"
+        self.error = None
+        self.total_bytes = 0
+        self.bytes_read = 0
+        self.rows_inserted = 0
+        self.rows_rejected = 0
+        self.rows_skipped = 0
+        self.rows_staged = 0
+        self.rows_updated = 0
+        self.rows_unchanged = 0
+        self.reject_path = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    # the job's progress as a dictionary (what /jobs/<id> returns)
+    def status(self):
+        now = self.finished_at or time.time()
+        elapsed = now - self.started_at if self.started_at else 0.0
+        processed = (self.rows_staged if self.mode == "merge" else self.rows_inserted) + self.rows_rejected
+        done = self.bytes_read / self.total_bytes if self.total_bytes else 0.0
+        if self.state == "done":
+            done = 1.0
+
+        eta = None
+        if self.state == "running" and done > 0:
+            eta = elapsed * (1 - done) / done
+
+        return {
+            "id": self.id,
+            "table": self.table_name,
+            "file": self.file_name,
+            "mode": self.mode,
+            "state": self.state,
+            "error": self.error,
+            "rows_processed": processed,
+            "rows_inserted": self.rows_inserted,
+            "rows_rejected": self.rows_rejected,
+            "rows_skipped": self.rows_skipped,
+            "rows_updated": self.rows_updated,
+            "rows_unchanged": self.rows_unchanged,
+            "percent_done": round(100 * done, 1),
+            "rows_per_second": processed / elapsed if elapsed else 0.0,
+            "eta_seconds": eta,
+            "elapsed_seconds": elapsed,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "reject_file": os.path.basename(self.reject_path) if self.reject_path else None,
+        }
+
+    def save_status(self):
+        path = status_path(self.id)
+        with open(path + ".tmp", "w") as f:
+            json.dump(self.status(), f)
+        os.replace(path + ".tmp", path)
+
+    # bulk_loader calls this after every committed batch (merge_loader after every staged one)
+    def _progress(self, committed, rejected):
+        if self.mode == "merge":
+            self.rows_staged = committed
+        else:
+            self.rows_inserted = committed
+        self.rows_rejected = rejected
+        self.save_status()
+
+    # yields the chunks read from f, noting how far into the file the reader has got
+    def _tracked(self, frames, f):
+        for frame in frames:
+            self.bytes_read = f.tell()
+            yield frame
+
+    # runs the import on a new connection from connect. the spooled file is removed afterwards; if the
+    # import fails, uploading the same file again resumes from the last committed batch as before.
+    # whatever was committed is recorded with audit_writer (an audit.AuditWriter), if given
+    def run(self, connect, audit_writer=None):
+        if self.key is None:
+            self.key = content_key(self.table_name, self.path)
+        self.state = "running"
+        self.started_at = time.time()
+        self.save_status()
+        connection = None
+        try:
+            connection = connect()
+            with open(self.path, "rb") as f, \
+                    contextlib.closing(bulk_loader.read_csv_frames(f, self.batch_size)) as reader:
+                frames = self._tracked(reader, f)
+                if self.mode == "merge":
+                    result = merge_loader.merge_frames(
+                        connection,
+                        self.table_name,
+                        frames,
+                        batch_size=self.batch_size,
+                        reject_key=self.key,
+                        fk_filter=fk_filter.ForeignKeyFilter(connection),
+                        progress=self._progress,
+                    )
+                    self.rows_inserted = result["inserted"]
+                    self.rows_updated = result["updated"]
+                    self.rows_unchanged = result["unchanged"]
+                else:
+                    result = bulk_loader.load_frames(
+                        connection,
+                        self.table_name,
+                        frames,
+                        batch_size=self.batch_size,
+                        checkpoint_key=self.key,
+                        fk_filter=fk_filter.ForeignKeyFilter(connection),
+                        progress=self._progress,
+                    )
+                    self.rows_inserted = result["rows"]
+            self.rows_skipped = result["skipped"]
+            self.rows_rejected = result["rejected"]
+            self.reject_path = result["reject_path"]
+            self.state = "done"
+        except bulk_loader.BulkLoadError as e:
+            self.state = "failed"
+            if self.mode == "merge":
+                self.error = f"{e} -- nothing was changed. Upload the file again to retry."
+            else:
+                self.error = (f"{e} -- {e.rows_committed} rows were inserted before the failure. "
+                              f"Upload the same file again to resume.")
+                self.rows_inserted = e.rows_committed
+        except Exception as e:
+            self.state = "failed"
+            self.error = f"Error inserting records: {e}"
+        finally:
+            if connection is not None:
+                connection.close()
+            self.finished_at = time.time()
+            self.save_status()
+            if audit_writer is not None and (self.rows_inserted or self.rows_updated):
+                operation = audit.MERGE if self.mode == "merge" else audit.BULK_INSERT
+                audit_writer.record(self.table_name, operation, self.changed_by, new_data=audit.load_summary(
+                    self.file_name, {"rows": self.rows_inserted + self.rows_updated, "skipped": self.rows_skipped,
+                                     "rejected": self.rows_rejected, "inserted": self.rows_inserted,
+                                     "updated": self.rows_updated, "unchanged": self.rows_unchanged}))
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+######################################################
+
+# the queue and the worker threads. at most `workers` imports run at once and at most max_queued
+# more wait for a free worker. on_finished, if given, is called with every job once it has finished.
+# jobs for the same file (same content_key) run one after the other, never side by side on the same
+# checkpoint, so a second upload of a file resumes where the first one got to
+class JobManager:
+    def __init__(self, connect, workers=2, max_queued=20, batch_size=bulk_loader.DEFAULT_BATCH_SIZE, audit=None,
+                 on_finished=None):
+        self._connect = connect
+        self._audit = audit
+        self._on_finished = on_finished
+        self.workers = workers
+        self.max_queued = max_queued
+        self.batch_size = batch_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="import")
+        self._jobs = {}
+        self._futures = {}
+        self._key_locks = {}
+        self._lock = threading.Lock()
+
+    # spools an uploaded file (anything with a save(path) method, like flask's FileStorage) and
+    # queues its import. returns the job
+    def submit(self, table_name, file_name, upload, changed_by=None, mode="insert"):
+        with self._lock:
+            self._prune()
+            waiting = sum(1 for job in self._jobs.values() if job.state == "queued")
+            if waiting >= self.max_queued:
+                raise QueueFull(f"{waiting} uploads are already waiting to be imported. Try again later.")
+            job = ImportJob(table_name, file_name, self.batch_size, changed_by, mode)
+            self._jobs[job.id] = job
+
+        os.makedirs(SPOOL_DIR, exist_ok=True)
+        upload.save(job.path)
+        job.total_bytes = os.path.getsize(job.path)
+        job.key = content_key(table_name, job.path)
+        job.save_status()
+        future = self._executor.submit(self._run, job)
+        with self._lock:
+            self._futures[job.id] = future
+        return job
+
+    # runs a job on a worker thread, then calls on_finished (if given) with it
+    def _run(self, job):
+        with self._lock:
+            key_lock = self._key_locks.setdefault(job.key, threading.Lock())
+        with key_lock:
+            job.run(self._connect, self._audit)
+        with self._lock:
+            if not any(other.key == job.key and other.state in ("queued", "running")
+                       for other in self._jobs.values()):
+                self._key_locks.pop(job.key, None)
+        if self._on_finished is not None:
+            self._on_finished(job)
+
+    # the status of a job, or None if there is no such job
+    def status(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job.status()
+        return read_status(job_id)
+
+    # blocks until the job has finished
+    def wait(self, job_id, timeout=None):
+        with self._lock:
+            future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout)
+
+    def stats(self):
+        with self._lock:
+            states = [job.state for job in self._jobs.values()]
+        return {
+            "workers": self.workers,
+            "queued": states.count("queued"),
+            "running": states.count("running"),
+            "done": states.count("done"),
+            "failed": states.count("failed"),
+        }
+
+    # forgets jobs that finished more than JOB_RETENTION seconds ago. called with the lock held
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION
+        for job_id, job in list(self._jobs.items()):
+            if job.finished_at and job.finished_at < cutoff:
+                del self._jobs[job_id]
+                self._futures.pop(job_id, None)
+                try:
+                    os.remove(status_path(job_id))
+                except OSError:
+                    pass
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
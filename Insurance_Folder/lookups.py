@@ -0,0 +1,59 @@
+# The customer service lookups: a customer's policies and claims and a policy's payments. They are
+# asked for many times a minute while staff are on the phone, so their results are served from the
+# app's query cache (see query_cache.py) until one of the tables they read is written to.
+
+######################################################
+
+# importing the necessary libraries
+
+import table_browser
+
+######################################################
+
+# lookup name -> query with one parameter (the customer ID or the policy number)
+LOOKUPS = {
+    # every policy of a customer with its number of claims, newest expiry first
+    "customer_policies": """
+        SELECT p.Policy_Number, p.Application_ID, a.Status AS Application_Status, p.Start_Date, p.Expiry_Date,
+               COUNT(c.Claim_ID) AS Claims
+        FROM Application a
+        JOIN Policy p ON p.Application_ID = a.Application_ID
+        LEFT JOIN Claim c ON c.Policy_Number = p.Policy_Number
+        WHERE a.Customer_ID = ?
+        GROUP BY p.Policy_Number, p.Application_ID, a.Status, p.Start_Date, p.Expiry_Date
+        ORDER BY p.Expiry_Date DESC
+    """,
+    # every claim of a customer with what was paid for it, newest first
+    "customer_claims": """
+        SELECT c.Claim_ID, c.Policy_Number, c.Date, c.Damage_Type, c.Amount, c.Status,
+               s.Amount_Paid, s.Settlement_Date
+        FROM Application a
+        JOIN Policy p ON p.Application_ID = a.Application_ID
+        JOIN Claim c ON c.Policy_Number = p.Policy_Number
+        LEFT JOIN Claim_Settlement s ON s.Claim_ID = c.Claim_ID
+        WHERE a.Customer_ID = ?
+        ORDER BY c.Date DESC
+    """,
+    # the payments of a policy, newest first
+    "policy_payments": """
+        SELECT Payment_ID, Payment_Date, Amount, Receipt_ID
+        FROM Premium_Payment
+        WHERE Policy_Number = ?
+        ORDER BY Payment_Date DESC
+    """,
+}
+
+
+# the rows of a lookup as json ready dictionaries, through results (a query_cache.QueryCache)
+def run(results, connection, name, value):
+    columns, rows = results.fetch(connection, LOOKUPS[name], (value,))
+    return [
+        {column: _json_value(cell) for column, cell in zip(columns, row)}
+        for row in rows
+    ]
+
+
+def _json_value(value):
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return table_browser.json_default(value)
@@ -0,0 +1,247 @@
+# Merge mode for the CSV loads. A plain load (bulk_loader.py) only inserts, so sending a corrected
+# file again fails on the rows that are already there. A merge loads the file into a temporary
+# staging table first and then applies it to the table in one set-based statement keyed on the
+# table's primary key (composite keys like Department's included): rows with a new key are inserted,
+# rows whose values differ are updated, and rows that are the same as the table's are left alone,
+# so a daily re-sync of a big table only writes what actually changed.
+#
+# Rows go through the same validation and foreign key checks as a plain load (chunk_validation.py)
+# and the rejects end up in a reject file the same way. Only the columns in the file's header are
+# compared and updated. If a key appears more than once in the file, its last row wins.
+#
+# On SQL server the statement is a MERGE and changed rows are found with EXISTS (... EXCEPT ...),
+# which treats two NULLs as equal; the counts come from its OUTPUT $action. On the sqlite stand-in
+# (which has no MERGE) it is an UPDATE ... FROM with IS NOT comparisons followed by an INSERT of the
+# new keys, counted with changes(). The staged values are compared with the table's directly rather than
+# through a stored hash of every row: the server does it in the same pass as the key join, the
+# result is exact (no hash collisions) and there is no hash column to keep up to date on every other
+# write path. Nothing is applied until every row is staged, and the apply is a single transaction,
+# so a failed merge changes nothing and can simply be run again (there is no checkpoint).
+#
+# Rows a merge inserts or updates get a new rowversion, so the revenue rollup, the delta extracts
+# and the other incremental jobs pick them up like any other change (on the sqlite stand-in, where
+# rowid stands in for the rowversion, only the inserted ones).
+
+######################################################
+
+# importing the necessary libraries
+
+import itertools
+import os
+import time
+
+import numpy as np
+
+import bulk_loader
+import chunk_validation
+import db_pool
+import fk_filter
+import query_cache
+import registry
+
+######################################################
+
+# the file order of every staged row, so the last of several rows with the same key can be kept
+STAGE_ROW_COLUMN = "Stage_Row"
+
+
+def stage_name(table_name):
+    return f"Merge_{table_name}" if db_pool.using_sqlite() else f"#Merge_{table_name}"
+
+
+def drop_stage(cursor, table_name):
+    stage = stage_name(table_name)
+    if db_pool.using_sqlite():
+        cursor.execute(f"DROP TABLE IF EXISTS temp.{stage}")
+    else:
+        cursor.execute(f"IF OBJECT_ID('tempdb..{stage}') IS NOT NULL DROP TABLE {stage}")
+
+
+# an empty temporary table with the given columns of table_name (and their types), plus Stage_Row
+def create_stage(cursor, table_name, columns):
+    stage = stage_name(table_name)
+    drop_stage(cursor, table_name)
+    if db_pool.using_sqlite():
+        cursor.execute(f"CREATE TEMP TABLE {stage} AS SELECT {', '.join(columns)} FROM {table_name} WHERE 0")
+    else:
+        cursor.execute(f"SELECT {', '.join(columns)} INTO {stage} FROM {table_name} WHERE 1 = 0")
+    cursor.execute(f"ALTER TABLE {stage} ADD {STAGE_ROW_COLUMN} BIGINT")
+
+
+# the statement that applies the staging table to table_name on SQL server. the actions the MERGE took
+# are collected with OUTPUT and counted in the same batch, which returns one row: (inserted, updated)
+def merge_sql(table_name, columns, keys):
+    stage = stage_name(table_name)
+    values = [name for name in columns if name not in keys]
+    matched = ""
+    if values:
+        matched = (
+            f"WHEN MATCHED AND EXISTS (SELECT {', '.join('s.' + name for name in values)} "
+            f"EXCEPT SELECT {', '.join('t.' + name for name in values)}) "
+            f"THEN UPDATE SET {', '.join(f'{name} = s.{name}' for name in values)} "
+        )
+    return (
+        "SET NOCOUNT ON; "
+        "DECLARE @Actions TABLE (Action NVARCHAR(10)); "
+        f"MERGE {table_name} WITH (HOLDLOCK) AS t USING {stage} AS s "
+        f"ON {' AND '.join(f't.{name} = s.{name}' for name in keys)} "
+        f"{matched}"
+        f"WHEN NOT MATCHED BY TARGET THEN INSERT ({', '.join(columns)}) "
+        f"VALUES ({', '.join('s.' + name for name in columns)}) "
+        "OUTPUT $action INTO @Actions; "
+        "SELECT COALESCE(SUM(CASE WHEN Action = 'INSERT' THEN 1 ELSE 0 END), 0), "
+        "COALESCE(SUM(CASE WHEN Action = 'UPDATE' THEN 1 ELSE 0 END), 0) FROM @Actions;"
+    )
+
+
+# applies the staging table to table_name (without committing) and returns the number of rows
+# (inserted, updated), as counted by the statements that changed them
+def apply_stage(cursor, table_name, columns, keys):
+    if not db_pool.using_sqlite():
+        cursor.execute(merge_sql(table_name, columns, keys))
+        inserted, updated = cursor.fetchone()
+        return inserted, updated
+
+    stage = stage_name(table_name)
+    values = [name for name in columns if name not in keys]
+    same_key = " AND ".join(f"{table_name}.{name} = s.{name}" for name in keys)
+    updated = 0
+    if values:
+        changed = " OR ".join(f"{table_name}.{name} IS NOT s.{name}" for name in values)
+        cursor.execute(
+            f"UPDATE {table_name} SET {', '.join(f'{name} = s.{name}' for name in values)} "
+            f"FROM {stage} AS s WHERE {same_key} AND ({changed})"
+        )
+        updated = cursor.execute("SELECT changes()").fetchone()[0]
+    column_list = ", ".join(columns)
+    cursor.execute(
+        f"INSERT INTO {table_name} ({column_list}) SELECT {', '.join('s.' + name for name in columns)} "
+        f"FROM {stage} AS s WHERE NOT EXISTS (SELECT 1 FROM {table_name} WHERE {same_key})"
+    )
+    inserted = cursor.execute("SELECT changes()").fetchone()[0]
+    return inserted, updated
+
+
+######################################################
+
+# merges DataFrame chunks (e.g. from bulk_loader.read_csv_frames) into table_name. rows are validated
+# like load_frames does and staged batch_size at a time, then applied in one transaction. returns
+# the counts: "inserted", "updated", "unchanged", "duplicates" (earlier rows of a key that appears
+# again later in the file), "rejected", plus "rows" (inserted + updated) and "skipped" (always 0) so
+# the result can be reported like a plain load's. progress, if given, is called with (rows staged,
+# rows rejected) after every batch
+def merge_frames(connection, table_name, frames, batch_size=bulk_loader.DEFAULT_BATCH_SIZE, reject_key=None,
+                 fk_filter=None, progress=None):
+    start = time.perf_counter()
+    frames = iter(frames)
+    first = next(frames, None)
+    result = {"rows": 0, "inserted": 0, "updated": 0, "unchanged": 0, "duplicates": 0, "skipped": 0,
+              "rejected": 0, "reject_path": None, "seconds": 0.0, "rows_per_second": 0.0}
+    if first is None:
+        return result
+
+    columns = list(first.columns)
+    try:
+        keys = list(registry.get(table_name).table.primary_key)
+        registry.get(table_name).prepare(columns)
+    except registry.RegistryError as e:
+        raise bulk_loader.BulkLoadError(str(e), 0) from e
+    if not keys:
+        raise bulk_loader.BulkLoadError(f"{table_name} has no primary key to merge on.", 0)
+    missing = [name for name in keys if name not in columns]
+    if missing:
+        raise bulk_loader.BulkLoadError(f"Merging into {table_name} needs the key column {', '.join(missing)}.", 0)
+
+    counts = {"rejected": 0}
+    path = bulk_loader.reject_path(reject_key or f"{table_name}_merge")
+    rows = chunk_validation.valid_rows(table_name, itertools.chain([first], frames), path, counts, fk_filter)
+
+    stage = stage_name(table_name)
+    cursor = connection.cursor()
+    if hasattr(cursor, "fast_executemany"):
+        cursor.fast_executemany = True
+    insert_sql = (
+        f"INSERT INTO {stage} ({', '.join(columns + [STAGE_ROW_COLUMN])}) "
+        f"VALUES ({', '.join('?' for _ in range(len(columns) + 1))})"
+    )
+    key_positions = [columns.index(name) for name in keys]
+    # hashes of the keys staged so far, to tell whether the file repeats any key
+    seen = _SeenKeys(table_name, keys)
+    # keys of the staged rows for fk_filter, added once the merge is committed
+    parent_keys = []
+
+    try:
+        create_stage(cursor, table_name, columns)
+        staged = 0
+        for batch in bulk_loader.batches(rows, batch_size):
+            cursor.executemany(insert_sql, [(*row, staged + number) for number, row in enumerate(batch)])
+            connection.commit()
+            seen.add([[row[i] for row in batch] for i in key_positions])
+            if fk_filter is not None:
+                parent_keys.extend(fk_filter.keys(table_name, columns, batch))
+            staged += len(batch)
+            if progress:
+                progress(staged, counts["rejected"])
+
+        key_list = ", ".join(keys)
+        cursor.execute(f"CREATE INDEX IX_{stage.lstrip('#')} ON {stage} ({key_list})")
+        if seen.repeated:
+            cursor.execute(
+                f"DELETE FROM {stage} WHERE {STAGE_ROW_COLUMN} NOT IN "
+                f"(SELECT MAX({STAGE_ROW_COLUMN}) FROM {stage} GROUP BY {key_list})"
+            )
+            result["duplicates"] = max(cursor.rowcount, 0)
+
+        inserted, updated = apply_stage(cursor, table_name, columns, keys)
+        connection.commit()
+        query_cache.table_changed(table_name)
+        if fk_filter is not None:
+            fk_filter.add_keys(parent_keys)
+    except Exception as e:
+        connection.rollback()
+        raise bulk_loader.BulkLoadError(f"Error merging into {table_name}: {e}", 0) from e
+    finally:
+        try:
+            drop_stage(cursor, table_name)
+            connection.commit()
+        except Exception:
+            pass
+
+    elapsed = time.perf_counter() - start
+    result.update({
+        "rows": inserted + updated,
+        "inserted": inserted,
+        "updated": updated,
+        "unchanged": staged - result["duplicates"] - inserted - updated,
+        "rejected": counts["rejected"],
+        "reject_path": path if counts["rejected"] else None,
+        "seconds": elapsed,
+        "rows_per_second": staged / elapsed if elapsed else 0.0,
+    })
+    return result
+
+
+# the hashes of the keys staged so far. repeated is set once a key turns up twice (or two keys hash
+# the same, which only costs an unneeded duplicate check)
+class _SeenKeys:
+    def __init__(self, table_name, keys):
+        self.keys = fk_filter.KeySet(table_name, keys)
+        self.repeated = False
+
+    def add(self, key_columns):
+        hashes = fk_filter.hash_keys(key_columns)
+        if not self.repeated:
+            self.repeated = len(np.unique(hashes)) < len(hashes) or bool(self.keys.contains(hashes).any())
+        self.keys.add(hashes)
+
+
+# streams a CSV file on disk into table_name in merge mode (see load_csv_file)
+def merge_csv_file(connection, table_name, file_path, chunk_size=bulk_loader.DEFAULT_BATCH_SIZE, fk_filter=None):
+    return merge_frames(
+        connection,
+        table_name,
+        bulk_loader.read_csv_frames(file_path, chunk_size),
+        batch_size=chunk_size,
+        reject_key=f"{table_name}_{os.path.basename(file_path)}",
+        fk_filter=fk_filter,
+    )
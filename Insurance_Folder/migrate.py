@@ -0,0 +1,111 @@
+# Applies the numbered SQL scripts in the migrations folder (001_..., 002_..., ...) to the database,
+# in order, and records each one in a Schema_Version table so it is never applied twice.
+#
+# usage: python migrate.py            -- apply every migration that has not been applied yet
+#        python migrate.py --status   -- list the migrations and whether they have been applied
+
+######################################################
+
+# importing the necessary libraries
+
+import argparse
+import os
+import re
+import sqlite3
+
+import db_pool
+
+######################################################
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migrations")
+
+
+# returns (version, name, path) for every migration script, sorted by version
+def find_migrations(directory=MIGRATIONS_DIR):
+    migrations = []
+    for file_name in os.listdir(directory):
+        match = re.match(r"^(\d+)_(\w+)\.sql$", file_name)
+        if match:
+            migrations.append((int(match.group(1)), match.group(2), os.path.join(directory, file_name)))
+    return sorted(migrations)
+
+
+# splits a migration script into statements. comments are removed and statements end with a ;
+def read_statements(path):
+    with open(path) as f:
+        sql = "\n".join(line.split("--", 1)[0] for line in f.read().splitlines())
+    return [statement.strip() for statement in sql.split(";") if statement.strip()]
+
+
+# returns the set of versions already applied, creating the Schema_Version table the first time
+def applied_versions(connection):
+    cursor = connection.cursor()
+    try:
+        cursor.execute("SELECT Version FROM Schema_Version")
+        return {row[0] for row in cursor.fetchall()}
+    except Exception:
+        connection.rollback()
+        cursor.execute("""
+            CREATE TABLE Schema_Version (
+                Version INT NOT NULL PRIMARY KEY,
+                Name VARCHAR(100) NOT NULL,
+                Applied_At DATETIME DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        connection.commit()
+        return set()
+
+
+# runs one migration and records it, in a single transaction. python's sqlite3 does not start a
+# transaction for CREATE / DROP statements by itself, so on the stand-in it is started explicitly
+def apply_migration(connection, version, name, path):
+    cursor = connection.cursor()
+    if isinstance(connection, sqlite3.Connection) and not connection.in_transaction:
+        cursor.execute("BEGIN")
+    try:
+        for statement in read_statements(path):
+            cursor.execute(statement)
+        cursor.execute("INSERT INTO Schema_Version (Version, Name) VALUES (?, ?)", (version, name))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+
+# applies every migration newer than what the database already has (or only up to `target`)
+def migrate(connection, target=None, directory=MIGRATIONS_DIR):
+    done = applied_versions(connection)
+    applied = []
+    for version, name, path in find_migrations(directory):
+        if version in done or (target is not None and version > target):
+            continue
+        apply_migration(connection, version, name, path)
+        applied.append((version, name))
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply the database migrations.")
+    parser.add_argument("--status", action="store_true", help="only list the migrations")
+    parser.add_argument("--target", type=int, help="apply migrations up to this version only")
+    args = parser.parse_args()
+
+    connection = db_pool.connect()
+    try:
+        if args.status:
+            done = applied_versions(connection)
+            for version, name, _ in find_migrations():
+                print(f"{version:03d} {name:<40} {'applied' if version in done else 'pending'}")
+            return
+
+        applied = migrate(connection, target=args.target)
+        for version, name in applied:
+            print(f"Applied {version:03d} {name}")
+        if not applied:
+            print("The database is up to date.")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
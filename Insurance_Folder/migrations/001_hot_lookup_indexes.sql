@@ -0,0 +1,17 @@
+-- Migration 001: secondary (nonclustered) indexes for the columns rows are looked up by.
+-- Without them each of these lookups scans the whole table.
+
+-- the login page finds the staff member by email
+CREATE INDEX IX_Staff_Email ON Staff (Email);
+
+-- the claims of a policy, and the claims in a given state (e.g. all Pending claims)
+CREATE INDEX IX_Claim_Policy_Number ON Claim (Policy_Number);
+CREATE INDEX IX_Claim_Status ON Claim (Status);
+
+-- the payments of a policy in date order, and all payments in a date range
+CREATE INDEX IX_Premium_Payment_Policy_Date ON Premium_Payment (Policy_Number, Payment_Date);
+CREATE INDEX IX_Premium_Payment_Date ON Premium_Payment (Payment_Date);
+
+-- a customer's vehicles and applications
+CREATE INDEX IX_Vehicle_Customer_ID ON Vehicle (Customer_ID);
+CREATE INDEX IX_Application_Customer_ID ON Application (Customer_ID);
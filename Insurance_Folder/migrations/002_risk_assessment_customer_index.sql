@@ -0,0 +1,4 @@
+-- Migration 002: index for the risk scoring engine (risk_scoring.py), which updates the assessments
+-- of a customer by Customer_ID. Without it every updated row scans the whole table.
+
+CREATE INDEX IX_Risk_Assessment_Customer_ID ON Risk_Assessment (Customer_ID);
@@ -0,0 +1,16 @@
+-- Migration 003: change tracking for the revenue rollup (revenue_rollup.py). Every payment and
+-- settlement gets a rowversion, which the server sets on every insert, so the rollup can read just
+-- the rows added since its last run. Rollup_Watermark records how far each source has been applied.
+-- (on the sqlite stand-in the column stays empty and the rollup uses rowid instead)
+
+ALTER TABLE Premium_Payment ADD Row_Version ROWVERSION;
+ALTER TABLE Claim_Settlement ADD Row_Version ROWVERSION;
+
+CREATE INDEX IX_Premium_Payment_Row_Version ON Premium_Payment (Row_Version);
+CREATE INDEX IX_Claim_Settlement_Row_Version ON Claim_Settlement (Row_Version);
+
+CREATE TABLE Rollup_Watermark (
+    Name VARCHAR(50) NOT NULL PRIMARY KEY,
+    Version BIGINT NOT NULL,
+    Updated_At DATETIME DEFAULT CURRENT_TIMESTAMP
+);
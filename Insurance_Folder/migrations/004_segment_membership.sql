@@ -0,0 +1,16 @@
+-- Migration 004: tables and indexes for the customer segmentation job (segmentation.py).
+
+-- which segment of Customer_Segmentation each customer was put in, and how far the customer is
+-- from the segment's centre (in standardized feature units)
+CREATE TABLE Segment_Membership (
+    Customer_ID VARCHAR(10) NOT NULL PRIMARY KEY,
+    Segment_ID VARCHAR(10) NOT NULL,
+    Distance FLOAT NULL,
+    CONSTRAINT fk_sm1 FOREIGN KEY (Customer_ID) REFERENCES Customer(Customer_ID),
+    CONSTRAINT fk_sm2 FOREIGN KEY (Segment_ID) REFERENCES Customer_Segmentation(Segment_ID)
+);
+
+CREATE INDEX IX_Segment_Membership_Segment_ID ON Segment_Membership (Segment_ID);
+
+-- the policies of an application, used to get from a customer to their claims and payments
+CREATE INDEX IX_Policy_Application_ID ON Policy (Application_ID);
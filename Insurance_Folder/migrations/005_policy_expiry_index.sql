@@ -0,0 +1,6 @@
+-- Migration 005: index for the renewal scanner (renewals.py), which reads the policies expiring in
+-- the next few weeks. Without it every scan reads the whole Policy table. The index also holds the
+-- Policy_Number and Application_ID, so the scan never has to visit the table itself. (the latest
+-- payment of each policy comes from IX_Premium_Payment_Policy_Date, from migration 001)
+
+CREATE INDEX IX_Policy_Expiry_Date ON Policy (Expiry_Date, Policy_Number, Application_ID);
@@ -0,0 +1,40 @@
+-- Migration 006: change tracking for the delta extracts (delta_sync.py). Every table gets a rowversion,
+-- which the server sets on every insert and update, and an index on it, so an extract can read just the
+-- rows changed since the last one instead of the whole table. (Premium_Payment and Claim_Settlement got
+-- theirs in migration 003; on the sqlite stand-in the columns stay empty and rowid is used instead)
+
+ALTER TABLE Customer ADD Row_Version ROWVERSION;
+ALTER TABLE Incident ADD Row_Version ROWVERSION;
+ALTER TABLE Incident_Report ADD Row_Version ROWVERSION;
+ALTER TABLE Company ADD Row_Version ROWVERSION;
+ALTER TABLE Department ADD Row_Version ROWVERSION;
+ALTER TABLE Vehicle_Service ADD Row_Version ROWVERSION;
+ALTER TABLE Vehicle ADD Row_Version ROWVERSION;
+ALTER TABLE Application ADD Row_Version ROWVERSION;
+ALTER TABLE Policy ADD Row_Version ROWVERSION;
+ALTER TABLE Claim ADD Row_Version ROWVERSION;
+ALTER TABLE Risk_Assessment ADD Row_Version ROWVERSION;
+ALTER TABLE Revenue_Expenses ADD Row_Version ROWVERSION;
+ALTER TABLE Customer_Segmentation ADD Row_Version ROWVERSION;
+ALTER TABLE Reinsurance_Info ADD Row_Version ROWVERSION;
+ALTER TABLE Feedback_Info ADD Row_Version ROWVERSION;
+ALTER TABLE Staff ADD Row_Version ROWVERSION;
+ALTER TABLE Audit_Log ADD Row_Version ROWVERSION;
+
+CREATE INDEX IX_Customer_Row_Version ON Customer (Row_Version);
+CREATE INDEX IX_Incident_Row_Version ON Incident (Row_Version);
+CREATE INDEX IX_Incident_Report_Row_Version ON Incident_Report (Row_Version);
+CREATE INDEX IX_Company_Row_Version ON Company (Row_Version);
+CREATE INDEX IX_Department_Row_Version ON Department (Row_Version);
+CREATE INDEX IX_Vehicle_Service_Row_Version ON Vehicle_Service (Row_Version);
+CREATE INDEX IX_Vehicle_Row_Version ON Vehicle (Row_Version);
+CREATE INDEX IX_Application_Row_Version ON Application (Row_Version);
+CREATE INDEX IX_Policy_Row_Version ON Policy (Row_Version);
+CREATE INDEX IX_Claim_Row_Version ON Claim (Row_Version);
+CREATE INDEX IX_Risk_Assessment_Row_Version ON Risk_Assessment (Row_Version);
+CREATE INDEX IX_Revenue_Expenses_Row_Version ON Revenue_Expenses (Row_Version);
+CREATE INDEX IX_Customer_Segmentation_Row_Version ON Customer_Segmentation (Row_Version);
+CREATE INDEX IX_Reinsurance_Info_Row_Version ON Reinsurance_Info (Row_Version);
+CREATE INDEX IX_Feedback_Info_Row_Version ON Feedback_Info (Row_Version);
+CREATE INDEX IX_Staff_Row_Version ON Staff (Row_Version);
+CREATE INDEX IX_Audit_Log_Row_Version ON Audit_Log (Row_Version);
@@ -0,0 +1,5 @@
+-- Migration 007: index for the home page dashboard (dashboard.py), which counts the Pending
+-- applications. With it the count only reads the index entries of the Pending rows instead of the
+-- whole Application table. (the open claims are counted through IX_Claim_Status, from migration 001)
+
+CREATE INDEX IX_Application_Status ON Application (Status);
@@ -0,0 +1,14 @@
+-- Migration 008: the rows the revenue rollup (revenue_rollup.py) has applied, with the date and amount
+-- each one was applied with. A payment or settlement that is edited afterwards gets a new rowversion
+-- and is read again, and its old amount is taken out of its old month before the new one is added.
+-- The rollup watermarks are reset, so the next run rebuilds the months and fills in the ledger.
+
+CREATE TABLE Rollup_Ledger (
+    Source VARCHAR(50) NOT NULL,
+    Row_ID VARCHAR(10) NOT NULL,
+    Row_Date DATE NOT NULL,
+    Amount FLOAT NOT NULL,
+    CONSTRAINT pk_rollup_ledger PRIMARY KEY (Source, Row_ID)
+);
+
+DELETE FROM Rollup_Watermark WHERE Name LIKE 'revenue_rollup.%';
@@ -0,0 +1,152 @@
+# Non-interactive loader for the nightly load. Takes a directory containing one CSV per table
+# (named after the table, e.g. Claim.csv) and loads every file without prompting.
+#
+# The foreign keys in InsuranceDB_Creator.sql decide the order: a table is only started once every
+# table it references has finished loading (Customer -> Vehicle -> Application -> Policy ->
+# Premium_Payment/Claim -> Claim_Settlement, and so on). Tables that do not depend on each other
+# load at the same time in a pool of worker threads, each with its own database connection.
+#
+# Rows whose foreign keys have no parent row are rejected before they are sent (see fk_filter.py).
+# The filter is shared by the whole load, so the keys of a parent loaded earlier in the same run are
+# known without reading the table back.
+#
+# usage: python parallel_loader.py DIRECTORY [--workers N] [--chunk-size N] [--no-fk-filter]
+
+######################################################
+
+# importing the necessary libraries
+
+import argparse
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import audit
+import bulk_loader
+import db_pool
+import fk_filter
+import schema
+
+######################################################
+
+# finds the CSV file for every table in the schema, matching file names case-insensitively
+def find_csv_files(directory, tables):
+    files = {}
+    for file_name in os.listdir(directory):
+        base, extension = os.path.splitext(file_name)
+        if extension.lower() != ".csv":
+            continue
+        for table_name in tables:
+            if base.lower() == table_name.lower():
+                files[table_name] = os.path.join(directory, file_name)
+    return files
+
+
+# loads one table on its own connection and returns the bulk loader's result
+def load_table(table_name, file_path, chunk_size, fk_filter=None):
+    connection = db_pool.connect()
+    try:
+        return bulk_loader.load_csv_file(connection, table_name, file_path, chunk_size=chunk_size, fk_filter=fk_filter)
+    finally:
+        connection.close()
+
+
+# loads every file in files (table name -> path) with at most `workers` tables loading at once.
+# returns a dictionary of table name -> result, or the exception that stopped that table.
+# tables whose parents failed are not attempted, since every one of their rows would be rejected.
+def load_all(files, tables, workers=4, chunk_size=bulk_loader.DEFAULT_BATCH_SIZE, fk_filter=None, audit_writer=None):
+    # only wait on parents that are actually part of this load
+    waiting_on = {name: tables[name].parents() & set(files) for name in files}
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        running = {}
+
+        while waiting_on or running:
+            # start every table whose parents have all finished
+            for name in [name for name, parents in waiting_on.items() if not parents]:
+                del waiting_on[name]
+                running[executor.submit(load_table, name, files[name], chunk_size, fk_filter)] = name
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    results[name] = future.result()
+                    if audit_writer is not None:
+                        audit_writer.record(name, audit.BULK_INSERT, audit.script_user(),
+                                            new_data=audit.load_summary(os.path.basename(files[name]), results[name]))
+                    print(f"{name:<22} {results[name]['rows']:>10} rows {results[name]['seconds']:>8.1f}s "
+                          f"{results[name]['rows_per_second']:>10.0f} rows/sec"
+                          + (f" ({results[name]['rejected']} rejected)" if results[name]["rejected"] else ""))
+                except Exception as e:
+                    results[name] = e
+                    print(f"{name:<22} failed: {e}")
+
+                for parents in waiting_on.values():
+                    parents.discard(name)
+
+                # children of a failed table are skipped, along with their own children
+                if isinstance(results[name], Exception):
+                    skipped = [child for child in waiting_on if name in tables[child].parents()]
+                    while skipped:
+                        child = skipped.pop()
+                        if child not in waiting_on:
+                            continue
+                        del waiting_on[child]
+                        results[child] = RuntimeError(f"skipped because {name} failed")
+                        print(f"{child:<22} skipped because {name} failed")
+                        skipped.extend(c for c in waiting_on if child in tables[c].parents())
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load a directory of table CSVs in foreign key order.")
+    parser.add_argument("directory", help="directory containing one <Table>.csv per table")
+    parser.add_argument("--workers", type=int, default=4, help="number of tables loaded at the same time")
+    parser.add_argument("--chunk-size", type=int, default=bulk_loader.DEFAULT_BATCH_SIZE,
+                        help="number of rows read and inserted per batch")
+    parser.add_argument("--no-fk-filter", action="store_true",
+                        help="send rows with missing parents to the server instead of rejecting them up front")
+    args = parser.parse_args()
+
+    tables = schema.parse_schema()
+    files = find_csv_files(args.directory, tables)
+    if not files:
+        print("No table CSV files found.")
+        return
+
+    # the filter reads parent keys on its own connection
+    filter_connection = None if args.no_fk_filter else db_pool.connect()
+    fk = fk_filter.ForeignKeyFilter(filter_connection) if filter_connection else None
+
+    # every loaded table is recorded in Audit_Log in the background
+    audit_writer = audit.AuditWriter(db_pool.connect).start()
+
+    start = time.perf_counter()
+    try:
+        results = load_all(files, tables, workers=args.workers, chunk_size=args.chunk_size, fk_filter=fk,
+                           audit_writer=audit_writer)
+    finally:
+        if filter_connection:
+            filter_connection.close()
+        audit_writer.stop()
+    elapsed = time.perf_counter() - start
+
+    loaded = sum(result["rows"] for result in results.values() if isinstance(result, dict))
+    failed = [name for name, result in results.items() if isinstance(result, Exception)]
+    print(f"Loaded {loaded} rows from {len(files)} files in {elapsed:.1f}s "
+          f"({loaded / elapsed if elapsed else 0:.0f} rows/sec overall).")
+    if failed:
+        print(f"Failed or skipped: {', '.join(sorted(failed))}")
+    if fk is not None:
+        stats = fk.stats()
+        print(f"Foreign key filter: {stats['orphans']} of {stats['checked']} keys had no parent row.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,310 @@
+# Cache of query results for the lookups that are repeated many times a minute (e.g. the policies and
+# claims of a customer, see lookups.py). Results are keyed by the query text (with its whitespace
+# normalized) and the parameters.
+#
+# Invalidation works with a version number per table. Every entry remembers the versions of the
+# tables its query reads (found in its FROM / JOIN clauses) at the time it was filled, and a lookup
+# only uses the entry while they are all unchanged. Anything that writes to a table calls
+# table_changed(table), which bumps the table's version: one counter update however many entries
+# depend on the table. Stale entries are dropped when they are next looked up or pushed out by the
+# LRU eviction, which keeps the estimated size of the cached results under max_bytes.
+#
+# With a shared path (INSURANCE_QUERY_CACHE_PATH) the versions and the results are also kept in a
+# sqlite file that every app process (and the command line loaders, so their writes invalidate the
+# app's entries) uses, so results filled by one process are served by the others and a write made by
+# any of them is seen by all. Results are then written to memory and to the file when they are filled.
+# The file holds the results as JSON (not pickles, so nothing read from it can run code), with dates,
+# times, decimals and bytes tagged so they come back as the types the driver returned.
+
+######################################################
+
+# importing the necessary libraries
+
+import datetime
+import decimal
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+
+######################################################
+
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+# the shared cache file, if the app runs as more than one process
+SHARED_PATH = os.environ.get("INSURANCE_QUERY_CACHE_PATH")
+
+_TABLE_REFERENCE = re.compile(r"\b(?:FROM|JOIN)\s+([A-Za-z_][A-Za-z0-9_]*)", re.IGNORECASE)
+_LITERAL_OR_SPACE = re.compile(r"'(?:[^']|'')*'|\s+")
+
+
+# the query text with every run of whitespace outside string literals turned into one space
+def normalize_sql(sql):
+    return _LITERAL_OR_SPACE.sub(lambda match: match.group() if match.group().startswith("'") else " ", sql).strip()
+
+
+# the tables a query reads, in alphabetical order
+def tables_in(sql):
+    return tuple(sorted({name for name in _TABLE_REFERENCE.findall(sql)}))
+
+
+def cache_key(sql, params):
+    data = json.dumps([normalize_sql(sql), list(params)], default=_tagged)
+    return hashlib.sha1(data.encode()).hexdigest()
+
+
+######################################################
+
+# values JSON has no type for are written as {"$": type, "v": text} and turned back on load
+
+_TAGS = {
+    "datetime": datetime.datetime.fromisoformat,
+    "date": datetime.date.fromisoformat,
+    "time": datetime.time.fromisoformat,
+    "decimal": decimal.Decimal,
+    "bytes": bytes.fromhex,
+}
+
+
+def _tagged(value):
+    # datetime first: a datetime is a date too
+    if isinstance(value, datetime.datetime):
+        return {"$": "datetime", "v": value.isoformat()}
+    if isinstance(value, datetime.date):
+        return {"$": "date", "v": value.isoformat()}
+    if isinstance(value, datetime.time):
+        return {"$": "time", "v": value.isoformat()}
+    if isinstance(value, decimal.Decimal):
+        return {"$": "decimal", "v": str(value)}
+    if isinstance(value, (bytes, bytearray)):
+        return {"$": "bytes", "v": bytes(value).hex()}
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def _untagged(value):
+    if value.keys() == {"$", "v"} and value["$"] in _TAGS:
+        return _TAGS[value["$"]](value["v"])
+    return value
+
+
+# a (column names, rows) result as JSON text, and back
+def dump_result(result):
+    return json.dumps(result, default=_tagged, separators=(",", ":"))
+
+
+def load_result(value):
+    columns, rows = json.loads(value, object_hook=_untagged)
+    return columns, [tuple(row) for row in rows]
+
+
+######################################################
+
+# the table versions and the results in a sqlite file shared by several processes
+class SharedStore:
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._connection = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS Query_Cache_Version (Table_Name TEXT PRIMARY KEY, Version INTEGER NOT NULL)"
+        )
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS Query_Cache_Entry (Cache_Key TEXT PRIMARY KEY, Versions TEXT NOT NULL, "
+            "Value BLOB NOT NULL, Size INTEGER NOT NULL, Used_At REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS IX_Query_Cache_Entry_Used_At ON Query_Cache_Entry (Used_At)")
+
+    def bump(self, table_names):
+        with self._lock:
+            self._connection.executemany(
+                "INSERT INTO Query_Cache_Version (Table_Name, Version) VALUES (?, 1) "
+                "ON CONFLICT (Table_Name) DO UPDATE SET Version = Version + 1",
+                [(name,) for name in table_names],
+            )
+
+    def versions(self, table_names):
+        with self._lock:
+            found = dict(self._connection.execute(
+                f"SELECT Table_Name, Version FROM Query_Cache_Version WHERE Table_Name IN "
+                f"({', '.join('?' for _ in table_names)})",
+                table_names,
+            ).fetchall())
+        return tuple(found.get(name, 0) for name in table_names)
+
+    # (versions, value) of an entry, or None
+    def get(self, key):
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT Versions, Value FROM Query_Cache_Entry WHERE Cache_Key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._connection.execute(
+                    "UPDATE Query_Cache_Entry SET Used_At = ? WHERE Cache_Key = ?", (time.time(), key)
+                )
+        if row is None:
+            return None
+        return tuple(int(version) for version in row[0].split(",") if version), row[1]
+
+    # stores an entry, then drops the least recently used ones while the file holds more than max_bytes
+    def set(self, key, versions, value):
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO Query_Cache_Entry (Cache_Key, Versions, Value, Size, Used_At) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, ",".join(str(version) for version in versions), value, len(value), time.time()),
+            )
+            total = self._connection.execute("SELECT COALESCE(SUM(Size), 0) FROM Query_Cache_Entry").fetchone()[0]
+            if total > self.max_bytes:
+                self._connection.execute(
+                    "DELETE FROM Query_Cache_Entry WHERE Cache_Key IN (SELECT Cache_Key FROM Query_Cache_Entry "
+                    "ORDER BY Used_At LIMIT (SELECT COUNT(*) / 4 + 1 FROM Query_Cache_Entry))"
+                )
+
+
+######################################################
+
+# every QueryCache of this process, so table_changed() reaches all of them
+_caches = weakref.WeakSet()
+_shared_versions = None
+
+
+class QueryCache:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, shared_path=SHARED_PATH):
+        self.max_bytes = max_bytes
+        self.shared = SharedStore(shared_path, max_bytes) if shared_path else None
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.shared_hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        _caches.add(self)
+
+    def table_versions(self, table_names):
+        if self.shared is not None:
+            return self.shared.versions(table_names)
+        with self._lock:
+            return tuple(self._versions.get(name, 0) for name in table_names)
+
+    # bumps the version of every given table, which invalidates the entries that read them
+    def table_changed(self, table_names):
+        if self.shared is not None:
+            self.shared.bump(table_names)
+        with self._lock:
+            for name in table_names:
+                self._versions[name] = self._versions.get(name, 0) + 1
+
+    # the (column names, rows) of the query, from the cache if an entry with the current versions
+    # of its tables is there, otherwise from the database (and then cached). tables defaults to the
+    # tables named in the query. the result is shared with other callers, so it must not be changed
+    def fetch(self, connection, sql, params=(), tables=None):
+        tables = tuple(tables) if tables else tables_in(sql)
+        key = cache_key(sql, params)
+        # read before the query runs, so a write that happens while it runs leaves the entry stale
+        versions = self.table_versions(tables)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] == versions:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                self._drop(key)
+                self.stale += 1
+
+        if self.shared is not None:
+            found = self.shared.get(key)
+            if found is not None and found[0] == versions:
+                try:
+                    result = load_result(found[1])
+                except ValueError:
+                    # written by an older version of the cache, fetched again below
+                    result = None
+                if result is not None:
+                    self._store(key, versions, result, len(found[1]))
+                    with self._lock:
+                        self.shared_hits += 1
+                    return result
+
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        columns = [description[0] for description in cursor.description]
+        result = (columns, [tuple(row) for row in cursor.fetchall()])
+        value = dump_result(result)
+        with self._lock:
+            self.misses += 1
+        self._store(key, versions, result, len(value))
+        if self.shared is not None:
+            self.shared.set(key, versions, value)
+        return result
+
+    # the query's rows as dictionaries
+    def fetch_dicts(self, connection, sql, params=(), tables=None):
+        columns, rows = self.fetch(connection, sql, params, tables)
+        return [dict(zip(columns, row)) for row in rows]
+
+    def _store(self, key, versions, result, size):
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (versions, result, size)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._drop(oldest)
+                self.evictions += 1
+
+    # called with the lock held
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry[2]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.shared_hits + self.misses
+            return {
+                "size": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "shared_hits": self.shared_hits,
+                "misses": self.misses,
+                "stale": self.stale,
+                "evictions": self.evictions,
+                "hit_ratio": (self.hits + self.shared_hits) / lookups if lookups else 0.0,
+            }
+
+
+# records that rows of the given tables were written. called by everything that writes (the add_*
+# routes, the bulk loader, merges, ...). a process without a QueryCache of its own (e.g. a command
+# line loader) still bumps the versions in the shared file, if there is one
+def table_changed(*table_names):
+    global _shared_versions
+    caches = list(_caches)
+    for cache in caches:
+        cache.table_changed(table_names)
+    if not caches and SHARED_PATH:
+        if _shared_versions is None:
+            _shared_versions = SharedStore(SHARED_PATH)
+        _shared_versions.bump(table_names)
@@ -0,0 +1,288 @@
+# One entry per table of the schema, built once when the module is imported. Each entry holds the
+# prepared INSERT statement and a converter per column that checks the value against the column's
+# definition in InsuranceDB_Creator.sql (NOT NULL, VARCHAR length, numeric and date types, plus the
+# email / url / positive amount rules) and turns it into the value sent to the server.
+#
+# The add_... routes in app.py, the insert_... functions in insurance_supplement.py and the bulk
+# loader all insert through this registry, so the constraints only live in one place.
+
+######################################################
+
+# importing the necessary libraries
+
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+
+import schema
+
+######################################################
+
+EMAIL_COLUMNS = {"Email"}
+URL_COLUMNS = {"Website"}
+
+# money columns that must be greater than zero
+POSITIVE_COLUMNS = {"Amount", "Amount_Paid", "Estimated_Cost", "Coverage_Limit"}
+
+EMAIL = re.compile(r"[^@]+@[^@]+\.[^@]+")
+URL = re.compile(r"https?://[^\s/$.?#].[^\s]*")
+
+TEXT_TYPES = {"VARCHAR", "NVARCHAR", "CHAR", "NCHAR", "TEXT"}
+INTEGER_TYPES = {"INT", "INTEGER", "BIGINT", "SMALLINT", "TINYINT"}
+FLOAT_TYPES = {"FLOAT", "REAL"}
+DECIMAL_TYPES = {"DECIMAL", "NUMERIC"}
+
+BIT_VALUES = {"1": 1, "true": 1, "yes": 1, "on": 1, "0": 0, "false": 0, "no": 0, "off": 0}
+
+
+# an unknown table or column, or a set of columns that leaves out a NOT NULL column
+class RegistryError(ValueError):
+    pass
+
+
+# a value that does not fit its column. the message is meant to be shown to the user as is
+class FieldError(ValueError):
+    pass
+
+
+# a row with one or more bad values. errors holds one message per bad value
+class RowError(ValueError):
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+######################################################
+
+# parsers, one per column type. each takes a non-empty value (a string from a form or a CSV file,
+# or an already typed value from pandas) and returns the value to send, or raises FieldError
+
+def _parse_text(label, value):
+    return value if isinstance(value, str) else str(value)
+
+
+def _parse_integer(label, value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise FieldError(f"{label} must be a whole number.")
+
+
+def _parse_float(label, value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise FieldError(f"{label} must be a valid number.")
+
+
+def _parse_bit(label, value):
+    if isinstance(value, (bool, int)):
+        return int(bool(value))
+    bit = BIT_VALUES.get(str(value).strip().lower())
+    if bit is None:
+        raise FieldError(f"{label} must be 0 or 1.")
+    return bit
+
+
+def _parse_date(label, value):
+    if isinstance(value, datetime):
+        return value.date().isoformat()
+    if isinstance(value, date):
+        return value.isoformat()
+    try:
+        date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise FieldError(f"{label} must be a date (YYYY-MM-DD).")
+    return value
+
+
+def _parse_datetime(label, value):
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    try:
+        datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise FieldError(f"{label} must be a date and time (YYYY-MM-DD HH:MM:SS).")
+    return value
+
+
+# DECIMAL(precision, scale) values are checked for the number of digits before the decimal point
+# and sent as floats, which both pyodbc and the sqlite stand-in accept
+def _decimal_parser(precision, scale):
+    max_digits = (precision or 18) - (scale or 0)
+
+    def parse(label, value):
+        try:
+            number = Decimal(str(value))
+        except InvalidOperation:
+            raise FieldError(f"{label} must be a valid number.")
+        if not number.is_finite():
+            raise FieldError(f"{label} must be a valid number.")
+        if number.adjusted() >= max_digits:
+            raise FieldError(f"{label} must have at most {max_digits} digits before the decimal point.")
+        return float(round(number, scale or 0))
+
+    return parse
+
+
+def _parser(column):
+    if column.data_type in TEXT_TYPES:
+        return _parse_text
+    if column.data_type in INTEGER_TYPES:
+        return _parse_integer
+    if column.data_type in FLOAT_TYPES:
+        return _parse_float
+    if column.data_type in DECIMAL_TYPES:
+        return _decimal_parser(column.length, column.scale)
+    if column.data_type == "BIT":
+        return _parse_bit
+    if column.data_type == "DATE":
+        return _parse_date
+    if column.data_type == "DATETIME":
+        return _parse_datetime
+    return lambda label, value: value
+
+
+# builds the converter for one column: empty values become None (or are rejected if the column is
+# NOT NULL), everything else is parsed and run through the checks that apply to the column
+def _converter(column):
+    label = column.name.replace("_", " ")
+    required = not column.nullable
+    parse = _parser(column)
+
+    checks = []
+    if column.data_type in TEXT_TYPES and column.length:
+        max_length = column.length
+
+        def check_length(value):
+            if len(value) > max_length:
+                raise FieldError(f"{label} exceeds the maximum length of {max_length}.")
+        checks.append(check_length)
+
+    if column.name in EMAIL_COLUMNS:
+        def check_email(value):
+            if not EMAIL.match(value):
+                raise FieldError(f"{label} is not a valid email address.")
+        checks.append(check_email)
+
+    if column.name in URL_COLUMNS:
+        def check_url(value):
+            if not URL.match(value):
+                raise FieldError(f"{label} is not a valid URL.")
+        checks.append(check_url)
+
+    if column.name in POSITIVE_COLUMNS:
+        def check_positive(value):
+            if value <= 0:
+                raise FieldError(f"{label} must be a positive number.")
+        checks.append(check_positive)
+
+    def empty():
+        if required:
+            raise FieldError(f"{label} is required and cannot be empty.")
+        return None
+
+    # text columns are the most common, so they get a converter without the generic parse / check
+    # calls. the others run the parser and then their checks (if any)
+    if parse is _parse_text and column.name not in EMAIL_COLUMNS | URL_COLUMNS | POSITIVE_COLUMNS:
+        max_length = column.length or float("inf")
+
+        def convert_text(value):
+            if value is None or value == "":
+                return empty()
+            if value.__class__ is not str:
+                value = str(value)
+            if len(value) > max_length:
+                raise FieldError(f"{label} exceeds the maximum length of {max_length}.")
+            return value
+        return convert_text
+
+    if not checks:
+        def convert_plain(value):
+            if value is None or value == "":
+                return empty()
+            return parse(label, value)
+        return convert_plain
+
+    def convert(value):
+        if value is None or value == "":
+            return empty()
+        value = parse(label, value)
+        for check in checks:
+            check(value)
+        return value
+
+    return convert
+
+
+######################################################
+
+# an INSERT into some of a table's columns, with the converters for those columns in the same order
+class PreparedInsert:
+    def __init__(self, table_name, columns, converters):
+        self.columns = columns
+        self.sql = f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+        self._converters = converters
+
+    # converts one row of values (in the order of self.columns) and returns the parameters to
+    # execute self.sql with. every value is checked, and RowError lists all the bad ones
+    def convert(self, values):
+        try:
+            return tuple([convert(value) for convert, value in zip(self._converters, values)])
+        except FieldError:
+            pass
+
+        # at least one value is bad. go through the row again to collect every error
+        errors = []
+        for convert, value in zip(self._converters, values):
+            try:
+                convert(value)
+            except FieldError as e:
+                errors.append(str(e))
+        raise RowError(errors)
+
+
+class TableSpec:
+    def __init__(self, table):
+        self.table = table
+        self.name = table.name
+        self.label = table.name.replace("_", " ")
+        self.columns = [column.name for column in table.columns]
+        self.required = [column.name for column in table.columns if not column.nullable]
+        self._converters = {column.name: _converter(column) for column in table.columns}
+        self._prepared = {}
+        self.insert = self.prepare(self.columns)
+
+    # the insert for the given columns (e.g. a CSV header). prepared inserts are kept, so a header
+    # seen before costs a dictionary lookup
+    def prepare(self, columns):
+        key = tuple(columns)
+        prepared = self._prepared.get(key)
+        if prepared is None:
+            unknown = [name for name in key if name not in self._converters]
+            if unknown:
+                raise RegistryError(f"{self.name} has no column {', '.join(unknown)}")
+            missing = [name for name in self.required if name not in key]
+            if missing:
+                raise RegistryError(f"{self.name} requires column {', '.join(missing)}")
+            prepared = PreparedInsert(self.name, list(key), [self._converters[name] for name in key])
+            self._prepared[key] = prepared
+        return prepared
+
+    # the parameters for a full row, given as a sequence in column order
+    def convert(self, values):
+        return self.insert.convert(values)
+
+    # the parameters for a submitted add_... form, whose fields are the lower cased column names
+    def convert_form(self, form):
+        return self.insert.convert([form.get(name.lower(), "") for name in self.columns])
+
+
+TABLES = {name: TableSpec(table) for name, table in schema.parse_schema().items()}
+
+
+def get(table_name):
+    try:
+        return TABLES[table_name]
+    except KeyError:
+        raise RegistryError(f"Unknown table {table_name}")
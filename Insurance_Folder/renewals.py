@@ -0,0 +1,272 @@
+# Renewal work list: the policies that expire in the next N days, each with its latest premium
+# payment, so staff can chase the renewals that need it first.
+#
+# A scan (run by the app's scheduler every few minutes, see scheduler.py) reads only the policies
+# that expire within the horizon (DEFAULT_HORIZON_DAYS unless set) through the Expiry_Date index from migration 005,
+# and picks up each one's latest payment through the (Policy_Number, Payment_Date) index from
+# migration 001, so the cost of a scan depends on the number of policies in the window and not on
+# the size of the Policy table. The result is kept in memory as arrays sorted by expiry date, and a
+# work list for any N up to the horizon is a binary search into them.
+#
+# Between scans the policies and payments added through the app are applied to the index as they
+# are inserted (add_policy / add_payment). Rows loaded by CSV imports or by other programs show up
+# at the next scan.
+#
+# usage: python renewals.py [--days N] [--today YYYY-MM-DD] [--limit N]
+
+######################################################
+
+# importing the necessary libraries
+
+import argparse
+import bisect
+import threading
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import db_pool
+from columnar import as_dates, as_float, fetch_columns
+
+######################################################
+
+DEFAULT_HORIZON_DAYS = 90
+
+# a policy whose latest payment is older than this is marked overdue
+PAYMENT_OVERDUE_DAYS = 35
+
+# the policies expiring between two dates (inclusive) with the date and amount of their latest
+# payment, in expiry order. a policy with two payments on its latest payment date comes back twice
+SCAN_SQL = (
+    "SELECT p.Policy_Number, p.Application_ID, a.Customer_ID, p.Expiry_Date, pp.Payment_Date, pp.Amount "
+    "FROM Policy p "
+    "JOIN Application a ON a.Application_ID = p.Application_ID "
+    "LEFT JOIN Premium_Payment pp ON pp.Policy_Number = p.Policy_Number AND pp.Payment_Date = "
+    "(SELECT MAX(x.Payment_Date) FROM Premium_Payment x WHERE x.Policy_Number = p.Policy_Number) "
+    "WHERE p.Expiry_Date >= ? AND p.Expiry_Date <= ? "
+    "ORDER BY p.Expiry_Date, p.Policy_Number"
+)
+
+
+def as_day(value):
+    return np.datetime64(str(value)[:10], "D")
+
+
+def _days(values):
+    return as_dates(values).to_numpy().astype("datetime64[D]")
+
+
+######################################################
+
+class RenewalIndex:
+    def __init__(self, horizon_days=DEFAULT_HORIZON_DAYS):
+        self.horizon_days = horizon_days
+        self._lock = threading.Lock()
+
+        # the last scan, sorted by expiry date: one array per column
+        self._expiry = np.array([], dtype="datetime64[D]")
+        self._policies = np.array([], dtype=object)
+        self._applications = np.array([], dtype=object)
+        self._customers = np.array([], dtype=object)
+        self._paid = np.array([], dtype="datetime64[D]")
+        self._amounts = np.array([], dtype=float)
+        self._window = None
+
+        # what was added since the scan. _added is kept sorted by (expiry date, policy number). every
+        # change gets a sequence number, so a scan only drops the changes it has seen
+        self._added = []
+        self._added_rows = {}
+        self._payments = {}
+        self._sequence = 0
+
+        # bumped on every change, so cached work lists can be keyed by it
+        self.version = 0
+        self.scans = 0
+        self.last_scan_seconds = 0.0
+        self.scanned_at = None
+
+    # true when the last scan covers the next `days` days
+    def covers(self, days, today=None):
+        first = np.datetime64(today or date.today(), "D")
+        window = self._window
+        return window is not None and window[0] <= first and first + days <= window[1]
+
+    # reads the policies expiring in the next horizon_days days and replaces the index with them
+    def refresh(self, connection, today=None):
+        start = time.perf_counter()
+        first = np.datetime64(today or date.today(), "D")
+        last = first + self.horizon_days
+        with self._lock:
+            mark = self._sequence
+
+        policies, applications, customers, expiry, paid, amounts = fetch_columns(
+            connection, SCAN_SQL, 6, (str(first), str(last))
+        )
+        # rows come in policy order within a day, so repeats of a policy are next to each other
+        keep = np.ones(len(policies), dtype=bool)
+        keep[1:] = policies[1:] != policies[:-1]
+
+        with self._lock:
+            self._expiry = _days(expiry[keep])
+            self._policies = policies[keep]
+            self._applications = applications[keep]
+            self._customers = customers[keep]
+            self._paid = _days(paid[keep])
+            self._amounts = as_float(amounts[keep])
+            self._window = (first, last)
+
+            self._added_rows = {policy: row for policy, row in self._added_rows.items() if row[3] > mark}
+            self._added = sorted((row[2], policy) for policy, row in self._added_rows.items())
+            self._payments = {policy: payment for policy, payment in self._payments.items() if payment[2] > mark}
+
+            self.version += 1
+            self.scans += 1
+            self.last_scan_seconds = time.perf_counter() - start
+            self.scanned_at = time.time()
+            return len(self._policies)
+
+    # refresh() on a connection of its own, for the scheduler
+    def scan(self, connect, today=None):
+        connection = connect()
+        try:
+            return self.refresh(connection, today)
+        finally:
+            connection.close()
+
+    # applies a newly inserted Policy row. policies that expire outside the scanned window are left
+    # for the next scan. the customer is looked up on connection, if one is given
+    def add_policy(self, row, connection=None):
+        expiry = as_day(row["Expiry_Date"])
+        window = self._window
+        if window is None or not window[0] <= expiry <= window[1]:
+            return False
+
+        customer = None
+        if connection is not None:
+            cursor = connection.cursor()
+            cursor.execute("SELECT Customer_ID FROM Application WHERE Application_ID = ?", (row["Application_ID"],))
+            found = cursor.fetchone()
+            customer = found[0] if found else None
+
+        policy = row["Policy_Number"]
+        with self._lock:
+            self._sequence += 1
+            old = self._added_rows.get(policy)
+            if old is not None:
+                self._added.remove((old[2], policy))
+            self._added_rows[policy] = (row["Application_ID"], customer, expiry, self._sequence)
+            bisect.insort(self._added, (expiry, policy))
+            self.version += 1
+        return True
+
+    # applies a newly inserted Premium_Payment row
+    def add_payment(self, row):
+        paid = as_day(row["Payment_Date"])
+        policy = row["Policy_Number"]
+        with self._lock:
+            self._sequence += 1
+            old = self._payments.get(policy)
+            if old is None or paid >= old[0]:
+                self._payments[policy] = (paid, float(row["Amount"]), self._sequence)
+                self.version += 1
+
+    # the policies expiring in the next `days` days (today included), soonest first. returns the
+    # total number and the `limit` rows starting at `offset`
+    def work_list(self, days, today=None, limit=None, offset=0):
+        first = np.datetime64(today or date.today(), "D")
+        last = first + days
+        with self._lock:
+            low = np.searchsorted(self._expiry, first, side="left")
+            high = np.searchsorted(self._expiry, last, side="right")
+            columns = [self._expiry[low:high], self._policies[low:high], self._applications[low:high],
+                       self._customers[low:high], self._paid[low:high], self._amounts[low:high]]
+            added = self._added[bisect.bisect_left(self._added, (first,)):bisect.bisect_left(self._added, (last + 1,))]
+            added_rows = {policy: self._added_rows[policy] for _, policy in added}
+            payments = dict(self._payments)
+            replaced = list(self._added_rows)
+
+        if replaced:
+            # policies that were added again since the scan are only listed once, as added
+            keep = ~pd.Index(columns[1]).isin(replaced)
+            columns = [column[keep] for column in columns]
+        if added:
+            positions = np.searchsorted(columns[0], [expiry for expiry, _ in added], side="right")
+            values = [
+                [expiry for expiry, _ in added],
+                [policy for _, policy in added],
+                [added_rows[policy][0] for _, policy in added],
+                [added_rows[policy][1] for _, policy in added],
+                [np.datetime64("NaT", "D")] * len(added),
+                [np.nan] * len(added),
+            ]
+            columns = [np.insert(column, positions, value) for column, value in zip(columns, values)]
+
+        total = len(columns[0])
+        end = total if limit is None else offset + limit
+        rows = [_work_item(first, payments, *values) for values in zip(*(column[offset:end] for column in columns))]
+        return total, rows
+
+    def stats(self):
+        with self._lock:
+            return {
+                "policies": len(self._policies),
+                "added": len(self._added),
+                "payments": len(self._payments),
+                "version": self.version,
+                "scans": self.scans,
+                "last_scan_seconds": self.last_scan_seconds,
+                "scanned_at": self.scanned_at or 0,
+            }
+
+
+# one row of the work list. payments added since the scan win over the scanned one if newer
+def _work_item(today, payments, expiry, policy, application, customer, paid, amount):
+    payment = payments.get(policy)
+    if payment is not None and (np.isnat(paid) or payment[0] >= paid):
+        paid, amount = payment[0], payment[1]
+
+    if np.isnat(paid):
+        days_since, status = None, "none"
+    else:
+        days_since = int((today - paid).astype(int))
+        status = "overdue" if days_since > PAYMENT_OVERDUE_DAYS else "current"
+    return {
+        "Policy_Number": policy,
+        "Application_ID": application,
+        "Customer_ID": customer,
+        "Expiry_Date": str(expiry),
+        "Days_Left": int((expiry - today).astype(int)),
+        "Last_Payment_Date": None if np.isnat(paid) else str(paid),
+        "Last_Payment_Amount": None if np.isnat(paid) else round(float(amount), 2),
+        "Days_Since_Payment": days_since,
+        "Payment_Status": status,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the policies that are up for renewal.")
+    parser.add_argument("--days", type=int, default=30, help="policies expiring in the next N days")
+    parser.add_argument("--today", help="the date to count from (YYYY-MM-DD), today by default")
+    parser.add_argument("--limit", type=int, default=50, help="number of policies to print")
+    args = parser.parse_args()
+
+    today = date.fromisoformat(args.today) if args.today else date.today()
+    index = RenewalIndex(horizon_days=args.days)
+    connection = db_pool.connect()
+    try:
+        index.refresh(connection, today)
+    finally:
+        connection.close()
+
+    total, rows = index.work_list(args.days, today, limit=args.limit)
+    print(f"{total} policies expire in the next {args.days} days (scanned in {index.last_scan_seconds:.2f}s).")
+    for row in rows:
+        paid = row["Last_Payment_Date"] or "never"
+        print(f"  {row['Expiry_Date']}  {row['Policy_Number']}  {row['Customer_ID']}  "
+              f"last paid {paid}  ({row['Payment_Status']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+# Keeps the Revenue and Claims_paid columns of Revenue_Expenses up to date from the underlying facts:
+# Premium_Payment.Amount by Payment_Date and Claim_Settlement.Amount_Paid by Settlement_Date, summed
+# per month ("January 2023", like the rows typed in by hand). Expenses are still entered by hand and
+# Profit is recalculated for every month that changes.
+#
+# The rollup is incremental. Migration 003 gives both fact tables a rowversion column and a
+# Rollup_Watermark table that records the highest version already applied, so each run only reads
+# the rows inserted or updated since the last one (on the sqlite stand-in, rowid plays the part of
+# the rowversion, so only inserted rows are picked up there). The server sets a new rowversion on
+# every update, so an edited row is read again: Rollup_Ledger (migration 008) keeps the date and
+# amount every row was applied with, and a run adds the difference between the rows' new and old
+# amounts to their months (taking the old amount out of the old month if the date changed). The
+# month sums, the ledger and the watermark are written in one transaction, and the watermark is
+# only moved if no other run moved it first.
+#
+# Deleted rows leave no rowversion behind and are not subtracted. Run with --rebuild after deleting
+# payments or settlements to recompute the months (and the ledger) from scratch.
+#
+# The app runs the rollup in the background every REVENUE_ROLLUP_INTERVAL seconds; /reports/revenue
+# only reads Revenue_Expenses.
+#
+# usage: python revenue_rollup.py [--rebuild]
+
+######################################################
+
+# importing the necessary libraries
+
+import argparse
+import calendar
+import time
+from datetime import datetime
+
+import pandas as pd
+
+import db_pool
+from db_pool import version_bounds
+
+######################################################
+
+# fact table -> (key column, date column, amount column, Revenue_Expenses column it adds up to)
+SOURCES = {
+    "Premium_Payment": ("Payment_ID", "Payment_Date", "Amount", "Revenue"),
+    "Claim_Settlement": ("Settlement_ID", "Settlement_Date", "Amount_Paid", "Claims_paid"),
+}
+
+WATERMARK_PREFIX = "revenue_rollup."
+
+
+# raised when another run applied (some of) the same rows first. nothing was written
+class RollupConflict(Exception):
+    pass
+
+
+def read_watermarks(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT Name, Version FROM Rollup_Watermark")
+    return {name[len(WATERMARK_PREFIX):]: int(version) for name, version in cursor.fetchall()
+            if name.startswith(WATERMARK_PREFIX)}
+
+
+def month_names(dates):
+    dates = pd.to_datetime(pd.Series(dates, dtype=object))
+    return [f"{calendar.month_name[month]} {year}" for year, month in zip(dates.dt.year, dates.dt.month)]
+
+
+# adds up per-day (date, amount) sums per month
+def _by_month(days):
+    if not days:
+        return {}
+    dates, amounts = zip(*days)
+    totals = pd.Series([float(amount or 0) for amount in amounts]).groupby(month_names(dates)).sum()
+    return {month: round(amount, 2) for month, amount in totals.items()}
+
+
+# sums the amounts of table's rows with a version in (low, high] per month. the server adds them up
+# per day, so only one row per day comes back. returns ({month: amount}, number of rows)
+def monthly_totals(connection, table, low, high):
+    _, date_column, amount_column, _ = SOURCES[table]
+    _, between = version_bounds(table)
+    cursor = connection.cursor()
+    cursor.execute(
+        f"SELECT {date_column}, SUM({amount_column}), COUNT(*) FROM {table} WHERE {between} GROUP BY {date_column}",
+        (low, high),
+    )
+    days = cursor.fetchall()
+    return _by_month([(day, amount) for day, amount, _ in days]), sum(count for _, _, count in days)
+
+
+# what the rows of table with a version in (low, high] change every month by: their amounts now,
+# less the amounts the ledger says they were applied with before (nothing for new rows). returns
+# ({month: change}, number of rows)
+def monthly_changes(connection, table, low, high):
+    key_column, _, _, _ = SOURCES[table]
+    _, between = version_bounds(table)
+    totals, count = monthly_totals(connection, table, low, high)
+    cursor = connection.cursor()
+    cursor.execute(
+        f"SELECT Row_Date, SUM(Amount) FROM Rollup_Ledger WHERE Source = ? AND Row_ID IN "
+        f"(SELECT {key_column} FROM {table} WHERE {between}) GROUP BY Row_Date",
+        (table, low, high),
+    )
+    for month, amount in _by_month(cursor.fetchall()).items():
+        totals[month] = round(totals.get(month, 0.0) - amount, 2)
+    return {month: amount for month, amount in totals.items() if amount}, count
+
+
+# records the rows of table with a version in (low, high] in the ledger as they are now. with
+# replace, the source's whole ledger is replaced
+def update_ledger(cursor, table, low, high, replace=False):
+    key_column, date_column, amount_column, _ = SOURCES[table]
+    _, between = version_bounds(table)
+    if replace:
+        cursor.execute("DELETE FROM Rollup_Ledger WHERE Source = ?", (table,))
+    else:
+        cursor.execute(
+            f"DELETE FROM Rollup_Ledger WHERE Source = ? AND Row_ID IN (SELECT {key_column} FROM {table} WHERE {between})",
+            (table, low, high),
+        )
+    cursor.execute(
+        f"INSERT INTO Rollup_Ledger (Source, Row_ID, Row_Date, Amount) "
+        f"SELECT ?, {key_column}, {date_column}, {amount_column} FROM {table} WHERE {between}",
+        (table, low, high),
+    )
+
+
+######################################################
+
+# applies the new and changed rows of every source. with rebuild (and for any source that has no
+# watermark yet) the months are summed from all of the source's rows and replace what was there,
+# otherwise the changes are added (see monthly_changes). returns a summary of what was applied
+def rollup(connection, rebuild=False):
+    start = time.perf_counter()
+    old = read_watermarks(connection)
+    cursor = connection.cursor()
+
+    changes = {}
+    new = {}
+    rows = 0
+    for table, (_, _, _, column) in SOURCES.items():
+        upper_sql, _ = version_bounds(table)
+        cursor.execute(upper_sql)
+        high = int(cursor.fetchone()[0] or 0)
+        replace = rebuild or table not in old
+        low = 0 if replace else old[table]
+        if high <= low and not replace:
+            continue
+        if replace:
+            totals, count = monthly_totals(connection, table, low, high)
+        else:
+            totals, count = monthly_changes(connection, table, low, high)
+        changes[column] = (totals, replace)
+        new[table] = (low, high, replace)
+        rows += count
+
+    months = sorted({month for totals, _ in changes.values() for month in totals})
+    try:
+        cursor.execute("SELECT Month FROM Revenue_Expenses")
+        existing = {row[0] for row in cursor.fetchall()}
+
+        for month in months:
+            if month in existing:
+                assignments, params = [], []
+                for column, (totals, replace) in changes.items():
+                    if month in totals:
+                        assignments.append(f"{column} = ?" if replace else f"{column} = COALESCE({column}, 0) + ?")
+                        params.append(totals[month])
+                cursor.execute(f"UPDATE Revenue_Expenses SET {', '.join(assignments)} WHERE Month = ?", (*params, month))
+            else:
+                revenue = changes.get("Revenue", ({}, False))[0].get(month, 0.0)
+                claims_paid = changes.get("Claims_paid", ({}, False))[0].get(month, 0.0)
+                cursor.execute(
+                    "INSERT INTO Revenue_Expenses (Month, Revenue, Claims_paid, Expenses, Profit) VALUES (?, ?, ?, ?, ?)",
+                    (month, revenue, claims_paid, 0.0, round(revenue - claims_paid, 2)),
+                )
+        if months:
+            cursor.executemany(
+                "UPDATE Revenue_Expenses SET Profit = COALESCE(Revenue, 0) - COALESCE(Claims_paid, 0) "
+                "- COALESCE(Expenses, 0) WHERE Month = ?",
+                [(month,) for month in months],
+            )
+
+        for table, (low, version, replace) in new.items():
+            update_ledger(cursor, table, low, version, replace)
+            name = WATERMARK_PREFIX + table
+            if table in old:
+                cursor.execute(
+                    "UPDATE Rollup_Watermark SET Version = ?, Updated_At = CURRENT_TIMESTAMP WHERE Name = ? AND Version = ?",
+                    (version, name, old[table]),
+                )
+                if cursor.rowcount != 1:
+                    raise RollupConflict(f"The watermark of {table} was moved by another run.")
+            else:
+                cursor.execute("INSERT INTO Rollup_Watermark (Name, Version) VALUES (?, ?)", (name, version))
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+
+    return {
+        "rows": rows,
+        "months": months,
+        "watermarks": {table: version for table, (_, version, _) in new.items()},
+        "seconds": time.perf_counter() - start,
+    }
+
+
+# the rows of Revenue_Expenses in calendar order (months that are not "Month YYYY" come last)
+def report(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT Month, Revenue, Claims_paid, Expenses, Profit FROM Revenue_Expenses")
+    rows = [
+        {"Month": month, "Revenue": _number(revenue), "Claims_paid": _number(claims_paid),
+         "Expenses": _number(expenses), "Profit": _number(profit)}
+        for month, revenue, claims_paid, expenses, profit in cursor.fetchall()
+    ]
+    return sorted(rows, key=lambda row: _month_key(row["Month"]))
+
+
+# rollup() on a connection of its own, for the app's scheduler. a run that finds another one applied
+# the same rows first leaves them to it
+def scan(connect):
+    connection = connect()
+    try:
+        return rollup(connection)
+    except RollupConflict:
+        return None
+    finally:
+        connection.close()
+
+
+def _number(value):
+    return None if value is None else round(float(value), 2)
+
+
+def _month_key(month):
+    try:
+        return (0, datetime.strptime(month or "", "%B %Y"))
+    except ValueError:
+        return (1, datetime.min)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Roll the new payments and settlements up into Revenue_Expenses.")
+    parser.add_argument("--rebuild", action="store_true",
+                        help="recompute every month from all the rows instead of adding the new ones")
+    args = parser.parse_args()
+
+    connection = db_pool.connect()
+    try:
+        summary = rollup(connection, rebuild=args.rebuild)
+    finally:
+        connection.close()
+
+    print(f"Applied {summary['rows']} rows to {len(summary['months'])} months in {summary['seconds']:.2f}s.")
+    for table, version in summary["watermarks"].items():
+        print(f"  {table} watermark: {version}")
+
+
+if __name__ == "__main__":
+    main()
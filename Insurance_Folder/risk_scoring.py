@@ -0,0 +1,407 @@
+# Batch risk scoring. Fills in Risk_Assessment.Age, Risk_Level and Premium_Multiplier for every
+# customer from the rest of the database instead of having them typed in through add_risk_assessment:
+#
+#   age                  from Customer.DOB
+#   marital status       from Customer.Marital_Status
+#   claim frequency      claims per policy year (Claim -> Policy -> Application.Customer_ID)
+#   severity             average cost of the customer's claims and incident reports
+#   vehicle              value and type of the customer's riskiest vehicle
+#
+# Each input is read with one query into columnar NumPy arrays (aggregated on the server where it
+# can be) and the whole book is scored at once with array operations. The results are written back
+# in batches: customers that already have an assessment are updated, the others get a new one.
+#
+# With --incremental only the customers whose inputs changed since the last run are read, rescored
+# and written. Every run records the highest rowversion (migrations 003 and 006) it has seen of each
+# input table in Rollup_Watermark (named risk_scoring.<table>), like revenue_rollup.py and
+# delta_sync.py do, and the next one asks the server for the customers owning a row inserted or
+# updated after that: through the Row_Version indexes, so the time taken depends on the number of
+# changes rather than the size of the book. Customers whose age went up since the last run and those
+# with claims whose cover has grown (the claim frequency is per policy year) are rescored as well.
+# Deleted rows are not tracked; a full run (without --incremental) picks those up. On the sqlite
+# stand-in rowid takes the place of the rowversion, so only inserted rows are picked up there.
+#
+# usage: python risk_scoring.py [--incremental] [--dry-run] [--batch-size N]
+
+######################################################
+
+# importing the necessary libraries
+
+import argparse
+import re
+import time
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+import bulk_loader
+import db_pool
+import query_cache
+from columnar import as_dates, as_float, fetch_columns
+from db_pool import version_bounds
+
+######################################################
+
+# customer IDs sent per query when only some customers are read (SQL server takes at most 2100
+# parameters per statement)
+IDS_PER_QUERY = 1000
+
+# bump when the model below changes, so the next incremental run rescores everyone
+MODEL_VERSION = 1
+
+# the model. the multiplier is the product of one factor per input
+AGE_POINTS = [16, 25, 30, 50, 65, 80]
+AGE_FACTORS = [1.6, 1.25, 1.0, 0.9, 1.05, 1.3]
+MARRIED_FACTOR = 0.95
+FREQUENCY_WEIGHT = 0.35       # per claim per policy year
+MAX_FREQUENCY_FACTOR = 2.5
+SEVERITY_REFERENCE = 5000.0   # an average cost of this much adds SEVERITY_WEIGHT * log(2)
+SEVERITY_WEIGHT = 0.2
+VEHICLE_VALUE_REFERENCE = 25000.0
+VEHICLE_TYPE_FACTORS = {"Coupe": 1.15, "Truck": 1.1, "SUV": 1.05, "Sedan": 1.0, "Hatchback": 0.95}
+MIN_MULTIPLIER = 0.5
+MAX_MULTIPLIER = 5.0
+
+# Risk_Level by multiplier: below 1.0 is Low, below 1.4 Medium, the rest High
+RISK_LEVEL_LIMITS = [(1.0, "Low"), (1.4, "Medium")]
+TOP_RISK_LEVEL = "High"
+
+# new assessments are numbered after the highest existing RA######## ID
+ASSESSMENT_ID = re.compile(r"RA(\d{8})")
+
+
+######################################################
+
+# runs a query with a {where} placeholder for the customers in customer_ids (a condition on column),
+# or for every customer if customer_ids is None. returns its columns like fetch_columns
+def fetch_for_customers(connection, sql, count, column, customer_ids=None):
+    if customer_ids is None:
+        return fetch_columns(connection, sql.format(where=""), count)
+    parts = [[] for _ in range(count)]
+    for first in range(0, len(customer_ids), IDS_PER_QUERY):
+        ids = list(customer_ids[first:first + IDS_PER_QUERY])
+        where = f"WHERE {column} IN ({', '.join('?' for _ in ids)})"
+        for part, values in zip(parts, fetch_columns(connection, sql.format(where=where), count, ids)):
+            part.append(values)
+    return [np.concatenate(part) if part else np.empty(0, dtype=object) for part in parts]
+
+
+# reads the inputs of every customer (or only of customer_ids) and returns one array per feature, in
+# the order of the returned customer IDs
+def load_features(connection, today=None, customer_ids=None):
+    today = pd.Timestamp(today or date.today())
+
+    customer_ids, dob, marital_status = fetch_for_customers(
+        connection, "SELECT Customer_ID, DOB, Marital_Status FROM Customer {where}", 3, "Customer_ID", customer_ids
+    )
+    customers = pd.Index(customer_ids)
+    n = len(customers)
+
+    # sums values into one slot per customer. rows of unknown customers are dropped
+    def per_customer(ids, values, combine=np.add):
+        positions = customers.get_indexer(ids)
+        known = positions >= 0
+        totals = np.zeros(n)
+        combine.at(totals, positions[known], np.asarray(values, dtype=float)[known])
+        return totals
+
+    ages = ((today - as_dates(dob)).dt.days // 365.25).fillna(0).to_numpy(dtype=float)
+
+    claim_customers, claim_count, claim_total = fetch_for_customers(connection, """
+        SELECT a.Customer_ID, COUNT(*), SUM(c.Amount)
+        FROM Claim c
+        JOIN Policy p ON p.Policy_Number = c.Policy_Number
+        JOIN Application a ON a.Application_ID = p.Application_ID
+        {where}
+        GROUP BY a.Customer_ID
+    """, 3, "a.Customer_ID", customer_ids)
+
+    policy_customers, start_date, expiry_date = fetch_for_customers(connection, """
+        SELECT a.Customer_ID, p.Start_Date, p.Expiry_Date
+        FROM Policy p
+        JOIN Application a ON a.Application_ID = p.Application_ID
+        {where}
+    """, 3, "a.Customer_ID", customer_ids)
+    ends = np.minimum(as_dates(expiry_date).to_numpy(), today.to_datetime64())
+    policy_days = (ends - as_dates(start_date).to_numpy()) / np.timedelta64(1, "D")
+    policy_years = np.nan_to_num(np.clip(policy_days, 0, None)) / 365.25
+
+    report_customers, report_count, report_total = fetch_for_customers(connection, """
+        SELECT Customer_ID, COUNT(*), SUM(Estimated_Cost)
+        FROM Incident_Report
+        {where}
+        GROUP BY Customer_ID
+    """, 3, "Customer_ID", customer_ids)
+
+    vehicle_customers, vehicle_value, vehicle_type = fetch_for_customers(
+        connection, "SELECT Customer_ID, Value, Type FROM Vehicle {where}", 3, "Customer_ID", customer_ids
+    )
+    type_factors = pd.Series(vehicle_type).map(VEHICLE_TYPE_FACTORS).fillna(1.0).to_numpy(dtype=float)
+
+    return customer_ids, {
+        "age": ages,
+        "married": as_float(marital_status),
+        "claims": per_customer(claim_customers, as_float(claim_count)),
+        "claim_cost": per_customer(claim_customers, as_float(claim_total)),
+        "policy_years": per_customer(policy_customers, policy_years),
+        "reports": per_customer(report_customers, as_float(report_count)),
+        "report_cost": per_customer(report_customers, as_float(report_total)),
+        "vehicle_value": per_customer(vehicle_customers, as_float(vehicle_value), np.maximum),
+        "vehicle_type": per_customer(vehicle_customers, type_factors, np.maximum),
+    }
+
+
+# scores the customers from their features. returns (age, multiplier, risk level) arrays
+def score(features):
+    age = features["age"]
+    factor = np.interp(age, AGE_POINTS, AGE_FACTORS)
+    factor *= np.where(features["married"] > 0, MARRIED_FACTOR, 1.0)
+
+    # claims per policy year, counting less than a year of cover as a full year
+    frequency = features["claims"] / np.maximum(features["policy_years"], 1.0)
+    factor *= np.minimum(1.0 + FREQUENCY_WEIGHT * frequency, MAX_FREQUENCY_FACTOR)
+
+    events = features["claims"] + features["reports"]
+    severity = (features["claim_cost"] + features["report_cost"]) / np.maximum(events, 1.0)
+    factor *= 1.0 + SEVERITY_WEIGHT * np.log1p(severity / SEVERITY_REFERENCE)
+
+    value = features["vehicle_value"]
+    has_vehicle = value > 0
+    value_factor = 1.0 + 0.1 * np.log2(np.where(has_vehicle, value, VEHICLE_VALUE_REFERENCE) / VEHICLE_VALUE_REFERENCE)
+    factor *= np.where(has_vehicle, np.clip(value_factor, 0.9, 1.3), 1.0)
+    factor *= np.where(features["vehicle_type"] > 0, features["vehicle_type"], 1.0)
+
+    multiplier = np.round(np.clip(factor, MIN_MULTIPLIER, MAX_MULTIPLIER), 2)
+    levels = np.select([multiplier < limit for limit, _ in RISK_LEVEL_LIMITS],
+                       [level for _, level in RISK_LEVEL_LIMITS], TOP_RISK_LEVEL)
+    return age.astype(int), multiplier, levels
+
+
+######################################################
+
+# incremental runs. the watermarks of the last run: the highest version read of every input table,
+# plus the day it ran on (as a date ordinal) and the model it used
+
+WATERMARK_PREFIX = "risk_scoring."
+DAY_WATERMARK = "day"
+MODEL_WATERMARK = "model"
+
+# input table -> query for the customers owning its rows with a version in (?, ?]
+CHANGED_CUSTOMERS = {
+    "Customer": "SELECT Customer_ID FROM Customer WHERE {between}",
+    "Vehicle": "SELECT Customer_ID FROM Vehicle WHERE {between}",
+    "Incident_Report": "SELECT Customer_ID FROM Incident_Report WHERE {between}",
+    "Application": "SELECT Customer_ID FROM Application WHERE {between}",
+    "Policy": "SELECT Customer_ID FROM Application WHERE Application_ID IN "
+              "(SELECT Application_ID FROM Policy WHERE {between})",
+    "Claim": "SELECT a.Customer_ID FROM Application a JOIN Policy p ON p.Application_ID = a.Application_ID "
+             "WHERE p.Policy_Number IN (SELECT Policy_Number FROM Claim WHERE {between})",
+}
+
+
+def read_watermarks(connection):
+    cursor = connection.cursor()
+    cursor.execute("SELECT Name, Version FROM Rollup_Watermark")
+    return {name[len(WATERMARK_PREFIX):]: int(version) for name, version in cursor.fetchall()
+            if name.startswith(WATERMARK_PREFIX)}
+
+
+# the highest version of every input table that can safely be read now
+def current_versions(connection):
+    cursor = connection.cursor()
+    versions = {}
+    for table in CHANGED_CUSTOMERS:
+        upper_sql, _ = version_bounds(table)
+        cursor.execute(upper_sql)
+        versions[table] = int(cursor.fetchone()[0] or 0)
+    return versions
+
+
+# records the versions read by a run on today (in the caller's transaction)
+def write_watermarks(connection, versions, today):
+    cursor = connection.cursor()
+    marks = dict(versions, **{DAY_WATERMARK: today.toordinal(), MODEL_WATERMARK: MODEL_VERSION})
+    for name, version in marks.items():
+        cursor.execute(
+            "UPDATE Rollup_Watermark SET Version = ?, Updated_At = CURRENT_TIMESTAMP WHERE Name = ?",
+            (version, WATERMARK_PREFIX + name),
+        )
+        if cursor.rowcount != 1:
+            cursor.execute("INSERT INTO Rollup_Watermark (Name, Version) VALUES (?, ?)", (WATERMARK_PREFIX + name, version))
+
+
+# a customer's birthday as month * 100 + day
+def birthday_sql():
+    if db_pool.using_sqlite():
+        return "CAST(strftime('%m%d', DOB) AS INTEGER)"
+    return "(MONTH(DOB) * 100 + DAY(DOB))"
+
+
+# the IDs of the customers to rescore since a run that read old_versions on last_day (see the top
+# of the file), now that the versions are at new_versions
+def changed_customers(connection, old_versions, new_versions, last_day, today):
+    ids = []
+    for table, sql in CHANGED_CUSTOMERS.items():
+        low, high = old_versions.get(table, 0), new_versions[table]
+        if high > low:
+            _, between = version_bounds(table)
+            ids.append(fetch_columns(connection, sql.format(between=between), 1, (low, high))[0])
+
+    if today > last_day:
+        # ages are counted in years of 365.25 days, which can tick over a day or two either side of
+        # the birthday, so the window is widened by two days
+        first, last = last_day - timedelta(days=1), today + timedelta(days=2)
+        if (last - first).days >= 360:
+            ids.append(fetch_columns(connection, "SELECT Customer_ID FROM Customer", 1)[0])
+        else:
+            birthday = birthday_sql()
+            low, high = first.month * 100 + first.day, last.month * 100 + last.day
+            condition = f"{birthday} BETWEEN ? AND ?" if low <= high else f"{birthday} >= ? OR {birthday} <= ?"
+            ids.append(fetch_columns(connection, f"SELECT Customer_ID FROM Customer WHERE {condition}", 1, (low, high))[0])
+
+        ids.append(fetch_columns(connection, """
+            SELECT DISTINCT a.Customer_ID
+            FROM Policy p
+            JOIN Application a ON a.Application_ID = p.Application_ID
+            WHERE p.Start_Date < ? AND p.Expiry_Date > ? AND EXISTS (
+                SELECT 1 FROM Claim c
+                JOIN Policy cp ON cp.Policy_Number = c.Policy_Number
+                JOIN Application ca ON ca.Application_ID = cp.Application_ID
+                WHERE ca.Customer_ID = a.Customer_ID)
+        """, 1, (today.isoformat(), last_day.isoformat()))[0])
+
+    if not ids:
+        return np.empty(0, dtype=object)
+    return pd.unique(np.concatenate(ids))
+
+
+######################################################
+
+# the number of the next new assessment. the highest ID in the RA######## range is looked up through
+# the primary key; the IDs are only all read if that one is not a plain RA######## ID
+def next_assessment_number(connection):
+    cursor = connection.cursor()
+    cursor.execute(
+        "SELECT MAX(Assessment_ID) FROM Risk_Assessment WHERE Assessment_ID >= ? AND Assessment_ID <= ?",
+        ("RA00000000", "RA99999999"),
+    )
+    highest = cursor.fetchone()[0]
+    match = ASSESSMENT_ID.fullmatch(str(highest)) if highest is not None else None
+    if highest is None or match:
+        return int(match.group(1)) + 1 if match else 0
+    assessment_ids, = fetch_columns(connection, "SELECT Assessment_ID FROM Risk_Assessment", 1)
+    numbers = [int(match.group(1)) for match in map(ASSESSMENT_ID.fullmatch, assessment_ids.astype(str)) if match]
+    return max(numbers, default=-1) + 1
+
+
+# writes the scores back. customers with an assessment get it updated, the others get a new one.
+# everyone says whether customer_ids is the whole book (then every assessment is read at once
+# instead of looking up the customers' ones). returns (updated, inserted)
+def write_scores(connection, customer_ids, ages, multipliers, levels, batch_size=bulk_loader.DEFAULT_BATCH_SIZE,
+                 everyone=True):
+    if not len(customer_ids):
+        return 0, 0
+    assessed_customers, = fetch_for_customers(
+        connection, "SELECT Customer_ID FROM Risk_Assessment {where}", 1, "Customer_ID",
+        None if everyone else customer_ids,
+    )
+    assessed = pd.Index(customer_ids).isin(assessed_customers)
+
+    rows = list(zip(ages.tolist(), levels.tolist(), multipliers.tolist(), customer_ids.tolist()))
+    updates = [row for row, has_assessment in zip(rows, assessed) if has_assessment]
+    cursor = connection.cursor()
+    if hasattr(cursor, "fast_executemany"):
+        cursor.fast_executemany = True
+    for batch in bulk_loader.batches(updates, batch_size):
+        cursor.executemany(
+            "UPDATE Risk_Assessment SET Age = ?, Risk_Level = ?, Premium_Multiplier = ? WHERE Customer_ID = ?",
+            batch,
+        )
+        connection.commit()
+    if updates:
+        query_cache.table_changed("Risk_Assessment")
+
+    inserts = (
+        (f"RA{number:08d}", customer_id, age, level, multiplier)
+        for number, (age, level, multiplier, customer_id) in enumerate(
+            (row for row, has_assessment in zip(rows, assessed) if not has_assessment),
+            start=next_assessment_number(connection),
+        )
+    )
+    result = bulk_loader.bulk_insert(
+        connection, "Risk_Assessment", ["Assessment_ID", "Customer_ID", "Age", "Risk_Level", "Premium_Multiplier"],
+        inserts, batch_size=batch_size, convert=False,
+    )
+    return len(updates), result["rows"]
+
+
+# scores the book (or with incremental, the customers whose inputs changed since the last run) and
+# writes the results. returns a summary with the counts and the time spent reading, scoring and
+# writing. the first incremental run, and any after the model changed, scores everyone
+def rescore(connection, incremental=False, dry_run=False, batch_size=bulk_loader.DEFAULT_BATCH_SIZE, today=None):
+    today = today or date.today()
+    timings = {}
+    start = time.perf_counter()
+    versions = current_versions(connection)
+    old = read_watermarks(connection) if incremental else {}
+    everyone = old.get(MODEL_WATERMARK) != MODEL_VERSION or DAY_WATERMARK not in old
+    selected = None
+    if not everyone:
+        selected = changed_customers(connection, old, versions, date.fromordinal(old[DAY_WATERMARK]), today)
+    customer_ids, features = load_features(connection, today, selected)
+    timings["read"] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    ages, multipliers, levels = score(features)
+    timings["score"] = time.perf_counter() - start
+
+    updated = inserted = 0
+    start = time.perf_counter()
+    if not dry_run:
+        updated, inserted = write_scores(connection, customer_ids, ages, multipliers, levels, batch_size, everyone)
+        try:
+            write_watermarks(connection, versions, today)
+            connection.commit()
+        except Exception:
+            connection.rollback()
+            raise
+    timings["write"] = time.perf_counter() - start
+
+    return {
+        "customers": None if selected is not None else len(customer_ids),
+        "scored": len(customer_ids),
+        "updated": updated,
+        "inserted": inserted,
+        "levels": {str(level): int(count) for level, count in zip(*np.unique(levels, return_counts=True))},
+        "seconds": timings,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score every customer's risk and write it to Risk_Assessment.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only rescore customers whose claims, vehicles, age, etc. changed since the last run")
+    parser.add_argument("--dry-run", action="store_true", help="score but do not write anything")
+    parser.add_argument("--batch-size", type=int, default=bulk_loader.DEFAULT_BATCH_SIZE,
+                        help="rows written per batch")
+    args = parser.parse_args()
+
+    connection = db_pool.connect()
+    try:
+        summary = rescore(connection, incremental=args.incremental, dry_run=args.dry_run, batch_size=args.batch_size)
+    finally:
+        connection.close()
+
+    seconds = summary["seconds"]
+    scored = f"{summary['scored']} of {summary['customers']}" if summary["customers"] is not None \
+        else f"{summary['scored']} changed"
+    print(f"Scored {scored} customers "
+          f"(read {seconds['read']:.1f}s, score {seconds['score']:.1f}s, write {seconds['write']:.1f}s).")
+    print(f"Updated {summary['updated']} assessments, added {summary['inserted']}.")
+    for level, count in summary["levels"].items():
+        print(f"  {level:<8} {count}")
+
+
+if __name__ == "__main__":
+    main()
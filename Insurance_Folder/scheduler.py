@@ -0,0 +1,108 @@
+# A small in-process scheduler: one background thread that runs each registered function every
+# `interval` seconds. Used by the app for periodic work that does not belong in a request (e.g. the
+# renewal scan in renewals.py). Jobs run one after another on the same thread, so a slow job delays
+# the others instead of piling up, and a job that raises is logged and tried again at its next turn.
+# stats() gives the runs, failures and last duration of every job for /metrics.
+
+######################################################
+
+# importing the necessary libraries
+
+import logging
+import threading
+import time
+
+######################################################
+
+scheduler_log = logging.getLogger("insurance.scheduler")
+
+
+class ScheduledJob:
+    def __init__(self, name, interval, function, next_run):
+        self.name = name
+        self.interval = interval
+        self.function = function
+        self.next_run = next_run
+        self.runs = 0
+        self.failures = 0
+        self.last_seconds = 0.0
+        self.last_run = None
+
+
+class Scheduler:
+    def __init__(self):
+        self._jobs = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    # runs function every interval seconds, starting right away (or after the first interval when
+    # run_now is false)
+    def every(self, interval, function, name=None, run_now=True):
+        job = ScheduledJob(name or function.__name__, interval, function,
+                           time.monotonic() + (0 if run_now else interval))
+        with self._lock:
+            self._jobs.append(job)
+        self._wake.set()
+        return job
+
+    # moves a job's next run forward to now (e.g. because the data it works on just changed)
+    def run_soon(self, job):
+        with self._lock:
+            job.next_run = min(job.next_run, time.monotonic())
+        self._wake.set()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="scheduler", daemon=True)
+                self._thread.start()
+        return self
+
+    # stops the thread after the job that is running (if any) has finished
+    def stop(self, timeout=30):
+        with self._lock:
+            self._stopping = True
+            thread = self._thread
+        self._wake.set()
+        if thread is not None:
+            thread.join(timeout)
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._stopping:
+                    return
+                now = time.monotonic()
+                due = [job for job in self._jobs if job.next_run <= now]
+                wait = min((job.next_run for job in self._jobs), default=now + 60) - now
+            if not due:
+                self._wake.wait(max(wait, 0))
+                self._wake.clear()
+                continue
+            for job in due:
+                self._run_job(job)
+
+    def _run_job(self, job):
+        start = time.perf_counter()
+        try:
+            job.function()
+        except Exception:
+            job.failures += 1
+            scheduler_log.exception("Scheduled job %s failed", job.name)
+        job.runs += 1
+        job.last_seconds = time.perf_counter() - start
+        job.last_run = time.time()
+        # the next run is counted from the end of this one, so a job never overlaps itself
+        job.next_run = time.monotonic() + job.interval
+
+    def stats(self):
+        with self._lock:
+            stats = {}
+            for job in self._jobs:
+                stats[f"{job.name}_runs"] = job.runs
+                stats[f"{job.name}_failures"] = job.failures
+                stats[f"{job.name}_last_seconds"] = job.last_seconds
+                stats[f"{job.name}_last_run"] = job.last_run or 0
+            return stats
@@ -0,0 +1,193 @@
+# Reads the table definitions out of InsuranceDB_Creator.sql so the loaders can work from the real
+# schema (columns, primary keys and foreign keys) instead of a hand-maintained copy of it.
+
+######################################################
+
+# importing the necessary libraries
+
+import os
+import re
+
+######################################################
+
+SCHEMA_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "InsuranceDB_Creator.sql")
+
+
+# a single column of a table, e.g. Address VARCHAR(50) NOT NULL
+class Column:
+    def __init__(self, name, data_type, length=None, scale=None, nullable=True):
+        self.name = name
+        self.data_type = data_type
+        self.length = length
+        self.scale = scale
+        self.nullable = nullable
+
+    def __repr__(self):
+        return f"Column({self.name!r}, {self.data_type!r}, length={self.length}, nullable={self.nullable})"
+
+
+# a foreign key from columns of one table to parent_columns of parent_table
+class ForeignKey:
+    def __init__(self, columns, parent_table, parent_columns):
+        self.columns = columns
+        self.parent_table = parent_table
+        self.parent_columns = parent_columns
+
+    def __repr__(self):
+        return f"ForeignKey({self.columns!r} -> {self.parent_table}{self.parent_columns!r})"
+
+
+class Table:
+    def __init__(self, name):
+        self.name = name
+        self.columns = []
+        self.primary_key = []
+        self.foreign_keys = []
+
+    def column(self, name):
+        for column in self.columns:
+            if column.name == name:
+                return column
+        raise KeyError(f"{self.name} has no column {name}")
+
+    # the names of the tables this table references
+    def parents(self):
+        return {fk.parent_table for fk in self.foreign_keys if fk.parent_table != self.name}
+
+    def __repr__(self):
+        return f"Table({self.name!r}, {len(self.columns)} columns)"
+
+
+######################################################
+
+# parsing helpers
+
+COLUMN_DEFINITION = re.compile(r"^(\w+)\s+(\w+)(?:\s*\(\s*(\d+)\s*(?:,\s*(\d+)\s*)?\))?(.*)$", re.IGNORECASE)
+FOREIGN_KEY = re.compile(
+    r"^(?:CONSTRAINT\s+\w+\s+)?FOREIGN\s+KEY\s*\(([^)]*)\)\s*REFERENCES\s+(\w+)\s*\(([^)]*)\)", re.IGNORECASE
+)
+PRIMARY_KEY = re.compile(r"^(?:CONSTRAINT\s+\w+\s+)?PRIMARY\s+KEY\s*\(([^)]*)\)", re.IGNORECASE)
+ALTER_ADD = re.compile(r"ALTER\s+TABLE\s+(\w+)\s+ADD\s+([^;]+);", re.IGNORECASE)
+
+
+def _names(text):
+    return [name.strip() for name in text.split(",")]
+
+
+# removes -- comments from every line
+def _strip_comments(sql):
+    return "\n".join(line.split("--", 1)[0] for line in sql.splitlines())
+
+
+# splits the body of a CREATE TABLE statement into one item per column or constraint. items are
+# separated by commas outside parentheses, or by line breaks (one definition in the creator script
+# is missing its trailing comma)
+def _split_items(body):
+    items, current, depth = [], [], 0
+    for char in body:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if depth == 0 and char in ",\n":
+            items.append("".join(current).strip())
+            current = []
+        else:
+            current.append(char)
+    items.append("".join(current).strip())
+    return [item for item in items if item]
+
+
+# returns the text between the parenthesis at position start and its matching closing parenthesis
+def _balanced(text, start):
+    depth = 0
+    for position in range(start, len(text)):
+        if text[position] == "(":
+            depth += 1
+        elif text[position] == ")":
+            depth -= 1
+            if depth == 0:
+                return text[start + 1:position]
+    raise ValueError("Unbalanced parentheses in the schema file.")
+
+
+def _add_item(table, item):
+    match = FOREIGN_KEY.match(item)
+    if match:
+        table.foreign_keys.append(ForeignKey(_names(match.group(1)), match.group(2), _names(match.group(3))))
+        return
+
+    match = PRIMARY_KEY.match(item)
+    if match:
+        table.primary_key = _names(match.group(1))
+        return
+
+    match = COLUMN_DEFINITION.match(item)
+    if not match:
+        raise ValueError(f"Could not parse {table.name} definition: {item!r}")
+
+    name, data_type, length, scale, rest = match.groups()
+    rest = rest.upper()
+    table.columns.append(Column(
+        name,
+        data_type.upper(),
+        int(length) if length else None,
+        int(scale) if scale else None,
+        nullable="NOT NULL" not in rest and "PRIMARY KEY" not in rest,
+    ))
+    if "PRIMARY KEY" in rest:
+        table.primary_key = [name]
+
+
+# parses every CREATE TABLE (and ALTER TABLE ... ADD) statement in the schema file and returns the
+# tables as a dictionary keyed by table name, in the order they are created
+def parse_schema(path=SCHEMA_FILE):
+    with open(path) as f:
+        sql = _strip_comments(f.read())
+
+    tables = {}
+    for match in re.finditer(r"CREATE\s+TABLE\s+(\w+)\s*\(", sql, re.IGNORECASE):
+        table = Table(match.group(1))
+        for item in _split_items(_balanced(sql, match.end() - 1)):
+            _add_item(table, item)
+        tables[table.name] = table
+
+    for match in ALTER_ADD.finditer(sql):
+        _add_item(tables[match.group(1)], match.group(2).strip())
+
+    return tables
+
+
+# groups the tables into levels that can be loaded in order: every table's parents are in an
+# earlier level, and the tables within a level do not depend on each other
+def load_levels(tables):
+    remaining = {name: tables[name].parents() & set(tables) for name in tables}
+    levels = []
+    while remaining:
+        level = [name for name, parents in remaining.items() if not parents]
+        if not level:
+            raise ValueError(f"Circular foreign keys between {sorted(remaining)}")
+        levels.append(level)
+        for name in level:
+            del remaining[name]
+        for parents in remaining.values():
+            parents.difference_update(level)
+    return levels
+
+
+# builds a CREATE TABLE statement for a parsed table using only the DDL that both SQL server and
+# sqlite accept, so the benchmarks can recreate the schema in a local sqlite database
+def create_table_sql(table):
+    lines = []
+    for column in table.columns:
+        data_type = column.data_type
+        if column.length is not None:
+            data_type += f"({column.length}" + (f", {column.scale})" if column.scale is not None else ")")
+        lines.append(f"{column.name} {data_type}{'' if column.nullable else ' NOT NULL'}")
+    if table.primary_key:
+        lines.append(f"PRIMARY KEY ({', '.join(table.primary_key)})")
+    for fk in table.foreign_keys:
+        lines.append(
+            f"FOREIGN KEY ({', '.join(fk.columns)}) REFERENCES {fk.parent_table} ({', '.join(fk.parent_columns)})"
+        )
+    return f"CREATE TABLE {table.name} (\n    " + ",\n    ".join(lines) + "\n)"
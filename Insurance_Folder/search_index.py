@@ -0,0 +1,589 @@
+# Full-text search over the free text columns (incident and report descriptions, policy terms,
+# coverage descriptions and feedback), instead of LIKE '%...%' queries that read every row. Used by
+# the app's /search route and from the command line.
+#
+# The index is an inverted index: for every term, the sorted list of the documents (rows) it appears
+# in and how often (its postings). Results are ranked with BM25. It is made of
+#   - a base, written to numpy files in a generation folder under SEARCH_DIR and memory-mapped when
+#     loaded, so opening it is instant and a restart does not rebuild it. The terms are a sorted
+#     fixed-width array found by binary search, and the postings of all terms are two flat arrays
+#     (document number as uint32, term count as uint8) with an offset per term
+#   - small in-memory deltas holding the documents added since the base was written
+#
+# build() reads every source table once, in batches, and writes the first base. After that the app's
+# scheduler calls refresh(), which reads only the rows whose rowversion moved since the last read
+# (migrations 003 and 006, rowid on the sqlite stand-in) into the delta, and writes a new base
+# (compact) once the delta has COMPACT_AFTER documents. Rows added through the app's add_* pages are
+# indexed as they are inserted (record_insert). A changed row replaces its earlier document, which
+# is then marked deleted. Deleted rows are not noticed until the next build().
+#
+# The base folder also records how far every table had been read, so after a restart refresh()
+# only reads the rows that changed since the base was written.
+#
+# usage: python search_index.py --build
+#        python search_index.py <query> [--source TABLE] [--limit N]
+
+######################################################
+
+# importing the necessary libraries
+
+import argparse
+import json
+import math
+import os
+import re
+import shutil
+import threading
+import time
+from array import array
+from collections import Counter
+
+import numpy as np
+
+import db_pool
+from db_pool import version_bounds
+
+######################################################
+
+# table -> (key column, text column). the order must not change, since documents store the position
+SOURCES = {
+    "Incident": ("Incident_ID", "Description"),
+    "Incident_Report": ("Report_ID", "Description"),
+    "Policy": ("Policy_Number", "Terms"),
+    "Application": ("Application_ID", "Coverage_Description"),
+    "Feedback_Info": ("Feedback_ID", "Feedback_Text"),
+}
+SOURCE_NAMES = list(SOURCES)
+
+# the index files are kept next to the app unless INSURANCE_SEARCH_DIR says otherwise
+SEARCH_DIR = os.environ.get(
+    "INSURANCE_SEARCH_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "search")
+)
+
+# documents in the deltas before they are written into a new base
+COMPACT_AFTER = 100000
+BATCH_SIZE = 10000
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+# terms longer than this (in bytes) are not indexed. keys are at most 20 characters (VARCHAR(20))
+MAX_TERM_BYTES = 32
+KEY_BYTES = 20
+
+STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with".split()
+)
+
+_WORD = re.compile(r"\w+")
+
+
+# the terms of a text: lower cased words, without stopwords and overlong words
+def tokenize(text):
+    if not text:
+        return []
+    return [
+        word for word in _WORD.findall(str(text).lower())
+        if word not in STOPWORDS and len(word.encode()) <= MAX_TERM_BYTES
+    ]
+
+
+######################################################
+
+# the documents added since the base was written. their numbers start at first_doc
+class _Delta:
+    def __init__(self, first_doc):
+        self.first_doc = first_doc
+        self.postings = {}
+        self.sources = array("B")
+        self.lengths = array("H")
+        self.keys = []
+        self.docs_by_key = {}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def add(self, source, key, terms):
+        doc = self.first_doc + len(self.keys)
+        for term, count in Counter(terms).items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = (array("I"), array("B"))
+            postings[0].append(doc)
+            postings[1].append(min(count, 255))
+        self.sources.append(source)
+        self.lengths.append(min(len(terms), 65535))
+        self.keys.append(key)
+        self.docs_by_key[(source, key)] = doc
+        return doc
+
+    def term_postings(self, term):
+        postings = self.postings.get(term)
+        if postings is None:
+            return None
+        # copies, not views: an array cannot grow while a view of its buffer is still alive
+        return np.array(postings[0], dtype=np.uint32), np.array(postings[1], dtype=np.uint8)
+
+
+# a base written to disk, memory-mapped
+class _Base:
+    FILES = ("terms", "offsets", "docs", "counts", "doc_sources", "doc_lengths", "doc_keys", "deleted",
+             "key_index", "key_docs")
+
+    def __init__(self, path=None):
+        self.path = path
+        self.meta = {"versions": {}, "documents": 0, "live": 0, "total_length": 0}
+        if path is None:
+            self.terms = np.array([], dtype=f"S{MAX_TERM_BYTES}")
+            self.offsets = np.zeros(1, dtype=np.int64)
+            self.docs = np.array([], dtype=np.uint32)
+            self.counts = np.array([], dtype=np.uint8)
+            self.doc_sources = np.array([], dtype=np.uint8)
+            self.doc_lengths = np.array([], dtype=np.uint16)
+            self.doc_keys = np.array([], dtype=f"S{KEY_BYTES}")
+            self.deleted = np.array([], dtype=bool)
+            self.key_index = np.array([], dtype=f"S{KEY_BYTES + 4}")
+            self.key_docs = np.array([], dtype=np.uint32)
+            return
+        for name in self.FILES:
+            setattr(self, name, np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r"))
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+
+    def __len__(self):
+        return len(self.doc_sources)
+
+    def term_postings(self, term):
+        encoded = term.encode()
+        position = int(np.searchsorted(self.terms, encoded))
+        if position == len(self.terms) or self.terms[position] != encoded:
+            return None
+        start, end = int(self.offsets[position]), int(self.offsets[position + 1])
+        return self.docs[start:end], self.counts[start:end]
+
+    def find(self, source, key):
+        wanted = _composite_key(source, key)
+        position = int(np.searchsorted(self.key_index, wanted))
+        if position < len(self.key_index) and self.key_index[position] == wanted:
+            return int(self.key_docs[position])
+        return None
+
+
+def _composite_key(source, key):
+    return f"{source}:{key}".encode()
+
+
+######################################################
+
+class SearchIndex:
+    def __init__(self, directory=SEARCH_DIR):
+        self.directory = directory
+        self._lock = threading.Lock()
+        # only one build / refresh / compaction runs at a time
+        self._writing = threading.Lock()
+        self._base = _Base(_current_generation(directory))
+        self._deltas = [_Delta(len(self._base))]
+        self._deleted = set()
+        self._versions = dict(self._base.meta["versions"])
+        self._live = self._base.meta["live"]
+        self._total_length = self._base.meta["total_length"]
+        self._scores = None
+        self._seen = None
+
+        self.searches = 0
+        self.refreshes = 0
+        self.compactions = 0
+        self.last_search_seconds = 0.0
+        self.last_refresh_seconds = 0.0
+        self.last_compaction_seconds = 0.0
+
+    # true once there is a base on disk
+    def built(self):
+        return self._base.path is not None
+
+    # reads every row of every source into a new base. rows are read in batches, so only the
+    # postings are ever held in memory, not the rows
+    def build(self, connection):
+        with self._writing:
+            start = time.perf_counter()
+            delta = _Delta(0)
+            versions = {}
+            cursor = connection.cursor()
+            for source, (table_name, (key_column, text_column)) in enumerate(SOURCES.items()):
+                upper_sql, between = version_bounds(table_name)
+                cursor.execute(upper_sql)
+                versions[table_name] = int(cursor.fetchone()[0] or 0)
+                cursor.execute(
+                    f"SELECT {key_column}, {text_column} FROM {table_name} WHERE {between}",
+                    (0, versions[table_name]),
+                )
+                while True:
+                    rows = cursor.fetchmany(BATCH_SIZE)
+                    if not rows:
+                        break
+                    for key, text in rows:
+                        delta.add(source, str(key), tokenize(text))
+
+            path = _write_generation(self.directory, _Base(), [delta], set(), versions)
+            base = _Base(path)
+            with self._lock:
+                self._base = base
+                self._deltas = [_Delta(len(base))]
+                self._deleted = set()
+                self._versions = versions
+                self._live = base.meta["live"]
+                self._total_length = base.meta["total_length"]
+                self.compactions += 1
+                self.last_compaction_seconds = time.perf_counter() - start
+            _remove_old_generations(self.directory, path)
+            return len(base)
+
+    # adds the rows changed since the last read to the delta, and compacts it if it has grown big
+    # enough. returns the number of rows read
+    def refresh(self, connection):
+        with self._writing:
+            start = time.perf_counter()
+            cursor = connection.cursor()
+            read = 0
+            for source, (table_name, (key_column, text_column)) in enumerate(SOURCES.items()):
+                upper_sql, between = version_bounds(table_name)
+                cursor.execute(upper_sql)
+                high = int(cursor.fetchone()[0] or 0)
+                low = self._versions.get(table_name, 0)
+                if high <= low:
+                    continue
+                cursor.execute(f"SELECT {key_column}, {text_column} FROM {table_name} WHERE {between}", (low, high))
+                while True:
+                    rows = cursor.fetchmany(BATCH_SIZE)
+                    if not rows:
+                        break
+                    with self._lock:
+                        for key, text in rows:
+                            self._replace(source, str(key), tokenize(text))
+                    read += len(rows)
+                with self._lock:
+                    self._versions[table_name] = high
+
+            with self._lock:
+                self.refreshes += 1
+                self.last_refresh_seconds = time.perf_counter() - start
+                pending = sum(len(delta) for delta in self._deltas)
+        if pending >= COMPACT_AFTER:
+            self.compact()
+        return read
+
+    # build() the first time, refresh() after that, on a connection of its own, for the scheduler
+    def scan(self, connect):
+        connection = connect()
+        try:
+            if not self.built():
+                return self.build(connection)
+            return self.refresh(connection)
+        finally:
+            connection.close()
+
+    # indexes a row just inserted into table_name (rows of other tables are ignored)
+    def record_insert(self, table_name, row):
+        if table_name not in SOURCES:
+            return
+        key_column, text_column = SOURCES[table_name]
+        with self._lock:
+            self._replace(SOURCE_NAMES.index(table_name), str(row[key_column]), tokenize(row.get(text_column)))
+
+    # adds a document, replacing the one with the same key if there is one. called with the lock held
+    def _replace(self, source, key, terms):
+        old = None
+        for delta in reversed(self._deltas):
+            old = delta.docs_by_key.get((source, key))
+            if old is not None:
+                break
+        if old is None:
+            old = self._base.find(source, key)
+        if old is not None and old not in self._deleted:
+            self._deleted.add(old)
+            self._live -= 1
+            self._total_length -= int(self._column("lengths", np.array([old]))[0])
+
+        self._deltas[-1].add(source, key, terms)
+        self._live += 1
+        self._total_length += min(len(terms), 65535)
+
+    # writes the base and the deltas as they are now into a new base. documents added while it is
+    # being written go to a new delta, which is kept
+    def compact(self):
+        with self._writing:
+            start = time.perf_counter()
+            with self._lock:
+                base = self._base
+                deltas = list(self._deltas)
+                deleted = set(self._deleted)
+                versions = dict(self._versions)
+                following = deltas[-1].first_doc + len(deltas[-1])
+                self._deltas.append(_Delta(following))
+
+            path = _write_generation(self.directory, base, deltas, deleted, versions)
+            new_base = _Base(path)
+            with self._lock:
+                self._base = new_base
+                self._deltas = self._deltas[len(deltas):]
+                # the base has the documents deleted before it was written marked already
+                self._deleted -= deleted
+                self.compactions += 1
+                self.last_compaction_seconds = time.perf_counter() - start
+            _remove_old_generations(self.directory, path)
+
+    # the score and seen-already arrays of search(), one entry per document. they are kept (all zero)
+    # between searches, since allocating them for every query would cost more than the query.
+    # called with the lock held
+    def _buffers(self):
+        documents = self._deltas[-1].first_doc + len(self._deltas[-1])
+        if self._scores is None or len(self._scores) < documents:
+            size = documents + documents // 4 + 1024
+            self._scores = np.zeros(size, dtype=np.float32)
+            self._seen = np.zeros(size, dtype=bool)
+        return self._scores, self._seen
+
+    # the values of a document column ("sources", "lengths" or "keys") for an array of documents
+    def _column(self, name, docs):
+        base_values = getattr(self._base, f"doc_{name}")
+        if name == "keys":
+            values = np.empty(len(docs), dtype=object)
+        else:
+            values = np.empty(len(docs), dtype=base_values.dtype)
+        in_base = docs < len(self._base)
+        if in_base.any():
+            found = base_values[docs[in_base]]
+            values[in_base] = [key.decode() for key in found] if name == "keys" else found
+        for delta in self._deltas:
+            mask = (docs >= delta.first_doc) & (docs < delta.first_doc + len(delta))
+            if mask.any():
+                positions = docs[mask] - delta.first_doc
+                if name == "keys":
+                    values[mask] = [delta.keys[position] for position in positions]
+                else:
+                    values[mask] = np.frombuffer(getattr(delta, name), dtype=base_values.dtype)[positions]
+        return values
+
+    # the documents that best match the query, best first. sources limits the search to some of the
+    # tables. returns the number of matching documents and the `limit` results starting at `offset`,
+    # each {"table", "key", "score"}
+    def search(self, query, limit=20, offset=0, sources=None):
+        start = time.perf_counter()
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            live = max(self._live, 1)
+            average_length = max(self._total_length / live, 1.0)
+            scores_by_doc, seen = self._buffers()
+            found_docs = []
+            for term in terms:
+                postings = [found for found in [self._base.term_postings(term)]
+                            + [delta.term_postings(term) for delta in self._deltas] if found is not None]
+                if not postings:
+                    continue
+                # a document is in a term's postings once, so the scores can be added by plain indexing
+                docs = np.concatenate([found[0] for found in postings]).astype(np.int64)
+                counts = np.concatenate([found[1] for found in postings]).astype(np.float32)
+                lengths = self._column("lengths", docs).astype(np.float32)
+                idf = math.log(1 + (live - len(docs) + 0.5) / (len(docs) + 0.5))
+                scores_by_doc[docs] += idf * counts * (K1 + 1) / (counts + K1 * (1 - B + B * lengths / average_length))
+                new = ~seen[docs]
+                seen[docs] = True
+                found_docs.append(docs[new])
+
+            docs = np.concatenate(found_docs) if found_docs else np.array([], dtype=np.int64)
+            scores = scores_by_doc[docs]
+            scores_by_doc[docs] = 0
+            seen[docs] = False
+
+            keep = np.ones(len(docs), dtype=bool)
+            if self._deleted:
+                keep &= ~np.isin(docs, np.fromiter(self._deleted, dtype=np.int64))
+            in_base = docs < len(self._base)
+            if len(self._base.deleted) and in_base.any():
+                keep[in_base] &= ~self._base.deleted[docs[in_base]]
+            if sources:
+                wanted = [SOURCE_NAMES.index(name) for name in sources]
+                keep &= np.isin(self._column("sources", docs), wanted)
+            docs, scores = docs[keep], scores[keep]
+
+            total = len(docs)
+            end = min(offset + limit, total)
+            if end > offset:
+                best = np.argpartition(-scores, end - 1)[:end] if end < total else np.arange(total)
+                best = best[np.lexsort((docs[best], -scores[best]))][offset:end]
+            else:
+                best = np.array([], dtype=np.int64)
+            table_numbers = self._column("sources", docs[best])
+            keys = self._column("keys", docs[best])
+            self.searches += 1
+            self.last_search_seconds = time.perf_counter() - start
+
+        results = [
+            {"table": SOURCE_NAMES[int(table)], "key": key, "score": round(float(score), 4)}
+            for table, key, score in zip(table_numbers, keys, scores[best])
+        ]
+        return total, results
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": self._live,
+                "base_documents": len(self._base),
+                "delta_documents": sum(len(delta) for delta in self._deltas),
+                "terms": len(self._base.terms),
+                "postings": len(self._base.docs),
+                "searches": self.searches,
+                "refreshes": self.refreshes,
+                "compactions": self.compactions,
+                "last_search_seconds": self.last_search_seconds,
+                "last_refresh_seconds": self.last_refresh_seconds,
+                "last_compaction_seconds": self.last_compaction_seconds,
+            }
+
+
+# adds the text of every result, read by key from its table
+def with_text(connection, results):
+    cursor = connection.cursor()
+    for table_name in {result["table"] for result in results}:
+        key_column, text_column = SOURCES[table_name]
+        keys = [result["key"] for result in results if result["table"] == table_name]
+        cursor.execute(
+            f"SELECT {key_column}, {text_column} FROM {table_name} WHERE {key_column} IN ({', '.join('?' for _ in keys)})",
+            keys,
+        )
+        texts = {str(key): text for key, text in cursor.fetchall()}
+        for result in results:
+            if result["table"] == table_name:
+                result["text"] = texts.get(result["key"])
+    return results
+
+
+######################################################
+
+# the base generation named in the CURRENT file of directory, or None
+def _current_generation(directory):
+    try:
+        with open(os.path.join(directory, "CURRENT")) as f:
+            path = os.path.join(directory, f.read().strip())
+    except OSError:
+        return None
+    return path if os.path.isdir(path) else None
+
+
+# writes base plus deltas (without the deleted documents' postings) to a new generation folder and
+# points CURRENT at it. returns the folder
+def _write_generation(directory, base, deltas, deleted, versions):
+    documents = len(base) + sum(len(delta) for delta in deltas)
+    is_deleted = np.zeros(documents, dtype=bool)
+    is_deleted[:len(base)] = base.deleted
+    if deleted:
+        is_deleted[np.fromiter(deleted, dtype=np.int64)] = True
+
+    # every term, the base's and the deltas'
+    delta_terms = sorted({term for delta in deltas for term in delta.postings})
+    terms = np.union1d(base.terms, np.array([term.encode() for term in delta_terms], dtype=f"S{MAX_TERM_BYTES}"))
+
+    term_ids = [np.searchsorted(terms, base.terms)[np.repeat(np.arange(len(base.terms)), np.diff(base.offsets))]]
+    docs = [np.asarray(base.docs)]
+    counts = [np.asarray(base.counts)]
+    for delta in deltas:
+        ids = np.searchsorted(terms, np.array([term.encode() for term in delta.postings], dtype=f"S{MAX_TERM_BYTES}"))
+        for term_id, (term_docs, term_counts) in zip(ids, delta.postings.values()):
+            term_ids.append(np.full(len(term_docs), term_id, dtype=np.int64))
+            docs.append(np.frombuffer(term_docs, dtype=np.uint32))
+            counts.append(np.frombuffer(term_counts, dtype=np.uint8))
+    term_ids = np.concatenate(term_ids).astype(np.int64)
+    docs = np.concatenate(docs).astype(np.uint32)
+    counts = np.concatenate(counts).astype(np.uint8)
+
+    keep = ~is_deleted[docs]
+    term_ids, docs, counts = term_ids[keep], docs[keep], counts[keep]
+    order = np.lexsort((docs, term_ids))
+    term_ids, docs, counts = term_ids[order], docs[order], counts[order]
+    per_term = np.bincount(term_ids, minlength=len(terms))
+    used = per_term > 0
+    offsets = np.concatenate([[0], np.cumsum(per_term[used])]).astype(np.int64)
+
+    doc_sources = np.concatenate([np.asarray(base.doc_sources)]
+                                 + [np.frombuffer(delta.sources, dtype=np.uint8) for delta in deltas])
+    doc_lengths = np.concatenate([np.asarray(base.doc_lengths)]
+                                 + [np.frombuffer(delta.lengths, dtype=np.uint16) for delta in deltas])
+    doc_keys = np.concatenate([np.asarray(base.doc_keys)]
+                              + [np.array([key.encode() for key in delta.keys], dtype=f"S{KEY_BYTES}") for delta in deltas])
+
+    live = np.flatnonzero(~is_deleted)
+    composite = np.char.add(np.char.add(doc_sources[live].astype("S3"), b":"), doc_keys[live])
+    key_order = np.argsort(composite, kind="stable")
+
+    arrays = {
+        "terms": terms[used],
+        "offsets": offsets,
+        "docs": docs,
+        "counts": counts,
+        "doc_sources": doc_sources,
+        "doc_lengths": doc_lengths,
+        "doc_keys": doc_keys,
+        "deleted": is_deleted,
+        "key_index": composite[key_order].astype(f"S{KEY_BYTES + 4}"),
+        "key_docs": live[key_order].astype(np.uint32),
+    }
+    meta = {
+        "versions": versions,
+        "documents": documents,
+        "live": len(live),
+        "total_length": int(doc_lengths[live].sum()),
+        "sources": SOURCE_NAMES,
+        "created_at": time.time(),
+    }
+
+    os.makedirs(directory, exist_ok=True)
+    name = f"generation-{time.time_ns()}"
+    path = os.path.join(directory, name)
+    os.makedirs(path + ".tmp")
+    for file_name, values in arrays.items():
+        np.save(os.path.join(path + ".tmp", f"{file_name}.npy"), values)
+    with open(os.path.join(path + ".tmp", "meta.json"), "w") as f:
+        json.dump(meta, f)
+    os.replace(path + ".tmp", path)
+    with open(os.path.join(directory, "CURRENT.tmp"), "w") as f:
+        f.write(name)
+    os.replace(os.path.join(directory, "CURRENT.tmp"), os.path.join(directory, "CURRENT"))
+    return path
+
+
+# removes the generations other than keep. files still mapped by an index stay readable until closed
+def _remove_old_generations(directory, keep):
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if name.startswith("generation-") and path != keep and os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build or query the full-text search index.")
+    parser.add_argument("query", nargs="?", help="the words to search for")
+    parser.add_argument("--build", action="store_true", help="build the index from scratch")
+    parser.add_argument("--source", action="append", choices=SOURCE_NAMES, help="only search this table (can be repeated)")
+    parser.add_argument("--limit", type=int, default=10, help="number of results to print")
+    args = parser.parse_args()
+
+    index = SearchIndex()
+    connection = db_pool.connect()
+    try:
+        if args.build:
+            documents = index.build(connection)
+            print(f"Indexed {documents} documents in {index.last_compaction_seconds:.2f}s.")
+        else:
+            index.refresh(connection)
+        if args.query:
+            total, results = index.search(args.query, limit=args.limit, sources=args.source)
+            print(f"{total} matching documents ({index.last_search_seconds * 1000:.1f} ms).")
+            for result in with_text(connection, results):
+                print(f"  {result['score']:>8.3f}  {result['table']} {result['key']}: {result['text']}")
+    finally:
+        connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,379 @@
+# Offline customer segmentation. Groups the customers with mini-batch k-means over features derived
+# from Customer, Vehicle, Claim and Premium_Payment, then writes one Customer_Segmentation row per
+# segment (Age_Range, Risk_Level and Claim_Frequency describe the customers in it) and every
+# customer's segment to Segment_Membership (migration 004).
+#
+# The job never holds the whole book in memory:
+#   1. the features are read from the database one chunk of customers at a time (keyset paging on
+#      Customer_ID, with the vehicle / claim / payment totals of the chunk aggregated by the server)
+#      and spilled to memory-mapped files in a work folder
+#   2. k-means++ picks the starting centres from a sample, then mini-batch k-means updates the
+#      centres one chunk at a time for a few passes over the spilled features
+#   3. every customer is assigned to the nearest centre, the segments are summarised and both are
+#      written to the database in batches, replacing the last run's in one transaction (so readers
+#      see either the old segments or the new ones, never a half-written set)
+#
+# The same data and --seed always give the same segments. The centres and the feature scaling are
+# saved to a model file so the segments can be reproduced and checked later.
+#
+# usage: python segmentation.py [--segments K] [--seed N] [--chunk-size N] [--epochs N] [--dry-run]
+
+######################################################
+
+# importing the necessary libraries
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+from datetime import date
+
+import numpy as np
+import pandas as pd
+
+import db_pool
+import query_cache
+import registry
+from columnar import as_dates, as_float, fetch_columns
+
+######################################################
+
+DEFAULT_SEGMENTS = 8
+DEFAULT_CHUNK_SIZE = 50000
+DEFAULT_EPOCHS = 3
+
+# centres are picked from a sample of at most this many customers
+INIT_SAMPLE = 20000
+
+# training stops early once no centre moves further than this in a pass
+TOLERANCE = 1e-4
+
+# the centres and scaling of the last run (INSURANCE_SEGMENT_MODEL)
+MODEL_PATH = os.environ.get(
+    "INSURANCE_SEGMENT_MODEL",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "checkpoints", "segments.npz"),
+)
+
+# the segments written by this job have IDs KM00000000, KM00000001, ... so rows typed in by hand
+# (SG...) are left alone
+SEGMENT_PREFIX = "KM"
+
+FEATURES = ["age", "married", "vehicles", "vehicle_value", "claims", "claim_cost", "premiums"]
+
+# counts and amounts are heavily skewed, so they are clustered on a log scale
+LOG_FEATURES = np.array([name in ("vehicles", "vehicle_value", "claims", "claim_cost", "premiums")
+                         for name in FEATURES])
+
+# Claim_Frequency by average claims per customer, and Risk_Level by claim cost per customer
+# compared with the whole book
+CLAIM_FREQUENCY_LIMITS = [(0.1, "Rare"), (0.3, "Low"), (0.6, "Occasional"), (1.0, "Moderate")]
+TOP_CLAIM_FREQUENCY = "Frequent"
+RISK_LEVEL_LIMITS = [(0.75, "Low"), (1.25, "Medium")]
+TOP_RISK_LEVEL = "High"
+
+# per chunk totals. each query gives (Customer_ID, count, amount) for the customers in (?, ?]
+AGGREGATES = [
+    (("vehicles", "vehicle_value"), """
+        SELECT Customer_ID, COUNT(*), SUM(Value)
+        FROM Vehicle
+        WHERE Customer_ID > ? AND Customer_ID <= ?
+        GROUP BY Customer_ID
+    """),
+    (("claims", "claim_cost"), """
+        SELECT a.Customer_ID, COUNT(*), SUM(c.Amount)
+        FROM Application a
+        JOIN Policy p ON p.Application_ID = a.Application_ID
+        JOIN Claim c ON c.Policy_Number = p.Policy_Number
+        WHERE a.Customer_ID > ? AND a.Customer_ID <= ?
+        GROUP BY a.Customer_ID
+    """),
+    ((None, "premiums"), """
+        SELECT a.Customer_ID, COUNT(*), SUM(pp.Amount)
+        FROM Application a
+        JOIN Policy p ON p.Application_ID = a.Application_ID
+        JOIN Premium_Payment pp ON pp.Policy_Number = p.Policy_Number
+        WHERE a.Customer_ID > ? AND a.Customer_ID <= ?
+        GROUP BY a.Customer_ID
+    """),
+]
+
+
+# the next `count` customers after a Customer_ID. SQL server and sqlite limit rows differently
+def customer_page_sql(count):
+    if db_pool.using_sqlite():
+        return f"SELECT Customer_ID, DOB, Marital_Status FROM Customer WHERE Customer_ID > ? ORDER BY Customer_ID LIMIT {int(count)}"
+    return f"SELECT TOP ({int(count)}) Customer_ID, DOB, Marital_Status FROM Customer WHERE Customer_ID > ? ORDER BY Customer_ID"
+
+
+# yields (customer IDs, raw feature matrix) for chunk_size customers at a time, in Customer_ID order
+def feature_chunks(connection, chunk_size=DEFAULT_CHUNK_SIZE, today=None):
+    today = pd.Timestamp(today or date.today())
+    column = {name: i for i, name in enumerate(FEATURES)}
+    last = ""
+    while True:
+        ids, dob, married = fetch_columns(connection, customer_page_sql(chunk_size), 3, (last,))
+        if not len(ids):
+            return
+        features = np.zeros((len(ids), len(FEATURES)), dtype=np.float32)
+        features[:, column["age"]] = ((today - as_dates(dob)).dt.days // 365.25).fillna(0).to_numpy()
+        features[:, column["married"]] = as_float(married)
+
+        customers = pd.Index(ids)
+        for (count_name, amount_name), sql in AGGREGATES:
+            owners, counts, amounts = fetch_columns(connection, sql, 3, (last, ids[-1]))
+            positions = customers.get_indexer(owners)
+            known = positions >= 0
+            if count_name:
+                features[positions[known], column[count_name]] = as_float(counts)[known]
+            features[positions[known], column[amount_name]] = as_float(amounts)[known]
+
+        yield ids, features
+        last = ids[-1]
+
+
+# reads every customer's features into memory-mapped files in work_dir. returns (ids, features)
+def extract(connection, work_dir, chunk_size=DEFAULT_CHUNK_SIZE):
+    cursor = connection.cursor()
+    cursor.execute("SELECT COUNT(*) FROM Customer")
+    total = cursor.fetchone()[0]
+    id_length = registry.get("Customer").table.column("Customer_ID").length or 10
+
+    ids = np.lib.format.open_memmap(os.path.join(work_dir, "ids.npy"), mode="w+", dtype=f"U{id_length}",
+                                    shape=(total,))
+    features = np.lib.format.open_memmap(os.path.join(work_dir, "features.npy"), mode="w+", dtype=np.float32,
+                                         shape=(total, len(FEATURES)))
+    written = 0
+    for chunk_ids, chunk_features in feature_chunks(connection, chunk_size):
+        # customers added while the job runs are left for the next run
+        count = min(len(chunk_ids), total - written)
+        ids[written:written + count] = chunk_ids[:count]
+        features[written:written + count] = chunk_features[:count]
+        written += count
+        if written == total:
+            break
+    return ids[:written], features[:written]
+
+
+######################################################
+
+# k-means
+
+def transform(raw, mean, std):
+    x = raw.astype(np.float64)
+    x[:, LOG_FEATURES] = np.log1p(np.maximum(x[:, LOG_FEATURES], 0))
+    return (x - mean) / std
+
+
+# mean and standard deviation of the transformed features, one chunk at a time
+def scaling(features, chunk_size):
+    total = np.zeros(len(FEATURES))
+    squares = np.zeros(len(FEATURES))
+    identity = (np.zeros(len(FEATURES)), np.ones(len(FEATURES)))
+    for start in range(0, len(features), chunk_size):
+        x = transform(features[start:start + chunk_size], *identity)
+        total += x.sum(axis=0)
+        squares += (x ** 2).sum(axis=0)
+    mean = total / max(len(features), 1)
+    std = np.sqrt(np.maximum(squares / max(len(features), 1) - mean ** 2, 0))
+    return mean, np.where(std > 0, std, 1.0)
+
+
+# the nearest centre of every row of x, and the distance to it
+def nearest(x, centers):
+    distances = (x ** 2).sum(axis=1)[:, None] - 2 * x @ centers.T + (centers ** 2).sum(axis=1)[None, :]
+    labels = distances.argmin(axis=1)
+    return labels, np.sqrt(np.maximum(distances[np.arange(len(x)), labels], 0))
+
+
+def kmeans_plus_plus(sample, k, rng):
+    centers = [sample[rng.integers(len(sample))]]
+    closest = ((sample - centers[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        weights = closest / closest.sum() if closest.sum() > 0 else None
+        centers.append(sample[rng.choice(len(sample), p=weights)])
+        closest = np.minimum(closest, ((sample - centers[-1]) ** 2).sum(axis=1))
+    return np.array(centers)
+
+
+# mini-batch k-means over the spilled features. every chunk moves each centre towards the mean of
+# the rows assigned to it, by the share of all the rows the centre has seen so far that came from
+# this chunk. the chunks are visited in a seeded random order on every pass
+def train(features, k, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, epochs=DEFAULT_EPOCHS):
+    rng = np.random.default_rng(seed)
+    mean, std = scaling(features, chunk_size)
+
+    sample_rows = np.sort(rng.choice(len(features), size=min(len(features), INIT_SAMPLE), replace=False))
+    centers = kmeans_plus_plus(transform(features[sample_rows], mean, std), k, rng)
+
+    seen = np.zeros(k)
+    starts = np.arange(0, len(features), chunk_size)
+    passes = 0
+    for _ in range(epochs):
+        previous = centers.copy()
+        for start in rng.permutation(starts):
+            x = transform(features[start:start + chunk_size], mean, std)
+            labels, _ = nearest(x, centers)
+            assigned = np.bincount(labels, minlength=k)
+            sums = np.stack([np.bincount(labels, weights=x[:, j], minlength=k) for j in range(x.shape[1])], axis=1)
+            seen += assigned
+            rate = (assigned / np.maximum(seen, 1))[:, None]
+            centers += rate * (sums / np.maximum(assigned, 1)[:, None] - centers)
+        passes += 1
+        if np.abs(centers - previous).max() < TOLERANCE:
+            break
+
+    return {"centers": centers, "mean": mean, "std": std, "seed": seed, "passes": passes}
+
+
+######################################################
+
+# assigns every customer and summarises the segments. the labels and distances are written to
+# memory-mapped files in work_dir. returns (labels, distances, segments)
+def assign(features, model, work_dir, chunk_size=DEFAULT_CHUNK_SIZE):
+    k = len(model["centers"])
+    labels = np.lib.format.open_memmap(os.path.join(work_dir, "labels.npy"), mode="w+", dtype=np.int32,
+                                       shape=(len(features),))
+    distances = np.lib.format.open_memmap(os.path.join(work_dir, "distances.npy"), mode="w+",
+                                          dtype=np.float32, shape=(len(features),))
+    column = {name: i for i, name in enumerate(FEATURES)}
+    members = np.zeros(k)
+    totals = {name: np.zeros(k) for name in ("claims", "claim_cost", "premiums")}
+    ages = np.zeros((k, 121))
+
+    for start in range(0, len(features), chunk_size):
+        raw = features[start:start + chunk_size]
+        chunk_labels, chunk_distances = nearest(transform(raw, model["mean"], model["std"]), model["centers"])
+        labels[start:start + len(raw)] = chunk_labels
+        distances[start:start + len(raw)] = chunk_distances
+        members += np.bincount(chunk_labels, minlength=k)
+        for name, total in totals.items():
+            total += np.bincount(chunk_labels, weights=raw[:, column[name]], minlength=k)
+        age = np.clip(raw[:, column["age"]], 0, 120).astype(int)
+        ages += np.bincount(chunk_labels * 121 + age, minlength=k * 121).reshape(k, 121)
+
+    return labels, distances, describe(members, totals, ages)
+
+
+# one Customer_Segmentation row per segment, describing its customers
+def describe(members, totals, ages):
+    book_cost = totals["claim_cost"].sum() / max(members.sum(), 1)
+    segments = []
+    for i in range(len(members)):
+        count = max(members[i], 1)
+        cumulative = np.cumsum(ages[i]) / count
+        age_range = f"{int(np.searchsorted(cumulative, 0.1))}-{int(np.searchsorted(cumulative, 0.9))}"
+
+        claims = totals["claims"][i] / count
+        frequency = next((label for limit, label in CLAIM_FREQUENCY_LIMITS if claims < limit), TOP_CLAIM_FREQUENCY)
+        relative_cost = totals["claim_cost"][i] / count / book_cost if book_cost else 0.0
+        risk = next((label for limit, label in RISK_LEVEL_LIMITS if relative_cost < limit), TOP_RISK_LEVEL)
+
+        segments.append({
+            "Segment_ID": f"{SEGMENT_PREFIX}{i:08d}",
+            "Segment_Name": f"Ages {age_range}, {frequency} claims, {risk} risk",
+            "Age_Range": age_range,
+            # the schema has no income data, so this is left empty
+            "Average_Income": None,
+            "Risk_Level": risk,
+            "Claim_Frequency": frequency,
+            "Customers": int(members[i]),
+        })
+    return segments
+
+
+# replaces the segments written by the last run and everyone's membership. the rows are sent in
+# batches but committed once, at the end; if anything fails the last run's segments are left as they were
+def write(connection, ids, labels, distances, segments, batch_size=DEFAULT_CHUNK_SIZE):
+    cursor = connection.cursor()
+    if hasattr(cursor, "fast_executemany"):
+        cursor.fast_executemany = True
+    columns = ["Segment_ID", "Segment_Name", "Age_Range", "Average_Income", "Risk_Level", "Claim_Frequency"]
+
+    try:
+        cursor.execute("DELETE FROM Segment_Membership")
+        cursor.execute(f"DELETE FROM Customer_Segmentation WHERE Segment_ID LIKE '{SEGMENT_PREFIX}%'")
+        cursor.executemany(
+            f"INSERT INTO Customer_Segmentation ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [tuple(segment[name] for name in columns) for segment in segments],
+        )
+
+        segment_ids = np.array([segment["Segment_ID"] for segment in segments])
+        for start in range(0, len(ids), batch_size):
+            end = start + batch_size
+            cursor.executemany(
+                "INSERT INTO Segment_Membership (Customer_ID, Segment_ID, Distance) VALUES (?, ?, ?)",
+                list(zip(ids[start:end].tolist(), segment_ids[labels[start:end]].tolist(),
+                         np.round(distances[start:end].astype(float), 4).tolist())),
+            )
+        connection.commit()
+    except Exception:
+        connection.rollback()
+        raise
+    query_cache.table_changed("Customer_Segmentation", "Segment_Membership")
+
+
+def save_model(model, segments, path=MODEL_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path + ".tmp", "wb") as f:
+        np.savez(f, features=np.array(FEATURES), segment_ids=np.array([s["Segment_ID"] for s in segments]),
+                 **{name: model[name] for name in ("centers", "mean", "std", "seed")})
+    os.replace(path + ".tmp", path)
+
+
+# the whole job. returns the segments and the time spent on every step
+def run(connection, k=DEFAULT_SEGMENTS, seed=0, chunk_size=DEFAULT_CHUNK_SIZE, epochs=DEFAULT_EPOCHS,
+        dry_run=False, work_dir=None, model_path=MODEL_PATH):
+    work_dir = tempfile.mkdtemp(prefix="segmentation_", dir=work_dir)
+    timings = {}
+    try:
+        start = time.perf_counter()
+        ids, features = extract(connection, work_dir, chunk_size)
+        timings["extract"] = time.perf_counter() - start
+        if not len(ids):
+            return {"customers": 0, "segments": [], "passes": 0, "seconds": timings}
+
+        start = time.perf_counter()
+        model = train(features, min(k, len(ids)), seed, chunk_size, epochs)
+        timings["train"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        labels, distances, segments = assign(features, model, work_dir, chunk_size)
+        timings["assign"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if not dry_run:
+            write(connection, ids, labels, distances, segments, chunk_size)
+            save_model(model, segments, model_path)
+        timings["write"] = time.perf_counter() - start
+
+        return {"customers": len(ids), "segments": segments, "passes": model["passes"], "seconds": timings}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Segment the customers and write Customer_Segmentation.")
+    parser.add_argument("--segments", type=int, default=DEFAULT_SEGMENTS, help="number of segments (k)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for the starting centres and batch order")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="customers per chunk")
+    parser.add_argument("--epochs", type=int, default=DEFAULT_EPOCHS, help="passes over the customers")
+    parser.add_argument("--work-dir", help="folder for the temporary feature files (default: the system temp)")
+    parser.add_argument("--dry-run", action="store_true", help="compute the segments but do not write them")
+    args = parser.parse_args()
+
+    connection = db_pool.connect()
+    try:
+        result = run(connection, args.segments, args.seed, args.chunk_size, args.epochs, args.dry_run, args.work_dir)
+    finally:
+        connection.close()
+
+    seconds = result["seconds"]
+    print(f"Segmented {result['customers']} customers in {result['passes']} passes ("
+          + ", ".join(f"{step} {value:.1f}s" for step, value in seconds.items()) + ").")
+    for segment in result["segments"]:
+        print(f"  {segment['Segment_ID']}  {segment['Customers']:>9}  {segment['Segment_Name']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,219 @@
+# Builds the queries behind the read-only table views (/tables/<table>) and the JSON API
+# (/api/<table>). Pages are fetched with keyset pagination: instead of OFFSET, each page asks for
+# the rows that sort after the last row of the previous page, e.g.
+#
+#     SELECT TOP (50) ... FROM Claim WHERE Claim_ID > ? ORDER BY Claim_ID
+#
+# so the server seeks straight to the page through the index and page time stays flat however deep
+# into a large table the user goes. (on the sqlite stand-in the same query ends in LIMIT 50 instead.)
+#
+# A table without a primary key (Revenue_Expenses) has nothing that tells its rows apart, and its
+# rows can be NULL or even repeated, so "the rows after the last one" is not well defined there.
+# Those tables are small and are paged by offset instead: the cursor is just the number of rows
+# already shown.
+
+######################################################
+
+# importing the necessary libraries
+
+import base64
+import datetime
+import decimal
+import json
+
+import db_pool
+import schema
+
+######################################################
+
+TABLES = schema.parse_schema()
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+# columns that are never shown or returned
+HIDDEN_COLUMNS = {
+    "Staff": {"Password"},
+}
+
+
+# raised for a request the views cannot answer (unknown table or column, bad page cursor, ...)
+class BrowseError(Exception):
+    pass
+
+
+def get_table(table_name):
+    if table_name not in TABLES:
+        raise BrowseError(f"Unknown table: {table_name}")
+    return TABLES[table_name]
+
+
+def visible_columns(table):
+    hidden = HIDDEN_COLUMNS.get(table.name, set())
+    return [column.name for column in table.columns if column.name not in hidden]
+
+
+# the columns that identify a row and fix its position in the sort order: the sort column (if any)
+# followed by the rest of the primary key. empty for a table without a primary key, which is paged
+# by offset
+def key_columns(table, sort=None):
+    key = list(table.primary_key)
+    if key and sort:
+        key = [sort] + [name for name in key if name != sort]
+    return key
+
+
+# the columns a page can be sorted on. nullable columns are left out, since NULLs never compare
+# greater than the previous page's value and those rows would be skipped (this does not matter
+# when a table is paged by offset)
+def sortable_columns(table):
+    hidden = HIDDEN_COLUMNS.get(table.name, set())
+    by_offset = not table.primary_key
+    return [column.name for column in table.columns
+            if (by_offset or not column.nullable) and column.data_type != "TEXT" and column.name not in hidden]
+
+
+######################################################
+
+# page cursors. the key values of the last row on a page are packed into an opaque url-safe token,
+# which the client passes back as ?after=... to get the next page
+
+def json_default(value):
+    if isinstance(value, (datetime.date, datetime.datetime, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, (bytes, bytearray)):
+        return value.hex()
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+def encode_cursor(values):
+    data = json.dumps(list(values), default=json_default).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        data = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(data)
+    except ValueError:
+        raise BrowseError("Invalid page cursor.")
+    if not isinstance(values, list):
+        raise BrowseError("Invalid page cursor.")
+    return values
+
+
+######################################################
+
+# builds the query for one page. filters maps column names to values that must match exactly,
+# sort is an optional column from sortable_columns(), and after is the decoded cursor of the
+# previous page. returns the sql, its parameters and the key columns (which are selected last,
+# after the visible columns, so the caller can build the next cursor from each row). the key
+# columns are empty for a table paged by offset
+def build_page_query(table, filters=None, sort=None, descending=False, after=None, page_size=DEFAULT_PAGE_SIZE):
+    columns = visible_columns(table)
+    filters = filters or {}
+
+    for name in filters:
+        if name not in columns:
+            raise BrowseError(f"{table.name} has no column {name}")
+    if sort and sort not in sortable_columns(table):
+        raise BrowseError(f"{table.name} cannot be sorted on {sort}")
+
+    key = key_columns(table, sort)
+    conditions = [f"{name} = ?" for name in filters]
+    params = list(filters.values())
+    direction = " DESC" if descending else ""
+
+    if not key:
+        offset = offset_cursor(after)
+        order = [sort] if sort else []
+        order += [name for name in sortable_columns(table) if name not in order]
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+        order_by = ", ".join(name + direction for name in order)
+        if db_pool.using_sqlite():
+            query = (f"SELECT {', '.join(columns)} FROM {table.name}{where} ORDER BY {order_by} "
+                     f"LIMIT {int(page_size)} OFFSET ?")
+        else:
+            query = (f"SELECT {', '.join(columns)} FROM {table.name}{where} ORDER BY {order_by} "
+                     f"OFFSET ? ROWS FETCH NEXT {int(page_size)} ROWS ONLY")
+        return query, params + [offset], key
+
+    # (k1 > ?) OR (k1 = ? AND k2 > ?) OR ... -- the expanded form of (k1, k2, ...) > (?, ?, ...)
+    if after is not None:
+        if len(after) != len(key):
+            raise BrowseError("Invalid page cursor.")
+        operator = "<" if descending else ">"
+        alternatives = []
+        for position in range(len(key)):
+            parts = [f"{key[i]} = ?" for i in range(position)] + [f"{key[position]} {operator} ?"]
+            alternatives.append("(" + " AND ".join(parts) + ")")
+            params.extend(after[:position + 1])
+        conditions.append("(" + " OR ".join(alternatives) + ")")
+
+    where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    order_by = ", ".join(name + direction for name in key)
+    if db_pool.using_sqlite():
+        query = f"SELECT {', '.join(columns + key)} FROM {table.name}{where} ORDER BY {order_by} LIMIT {int(page_size)}"
+    else:
+        query = f"SELECT TOP ({int(page_size)}) {', '.join(columns + key)} FROM {table.name}{where} ORDER BY {order_by}"
+    return query, params, key
+
+
+# the number of rows already shown, from the cursor of a table paged by offset
+def offset_cursor(after):
+    if after is None:
+        return 0
+    if len(after) != 1 or not isinstance(after[0], int) or isinstance(after[0], bool) or after[0] < 0:
+        raise BrowseError("Invalid page cursor.")
+    return after[0]
+
+
+# reads the paging options shared by the html view and the json api out of the query string
+def page_options(table, args):
+    reserved = {"sort", "order", "after", "limit"}
+    filters = {name: value for name, value in args.items() if name not in reserved}
+
+    try:
+        page_size = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise BrowseError("limit must be a number.")
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+
+    after = decode_cursor(args["after"]) if args.get("after") else None
+    return {
+        "filters": filters,
+        "sort": args.get("sort") or None,
+        "descending": args.get("order", "asc").lower() == "desc",
+        "after": after,
+        "page_size": page_size,
+    }
+
+
+# runs the page query and returns a generator of (visible values, key values) for every row. rows
+# are fetched from the server a batch at a time rather than all at once. the query is executed
+# straight away, so a bad request fails here rather than halfway through a streamed response. for
+# a table paged by offset the "key" of a row is its position, [rows shown up to and including it]
+def iter_page(connection, table, fetch_size=500, **options):
+    query, params, key = build_page_query(table, **options)
+    width = len(visible_columns(table))
+    cursor = connection.cursor()
+    cursor.execute(query, params)
+    position = params[-1] if not key else None
+
+    def rows():
+        nonlocal position
+        while True:
+            batch = cursor.fetchmany(fetch_size)
+            if not batch:
+                break
+            for row in batch:
+                row = list(row)
+                if position is None:
+                    yield row[:width], row[width:]
+                else:
+                    position += 1
+                    yield row, [position]
+
+    return rows()
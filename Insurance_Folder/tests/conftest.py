@@ -0,0 +1,66 @@
+# Shared fixtures for the tests. Everything runs against the local sqlite stand-in of the database
+# (see db_pool.connect and bench_load.create_stand_in_db), so no SQL server or ODBC driver is needed.
+
+######################################################
+
+# importing the necessary libraries
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bench_load
+import bulk_loader
+import db_pool
+import jobs
+import migrate
+
+######################################################
+
+
+# an empty stand-in database (with the bench@insurance.com staff member and every migration applied)
+# that db_pool.connect opens, and checkpoint, reject and spool folders of the test's own
+@pytest.fixture
+def stand_in(tmp_path, monkeypatch):
+    path = str(tmp_path / "insurance.db")
+    bench_load.create_stand_in_db(path)
+    monkeypatch.setenv("INSURANCE_SQLITE_PATH", path)
+    connection = db_pool.connect()
+    migrate.migrate(connection)
+    connection.close()
+    monkeypatch.setattr(bulk_loader, "CHECKPOINT_DIR", str(tmp_path / "checkpoints"))
+    monkeypatch.setattr(bulk_loader, "REJECT_DIR", str(tmp_path / "rejects"))
+    monkeypatch.setattr(jobs, "SPOOL_DIR", str(tmp_path / "spool"))
+    return path
+
+
+@pytest.fixture
+def connection(stand_in):
+    connection = db_pool.connect()
+    yield connection
+    connection.close()
+
+
+# inserts rows (dictionaries) into table_name and commits
+def insert_rows(connection, table_name, rows):
+    columns = list(rows[0])
+    connection.executemany(
+        f"INSERT INTO {table_name} ({', '.join(columns)}) VALUES ({', '.join('?' for _ in columns)})",
+        [tuple(row[column] for column in columns) for row in rows],
+    )
+    connection.commit()
+
+
+def customer(customer_id, **values):
+    return {"Customer_ID": customer_id, "First_Name": "Ann", "Last_Name": "Lee", "DOB": "1980-05-01",
+            "Gender": None, "Address": "1 Road", "City": "Town", "Country": "Canada", "Phone": "+1-1234567890",
+            "Email": None, "Marital_Status": 0, **values}
+
+
+# customer C1 and their vehicle V1, the parents of an application
+def insert_owner(connection):
+    insert_rows(connection, "Customer", [customer("C1")])
+    insert_rows(connection, "Vehicle", [{"Vehicle_ID": "V1", "Customer_ID": "C1", "Registration_Number": "AB 123"}])
@@ -0,0 +1,106 @@
+# the flask app, driven through its test client against the stand-in database. the app imports
+# pyodbc at the top, so these are skipped where it is not installed
+
+######################################################
+
+# importing the necessary libraries
+
+import io
+
+import pytest
+
+pytest.importorskip("pyodbc")
+
+import bench_load
+from conftest import insert_rows
+
+######################################################
+
+
+@pytest.fixture
+def app_module(stand_in, monkeypatch):
+    monkeypatch.setenv("INSURANCE_SCHEDULER", "0")
+    import app
+    # connections and cached results of an earlier test's database
+    app.pool.close()
+    app.user_cache.clear()
+    app.report_cache.clear()
+    return app
+
+
+@pytest.fixture
+def client(app_module):
+    return bench_load.logged_in_client(app_module.app)
+
+
+# user-019: the background jobs are not started by importing the app, nor when they are switched off
+def test_background_jobs_are_not_started_on_import(client, app_module):
+    assert client.get("/").status_code == 200
+    assert app_module.scheduled_jobs._thread is None
+
+
+# user-021: a Staff merge can change any staff member, so the cached users are dropped
+def test_staff_merge_drops_the_cached_users(client, app_module, connection):
+    insert_rows(connection, "Company", [{"Company_ID": "CO00000000", "Name": "Bench", "Contact_Number": "1",
+                                         "Address": "Nowhere", "City": "Town", "Country": "Canada"}])
+    client.get("/")
+    assert app_module.user_cache.stats()["size"] == 1
+
+    csv = b"Staff_ID,Company_ID,First_Name,Last_Name,Address,Position,Email,Password\n" \
+          b"BENCH00001,CO00000000,Renamed,User,Nowhere,Tester,bench@insurance.com,bench\n"
+    response = client.post("/upload_csv", data={"table_name": "Staff", "mode": "merge",
+                                                "csv_file": (io.BytesIO(csv), "staff.csv")},
+                           headers={"Accept": "application/json"})
+    job_id = response.get_json()["job_id"]
+    app_module.upload_jobs.wait(job_id, timeout=30)
+
+    assert app_module.upload_jobs.status(job_id)["rows_updated"] == 1
+    assert app_module.user_cache.stats()["size"] == 0
+
+
+# user-025: the row is committed before the caches are told, so their failure is logged, not shown
+def test_a_failing_cache_update_does_not_fail_the_insert(client, app_module, connection, monkeypatch):
+    def broken(table_name, row):
+        raise RuntimeError("index unavailable")
+    monkeypatch.setattr(app_module.text_index, "record_insert", broken)
+
+    response = client.post("/add_incident", data={"incident_id": "I1", "type": "Collision", "date": "2024-01-01",
+                                                  "description": "Rear bumper dented"})
+
+    assert response.status_code == 302
+    assert connection.execute("SELECT Description FROM Incident").fetchall() == [("Rear bumper dented",)]
+
+
+# user-006: the logged in user is read from Staff once, then served from the cache until it changes
+def test_the_logged_in_user_is_cached(client, app_module):
+    client.get("/")
+    client.get("/")
+    assert app_module.user_cache.stats()["hits"] >= 1
+
+    app_module.AFTER_INSERT["Staff"]({"Staff_ID": "BENCH00001"})
+    assert app_module.user_cache.stats()["size"] == 0
+
+
+# user-023: a payment added through the app is in the next lookup, not served stale from the cache
+def test_an_added_payment_shows_in_the_cached_lookup(client, app_module):
+    app_module.query_results.clear()
+    assert client.get("/policies/P1/payments").get_json() == []
+
+    response = client.post("/add_premium_payment", data={"payment_id": "PY1", "policy_number": "P1", "amount": "25",
+                                                         "payment_date": "2024-01-05", "receipt_id": "R1"})
+
+    assert response.status_code == 302
+    assert [row["Payment_ID"] for row in client.get("/policies/P1/payments").get_json()] == ["PY1"]
+
+
+# user-011: a duplicate key is shown on the form as an error, whichever database is behind the app
+def test_a_duplicate_row_is_flashed_not_a_server_error(client, app_module):
+    data = {"incident_id": "I1", "type": "Collision", "date": "2024-01-01", "description": "Rear bumper dented"}
+    assert client.post("/add_incident", data=data).status_code == 302
+
+    response = client.post("/add_incident", data=data)
+
+    assert response.status_code == 200
+    with client.session_transaction() as session:
+        messages = [message for category, message in session.get("_flashes", []) if category == "error"]
+    assert messages and messages[0].startswith("Error inserting Incident")
@@ -0,0 +1,99 @@
+# audit: Audit_Log rows queued by record() and written in batches by a background thread
+
+######################################################
+
+# importing the necessary libraries
+
+import json
+import threading
+
+import audit
+import db_pool
+
+######################################################
+
+
+def logged(connection):
+    return connection.execute("SELECT Log_ID, Table_Name, Operation_Type, Changed_By, New_Data FROM Audit_Log "
+                              "ORDER BY rowid").fetchall()
+
+
+def test_queued_rows_are_written_in_batches(connection):
+    writer = audit.AuditWriter(db_pool.connect, batch_size=50, linger=0.5)
+    for number in range(120):
+        writer.record("Staff", "INSERT", "BENCH00001", new_data={"Staff_ID": f"S{number}", "Password": "secret"})
+    writer.stop()
+
+    rows = logged(connection)
+    stats = writer.stats()
+    assert (stats["recorded"], stats["written"], stats["failed"]) == (120, 120, 0)
+    assert stats["batches"] < 120
+    assert [json.loads(row[4])["Staff_ID"] for row in rows] == [f"S{number}" for number in range(120)]
+    assert {json.loads(row[4])["Password"] for row in rows} == {"***"}
+
+
+def test_a_batch_that_keeps_failing_is_dropped(stand_in, monkeypatch):
+    monkeypatch.setattr(audit.time, "sleep", lambda seconds: None)
+
+    def connect():
+        raise OSError("database is down")
+
+    writer = audit.AuditWriter(connect)
+    writer.record("Staff", "INSERT", "BENCH00001")
+    writer.stop()
+
+    assert (writer.stats()["written"], writer.stats()["failed"]) == (0, 1)
+
+
+# a row the database rejects is written again with a new Log_ID, and if that fails too only that row
+# is lost, not the rest of its batch
+def test_a_bad_row_only_loses_itself(connection, monkeypatch):
+    connection.execute("INSERT INTO Audit_Log (Log_ID, Table_Name, Operation_Type, Changed_By) "
+                       "VALUES ('TAKEN00001', 'Staff', 'INSERT', 'BENCH00001')")
+    connection.commit()
+    ids = iter(["TAKEN00001", "GOOD000001", "BAD0000001", "GOOD000002", "FRESH00001", "BAD0000002"])
+    monkeypatch.setattr(audit, "new_log_id", lambda: next(ids))
+
+    writer = audit.AuditWriter(db_pool.connect, linger=0.5)
+    writer.record("Staff", "INSERT", "BENCH00001")
+    writer.record("Staff", "INSERT", "BENCH00001")
+    writer.record(None, "INSERT", "BENCH00001")
+    writer.record("Claim", "INSERT", "BENCH00001")
+    writer.stop()
+
+    assert (writer.stats()["written"], writer.stats()["failed"]) == (3, 1)
+    assert [row[:2] for row in logged(connection)] == [("TAKEN00001", "Staff"), ("FRESH00001", "Staff"),
+                                                       ("GOOD000001", "Staff"), ("GOOD000002", "Claim")]
+
+
+def test_log_ids_are_upper_case_and_unique():
+    ids = [audit.new_log_id() for _ in range(100)]
+
+    assert all(len(log_id) == 10 and log_id == log_id.upper() for log_id in ids)
+    assert len({log_id.upper() for log_id in ids}) == 100
+
+
+def test_rows_are_dropped_when_the_queue_stays_full(connection):
+    release = threading.Event()
+
+    def slow_connect():
+        release.wait()
+        return db_pool.connect()
+
+    writer = audit.AuditWriter(slow_connect, max_queue=1, put_timeout=0.01, linger=0)
+    for number in range(4):
+        writer.record("Claim", "INSERT", "BENCH00001", new_data={"Claim_ID": number})
+    release.set()
+    writer.stop()
+
+    stats = writer.stats()
+    assert stats["dropped"] >= 1
+    assert stats["recorded"] + stats["dropped"] == 4
+    assert stats["written"] == stats["recorded"] == len(logged(connection))
+
+
+def test_load_summary():
+    result = {"rows": 10, "skipped": 2, "rejected": 1, "inserted": 4, "updated": 6, "seconds": 0.5}
+
+    assert audit.load_summary("claims.csv", result) == {"file": "claims.csv", "rows": 10, "skipped": 2, "rejected": 1,
+                                                         "inserted": 4, "updated": 6}
@@ -0,0 +1,139 @@
+# bulk_loader: batched inserts, reject files and resuming a failed load from its checkpoint
+
+######################################################
+
+# importing the necessary libraries
+
+import csv
+
+import pandas as pd
+import pytest
+
+import bulk_loader
+import fk_filter
+from conftest import insert_rows
+
+######################################################
+
+
+def applications(*ids):
+    return [{"Application_ID": app_id, "Customer_ID": "C1", "Vehicle_ID": "V1", "Status": "Pending",
+             "Coverage_Description": "Full"} for app_id in ids]
+
+
+def policy_frame(applications_ids):
+    return pd.DataFrame({
+        "Policy_Number": [f"P{number}" for number in range(1, len(applications_ids) + 1)],
+        "Application_ID": applications_ids,
+        "Start_Date": "2024-01-01",
+        "Expiry_Date": "2025-01-01",
+    })
+
+
+def policy_numbers(connection):
+    return sorted(row[0] for row in connection.execute("SELECT Policy_Number FROM Policy"))
+
+
+# fails the load after the first committed batch, like a dropped connection would
+def fail_after_first_batch(inserted, rejected):
+    raise bulk_loader.BulkLoadError("connection lost", inserted)
+
+
+def test_bulk_insert_converts_and_counts(connection):
+    rows = [[f"C{number}", "Ann", "Lee", "1990-01-01", "", "1 Road", "Town", "Canada", "+1-1", "", "0"]
+            for number in range(7)]
+    columns = ["Customer_ID", "First_Name", "Last_Name", "DOB", "Gender", "Address", "City", "Country", "Phone",
+               "Email", "Marital_Status"]
+
+    result = bulk_loader.bulk_insert(connection, "Customer", columns, rows, batch_size=3)
+
+    assert result["rows"] == 7
+    assert connection.execute("SELECT COUNT(*) FROM Customer WHERE Gender IS NULL").fetchone()[0] == 7
+
+
+def test_bulk_insert_reports_the_bad_row(connection):
+    rows = [["C1", "Ann", "Lee", "not a date", "", "1 Road", "Town", "Canada", "+1-1", "", "0"]]
+    columns = ["Customer_ID", "First_Name", "Last_Name", "DOB", "Gender", "Address", "City", "Country", "Phone",
+               "Email", "Marital_Status"]
+
+    with pytest.raises(bulk_loader.BulkLoadError, match="Row 1 of Customer"):
+        bulk_loader.bulk_insert(connection, "Customer", columns, rows)
+
+
+def test_load_frames_writes_rejects(connection):
+    insert_rows(connection, "Application", applications("A1", "A2"))
+    frame = policy_frame(["A1", "MISSING", "A2"])
+
+    result = bulk_loader.load_frames(connection, "Policy", [frame], checkpoint_key="rejects",
+                                     fk_filter=fk_filter.ForeignKeyFilter(connection))
+
+    assert result["rows"] == 2
+    assert result["rejected"] == 1
+    with open(result["reject_path"], newline="") as f:
+        rejects = list(csv.DictReader(f))
+    assert [(reject["Row"], reject["Application_ID"]) for reject in rejects] == [("2", "MISSING")]
+    assert policy_numbers(connection) == ["P1", "P3"]
+
+
+# the checkpoint counts rows of the file: a row rejected by the first run that passes when the load
+# is resumed (its parent was added in between) must not shift the part of the file that is skipped
+def test_resume_skips_the_committed_part_of_the_file(connection):
+    insert_rows(connection, "Application", applications(*(f"A{number}" for number in range(1, 11))))
+    frame = policy_frame(["A1", "A2", "A11", "A3", "A4", "A5", "A6", "A7", "A8", "A9"])
+
+    with pytest.raises(bulk_loader.BulkLoadError):
+        bulk_loader.load_frames(connection, "Policy", [frame], batch_size=4, checkpoint_key="policies",
+                                fk_filter=fk_filter.ForeignKeyFilter(connection), progress=fail_after_first_batch)
+    assert policy_numbers(connection) == ["P1", "P2", "P4", "P5"]
+
+    insert_rows(connection, "Application", applications("A11"))
+    result = bulk_loader.load_frames(connection, "Policy", [frame], batch_size=4, checkpoint_key="policies",
+                                     fk_filter=fk_filter.ForeignKeyFilter(connection))
+
+    assert result["skipped"] == 5
+    assert result["rows"] == 5
+    assert policy_numbers(connection) == sorted(f"P{number}" for number in [1, 2, 4, 5, 6, 7, 8, 9, 10])
+    # the row rejected by the first run is still listed
+    assert result["rejected"] == 1
+    with open(result["reject_path"], newline="") as f:
+        assert [reject["Row"] for reject in csv.DictReader(f)] == ["3"]
+
+
+def test_a_different_file_is_not_skipped(connection):
+    insert_rows(connection, "Application", applications("A1", "A2", "A3"))
+
+    with pytest.raises(bulk_loader.BulkLoadError):
+        bulk_loader.load_frames(connection, "Policy", [policy_frame(["A1", "A2"])], batch_size=1,
+                                checkpoint_key="policies", progress=fail_after_first_batch)
+
+    other = policy_frame(["A1", "A2", "A3"]).assign(Policy_Number=["Q1", "Q2", "Q3"])
+    result = bulk_loader.load_frames(connection, "Policy", [other], batch_size=1, checkpoint_key="policies")
+
+    assert result["skipped"] == 0
+    assert result["rows"] == 3
+
+
+def test_csv_is_read_in_chunks_of_strings(tmp_path):
+    path = tmp_path / "companies.csv"
+    path.write_text("\ufeffCompany_ID,Name,Website\n0001,NA,\n0002,null,x.com\n0003,Acme,\n", encoding="utf-8")
+
+    frames = list(bulk_loader.read_csv_frames(str(path), chunk_size=2))
+
+    assert [len(frame) for frame in frames] == [2, 1]
+    assert frames[0]["Company_ID"].tolist() == ["0001", "0002"]
+    assert frames[0]["Name"].tolist() == ["NA", "null"]
+    assert frames[0]["Website"].isna().tolist() == [True, False]
+
+
+def test_load_csv_file_loads_every_chunk_and_forgets_its_checkpoint(connection, tmp_path):
+    path = tmp_path / "companies.csv"
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["Company_ID", "Name", "Contact_Number", "Address", "City", "Country"])
+        writer.writerows([f"CO{number:04}", "Acme", "1", "Road", "Town", "Canada"] for number in range(25))
+
+    result = bulk_loader.load_csv_file(connection, "Company", str(path), chunk_size=10)
+
+    assert (result["rows"], result["rejected"]) == (25, 0)
+    assert connection.execute("SELECT MIN(Company_ID), COUNT(*) FROM Company").fetchone() == ("CO0000", 25)
+    assert bulk_loader.load_checkpoint("Company_companies.csv", ["CO0000", "Acme", "1", "Road", "Town", "Canada"]) == 0
@@ -0,0 +1,39 @@
+# cache: the bounded, expiring cache in front of load_user
+
+######################################################
+
+# importing the necessary libraries
+
+import cache
+
+######################################################
+
+
+def test_the_least_recently_used_entry_is_dropped():
+    users = cache.TTLCache(maxsize=2)
+    users.set("a", 1)
+    users.set("b", 2)
+    users.get("a")
+    users.set("c", 3)
+
+    assert users.get("b") is cache.MISSING
+    assert (users.get("a"), users.get("c")) == (1, 3)
+
+
+def test_expired_entries_are_missing():
+    users = cache.TTLCache(ttl=-1)
+    users.set("a", 1)
+
+    assert users.get("a") is cache.MISSING
+    assert users.stats()["size"] == 0
+
+
+def test_none_can_be_cached_and_entries_invalidated():
+    users = cache.TTLCache()
+    users.set("a", None)
+    users.set("b", 2)
+    users.invalidate("b")
+
+    assert users.get("a") is None
+    assert users.get("b") is cache.MISSING
+    assert users.stats()["hits"] == 1 and users.stats()["misses"] == 1
@@ -0,0 +1,79 @@
+# chunk_validation: whole-chunk checks that give the same answers as the registry's row by row ones
+
+######################################################
+
+# importing the necessary libraries
+
+import pandas as pd
+
+import chunk_validation
+import registry
+
+######################################################
+
+CUSTOMER_ROWS = [
+    ["C1", "Ann", "Lee", "1980-05-01", None, "1 Road", "Town", "Canada", "+1", "a@b.co", "1"],
+    ["C2", None, "Lee", "1980-13-01", None, "1 Road", "Town", "Canada", "+1", "bad", "yes"],
+    ["C" * 11, "Bo", "Ng", "1990-01-31", "M", "2 Road", "Town", "Canada", "+1", None, "0"],
+    ["C4", "Cy", "Ho", "2000-02-29", "F", "3 Road", "Town", "Canada", "+1", None, "2"],
+]
+
+PAYMENT_ROWS = [
+    ["PY1", "P1", "12.50", "2024-01-02", "R1"],
+    ["PY2", "P1", "0", "2024-01-02", "R2"],
+    ["PY3", "P1", "ten", "2024-01-02", "R3"],
+    ["PY4", "P1", "7", "02/01/2024", None],
+]
+
+
+def split(table_name, rows):
+    spec = registry.get(table_name)
+    chunk = pd.DataFrame(rows, columns=spec.columns, dtype=object)
+    return chunk_validation.ChunkValidator(table_name, spec.columns).split(chunk)
+
+
+def row_by_row(table_name, rows):
+    converted, reasons = [], {}
+    for number, row in enumerate(rows, start=1):
+        try:
+            converted.append(registry.get(table_name).convert(row))
+        except registry.RowError as e:
+            reasons[number] = " ".join(e.errors)
+    return converted, reasons
+
+
+def test_the_chunk_checks_agree_with_the_registry():
+    for table_name, rows in (("Customer", CUSTOMER_ROWS), ("Premium_Payment", PAYMENT_ROWS)):
+        valid, rejects = split(table_name, rows)
+        converted, reasons = row_by_row(table_name, rows)
+
+        assert valid == converted
+        assert dict(zip(rejects[chunk_validation.REJECT_ROW_COLUMN], rejects[chunk_validation.REJECT_REASON_COLUMN])) \
+            == reasons
+
+
+def test_rejects_are_written_with_their_row_in_the_file(tmp_path):
+    spec = registry.get("Premium_Payment")
+    chunks = [pd.DataFrame(PAYMENT_ROWS[:2], columns=spec.columns), pd.DataFrame(PAYMENT_ROWS[2:], columns=spec.columns)]
+    path = str(tmp_path / "rejects" / "payments.csv")
+    counts = {"rejected": 0}
+
+    rows = list(chunk_validation.valid_rows("Premium_Payment", chunks, path, counts, numbered=True))
+
+    assert [number for number, _ in rows] == [1]
+    assert counts["rejected"] == 3
+    written = pd.read_csv(path, dtype=str)
+    assert written["Row"].tolist() == ["2", "3", "4"]
+    assert written["Payment_ID"].tolist() == ["PY2", "PY3", "PY4"]
+
+
+def test_a_clean_run_removes_the_old_reject_file(tmp_path):
+    spec = registry.get("Premium_Payment")
+    path = tmp_path / "payments.csv"
+    path.write_text("stale")
+
+    rows = list(chunk_validation.valid_rows("Premium_Payment", [pd.DataFrame(PAYMENT_ROWS[:1], columns=spec.columns)],
+                                            str(path), {"rejected": 0}))
+
+    assert len(rows) == 1
+    assert not path.exists()
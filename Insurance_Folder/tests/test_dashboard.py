@@ -0,0 +1,75 @@
+# dashboard: the home page numbers, brought up to date by refresh() and record_insert()
+
+######################################################
+
+# importing the necessary libraries
+
+from datetime import date
+
+import dashboard
+from conftest import insert_rows
+
+######################################################
+
+TODAY = date(2024, 3, 15)
+
+
+def payment(payment_id, amount, day):
+    return {"Payment_ID": payment_id, "Policy_Number": "P1", "Amount": amount, "Payment_Date": day,
+            "Receipt_ID": f"R{payment_id}"}
+
+
+def claim(claim_id, status):
+    return {"Claim_ID": claim_id, "Policy_Number": "P1", "Amount": 100.0, "Incident_ID": "I1",
+            "Damage_Type": "Dent", "Date": "2024-03-01", "Status": status}
+
+
+def policy(policy_number, expiry):
+    return {"Policy_Number": policy_number, "Application_ID": "A1", "Start_Date": "2023-01-01", "Expiry_Date": expiry}
+
+
+def test_the_numbers_are_counted_on_the_first_refresh(connection):
+    insert_rows(connection, "Premium_Payment", [payment("PY1", 100.0, "2024-03-02"), payment("PY2", 40.0, "2024-02-28")])
+    insert_rows(connection, "Claim", [claim("CL1", "Pending"), claim("CL2", "Approved")])
+    insert_rows(connection, "Policy", [policy("P1", "2024-04-01"), policy("P2", "2024-06-01")])
+
+    numbers = dashboard.DashboardSummary().refresh(connection, TODAY)
+
+    assert numbers == {"open_claims": 1, "pending_applications": 0, "premiums_this_month": 100.0,
+                       "policies_expiring": 1}
+
+
+def test_an_edited_payment_is_not_counted_twice(connection):
+    insert_rows(connection, "Premium_Payment", [payment("PY1", 100.0, "2024-03-02")])
+    summary = dashboard.DashboardSummary()
+    summary.refresh(connection, TODAY)
+
+    connection.execute("UPDATE Premium_Payment SET Amount = 120.0 WHERE Payment_ID = 'PY1'")
+    insert_rows(connection, "Premium_Payment", [payment("PY2", 5.0, "2024-03-10")])
+
+    assert summary.refresh(connection, TODAY)["premiums_this_month"] == 125.0
+
+
+# on the stand-in an update does not change a row's version, so the counts are taken again anyway
+def test_a_status_change_is_seen_on_the_next_refresh(connection):
+    insert_rows(connection, "Claim", [claim("CL1", "Pending"), claim("CL2", "Pending")])
+    summary = dashboard.DashboardSummary()
+    assert summary.refresh(connection, TODAY)["open_claims"] == 2
+
+    connection.execute("UPDATE Claim SET Status = 'Approved' WHERE Claim_ID = 'CL1'")
+    connection.commit()
+
+    assert summary.refresh(connection, TODAY)["open_claims"] == 1
+
+
+def test_rows_added_through_the_app_show_until_a_refresh_reads_them(connection):
+    summary = dashboard.DashboardSummary()
+    summary.refresh(connection, TODAY)
+    row = claim("CL1", "Pending")
+
+    insert_rows(connection, "Claim", [row])
+    summary.record_insert("Claim", row)
+    assert summary.summary()["numbers"]["open_claims"] == 1
+
+    summary.refresh(connection, TODAY)
+    assert summary.summary()["numbers"]["open_claims"] == 1
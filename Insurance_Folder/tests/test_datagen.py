@@ -0,0 +1,48 @@
+# datagen: seeded synthetic rows for every table, consistent with the foreign keys
+
+######################################################
+
+# importing the necessary libraries
+
+import pandas as pd
+
+import datagen
+
+######################################################
+
+
+def test_the_same_seed_gives_the_same_rows():
+    first = pd.concat(datagen.generate_table("Policy", 250, seed=7, chunk_size=100))
+    again = pd.concat(datagen.generate_table("Policy", 250, seed=7, chunk_size=100))
+    other = pd.concat(datagen.generate_table("Policy", 250, seed=8, chunk_size=100))
+
+    pd.testing.assert_frame_equal(first, again)
+    assert not first.equals(other)
+    assert len(first) == datagen.row_counts(250)["Policy"]
+    assert first["Policy_Number"].is_unique
+
+
+def test_parents_come_before_their_children():
+    order = datagen.tables_in_load_order()
+
+    for table_name in order:
+        for parent in datagen.TABLES[table_name].parents():
+            assert order.index(parent) < order.index(table_name)
+
+
+def test_loaded_rows_satisfy_every_foreign_key(connection):
+    results = datagen.load_into(connection, scale=60, chunk_size=25)
+
+    counts = datagen.row_counts(60)
+    assert {name: result["rows"] for name, result in results.items()} == {name: counts[name] for name in results}
+    assert connection.execute("PRAGMA foreign_key_check").fetchall() == []
+
+
+def test_csv_files_are_named_after_their_tables(tmp_path):
+    written = dict(datagen.write_csv(str(tmp_path), 30, chunk_size=10, tables=["Customer", "Vehicle"]))
+
+    customers = pd.read_csv(written["Customer"], dtype=str)
+    vehicles = pd.read_csv(written["Vehicle"], dtype=str)
+    assert written["Vehicle"].endswith("Vehicle.csv")
+    assert len(customers) == 30
+    assert vehicles["Customer_ID"].isin(customers["Customer_ID"]).all()
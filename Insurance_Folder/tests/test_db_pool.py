@@ -0,0 +1,73 @@
+# db_pool: a bounded pool of stand-in connections
+
+######################################################
+
+# importing the necessary libraries
+
+import pytest
+
+import db_pool
+
+######################################################
+
+
+def test_a_returned_connection_is_handed_out_again(stand_in):
+    pool = db_pool.ConnectionPool(max_size=2)
+
+    first = pool.checkout()
+    pool.checkin(first)
+    second = pool.checkout()
+
+    assert second is first
+    assert pool.stats()["created"] == 1
+    pool.checkin(second)
+    pool.close()
+
+
+def test_checkout_times_out_when_every_connection_is_in_use(stand_in):
+    pool = db_pool.ConnectionPool(max_size=1, timeout=0.05)
+    connection = pool.checkout()
+
+    with pytest.raises(db_pool.PoolTimeout):
+        pool.checkout()
+    assert pool.stats()["checkout_failures"] == 1
+
+    pool.checkin(connection)
+    pool.checkin(pool.checkout())
+    pool.close()
+
+
+def test_uncommitted_work_is_rolled_back_on_checkin(stand_in):
+    pool = db_pool.ConnectionPool(max_size=1)
+    connection = pool.checkout()
+    connection.execute("INSERT INTO Company (Company_ID, Name, Contact_Number, Address, City, Country) "
+                       "VALUES ('CO1', 'Acme', '1', 'Road', 'Town', 'Canada')")
+    pool.checkin(connection)
+
+    connection = pool.checkout()
+    assert connection.execute("SELECT COUNT(*) FROM Company").fetchone() == (0,)
+    pool.checkin(connection)
+    pool.close()
+
+
+def test_a_dropped_connection_is_replaced(stand_in):
+    pool = db_pool.ConnectionPool(max_size=1, recheck_after=0)
+    connection = pool.checkout()
+    pool.checkin(connection)
+    connection.close()
+
+    replacement = pool.checkout()
+
+    assert replacement is not connection
+    assert replacement.execute("SELECT 1").fetchone() == (1,)
+    assert pool.stats()["reconnects"] == 1
+    pool.checkin(replacement)
+    pool.close()
+
+
+def test_a_broken_connection_is_not_kept(stand_in):
+    pool = db_pool.ConnectionPool(max_size=1)
+    pool.checkin(pool.checkout(), broken=True)
+
+    assert pool.stats()["idle"] == 0
+    assert pool.stats()["in_use"] == 0
@@ -0,0 +1,93 @@
+# delta_sync: per consumer extracts of the rows added since its last run, resumable part by part
+
+######################################################
+
+# importing the necessary libraries
+
+import json
+import os
+
+import pytest
+
+import delta_sync
+import exporter
+from conftest import insert_rows
+
+######################################################
+
+
+def payments(first, count):
+    return [{"Payment_ID": f"PY{number:03}", "Policy_Number": "P1", "Amount": 10.0, "Payment_Date": "2024-01-05",
+             "Receipt_ID": f"R{number}"} for number in range(first, first + count)]
+
+
+def extract(connection, out_dir, consumer="warehouse", part_rows=4):
+    return delta_sync.extract_table(connection, "Premium_Payment", str(out_dir), consumer, part_rows=part_rows,
+                                    batch_size=3)
+
+
+def extracted_ids(out_dir, files):
+    ids = []
+    for file_name in files:
+        with open(os.path.join(out_dir, "Premium_Payment", file_name)) as f:
+            ids.extend(json.loads(line)["Payment_ID"] for line in f)
+    return ids
+
+
+def test_each_run_extracts_only_the_new_rows(connection, tmp_path):
+    insert_rows(connection, "Premium_Payment", payments(0, 10))
+
+    first = extract(connection, tmp_path)
+    second = extract(connection, tmp_path)
+    insert_rows(connection, "Premium_Payment", payments(10, 2))
+    third = extract(connection, tmp_path)
+
+    assert (first["rows"], len(first["files"])) == (10, 3)
+    assert extracted_ids(tmp_path, first["files"]) == [f"PY{number:03}" for number in range(10)]
+    assert second == {"rows": 0, "files": []}
+    assert extracted_ids(tmp_path, third["files"]) == ["PY010", "PY011"]
+    manifests = [name for name in os.listdir(tmp_path / "Premium_Payment") if name.endswith(".manifest.json")]
+    assert len(manifests) == 2
+
+
+def test_consumers_have_their_own_watermarks(connection, tmp_path):
+    insert_rows(connection, "Premium_Payment", payments(0, 3))
+    extract(connection, tmp_path / "warehouse")
+    insert_rows(connection, "Premium_Payment", payments(3, 1))
+
+    assert extract(connection, tmp_path / "warehouse")["rows"] == 1
+    assert extract(connection, tmp_path / "audit", consumer="audit")["rows"] == 4
+
+
+def test_a_failed_run_carries_on_from_its_last_part(connection, tmp_path, monkeypatch):
+    insert_rows(connection, "Premium_Payment", payments(0, 10))
+    encode = exporter.ndjson_chunks
+    parts = []
+
+    def fail_on_the_second_part(columns, batches):
+        parts.append(columns)
+        if len(parts) == 2:
+            raise OSError("disk full")
+        return encode(columns, batches)
+
+    monkeypatch.setattr(exporter, "ndjson_chunks", fail_on_the_second_part)
+    with pytest.raises(OSError):
+        extract(connection, tmp_path)
+    monkeypatch.setattr(exporter, "ndjson_chunks", encode)
+
+    result = extract(connection, tmp_path)
+
+    assert result["rows"] == 10
+    assert extracted_ids(tmp_path, result["files"]) == [f"PY{number:03}" for number in range(10)]
+    assert delta_sync.read_watermark(connection, "warehouse", "Premium_Payment") is not None
+
+
+def test_a_watermark_moved_by_another_run_is_a_conflict(connection):
+    delta_sync.move_watermark(connection, "warehouse", "Claim", None, 5)
+    delta_sync.move_watermark(connection, "warehouse", "Claim", 5, 8)
+
+    with pytest.raises(delta_sync.SyncConflict):
+        delta_sync.move_watermark(connection, "warehouse", "Claim", 5, 9)
+    assert delta_sync.read_watermark(connection, "warehouse", "Claim") == 8
+    with pytest.raises(ValueError, match="Invalid consumer name"):
+        delta_sync.run(connection, ".", consumer="no/slashes")
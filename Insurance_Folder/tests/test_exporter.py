@@ -0,0 +1,75 @@
+# exporter: tables streamed out as CSV, NDJSON or Parquet, batch by batch
+
+######################################################
+
+# importing the necessary libraries
+
+import gzip
+import io
+import json
+
+import pandas as pd
+import pytest
+
+import exporter
+from conftest import insert_rows
+
+######################################################
+
+
+def payments(count):
+    return [{"Payment_ID": f"PY{number:03}", "Policy_Number": "P1" if number % 2 else "P2", "Amount": number + 0.5,
+             "Payment_Date": "2024-01-05", "Receipt_ID": f"R{number}"} for number in range(count)]
+
+
+def exported(connection, table_name, **options):
+    chunks, mimetype, file_name = exporter.export(connection, table_name, **options)
+    return list(chunks), mimetype, file_name
+
+
+def test_csv_is_streamed_one_batch_at_a_time(connection):
+    insert_rows(connection, "Premium_Payment", payments(25))
+
+    chunks, mimetype, file_name = exported(connection, "Premium_Payment", batch_size=10)
+
+    assert (mimetype, file_name) == ("text/csv", "Premium_Payment.csv")
+    assert len(chunks) == 3
+    frame = pd.read_csv(io.BytesIO(b"".join(chunks)), dtype=str)
+    assert len(frame) == 25
+    assert frame.columns.tolist() == ["Payment_ID", "Policy_Number", "Amount", "Payment_Date", "Receipt_ID"]
+
+
+def test_ndjson_with_columns_filters_and_gzip(connection):
+    insert_rows(connection, "Premium_Payment", payments(6))
+
+    chunks, mimetype, file_name = exported(connection, "Premium_Payment", format="ndjson", compress=True,
+                                           columns=["Payment_ID", "Amount"], filters={"Policy_Number": "P1"})
+
+    assert (mimetype, file_name) == ("application/gzip", "Premium_Payment.ndjson.gz")
+    lines = gzip.decompress(b"".join(chunks)).decode().splitlines()
+    assert [json.loads(line) for line in lines] == [{"Payment_ID": "PY001", "Amount": 1.5},
+                                                    {"Payment_ID": "PY003", "Amount": 3.5},
+                                                    {"Payment_ID": "PY005", "Amount": 5.5}]
+
+
+def test_parquet_keeps_the_column_types(connection):
+    pytest.importorskip("pyarrow")
+    insert_rows(connection, "Premium_Payment", payments(10))
+
+    chunks, _, file_name = exported(connection, "Premium_Payment", format="parquet", batch_size=3)
+
+    frame = pd.read_parquet(io.BytesIO(b"".join(chunks)))
+    assert file_name == "Premium_Payment.parquet"
+    assert len(frame) == 10
+    assert str(frame["Amount"].dtype) == "float64"
+    assert str(frame["Payment_Date"].iloc[0]) == "2024-01-05"
+
+
+def test_hidden_and_unknown_columns_are_refused(connection):
+    with pytest.raises(exporter.ExportError, match="has no column Password"):
+        exporter.export(connection, "Staff", columns=["Staff_ID", "Password"])
+    with pytest.raises(exporter.ExportError, match="Unknown export format"):
+        exporter.export(connection, "Staff", format="xml")
+
+    chunks, _, _ = exported(connection, "Staff")
+    assert b"Password" not in b"".join(chunks) and b"bench@insurance.com" in b"".join(chunks)
@@ -0,0 +1,60 @@
+# fk_filter: orphan rows are rejected, and parent keys become visible only once they are committed
+
+######################################################
+
+# importing the necessary libraries
+
+import pandas as pd
+import pytest
+
+import bulk_loader
+import fk_filter
+from conftest import insert_owner, insert_rows
+
+######################################################
+
+
+def application_frame(ids):
+    return pd.DataFrame({"Application_ID": ids, "Customer_ID": "C1", "Vehicle_ID": "V1", "Status": "Pending",
+                         "Coverage_Description": "Full"})
+
+
+def policy_frame(application_ids):
+    return pd.DataFrame({"Policy_Number": [f"P{number}" for number in range(len(application_ids))],
+                         "Application_ID": application_ids, "Start_Date": "2024-01-01", "Expiry_Date": "2025-01-01"})
+
+
+def orphans(filter, frame):
+    (mask, message), = filter.check("Policy", frame)
+    return mask.tolist()
+
+
+def test_keys_are_compared_like_the_server_does(connection):
+    insert_rows(connection, "Application", application_frame(["A1", "a2 "]).to_dict("records"))
+    filter = fk_filter.ForeignKeyFilter(connection)
+
+    assert orphans(filter, policy_frame(["A1", "a1", "A2", "A3"])) == [False, False, False, True]
+    assert filter.stats()["orphans"] == 1
+
+
+def test_parents_loaded_earlier_in_the_same_load_are_found(connection):
+    insert_owner(connection)
+    filter = fk_filter.ForeignKeyFilter(connection)
+    assert orphans(filter, policy_frame(["A1"])) == [True]
+
+    bulk_loader.load_frames(connection, "Application", [application_frame(["A1", "A2"])], fk_filter=filter)
+
+    assert orphans(filter, policy_frame(["A1", "A2"])) == [False, False]
+
+
+def test_keys_of_a_failed_batch_are_not_added(connection):
+    insert_owner(connection)
+    insert_rows(connection, "Application", application_frame(["A1"]).to_dict("records"))
+    filter = fk_filter.ForeignKeyFilter(connection)
+    assert orphans(filter, policy_frame(["A2"])) == [True]
+
+    # A1 is already there, so the batch with A2 in it fails on the server
+    with pytest.raises(bulk_loader.BulkLoadError):
+        bulk_loader.load_frames(connection, "Application", [application_frame(["A2", "A1"])], fk_filter=filter)
+
+    assert orphans(filter, policy_frame(["A2"])) == [True]
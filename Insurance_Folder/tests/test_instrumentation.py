@@ -0,0 +1,78 @@
+# instrumentation: per request SQL, commit and render timings, and the slow query log
+
+######################################################
+
+# importing the necessary libraries
+
+import logging
+
+import pytest
+from flask import Flask, render_template_string
+
+import db_pool
+import instrumentation
+
+######################################################
+
+
+@pytest.fixture
+def timed_app(stand_in):
+    metrics = instrumentation.Metrics()
+    connect = instrumentation.instrumented(db_pool.connect)
+    app = Flask(__name__)
+    instrumentation.init_app(app, metrics)
+
+    @app.route("/companies/<name>")
+    def add_company(name):
+        connection = connect()
+        cursor = connection.cursor()
+        cursor.execute("INSERT INTO Company (Company_ID, Name, Contact_Number, Address, City, Country) "
+                       "VALUES (?, ?, '1', 'Road', 'Town', 'Canada')", (name, name))
+        cursor.executemany("UPDATE Company SET Contact_Number = ? WHERE Company_ID = ?", [("2", name), ("3", name)])
+        connection.commit()
+        connection.close()
+        return render_template_string("{{ name }} added", name=name)
+
+    app.metrics = metrics
+    return app
+
+
+def test_a_request_reports_its_sql_and_commits(timed_app):
+    response = timed_app.test_client().get("/companies/CO1")
+
+    assert response.get_data(as_text=True) == "CO1 added"
+    timing = response.headers["Server-Timing"]
+    assert 'sql;desc="3 statements"' in timing
+    assert "commit;dur=" in timing and "render;dur=" in timing and "total;dur=" in timing
+
+
+def test_totals_are_kept_per_route(timed_app):
+    client = timed_app.test_client()
+    client.get("/companies/CO1")
+    client.get("/companies/CO2")
+    client.get("/nowhere")
+
+    text = timed_app.metrics.prometheus()
+    labels = 'route="/companies/<name>",method="GET",status="200"'
+    assert f"insurance_request_duration_seconds_count{{{labels}}} 2" in text
+    assert f'insurance_request_duration_seconds_bucket{{{labels},le="+Inf"}} 2' in text
+    assert f"insurance_sql_statements_total{{{labels}}} 6" in text
+    assert f"insurance_commits_total{{{labels}}} 2" in text
+    assert 'route="unmatched",method="GET",status="404"' in text
+
+
+def test_slow_statements_are_logged_without_their_values(stand_in, monkeypatch, caplog):
+    monkeypatch.setattr(instrumentation, "SLOW_QUERY_MS", 1e-9)
+    connection = instrumentation.instrumented(db_pool.connect)()
+
+    with caplog.at_level(logging.WARNING, logger="insurance.slow_sql"):
+        connection.execute("SELECT   ?\n  AS secret", ("hunter2",)).fetchall()
+    connection.close()
+
+    assert "execute [-] SELECT ? AS secret" in caplog.text
+    assert "hunter2" not in caplog.text
+
+
+def test_gauges():
+    assert instrumentation.gauges("insurance_pool", {"in_use": 2, "name": "x"}) == \
+        "# TYPE insurance_pool_in_use gauge\ninsurance_pool_in_use 2\n"
@@ -0,0 +1,112 @@
+# insurance_supplement: the insert_* helpers, one row at a time or grouped by batch()
+
+######################################################
+
+# importing the necessary libraries
+
+import importlib
+import inspect
+
+import pytest
+
+from conftest import customer
+
+######################################################
+
+
+# the script connects when it is imported, so it is imported again for every test's database
+@pytest.fixture
+def supplement(stand_in):
+    import insurance_supplement
+    insurance_supplement = importlib.reload(insurance_supplement)
+    yield insurance_supplement
+    insurance_supplement.connection.close()
+
+
+def insert_customer(supplement, customer_id):
+    supplement.insert_customer(*customer(customer_id).values())
+
+
+def customer_ids(connection):
+    return [row[0] for row in connection.execute("SELECT Customer_ID FROM Customer ORDER BY 1")]
+
+
+def test_without_a_batch_every_row_is_committed_straight_away(supplement, connection):
+    insert_customer(supplement, "C1")
+
+    assert customer_ids(connection) == ["C1"]
+
+
+def test_a_batch_commits_a_group_at_a_time(supplement, connection, capsys):
+    with supplement.batch(group_size=2) as current:
+        insert_customer(supplement, "C1")
+        assert customer_ids(connection) == []
+        insert_customer(supplement, "C2")
+        assert customer_ids(connection) == ["C1", "C2"]
+        insert_customer(supplement, "C3")
+
+    assert customer_ids(connection) == ["C1", "C2", "C3"]
+    assert (current.inserted, current.failed) == (3, 0)
+    assert "Batch finished: 3 rows inserted, 0 failed." in capsys.readouterr().out
+
+
+def test_rows_of_different_tables_keep_their_order(supplement, connection):
+    with supplement.batch(group_size=10):
+        insert_customer(supplement, "C1")
+        supplement.insert_vehicle("V1", "C1", "AB 123", None, None, None, None, None, None)
+        insert_customer(supplement, "C2")
+
+    assert customer_ids(connection) == ["C1", "C2"]
+    assert connection.execute("SELECT Customer_ID FROM Vehicle").fetchall() == [("C1",)]
+
+
+def test_a_nested_batch_joins_the_outer_one(supplement, connection):
+    with supplement.batch(group_size=10) as outer:
+        with supplement.batch(group_size=1) as inner:
+            insert_customer(supplement, "C1")
+        assert inner is outer
+        assert customer_ids(connection) == []
+
+    assert customer_ids(connection) == ["C1"]
+
+
+def test_values_that_do_not_fit_their_columns_are_not_sent(supplement, connection, capsys):
+    with supplement.batch():
+        supplement.insert_customer(*customer("C1", DOB="not a date").values())
+        insert_customer(supplement, "C2")
+
+    assert customer_ids(connection) == ["C2"]
+    assert "Error inserting" in capsys.readouterr().out
+
+
+# the group is sent again row by row, so only the duplicate is lost
+def test_a_bad_row_in_a_batch_only_loses_that_row(supplement, connection, capsys):
+    insert_customer(supplement, "C2")
+
+    with supplement.batch(group_size=10) as current:
+        for customer_id in ("C1", "C2", "C3"):
+            insert_customer(supplement, customer_id)
+
+    assert customer_ids(connection) == ["C1", "C2", "C3"]
+    assert (current.inserted, current.failed) == (2, 1)
+    assert "Error inserting Customer:" in capsys.readouterr().out
+
+
+def test_a_failed_single_insert_is_reported(supplement, connection, capsys):
+    insert_customer(supplement, "C1")
+    insert_customer(supplement, "C1")
+
+    assert "Error inserting Customer:" in capsys.readouterr().out
+
+
+def test_the_helpers_take_their_columns_by_name_too(supplement, connection):
+    supplement.insert_incident(incident_id="I1", type="Fire", date="2024-01-01", description="Kitchen fire")
+    supplement.insert_incident("I2", "Hail", description="Dented roof", date="2024-01-02")
+
+    assert connection.execute("SELECT Incident_ID, Type FROM Incident ORDER BY 1").fetchall() == \
+        [("I1", "Fire"), ("I2", "Hail")]
+    assert str(inspect.signature(supplement.insert_incident)) == "(incident_id, type, date, description)"
+    with pytest.raises(TypeError, match=r"insert_incident\(\): missing a required argument: 'description'"):
+        supplement.insert_incident("I3", "Fire", "2024-01-01")
+    with pytest.raises(TypeError, match="unexpected keyword argument 'colour'"):
+        supplement.insert_incident("I3", "Fire", "2024-01-01", "x", colour="red")
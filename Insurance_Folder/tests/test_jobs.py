@@ -0,0 +1,122 @@
+# jobs: background imports, their status and resuming a failed one
+
+######################################################
+
+# importing the necessary libraries
+
+import threading
+
+import db_pool
+import jobs
+from conftest import insert_owner, insert_rows
+
+######################################################
+
+HEADER = "Application_ID,Customer_ID,Vehicle_ID,Status,Coverage_Description\n"
+
+
+# stands in for flask's FileStorage
+class Upload:
+    def __init__(self, text):
+        self.text = text
+
+    def save(self, path):
+        with open(path, "w") as f:
+            f.write(self.text)
+
+
+def application_file(ids):
+    return Upload(HEADER + "".join(f"{app_id},C1,V1,Pending,Full\n" for app_id in ids))
+
+
+def run_job(manager, upload, mode="insert"):
+    job = manager.submit("Application", "applications.csv", upload, mode=mode)
+    manager.wait(job.id, timeout=30)
+    return manager.status(job.id)
+
+
+def test_import_job_reports_its_counts(connection):
+    insert_owner(connection)
+    manager = jobs.JobManager(db_pool.connect, workers=1, batch_size=2)
+    try:
+        # A2 belongs to a customer that does not exist
+        status = run_job(manager, Upload(HEADER + "A1,C1,V1,Pending,Full\nA2,C9,V1,Pending,Full\n"
+                                                  "A3,C1,V1,Pending,Full\n"))
+    finally:
+        manager.shutdown()
+
+    assert status["state"] == "done"
+    assert (status["rows_inserted"], status["rows_rejected"], status["rows_processed"]) == (2, 1, 3)
+    assert jobs.read_status(status["id"])["state"] == "done"
+    assert manager.stats()["done"] == 1
+
+
+# a failed job reports the rows it inserted itself, not the ones an earlier run had committed
+def test_resumed_job_counts_only_its_own_rows(connection):
+    insert_owner(connection)
+    insert_rows(connection, "Application", [{"Application_ID": app_id, "Customer_ID": "C1", "Vehicle_ID": "V1",
+                                             "Status": "Issued", "Coverage_Description": "Full"}
+                                            for app_id in ("A4", "A6")])
+    manager = jobs.JobManager(db_pool.connect, workers=1, batch_size=2)
+    ids = ["A1", "A2", "A3", "A4", "A5", "A6", "A7"]
+    try:
+        first = run_job(manager, application_file(ids))
+        connection.execute("DELETE FROM Application WHERE Application_ID = 'A4'")
+        connection.commit()
+        second = run_job(manager, application_file(ids))
+        connection.execute("DELETE FROM Application WHERE Application_ID = 'A6'")
+        connection.commit()
+        third = run_job(manager, application_file(ids))
+    finally:
+        manager.shutdown()
+
+    assert (first["state"], first["rows_inserted"]) == ("failed", 2)
+    assert (second["state"], second["rows_inserted"]) == ("failed", 2)
+    assert (third["state"], third["rows_inserted"], third["rows_skipped"]) == ("done", 3, 4)
+    assert connection.execute("SELECT COUNT(*) FROM Application").fetchone()[0] == 7
+
+
+# two different files uploaded under the same name keep their own reject files (and checkpoints)
+def test_files_with_the_same_name_do_not_share_a_key(connection):
+    insert_owner(connection)
+    manager = jobs.JobManager(db_pool.connect, workers=2, batch_size=2)
+    try:
+        first = manager.submit("Application", "applications.csv", Upload(HEADER + "A1,C9,V1,Pending,Full\n"))
+        second = manager.submit("Application", "applications.csv", Upload(HEADER + "A2,C8,V1,Pending,Full\n"))
+        again = manager.submit("Application", "applications.csv", Upload(HEADER + "A1,C9,V1,Pending,Full\n"))
+        for job in (first, second, again):
+            manager.wait(job.id, timeout=30)
+    finally:
+        manager.shutdown()
+
+    assert first.key != second.key
+    assert first.key == again.key
+    assert manager.status(first.id)["reject_file"] != manager.status(second.id)["reject_file"]
+    with open(second.reject_path) as f:
+        assert "A2" in f.read()
+
+
+def test_stats_while_jobs_are_submitted(connection):
+    manager = jobs.JobManager(db_pool.connect, workers=2, batch_size=2, max_queued=1000)
+    errors = []
+
+    def submit():
+        for _ in range(20):
+            manager.submit("Application", "empty.csv", Upload(HEADER))
+
+    def read_stats():
+        try:
+            for _ in range(2000):
+                manager.stats()
+        except RuntimeError as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=submit), threading.Thread(target=read_stats)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    manager.shutdown()
+
+    assert errors == []
+    assert sum(manager.stats()[state] for state in ("queued", "running", "done", "failed")) == 20
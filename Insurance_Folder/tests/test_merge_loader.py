@@ -0,0 +1,66 @@
+# merge_loader: inserts new rows, updates changed ones and leaves the rest alone
+
+######################################################
+
+# importing the necessary libraries
+
+import pandas as pd
+import pytest
+
+import bulk_loader
+import merge_loader
+from conftest import insert_rows
+
+######################################################
+
+
+def departments(rows):
+    return pd.DataFrame(rows, columns=["Department_ID", "Company_ID", "Name", "Staff_Count"], dtype=object)
+
+
+def stored(connection):
+    return connection.execute(
+        "SELECT Department_ID, Company_ID, Name, Staff_Count FROM Department ORDER BY 1, 2"
+    ).fetchall()
+
+
+@pytest.fixture
+def existing(connection):
+    insert_rows(connection, "Department", [
+        {"Department_ID": "D1", "Company_ID": "CO1", "Name": "Claims", "Staff_Count": 4},
+        {"Department_ID": "D1", "Company_ID": "CO2", "Name": "Claims", "Staff_Count": None},
+        {"Department_ID": "D2", "Company_ID": "CO1", "Name": "Sales", "Staff_Count": 9},
+    ])
+    return connection
+
+
+def test_merge_counts_and_applies_the_changes(existing):
+    frame = departments([
+        ["D1", "CO1", "Claims", "4"],       # unchanged
+        ["D1", "CO2", "Claims", None],      # unchanged (NULL = NULL)
+        ["D2", "CO1", "Sales", "10"],       # changed
+        ["D3", "CO1", "Audit", "2"],        # new
+    ])
+
+    result = merge_loader.merge_frames(existing, "Department", [frame], batch_size=2)
+
+    assert (result["inserted"], result["updated"], result["unchanged"]) == (1, 1, 2)
+    assert stored(existing) == [("D1", "CO1", "Claims", 4), ("D1", "CO2", "Claims", None),
+                                ("D2", "CO1", "Sales", 10), ("D3", "CO1", "Audit", 2)]
+
+
+def test_the_last_row_of_a_repeated_key_wins(existing):
+    frame = departments([["D2", "CO1", "Sales", "11"], ["D2", "CO1", "Sales", "12"]])
+
+    result = merge_loader.merge_frames(existing, "Department", [frame], batch_size=1)
+
+    assert (result["duplicates"], result["updated"]) == (1, 1)
+    assert ("D2", "CO1", "Sales", 12) in stored(existing)
+
+
+def test_a_file_without_the_key_is_refused(existing):
+    frame = pd.DataFrame({"Department_ID": ["D1"], "Name": ["Claims"]})
+
+    with pytest.raises(bulk_loader.BulkLoadError, match="Company_ID"):
+        merge_loader.merge_frames(existing, "Department", [frame])
+    assert len(stored(existing)) == 3
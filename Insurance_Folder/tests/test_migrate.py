@@ -0,0 +1,56 @@
+# migrate: the numbered migrations, applied once each and in order
+
+######################################################
+
+# importing the necessary libraries
+
+import sqlite3
+
+import pytest
+
+import bench_load
+import migrate
+
+######################################################
+
+
+@pytest.fixture
+def fresh(tmp_path):
+    path = str(tmp_path / "fresh.db")
+    bench_load.create_stand_in_db(path)
+    connection = sqlite3.connect(path)
+    yield connection
+    connection.close()
+
+
+def test_every_migration_is_applied_once_in_order(fresh):
+    versions = [version for version, _, _ in migrate.find_migrations()]
+
+    assert [version for version, _ in migrate.migrate(fresh, target=3)] == versions[:3]
+    assert [version for version, _ in migrate.migrate(fresh)] == versions[3:]
+    assert migrate.migrate(fresh) == []
+    assert migrate.applied_versions(fresh) == set(versions)
+
+
+def test_lookups_use_the_new_indexes(fresh):
+    migrate.migrate(fresh)
+
+    plan = fresh.execute("EXPLAIN QUERY PLAN SELECT Staff_ID FROM Staff WHERE Email = ?", ("a@b.c",)).fetchall()
+    assert "IX_Staff_Email" in str(plan)
+    plan = fresh.execute("EXPLAIN QUERY PLAN SELECT COUNT(*) FROM Claim WHERE Status = 'Pending'").fetchall()
+    assert "IX_Claim_Status" in str(plan)
+
+
+def test_a_failed_migration_leaves_nothing_behind(fresh, tmp_path):
+    directory = tmp_path / "migrations"
+    directory.mkdir()
+    (directory / "001_good.sql").write_text("CREATE INDEX IX_Test ON Staff (Last_Name);")
+    (directory / "002_bad.sql").write_text("-- a second index, then a typo\n"
+                                           "CREATE INDEX IX_Test_2 ON Staff (First_Name);\nCREATE INDEX ON;")
+
+    with pytest.raises(sqlite3.Error):
+        migrate.migrate(fresh, directory=str(directory))
+
+    assert migrate.applied_versions(fresh) == {1}
+    names = [row[0] for row in fresh.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+    assert "IX_Test" in names and "IX_Test_2" not in names
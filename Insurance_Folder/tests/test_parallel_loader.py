@@ -0,0 +1,67 @@
+# parallel_loader: a directory of table CSVs loaded in foreign key order
+
+######################################################
+
+# importing the necessary libraries
+
+import csv
+
+import fk_filter
+import parallel_loader
+import schema
+from conftest import customer
+
+######################################################
+
+
+def write_csv(path, rows):
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=list(rows[0]))
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def vehicle(vehicle_id, customer_id):
+    return {"Vehicle_ID": vehicle_id, "Customer_ID": customer_id, "Registration_Number": f"R {vehicle_id}"}
+
+
+def application(application_id, vehicle_id):
+    return {"Application_ID": application_id, "Customer_ID": "C1", "Vehicle_ID": vehicle_id, "Status": "Pending",
+            "Coverage_Description": "Full"}
+
+
+def test_files_are_found_whatever_their_case(tmp_path):
+    for name in ("customer.csv", "Vehicle.CSV", "notes.txt", "Unknown.csv"):
+        (tmp_path / name).write_text("")
+
+    files = parallel_loader.find_csv_files(str(tmp_path), schema.parse_schema())
+
+    assert sorted(files) == ["Customer", "Vehicle"]
+
+
+# the applications can only pass the filter if the vehicles were loaded (and their orphans rejected) first
+def test_children_are_loaded_after_their_parents(connection, tmp_path):
+    write_csv(tmp_path / "Application.csv", [application("A1", "V1"), application("A2", "V2")])
+    write_csv(tmp_path / "Vehicle.csv", [vehicle("V1", "C1"), vehicle("V2", "C9")])
+    write_csv(tmp_path / "Customer.csv", [customer("C1")])
+    tables = schema.parse_schema()
+    files = parallel_loader.find_csv_files(str(tmp_path), tables)
+
+    results = parallel_loader.load_all(files, tables, workers=3, fk_filter=fk_filter.ForeignKeyFilter(connection))
+
+    assert {name: (result["rows"], result["rejected"]) for name, result in results.items()} == {
+        "Customer": (1, 0), "Vehicle": (1, 1), "Application": (1, 1)}
+    assert connection.execute("SELECT Application_ID FROM Application").fetchall() == [("A1",)]
+
+
+def test_the_children_of_a_failed_table_are_skipped(connection, tmp_path):
+    write_csv(tmp_path / "Customer.csv", [{"Customer_ID": "C1", "No_Such_Column": "x"}])
+    write_csv(tmp_path / "Vehicle.csv", [vehicle("V1", "C1")])
+    write_csv(tmp_path / "Application.csv", [application("A1", "V1")])
+    tables = schema.parse_schema()
+
+    results = parallel_loader.load_all(parallel_loader.find_csv_files(str(tmp_path), tables), tables)
+
+    assert all(isinstance(result, Exception) for result in results.values())
+    assert "skipped because Customer failed" in str(results["Vehicle"])
+    assert connection.execute("SELECT COUNT(*) FROM Vehicle").fetchone() == (0,)
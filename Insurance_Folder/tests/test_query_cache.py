@@ -0,0 +1,94 @@
+# query_cache: cached lookup results, invalidated by a version number per table
+
+######################################################
+
+# importing the necessary libraries
+
+import datetime
+import decimal
+import json
+
+import lookups
+import query_cache
+from conftest import insert_rows
+
+######################################################
+
+
+def payment(payment_id, policy_number="P1", amount=10.0):
+    return {"Payment_ID": payment_id, "Policy_Number": policy_number, "Amount": amount, "Payment_Date": "2024-01-05",
+            "Receipt_ID": f"R{payment_id}"}
+
+
+def payment_ids(results, connection, policy_number="P1"):
+    return [row["Payment_ID"] for row in lookups.run(results, connection, "policy_payments", policy_number)]
+
+
+def test_queries_are_keyed_by_their_text_and_tables():
+    sql = "SELECT  a.x\n FROM Application a JOIN   Policy p ON p.y = a.y WHERE a.z = 'two  spaces'"
+
+    assert query_cache.normalize_sql(sql) == \
+        "SELECT a.x FROM Application a JOIN Policy p ON p.y = a.y WHERE a.z = 'two  spaces'"
+    assert query_cache.tables_in(sql) == ("Application", "Policy")
+    assert query_cache.cache_key(sql, (1,)) == query_cache.cache_key(" ".join(sql.split(" ")), (1,))
+    assert query_cache.cache_key(sql, (1,)) != query_cache.cache_key(sql, (2,))
+
+
+def test_a_write_to_a_table_invalidates_the_results_that_read_it(connection):
+    results = query_cache.QueryCache()
+    insert_rows(connection, "Premium_Payment", [payment("PY1")])
+
+    assert payment_ids(results, connection) == ["PY1"]
+    insert_rows(connection, "Premium_Payment", [payment("PY2")])
+    assert payment_ids(results, connection) == ["PY1"]
+
+    query_cache.table_changed("Claim")
+    assert payment_ids(results, connection) == ["PY1"]
+    query_cache.table_changed("Premium_Payment")
+    assert sorted(payment_ids(results, connection)) == ["PY1", "PY2"]
+
+    stats = results.stats()
+    assert (stats["hits"], stats["misses"], stats["stale"]) == (2, 2, 1)
+
+
+def test_the_oldest_results_are_evicted_to_stay_under_the_size_limit(connection):
+    insert_rows(connection, "Premium_Payment", [payment(f"PY{number}", f"P{number}") for number in range(5)])
+    one = query_cache.QueryCache()
+    payment_ids(one, connection, "P0")
+    results = query_cache.QueryCache(max_bytes=one.stats()["bytes"] * 3)
+
+    for number in range(5):
+        payment_ids(results, connection, f"P{number}")
+
+    stats = results.stats()
+    assert (stats["size"], stats["evictions"]) == (3, 2)
+    assert payment_ids(results, connection, "P4") == ["PY4"]
+    assert results.stats()["hits"] == 1
+
+
+# two caches on one file, like two app processes
+def test_a_shared_file_serves_and_invalidates_across_processes(connection, tmp_path):
+    path = str(tmp_path / "shared" / "query_cache.db")
+    first = query_cache.QueryCache(shared_path=path)
+    second = query_cache.QueryCache(shared_path=path)
+    insert_rows(connection, "Premium_Payment", [payment("PY1")])
+
+    payment_ids(first, connection)
+    assert payment_ids(second, connection) == ["PY1"]
+    assert second.stats()["shared_hits"] == 1
+
+    insert_rows(connection, "Premium_Payment", [payment("PY2")])
+    first.table_changed(["Premium_Payment"])
+    assert sorted(payment_ids(second, connection)) == ["PY1", "PY2"]
+
+
+# the shared file holds JSON, and the values come back as the types the driver returned
+def test_shared_results_keep_their_types():
+    result = (["Day", "At", "Amount", "Data", "Name", "Count"],
+              [(datetime.date(2024, 1, 5), datetime.datetime(2024, 1, 5, 9, 30), decimal.Decimal("10.50"), b"\x01",
+                "x", 3)])
+
+    value = query_cache.dump_result(result)
+
+    assert query_cache.load_result(value) == result
+    assert json.loads(value)[1][0][0] == {"$": "date", "v": "2024-01-05"}
@@ -0,0 +1,75 @@
+# registry: one prepared insert per table, with every value checked against its column
+
+######################################################
+
+# importing the necessary libraries
+
+import os
+import re
+
+import pytest
+
+import registry
+
+######################################################
+
+TEMPLATES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "templates")
+
+
+def customer_values(**changes):
+    values = {"Customer_ID": "C1", "First_Name": "Ann", "Last_Name": "Lee", "DOB": "1980-05-01", "Gender": "",
+              "Address": "1 Road", "City": "Town", "Country": "Canada", "Phone": "+1", "Email": "a@b.co",
+              "Marital_Status": "1"}
+    values.update(changes)
+    return list(values.values())
+
+
+def test_values_are_converted_for_their_columns():
+    assert registry.get("Customer").convert(customer_values()) == \
+        ("C1", "Ann", "Lee", "1980-05-01", None, "1 Road", "Town", "Canada", "+1", "a@b.co", 1)
+    assert registry.get("Premium_Payment").convert(["PY1", "P1", "12.5", "2024-01-02", "R1"])[2] == 12.5
+
+
+def test_every_bad_value_of_a_row_is_reported():
+    with pytest.raises(registry.RowError) as error:
+        registry.get("Customer").convert(customer_values(First_Name="", DOB="x", Email="bad", Marital_Status="2",
+                                                         Customer_ID="C" * 11))
+
+    assert error.value.errors == [
+        "Customer ID exceeds the maximum length of 10.",
+        "First Name is required and cannot be empty.",
+        "DOB must be a date (YYYY-MM-DD).",
+        "Email is not a valid email address.",
+        "Marital Status must be 0 or 1.",
+    ]
+
+
+def test_amounts_must_be_positive():
+    with pytest.raises(registry.RowError, match="Amount must be a positive number"):
+        registry.get("Premium_Payment").convert(["PY1", "P1", "-3", "2024-01-02", "R1"])
+
+
+def test_a_header_is_prepared_once_and_checked():
+    spec = registry.get("Vehicle")
+
+    assert spec.prepare(["Vehicle_ID", "Customer_ID", "Registration_Number"]) is \
+        spec.prepare(["Vehicle_ID", "Customer_ID", "Registration_Number"])
+    with pytest.raises(registry.RegistryError, match="has no column Colour"):
+        spec.prepare(["Vehicle_ID", "Customer_ID", "Registration_Number", "Colour"])
+    with pytest.raises(registry.RegistryError, match="requires column Registration_Number"):
+        spec.prepare(["Vehicle_ID", "Customer_ID"])
+    with pytest.raises(registry.RegistryError, match="Unknown table"):
+        registry.get("Vehicles")
+
+
+# the add_<table> pages post their fields to the generic add_record view under the column names
+def test_the_add_forms_name_their_fields_after_the_columns():
+    for file_name in os.listdir(TEMPLATES):
+        match = re.match(r"add_(\w+)\.html$", file_name)
+        if not match:
+            continue
+        spec = next(spec for name, spec in registry.TABLES.items() if name.lower() == match.group(1))
+        with open(os.path.join(TEMPLATES, file_name)) as f:
+            fields = set(re.findall(r'name="(\w+)"', f.read()))
+        assert {name.lower() for name in spec.required} <= fields, file_name
+        assert fields <= {name.lower() for name in spec.columns}, file_name
@@ -0,0 +1,77 @@
+# renewals: the policies expiring soon, with their latest payment, from a scan plus the rows added since
+
+######################################################
+
+# importing the necessary libraries
+
+from datetime import date
+
+import renewals
+from conftest import insert_owner, insert_rows
+
+######################################################
+
+TODAY = date(2024, 3, 1)
+
+
+def policy(policy_number, expiry):
+    return {"Policy_Number": policy_number, "Application_ID": "A1", "Start_Date": "2023-01-01", "Expiry_Date": expiry}
+
+
+def payment(payment_id, policy_number, amount, day):
+    return {"Payment_ID": payment_id, "Policy_Number": policy_number, "Amount": amount, "Payment_Date": day,
+            "Receipt_ID": f"R{payment_id}"}
+
+
+def listed(index, days, **options):
+    total, rows = index.work_list(days, TODAY, **options)
+    return total, [(row["Policy_Number"], row["Last_Payment_Date"], row["Payment_Status"]) for row in rows]
+
+
+def scanned(connection):
+    insert_owner(connection)
+    insert_rows(connection, "Application", [{"Application_ID": "A1", "Customer_ID": "C1", "Vehicle_ID": "V1",
+                                             "Status": "Issued", "Coverage_Description": "Full"}])
+    insert_rows(connection, "Policy", [policy("P1", "2024-03-10"), policy("P2", "2024-03-05"),
+                                       policy("P3", "2024-05-20"), policy("P4", "2024-02-28")])
+    insert_rows(connection, "Premium_Payment", [payment("PY1", "P1", 10.0, "2024-01-01"),
+                                                payment("PY2", "P1", 12.0, "2024-02-20"),
+                                                payment("PY3", "P3", 9.0, "2024-02-25")])
+    index = renewals.RenewalIndex(horizon_days=90)
+    index.refresh(connection, TODAY)
+    return index
+
+
+def test_the_work_list_is_soonest_first_with_the_latest_payment(connection):
+    index = scanned(connection)
+
+    assert listed(index, 30) == (2, [("P2", None, "none"), ("P1", "2024-02-20", "current")])
+    assert listed(index, 90) == (3, [("P2", None, "none"), ("P1", "2024-02-20", "current"),
+                                     ("P3", "2024-02-25", "current")])
+    assert listed(index, 90, limit=1, offset=1) == (3, [("P1", "2024-02-20", "current")])
+    assert index.work_list(30, TODAY)[1][0]["Customer_ID"] == "C1"
+
+
+def test_rows_added_since_the_scan_are_listed(connection):
+    index = scanned(connection)
+
+    assert index.add_policy(policy("P5", "2024-03-07"), connection)
+    assert not index.add_policy(policy("P6", "2025-01-01"), connection)
+    index.add_payment(payment("PY4", "P2", 20.0, "2024-01-10"))
+
+    assert listed(index, 30) == (3, [("P2", "2024-01-10", "overdue"), ("P5", None, "none"),
+                                     ("P1", "2024-02-20", "current")])
+    assert index.work_list(30, TODAY)[1][1]["Customer_ID"] == "C1"
+
+
+def test_a_scan_takes_over_the_added_rows_without_listing_them_twice(connection):
+    index = scanned(connection)
+    row = policy("P5", "2024-03-07")
+    insert_rows(connection, "Policy", [row])
+    index.add_policy(row, connection)
+
+    index.refresh(connection, TODAY)
+
+    assert listed(index, 30)[0] == 3
+    assert index.stats()["added"] == 0
+    assert index.covers(90, TODAY) and not index.covers(91, TODAY)
@@ -0,0 +1,70 @@
+# revenue_rollup: incremental monthly sums of payments and settlements, edited rows included
+
+######################################################
+
+# importing the necessary libraries
+
+import db_pool
+import revenue_rollup
+from conftest import insert_rows
+
+######################################################
+
+
+def payment(payment_id, amount, day):
+    return {"Payment_ID": payment_id, "Policy_Number": "P1", "Amount": amount, "Payment_Date": day,
+            "Receipt_ID": f"R{payment_id}"}
+
+
+def settlement(settlement_id, amount, day):
+    return {"Settlement_ID": settlement_id, "Claim_ID": "CL1", "Amount_Paid": amount, "Settlement_Date": day}
+
+
+def months(connection):
+    return {row["Month"]: (row["Revenue"], row["Claims_paid"], row["Profit"])
+            for row in revenue_rollup.report(connection)}
+
+
+# what an UPDATE does on SQL server: the row gets a new rowversion. on the stand-in a row only gets a
+# new rowid by being inserted again
+def edit_payment(connection, payment_id, amount, day):
+    connection.execute("DELETE FROM Premium_Payment WHERE Payment_ID = ?", (payment_id,))
+    insert_rows(connection, "Premium_Payment", [payment(payment_id, amount, day)])
+
+
+def test_new_rows_are_added_to_their_months(connection):
+    insert_rows(connection, "Premium_Payment", [payment("PY1", 100.0, "2024-01-05"), payment("PY2", 50.0, "2024-01-20"),
+                                                payment("PY3", 70.0, "2024-02-01")])
+    insert_rows(connection, "Claim_Settlement", [settlement("S1", 30.0, "2024-01-10")])
+
+    first = revenue_rollup.rollup(connection)
+    insert_rows(connection, "Premium_Payment", [payment("PY4", 5.0, "2024-02-10")])
+    second = revenue_rollup.rollup(connection)
+    third = revenue_rollup.rollup(connection)
+
+    assert (first["rows"], second["rows"], third["rows"]) == (4, 1, 0)
+    assert months(connection) == {"January 2024": (150.0, 30.0, 120.0), "February 2024": (75.0, 0.0, 75.0)}
+
+
+def test_an_edited_row_is_not_counted_twice(connection):
+    insert_rows(connection, "Premium_Payment", [payment("PY1", 100.0, "2024-01-05"), payment("PY2", 40.0, "2024-01-06")])
+    revenue_rollup.rollup(connection)
+
+    edit_payment(connection, "PY1", 150.0, "2024-02-03")
+    edit_payment(connection, "PY2", 45.0, "2024-01-06")
+    revenue_rollup.rollup(connection)
+
+    assert months(connection) == {"January 2024": (45.0, 0.0, 45.0), "February 2024": (150.0, 0.0, 150.0)}
+    incremental = months(connection)
+    revenue_rollup.rollup(connection, rebuild=True)
+    assert months(connection) == incremental
+
+
+def test_scan_uses_a_connection_of_its_own(stand_in):
+    connection = db_pool.connect()
+    insert_rows(connection, "Premium_Payment", [payment("PY1", 10.0, "2024-03-01")])
+    connection.close()
+
+    summary = revenue_rollup.scan(db_pool.connect)
+
+    assert summary["months"] == ["March 2024"]
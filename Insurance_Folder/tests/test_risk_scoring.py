@@ -0,0 +1,84 @@
+# risk_scoring: scoring the whole book, and incremental runs that only read the changed customers
+
+######################################################
+
+# importing the necessary libraries
+
+from datetime import date
+
+import risk_scoring
+from conftest import customer, insert_rows
+
+######################################################
+
+TODAY = date(2024, 6, 15)
+
+
+def add_customer(connection, number, dob="1980-01-10"):
+    customer_id, vehicle_id, application_id = f"C{number}", f"V{number}", f"A{number}"
+    insert_rows(connection, "Customer", [customer(customer_id, DOB=dob)])
+    insert_rows(connection, "Vehicle", [{"Vehicle_ID": vehicle_id, "Customer_ID": customer_id,
+                                         "Registration_Number": "AB 123", "Value": 25000, "Type": "Sedan"}])
+    insert_rows(connection, "Application", [{"Application_ID": application_id, "Customer_ID": customer_id,
+                                             "Vehicle_ID": vehicle_id, "Status": "Issued",
+                                             "Coverage_Description": "Full"}])
+    insert_rows(connection, "Policy", [{"Policy_Number": f"P{number}", "Application_ID": application_id,
+                                        "Start_Date": "2020-01-01", "Expiry_Date": "2023-01-01"}])
+
+
+def add_claim(connection, number, claim_id, amount):
+    insert_rows(connection, "Claim", [{"Claim_ID": claim_id, "Policy_Number": f"P{number}", "Amount": amount,
+                                       "Incident_ID": "I1", "Damage_Type": "Dent", "Date": "2021-03-01",
+                                       "Status": "Settled"}])
+
+
+def multipliers(connection):
+    return dict(connection.execute("SELECT Customer_ID, Premium_Multiplier FROM Risk_Assessment"))
+
+
+def test_full_run_scores_every_customer(connection):
+    for number in range(5):
+        add_customer(connection, number)
+    add_claim(connection, 0, "CL1", 20000.0)
+
+    summary = risk_scoring.rescore(connection, today=TODAY)
+
+    assert (summary["scored"], summary["inserted"], summary["updated"]) == (5, 5, 0)
+    scores = multipliers(connection)
+    assert scores["C0"] > scores["C1"] == scores["C4"]
+    assert connection.execute("SELECT COUNT(DISTINCT Assessment_ID) FROM Risk_Assessment").fetchone()[0] == 5
+
+
+def test_incremental_run_reads_only_changed_customers(connection, monkeypatch):
+    for number in range(5):
+        add_customer(connection, number)
+    risk_scoring.rescore(connection, incremental=True, today=TODAY)
+    before = multipliers(connection)
+
+    add_claim(connection, 2, "CL1", 40000.0)
+    add_customer(connection, 5)
+    changed = []
+    monkeypatch.setattr(risk_scoring.query_cache, "table_changed", lambda *tables: changed.extend(tables))
+    summary = risk_scoring.rescore(connection, incremental=True, today=TODAY)
+
+    assert summary["scored"] == 2
+    assert (summary["updated"], summary["inserted"]) == (1, 1)
+    after = multipliers(connection)
+    assert after["C2"] > before["C2"]
+    assert {name: after[name] for name in before if name != "C2"} == {name: before[name] for name in before
+                                                                        if name != "C2"}
+    assert "Risk_Assessment" in changed
+
+    assert risk_scoring.rescore(connection, incremental=True, today=TODAY)["scored"] == 0
+
+
+def test_incremental_run_picks_up_birthdays(connection):
+    add_customer(connection, 1, dob="1990-06-20")
+    add_customer(connection, 2, dob="1990-09-01")
+    risk_scoring.rescore(connection, incremental=True, today=TODAY)
+
+    summary = risk_scoring.rescore(connection, incremental=True, today=date(2024, 6, 25))
+
+    assert summary["scored"] == 1
+    age = connection.execute("SELECT Age FROM Risk_Assessment WHERE Customer_ID = 'C1'").fetchone()[0]
+    assert age == 34
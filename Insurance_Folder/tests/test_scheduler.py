@@ -0,0 +1,57 @@
+# scheduler: periodic jobs on one background thread
+
+######################################################
+
+# importing the necessary libraries
+
+import threading
+
+import scheduler
+
+######################################################
+
+
+def test_jobs_run_and_failures_are_counted():
+    jobs = scheduler.Scheduler()
+    ran = threading.Event()
+
+    def fail():
+        raise ValueError("boom")
+
+    failing = jobs.every(60, fail, name="failing")
+    jobs.every(60, ran.set, name="working")
+    jobs.start()
+    try:
+        assert ran.wait(5)
+    finally:
+        jobs.stop()
+
+    stats = jobs.stats()
+    assert (stats["failing_runs"], stats["failing_failures"]) == (1, 1)
+    assert (stats["working_runs"], stats["working_failures"]) == (1, 0)
+    assert failing.next_run > 0
+
+
+def test_run_soon_brings_a_job_forward():
+    jobs = scheduler.Scheduler()
+    calls = []
+    done = threading.Event()
+    job = jobs.every(3600, lambda: (calls.append(1), done.set()), name="slow", run_now=False)
+    jobs.start()
+    try:
+        assert not done.wait(0.2)
+        jobs.run_soon(job)
+        assert done.wait(5)
+    finally:
+        jobs.stop()
+    assert calls == [1]
+
+
+def test_start_is_idempotent():
+    jobs = scheduler.Scheduler()
+    jobs.start()
+    thread = jobs._thread
+    jobs.start()
+    assert jobs._thread is thread
+    jobs.stop()
+    assert not thread.is_alive()
@@ -0,0 +1,69 @@
+# search_index: the full-text index, built from the stand-in and kept up to date by refresh() and
+# record_insert()
+
+######################################################
+
+# importing the necessary libraries
+
+import search_index
+from conftest import insert_rows
+
+######################################################
+
+
+def incident(incident_id, description):
+    return {"Incident_ID": incident_id, "Type": "Collision", "Date": "2024-01-01",
+            "Description": description}
+
+
+def keys(index, query):
+    return [result["key"] for result in index.search(query)[1]]
+
+
+def test_build_search_and_reopen(connection, tmp_path):
+    insert_rows(connection, "Incident", [incident("I1", "Rear bumper dented in a parking lot"),
+                                         incident("I2", "Windshield cracked by a stone")])
+    index = search_index.SearchIndex(str(tmp_path / "search"))
+
+    assert index.build(connection) == 2
+    assert keys(index, "bumper") == ["I1"]
+    assert keys(index, "stone windshield") == ["I2"]
+    assert keys(search_index.SearchIndex(str(tmp_path / "search")), "bumper") == ["I1"]
+
+
+def test_new_rows_are_found_after_a_refresh_or_when_recorded(connection, tmp_path):
+    insert_rows(connection, "Incident", [incident("I1", "Rear bumper dented")])
+    index = search_index.SearchIndex(str(tmp_path / "search"))
+    index.build(connection)
+
+    insert_rows(connection, "Incident", [incident("I2", "Front bumper scratched")])
+    assert index.refresh(connection) == 1
+    index.record_insert("Incident", incident("I3", "Bumper fell off"))
+
+    assert sorted(keys(index, "bumper")) == ["I1", "I2", "I3"]
+    assert index.search("bumper", sources=["Policy"]) == (0, [])
+
+
+def test_a_recorded_row_replaces_its_earlier_document(connection, tmp_path):
+    index = search_index.SearchIndex(str(tmp_path / "search"))
+    index.build(connection)
+
+    index.record_insert("Incident", incident("I1", "Hail damage"))
+    index.record_insert("Incident", incident("I1", "Flood damage"))
+
+    assert keys(index, "hail") == []
+    assert keys(index, "flood") == ["I1"]
+    assert index.stats()["documents"] == 1
+
+
+# postings handed out by a delta are copies, so the delta can keep growing while they are in use
+def test_delta_postings_do_not_pin_the_delta():
+    delta = search_index._Delta(0)
+    delta.add(0, "I1", ["bumper"])
+
+    docs, counts = delta.term_postings("bumper")
+    for number in range(2, 100):
+        delta.add(0, f"I{number}", ["bumper"])
+
+    assert list(docs) == [0] and list(counts) == [1]
+    assert len(delta.term_postings("bumper")[0]) == 99
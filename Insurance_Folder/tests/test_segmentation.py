@@ -0,0 +1,60 @@
+# segmentation: segments every customer, and replaces the last run's segments all at once
+
+######################################################
+
+# importing the necessary libraries
+
+import numpy as np
+import pytest
+
+import segmentation
+from conftest import customer, insert_rows
+
+######################################################
+
+
+def add_customers(connection, count):
+    insert_rows(connection, "Customer", [customer(f"C{number:03d}", DOB=f"{1950 + number % 50}-03-01",
+                                                  Marital_Status=number % 2) for number in range(count)])
+
+
+def counts(connection):
+    return (connection.execute("SELECT COUNT(*) FROM Customer_Segmentation").fetchone()[0],
+            connection.execute("SELECT COUNT(*) FROM Segment_Membership").fetchone()[0])
+
+
+def test_every_customer_gets_a_segment(connection, tmp_path):
+    add_customers(connection, 60)
+
+    result = segmentation.run(connection, k=3, chunk_size=16, work_dir=str(tmp_path),
+                              model_path=str(tmp_path / "model.npz"))
+
+    assert result["customers"] == 60
+    assert counts(connection) == (3, 60)
+    assert sum(segment["Customers"] for segment in result["segments"]) == 60
+
+
+def test_the_same_seed_gives_the_same_segments(connection, tmp_path):
+    add_customers(connection, 40)
+    options = {"k": 3, "chunk_size": 16, "work_dir": str(tmp_path), "model_path": str(tmp_path / "model.npz")}
+
+    first = segmentation.run(connection, seed=7, **options)["segments"]
+    second = segmentation.run(connection, seed=7, **options)["segments"]
+
+    assert first == second
+
+
+def test_a_failed_write_leaves_the_last_segments(connection, tmp_path):
+    add_customers(connection, 30)
+    segmentation.run(connection, k=2, chunk_size=8, work_dir=str(tmp_path), model_path=str(tmp_path / "model.npz"))
+    before = connection.execute("SELECT Customer_ID, Segment_ID FROM Segment_Membership ORDER BY 1").fetchall()
+
+    # the same customer twice fails the second batch of memberships
+    ids = np.array(["C000", "C001", "C002", "C000"], dtype=object)
+    segments = [{"Segment_ID": f"{segmentation.SEGMENT_PREFIX}{9:08d}", "Segment_Name": "x", "Age_Range": "1-2",
+                 "Average_Income": None, "Risk_Level": "Low", "Claim_Frequency": "Low", "Customers": 4}]
+    with pytest.raises(Exception):
+        segmentation.write(connection, ids, np.zeros(4, dtype=int), np.zeros(4), segments, batch_size=2)
+
+    assert connection.execute("SELECT Customer_ID, Segment_ID FROM Segment_Membership ORDER BY 1").fetchall() == before
+    assert counts(connection) == (2, 30)
@@ -0,0 +1,83 @@
+# table_browser: keyset paging of tables with a primary key, offset paging of the ones without
+
+######################################################
+
+# importing the necessary libraries
+
+import pytest
+
+import table_browser
+from conftest import insert_rows
+
+######################################################
+
+
+def claims(count):
+    return [{"Claim_ID": f"CL{number:03d}", "Policy_Number": "P1", "Amount": float(number % 7), "Incident_ID": "I1",
+             "Damage_Type": "Dent", "Date": "2024-01-01", "Status": "Pending"} for number in range(count)]
+
+
+# every page of table_name, following the cursors like the views do
+def all_pages(connection, table_name, **options):
+    table = table_browser.get_table(table_name)
+    pages, after = [], None
+    while True:
+        page = list(table_browser.iter_page(connection, table, after=after, **options))
+        pages.append([values for values, _ in page])
+        if len(page) < options["page_size"]:
+            return pages
+        after = table_browser.decode_cursor(table_browser.encode_cursor(page[-1][1]))
+
+
+def test_keyset_pages_cover_the_table_once(connection):
+    insert_rows(connection, "Claim", claims(23))
+
+    pages = all_pages(connection, "Claim", page_size=5, sort="Amount", descending=True)
+    rows = [row for page in pages for row in page]
+
+    assert [len(page) for page in pages] == [5, 5, 5, 5, 3]
+    assert sorted(row[0] for row in rows) == [f"CL{number:03d}" for number in range(23)]
+    assert [row[2] for row in rows] == sorted((row[2] for row in rows), reverse=True)
+
+
+def test_a_table_can_be_sorted_on_the_second_key_column(connection):
+    insert_rows(connection, "Department", [
+        {"Department_ID": department, "Company_ID": company, "Name": "Claims"}
+        for department, company in (("D1", "CO3"), ("D2", "CO1"), ("D3", "CO2"), ("D1", "CO1"), ("D2", "CO2"))
+    ])
+
+    pages = all_pages(connection, "Department", page_size=2, sort="Company_ID")
+    rows = [(row[0], row[1]) for page in pages for row in page]
+
+    assert table_browser.key_columns(table_browser.get_table("Department"), "Company_ID") == \
+        ["Company_ID", "Department_ID"]
+    assert rows == [("D1", "CO1"), ("D2", "CO1"), ("D2", "CO2"), ("D3", "CO2"), ("D1", "CO3")]
+
+
+def test_filters_and_hidden_columns(connection):
+    table = table_browser.get_table("Staff")
+    rows = list(table_browser.iter_page(connection, table, filters={"First_Name": "Bench"}, page_size=10))
+
+    assert len(rows) == 1
+    assert "Password" not in table_browser.visible_columns(table)
+    with pytest.raises(table_browser.BrowseError):
+        table_browser.build_page_query(table, filters={"Password": "bench"})
+
+
+def test_a_table_without_a_key_is_paged_by_offset(connection):
+    rows = [{"Month": month, "Revenue": revenue, "Claims_paid": None, "Expenses": 1.0, "Profit": None}
+            for month, revenue in [("January 2024", 5.0), ("January 2024", 5.0), (None, 3.0), ("March 2024", None),
+                                   ("January 2024", 5.0), ("April 2024", 2.0), ("May 2024", 2.0)]]
+    insert_rows(connection, "Revenue_Expenses", rows)
+
+    pages = all_pages(connection, "Revenue_Expenses", page_size=3, sort="Revenue")
+    shown = [row for page in pages for row in page]
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert sorted(shown, key=repr) == sorted(([row[name] for name in row] for row in rows), key=repr)
+
+
+def test_bad_offset_cursor(connection):
+    table = table_browser.get_table("Revenue_Expenses")
+    with pytest.raises(table_browser.BrowseError):
+        table_browser.build_page_query(table, after=["CL001"])